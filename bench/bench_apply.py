@@ -0,0 +1,144 @@
+"""
+Apply latency for every mode, replayed against the scripted fake Pi.
+
+For each scenario a fresh FakeSystem (eth0 up with a DHCP lease, wlan0 idle,
+no ap0) gets a full apply, then, once leases have settled, a second apply of
+the same config, which should be an empty incremental plan. Reported per run:
+plan steps, subprocesses, netlink round trips, simulated wall time and the
+critical path.
+
+    python3 bench/bench_apply.py                      # table
+    python3 bench/bench_apply.py --json > base.json   # save a baseline
+    python3 bench/bench_apply.py --baseline base.json # exit 1 on regressions
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from hamsterfi.core.models import AppConfig  # noqa: E402
+from hamsterfi.system.apply import apply  # noqa: E402
+from hamsterfi.system.fake import FakeSystem  # noqa: E402
+from hamsterfi.system.host import use_host  # noqa: E402
+
+UPSTREAM = ("upstream", "upstream-psk")
+
+
+def _cfg(mode: str, wan: str, channel="6") -> AppConfig:
+    cfg = AppConfig()
+    cfg.wlan.channel = channel if channel == "auto" else int(channel)
+    cfg.mode = mode
+    cfg.wan.device = wan
+    if wan == "wlan0":
+        cfg.wan.upstream_ssid, cfg.wan.upstream_psk = UPSTREAM
+    if mode == "bridge":
+        cfg.lan.dhcp.enabled = False
+    return cfg
+
+
+SCENARIOS = {
+    "ap/eth0": lambda: _cfg("ap", "eth0"),
+    "ap/wlan0": lambda: _cfg("ap", "wlan0"),
+    "station": lambda: _cfg("station", "wlan0"),
+    "bridge": lambda: _cfg("bridge", "eth0"),
+    # first apply scans for a channel, re-apply keeps it without scanning
+    "ap/auto": lambda: _cfg("ap", "eth0", channel="auto"),
+}
+
+
+def _measure(pi: FakeSystem, cfg: AppConfig) -> dict:
+    pi.reset_counters()
+    plan = apply(cfg)
+    return {
+        "steps": len(plan.actions),
+        "full": plan.full,
+        "subprocesses": len(pi.calls),
+        "netlink_round_trips": pi.netlink_round_trips,
+        "wall_s": (plan.wall_s or 0.0) / pi.scale,
+        "critical_s": (plan.critical_s or 0.0) / pi.scale,
+        "critical_path": plan.critical_path,
+    }
+
+
+def run_scenario(name: str, scale: float) -> dict:
+    cfg = SCENARIOS[name]()
+    with FakeSystem(scale=scale) as pi, use_host(pi):
+        first = _measure(pi, cfg)
+        # let the leases that apply does not wait for (station mode) land
+        pi.sleep(pi.delays["dhcp"] * 2)
+        again = _measure(pi, cfg)
+    return {"full": first, "again": again}
+
+
+def _median(runs: list, key: str) -> float:
+    return statistics.median(r[key] for r in runs)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--repeat", type=int, default=3)
+    ap.add_argument("--scale", type=float, default=0.02, help="real seconds per simulated second")
+    ap.add_argument("--only", choices=sorted(SCENARIOS), action="append")
+    ap.add_argument("--json", action="store_true")
+    ap.add_argument("--baseline", help="JSON from an earlier --json run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed wall-time growth (fraction)")
+    args = ap.parse_args()
+
+    results = {}
+    for name in args.only or list(SCENARIOS):
+        runs = [run_scenario(name, args.scale) for _ in range(args.repeat)]
+        res = {}
+        for phase in ("full", "again"):
+            rs = [r[phase] for r in runs]
+            res[phase] = {
+                "steps": rs[0]["steps"],
+                "full": rs[0]["full"],
+                "subprocesses": rs[0]["subprocesses"],
+                "netlink_round_trips": rs[0]["netlink_round_trips"],
+                "wall_s": round(_median(rs, "wall_s"), 3),
+                "critical_s": round(_median(rs, "critical_s"), 3),
+                "critical_path": rs[0]["critical_path"],
+            }
+        results[name] = res
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'scenario':<10} {'phase':<6} {'steps':>5} {'procs':>5} {'nl rt':>5} {'wall s':>7} {'crit s':>7}  critical path")
+        for name, res in results.items():
+            for phase, r in res.items():
+                print(
+                    f"{name:<10} {phase:<6} {r['steps']:>5} {r['subprocesses']:>5} {r['netlink_round_trips']:>5} "
+                    f"{r['wall_s']:>7.2f} {r['critical_s']:>7.2f}  {' -> '.join(r['critical_path'])}"
+                )
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    failed = []
+    for name, res in results.items():
+        for phase, r in res.items():
+            b = base.get(name, {}).get(phase)
+            if not b:
+                continue
+            # a few ms of scheduling noise is magnified by 1/scale, so allow an absolute slack as well
+            if r["wall_s"] > b["wall_s"] * (1 + args.tolerance) + 0.25:
+                failed.append(f"{name}/{phase}: wall {b['wall_s']:.2f}s -> {r['wall_s']:.2f}s")
+            for key in ("steps", "subprocesses"):
+                if r[key] > b[key]:
+                    failed.append(f"{name}/{phase}: {key} {b[key]} -> {r[key]}")
+            # event waits re-query the fake, so round trips vary a little with timing
+            if r["netlink_round_trips"] > b["netlink_round_trips"] * 1.25 + 2:
+                failed.append(f"{name}/{phase}: netlink round trips {b['netlink_round_trips']} -> {r['netlink_round_trips']}")
+    for msg in failed:
+        print(f"REGRESSION {msg}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Time from power-on to a forwarding router, full apply vs the boot fast path,
+on the scripted fake Pi.
+
+Each scenario applies its config to a fresh FakeSystem (which records the boot
+snapshot) and reboots it: files and enabled units survive, ap0/br0,
+addresses, routes, leases and the association don't. It then brings the
+router back twice, once with a plain apply() and once with
+hamsterfi.system.boot.run(). "ready" is the time until the topology is back
+and, for the fast path, its verification plan is empty. Every phase gets a
+fresh config, as the boot unit loads one from config.yaml; "ap/wlan0 ch11"
+puts the upstream AP on another channel than the config's, so the AP follows
+it and the fast path must still accept the snapshot.
+
+    python3 bench/bench_boot.py
+    python3 bench/bench_boot.py --only ap/wlan0 -n 5 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_apply import SCENARIOS  # noqa: E402
+from hamsterfi.system import boot  # noqa: E402
+from hamsterfi.system.apply import apply  # noqa: E402
+from hamsterfi.system.fake import FakeSystem  # noqa: E402
+from hamsterfi.system.host import use_host  # noqa: E402
+
+
+BOOT_SCENARIOS = dict(SCENARIOS, **{"ap/wlan0 ch11": SCENARIOS["ap/wlan0"]})
+FAKE_ARGS = {"ap/wlan0 ch11": {"upstream_freq": 2462}}
+
+
+def run_scenario(name: str, scale: float) -> dict:
+    make_cfg = BOOT_SCENARIOS[name]
+    out = {}
+    with FakeSystem(scale=scale, **FAKE_ARGS.get(name, {})) as pi, use_host(pi):
+        apply(make_cfg())
+        pi.sleep(pi.delays["dhcp"] * 2)
+
+        pi.reboot()
+        pi.reset_counters()
+        t0 = time.monotonic()
+        plan = apply(make_cfg())
+        out["full apply"] = {
+            "ready_s": (time.monotonic() - t0) / scale,
+            "subprocesses": len(pi.calls),
+            "plan": "full" if plan.full else f"{len(plan.actions)} steps",
+        }
+
+        pi.sleep(pi.delays["dhcp"] * 2)
+        pi.reboot()
+        pi.reset_counters()
+        res = boot.run(make_cfg())
+        out["fast path"] = {
+            "ready_s": res["total_s"] / scale,
+            "subprocesses": len(pi.calls),
+            "plan": res["fallback"] or f"verify: {res['plan']}",
+        }
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--repeat", type=int, default=3)
+    ap.add_argument("--scale", type=float, default=0.02, help="real seconds per simulated second")
+    ap.add_argument("--only", choices=sorted(BOOT_SCENARIOS), action="append")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    results = {}
+    for name in args.only or list(BOOT_SCENARIOS):
+        runs = [run_scenario(name, args.scale) for _ in range(args.repeat)]
+        results[name] = {
+            variant: dict(runs[0][variant], ready_s=round(statistics.median(r[variant]["ready_s"] for r in runs), 2))
+            for variant in runs[0]
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'scenario':<14} {'variant':<10} {'ready s':>8} {'procs':>5}  plan")
+    for name, res in results.items():
+        for variant, r in res.items():
+            print(f"{name:<14} {variant:<10} {r['ready_s']:>8.2f} {r['subprocesses']:>5}  {r['plan']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
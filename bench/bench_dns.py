@@ -0,0 +1,185 @@
+"""
+DNS resolution latency through dnsmasq with the rendered cache options,
+against a local stand-in upstream.
+
+The stand-in answers every A query after a fixed delay (default 25 ms, a
+typical ISP resolver) with a configurable TTL, and counts what reaches it.
+Clients send a Zipf-distributed stream of names (a few popular domains, a long
+tail) to a dnsmasq on 127.0.0.1. Each variant reports the cache hit rate
+(queries that never reached the upstream) and p50/p99 resolution time.
+
+    python3 bench/bench_dns.py                  # needs the dnsmasq binary, no root
+    python3 bench/bench_dns.py --queries 20000 --names 5000 --json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from hamsterfi.core.models import AppConfig  # noqa: E402
+from hamsterfi.system.render import dns_cache_options  # noqa: E402
+
+UPSTREAM_PORT = 5399
+DNSMASQ_PORT = 5398
+
+
+def _qname(name: str) -> bytes:
+    return b"".join(bytes([len(p)]) + p.encode() for p in name.split(".")) + b"\0"
+
+
+def build_query(qid: int, name: str) -> bytes:
+    return struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0) + _qname(name) + struct.pack("!HH", 1, 1)
+
+
+class StandInUpstream:
+    """UDP resolver that answers anything with 10.x.y.z after `delay_s`."""
+
+    def __init__(self, port: int, delay_s: float, ttl: int) -> None:
+        self.delay_s, self.ttl = delay_s, ttl
+        self.queries = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", port))
+        self._lock = threading.Lock()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _answer(self, query: bytes, addr) -> None:
+        time.sleep(self.delay_s)
+        qid = struct.unpack("!H", query[:2])[0]
+        end = query.index(b"\0", 12) + 5
+        question = query[12:end]
+        ip = bytes([10]) + bytes(random.getrandbits(8) for _ in range(3))
+        answer = struct.pack("!HHHIH", 0xC00C, 1, 1, self.ttl, 4) + ip
+        reply = struct.pack("!HHHHHH", qid, 0x8180, 1, 1, 0, 0) + question + answer
+        self.sock.sendto(reply, addr)
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(512)
+            except OSError:
+                return
+            with self._lock:
+                self.queries += 1
+            threading.Thread(target=self._answer, args=(data, addr), daemon=True).start()
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+def _dnsmasq_conf(options: List[str]) -> str:
+    base = [
+        f"port={DNSMASQ_PORT}",
+        "listen-address=127.0.0.1",
+        "bind-interfaces",
+        "no-hosts",
+        "keep-in-foreground",
+        "pid-file=",  # no pid file, so it runs without root
+    ]
+    # the bench pins the upstream to the stand-in, whatever the WAN would say
+    opts = [o for o in options if not o.startswith(("server=", "resolv-file=", "no-resolv"))]
+    return "\n".join(base + opts + ["no-resolv", f"server=127.0.0.1#{UPSTREAM_PORT}"]) + "\n"
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_variant(options: List[str], names: List[str], weights: List[float], queries: int,
+                clients: int, delay_s: float, ttl: int) -> dict:
+    upstream = StandInUpstream(UPSTREAM_PORT, delay_s, ttl)
+    with tempfile.NamedTemporaryFile("w", suffix=".conf") as conf:
+        conf.write(_dnsmasq_conf(options))
+        conf.flush()
+        proc = subprocess.Popen(["dnsmasq", f"--conf-file={conf.name}"], stderr=subprocess.DEVNULL)
+        try:
+            time.sleep(0.3)
+            latencies: List[float] = []
+            lock = threading.Lock()
+            rng = random.Random(1)
+            stream = rng.choices(names, weights, k=queries)
+
+            def client(part: List[str]) -> None:
+                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                s.settimeout(2.0)
+                local = []
+                for i, name in enumerate(part):
+                    t0 = time.perf_counter()
+                    s.sendto(build_query(i & 0xFFFF, name), ("127.0.0.1", DNSMASQ_PORT))
+                    try:
+                        s.recvfrom(512)
+                    except socket.timeout:
+                        continue
+                    local.append(time.perf_counter() - t0)
+                with lock:
+                    latencies.extend(local)
+
+            threads = [threading.Thread(target=client, args=(stream[i::clients],)) for i in range(clients)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            proc.terminate()
+            proc.wait()
+            upstream.close()
+
+    return {
+        "answered": len(latencies),
+        "upstream_queries": upstream.queries,
+        "hit_rate": round(1 - upstream.queries / max(1, len(latencies)), 3),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--queries", type=int, default=10000)
+    ap.add_argument("--names", type=int, default=3000, help="distinct names in the workload")
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--delay-ms", type=float, default=25.0, help="stand-in upstream latency")
+    ap.add_argument("--ttl", type=int, default=60, help="TTL the stand-in hands out")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    if not shutil.which("dnsmasq"):
+        print("needs the dnsmasq binary", file=sys.stderr)
+        return 2
+
+    names = [f"host{i}.example{i % 97}.test" for i in range(args.names)]
+    weights = [1.0 / (i + 1) for i in range(args.names)]  # Zipf, s=1
+
+    tuned = dns_cache_options(AppConfig())
+    variants = {
+        "dnsmasq defaults": [],
+        "hamster-fi": tuned,
+    }
+    results = {}
+    for name, options in variants.items():
+        results[name] = run_variant(options, names, weights, args.queries, args.clients, args.delay_ms / 1000, args.ttl)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'variant':<18} {'hit rate':>8} {'p50 ms':>8} {'p99 ms':>8} {'upstream':>9}")
+        for name, r in results.items():
+            print(f"{name:<18} {r['hit_rate']:>8.1%} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['upstream_queries']:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
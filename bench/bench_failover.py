@@ -0,0 +1,121 @@
+"""
+WAN failover timing on the scripted fake Pi: an AP with wan.failover on
+(eth0 primary / wlan0 backup, and the other way round) is applied, the
+monitor runs against it, and the primary uplink fails in three ways:
+
+    gateway   the gateway stops answering; link and lease stay up
+    internet  the gateway answers but failover.target is unreachable behind it
+    carrier   cable pulled / association lost (dhcpcd drops the lease)
+
+"outage s" runs from the failure to the metric-50 default route being on the
+backup (masquerade moves just before it, QoS right after); "detect ms" and
+"switch ms" are the monitor's own numbers, switch including QoS. "failback s"
+runs from the primary coming back to the route returning to it
+(failover.failback_s of it is the hold-down).
+
+    python3 bench/bench_failover.py
+    python3 bench/bench_failover.py -n 3 --detect-ms 500 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("HAMSTERFI_CONFIG", os.path.join(tempfile.mkdtemp(), "config.yaml"))
+
+from bench_apply import UPSTREAM, _cfg  # noqa: E402
+from hamsterfi.system.apply import apply  # noqa: E402
+from hamsterfi.system.failover import Monitor  # noqa: E402
+from hamsterfi.system.fake import FakeSystem  # noqa: E402
+from hamsterfi.system.host import use_host  # noqa: E402
+
+FAULTS = ("gateway", "internet", "carrier")
+
+
+def _preferred(pi: FakeSystem) -> str:
+    return next((r.dev for r in pi.routes if r.metric == 50), "")
+
+
+def _until(pi: FakeSystem, cond, limit_s: float) -> float:
+    t0 = pi.clock()
+    while not cond() and pi.clock() - t0 < limit_s:
+        pi.sleep(0.005)
+    return pi.clock() - t0
+
+
+def _fail(pi: FakeSystem, fault: str, dev: str, down: bool) -> None:
+    if fault == "carrier":
+        pi.set_carrier(dev, not down)
+    else:
+        pi.gateway_down(dev, down, internet_only=fault == "internet")
+
+
+def run(scale: float, detect_ms: int, failback_s: int) -> dict:
+    out = {}
+    for primary in ("eth0", "wlan0"):
+        backup = "wlan0" if primary == "eth0" else "eth0"
+        cfg = _cfg("ap", primary)
+        cfg.wan.upstream_ssid, cfg.wan.upstream_psk = UPSTREAM
+        cfg.wan.failover.enabled = True
+        cfg.wan.failover.detect_ms = detect_ms
+        cfg.wan.failover.failback_s = failback_s
+        with FakeSystem(scale=scale) as pi, use_host(pi):
+            apply(cfg)
+            # let the backup's lease come in
+            _until(pi, lambda: any(r.dev == backup for r in pi.routes), 10)
+            monitor = Monitor(pi, config=lambda: cfg)
+            stop = threading.Event()
+            thread = threading.Thread(target=monitor.run, args=(stop,), daemon=True)
+            thread.start()
+            try:
+                pi.sleep(1)
+                for fault in FAULTS:
+                    seen = len(monitor.events)
+                    _fail(pi, fault, primary, True)
+                    outage = _until(pi, lambda: _preferred(pi) == backup, 10)
+                    _until(pi, lambda: len(monitor.events) > seen, 5)
+                    event = monitor.events[-1] if len(monitor.events) > seen else {}
+                    _fail(pi, fault, primary, False)
+                    failback = _until(pi, lambda: _preferred(pi) == primary, failback_s + 30)
+                    out[f"{primary} {fault}"] = {
+                        "outage_s": outage, "detect_ms": event.get("detect_ms"),
+                        "switch_ms": event.get("switch_ms"), "failback_s": failback,
+                    }
+                    pi.sleep(1)
+            finally:
+                stop.set()
+                thread.join()
+                monitor.close()
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--repeat", type=int, default=1)
+    ap.add_argument("--scale", type=float, default=0.05, help="real seconds per simulated second")
+    ap.add_argument("--detect-ms", type=int, default=600)
+    ap.add_argument("--failback-s", type=int, default=3)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    runs = [run(args.scale, args.detect_ms, args.failback_s) for _ in range(args.repeat)]
+    results = {
+        case: {k: (round(statistics.median(vals), 2) if vals else None)
+               for k in row for vals in [[r[case][k] for r in runs if r[case][k] is not None]]}
+        for case, row in runs[0].items()
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'case':<16} {'outage s':>8} {'detect ms':>9} {'switch ms':>9} {'failback s':>10}")
+    for case, r in results.items():
+        print(f"{case:<16} {r['outage_s']:>8.2f} {r['detect_ms'] or '-':>9} {r['switch_ms'] or '-':>9} {r['failback_s']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
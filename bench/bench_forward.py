@@ -0,0 +1,395 @@
+"""
+Forwarding throughput and latency through the rendered router config, per
+feature set (flowtable, WAN balancing).
+
+Builds three network namespaces on the local box joined by veth pairs. The
+router namespace gets the rendered nftables ruleset and router sysctls (plus
+balance.py's rules and tables when balancing) and forwards from a LAN client
+to a sink that sits behind both uplinks, as the internet would:
+
+    hf-lan [cl0 192.168.4.10] -- [lan0 192.168.4.1] hf-rtr [eth0  192.168.1.2] -- [up0 192.168.1.1] hf-wan [lo 10.99.0.1]
+                                                           [wlan0 192.168.2.2] -- [up1 192.168.2.1]
+
+eth0 holds the metric-50 default route and wlan0 the metric-5000 one, like
+an AP with failover. Per variant:
+
+    Mbit/s   TCP, --streams connections of bulk data
+    kpps     UDP, --streams flows of --size byte datagrams sent flat out;
+             "loss" is the share of them the sink never saw
+    p50..p99 UDP echo round trips, one probe at a time over --streams flows
+
+Sysctls the router namespace can't set (net.core.*, conntrack table size:
+init namespace only) are skipped. Needs root, `ip`, `nft` and `sysctl`. The
+load generator is plain Python sockets, so absolute numbers are lower than
+iperf3's; compare variants and commits with each other on the same box.
+
+    sudo python3 bench/bench_forward.py
+    sudo python3 bench/bench_forward.py --only baseline --only flowtable --seconds 5
+    sudo python3 bench/bench_forward.py --json > fwd.json     # save a baseline
+    sudo python3 bench/bench_forward.py --baseline fwd.json   # exit 1 on regressions
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from hamsterfi.core.models import AppConfig  # noqa: E402
+from hamsterfi.system import balance  # noqa: E402
+from hamsterfi.system.apply import _router_sysctl_conf  # noqa: E402
+from hamsterfi.system.render import render_fastpath, render_nft  # noqa: E402
+
+NS_LAN, NS_RTR, NS_WAN = "hf-lan", "hf-rtr", "hf-wan"
+LAN_IP, CLIENT_IP, SINK_IP = "192.168.4.1", "192.168.4.10", "10.99.0.1"
+# router address, gateway (hf-wan end) and route metric per uplink
+UPLINKS = {
+    "eth0": ("192.168.1.2", "192.168.1.1", 50),
+    "wlan0": ("192.168.2.2", "192.168.2.1", 5000),
+}
+TCP_PORT, UDP_PORT, ECHO_PORT = 5201, 5202, 5203
+CHUNK = 256 * 1024
+
+
+def _ip(*args: str, ns: str = "", check: bool = True) -> None:
+    cmd = ["ip", "-n", ns, *args] if ns else ["ip", *args]
+    subprocess.run(cmd, check=check, stderr=None if check else subprocess.DEVNULL)
+
+
+def _in_ns(ns: str, cmd: list, **kw) -> subprocess.CompletedProcess:
+    return subprocess.run(["ip", "netns", "exec", ns, *cmd], **kw)
+
+
+def _role_cmd(role: str, *args: str) -> list:
+    return [sys.executable, os.path.abspath(__file__), "--role", role, *args]
+
+
+class Rig:
+    """The three namespaces and their veth links; removed again on exit."""
+
+    def __init__(self) -> None:
+        self.rules = []
+
+    def __enter__(self) -> "Rig":
+        self.close()
+        for ns in (NS_LAN, NS_RTR, NS_WAN):
+            _ip("netns", "add", ns)
+            _ip("link", "set", "lo", "up", ns=ns)
+        _ip("link", "add", "lan0", "netns", NS_RTR, "type", "veth", "peer", "cl0", "netns", NS_LAN)
+        links = [(NS_LAN, "cl0", f"{CLIENT_IP}/24"), (NS_RTR, "lan0", f"{LAN_IP}/24")]
+        for i, (dev, (addr, gw, _)) in enumerate(UPLINKS.items()):
+            _ip("link", "add", dev, "netns", NS_RTR, "type", "veth", "peer", f"up{i}", "netns", NS_WAN)
+            links += [(NS_RTR, dev, f"{addr}/24"), (NS_WAN, f"up{i}", f"{gw}/24")]
+        for ns, dev, addr in links:
+            _ip("addr", "add", addr, "dev", dev, ns=ns)
+            _ip("link", "set", dev, "up", ns=ns)
+        _ip("addr", "add", f"{SINK_IP}/32", "dev", "lo", ns=NS_WAN)
+        _ip("route", "add", "default", "via", LAN_IP, ns=NS_LAN)
+        for dev, (_, gw, metric) in UPLINKS.items():
+            _ip("route", "add", "default", "via", gw, "dev", dev, "metric", str(metric), ns=NS_RTR)
+        return self
+
+    def load(self, cfg: AppConfig) -> None:
+        """Ruleset, sysctls and policy routing for cfg, replacing the previous variant's."""
+        # two transactions, as on the Pi: the firewall, then the flowtable (or its removal)
+        for render in (render_nft, render_fastpath):
+            with tempfile.NamedTemporaryFile("w", suffix=".nft") as f:
+                f.write(render(cfg, wan_if="eth0", lan_if="lan0"))
+                f.flush()
+                _in_ns(NS_RTR, ["nft", "-f", f.name], check=True)
+        # after the ruleset: the net.netfilter keys appear once conntrack is loaded
+        with tempfile.NamedTemporaryFile("w", suffix=".conf") as f:
+            f.write(_router_sysctl_conf(cfg))
+            f.flush()
+            _in_ns(NS_RTR, ["sysctl", "-q", "-e", "-p", f.name], stderr=subprocess.DEVNULL)
+        for r in self.rules:
+            _ip("rule", "del", "priority", str(r.priority), ns=NS_RTR)
+        self.rules = balance.rules(cfg)
+        for r in self.rules:
+            args = ["rule", "add", "priority", str(r.priority)]
+            if r.fwmark is not None:
+                args += ["fwmark", str(r.fwmark)]
+            args += ["lookup", str(r.table)]
+            if r.suppress_prefixlength is not None:
+                args += ["suppress_prefixlength", str(r.suppress_prefixlength)]
+            _ip(*args, ns=NS_RTR)
+        for m in balance.members(cfg):
+            _ip("route", "replace", "default", "via", UPLINKS[m.dev][1], "dev", m.dev,
+                "table", str(m.table), ns=NS_RTR)
+
+    def close(self) -> None:
+        for ns in (NS_LAN, NS_RTR, NS_WAN):
+            subprocess.run(["ip", "netns", "del", ns], stderr=subprocess.DEVNULL)
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# -- load generator roles (run inside a namespace via `ip netns exec`) ----
+
+
+def _sink() -> None:
+    """TCP drain on TCP_PORT and UDP echo on ECHO_PORT, until killed."""
+    srv = socket.create_server(("0.0.0.0", TCP_PORT), backlog=64)
+    echo = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # replies from 0.0.0.0 would leave with the uplink's address and miss the client's connected socket
+    echo.bind((SINK_IP, ECHO_PORT))
+
+    def drain(conn: socket.socket) -> None:
+        buf = bytearray(CHUNK)
+        with conn:
+            while conn.recv_into(buf):
+                pass
+
+    def reflect() -> None:
+        while True:
+            data, addr = echo.recvfrom(2048)
+            echo.sendto(data, addr)
+
+    threading.Thread(target=reflect, daemon=True).start()
+    print("ready", flush=True)
+    while True:
+        conn, _ = srv.accept()
+        threading.Thread(target=drain, args=(conn,), daemon=True).start()
+
+
+def _udp_sink(seconds: float) -> None:
+    """Count datagrams on UDP_PORT until the flood has been quiet for a moment."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(("0.0.0.0", UDP_PORT))
+    buf = bytearray(2048)
+    packets = nbytes = 0
+    first = last = 0.0
+    sock.settimeout(seconds + 5)
+    print("ready", flush=True)
+    try:
+        while True:
+            n = sock.recv_into(buf)
+            last = time.monotonic()
+            if not packets:
+                first = last
+                sock.settimeout(0.5)
+            packets += 1
+            nbytes += n
+    except socket.timeout:
+        pass
+    print(json.dumps({"packets": packets, "bytes": nbytes, "seconds": last - first}))
+
+
+def _tcp_source(seconds: float, streams: int) -> None:
+    total = [0] * streams
+    payload = memoryview(b"\0" * CHUNK)
+    deadline = time.monotonic() + seconds
+
+    def send(i: int) -> None:
+        with socket.create_connection((SINK_IP, TCP_PORT), timeout=5) as s:
+            while time.monotonic() < deadline:
+                s.sendall(payload)
+                total[i] += CHUNK
+
+    t0 = time.monotonic()
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(streams)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(json.dumps({"bytes": sum(total), "seconds": time.monotonic() - t0}))
+
+
+def _udp_source(seconds: float, streams: int, size: int) -> None:
+    # one connected socket per flow: distinct source ports, so balancing spreads them
+    socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(streams)]
+    for s in socks:
+        s.connect((SINK_IP, UDP_PORT))
+    payload = b"\0" * size
+    sent = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for s in socks:
+            try:
+                s.send(payload)
+                sent += 1
+            except OSError:
+                pass  # ENOBUFS: the local queue is full, that packet never left
+    print(json.dumps({"sent": sent}))
+
+
+def _ping(probes: int, streams: int) -> None:
+    socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(streams)]
+    for s in socks:
+        s.connect((SINK_IP, ECHO_PORT))
+        s.settimeout(0.2)
+    rtts = []
+    for seq in range(probes):
+        s = socks[seq % streams]
+        t0 = time.monotonic()
+        s.send(struct.pack("!I", seq))
+        try:
+            while struct.unpack("!I", s.recv(64)[:4])[0] != seq:
+                pass  # a late reply to an earlier probe
+        except socket.timeout:
+            continue
+        rtts.append(time.monotonic() - t0)
+    print(json.dumps({"rtts": rtts, "probes": probes}))
+
+
+# -- driver ----------------------------------------------------------------
+
+
+def _run(ns: str, role: str, *args: str) -> dict:
+    res = _in_ns(ns, _role_cmd(role, *args), check=True, capture_output=True, text=True)
+    return json.loads(res.stdout)
+
+
+def _spawn(ns: str, role: str, *args: str) -> subprocess.Popen:
+    proc = subprocess.Popen(["ip", "netns", "exec", ns, *_role_cmd(role, *args)], stdout=subprocess.PIPE, text=True)
+    proc.stdout.readline()  # "ready"
+    return proc
+
+
+def _tcp(args) -> float:
+    out = _run(NS_LAN, "tcp-source", "--seconds", str(args.seconds), "--streams", str(args.streams))
+    return out["bytes"] * 8 / out["seconds"] / 1e6
+
+
+def _udp(args) -> tuple:
+    sink = _spawn(NS_WAN, "udp-sink", "--seconds", str(args.seconds))
+    try:
+        sent = _run(NS_LAN, "udp-source", "--seconds", str(args.seconds), "--streams", str(args.streams),
+                    "--size", str(args.size))["sent"]
+        got = json.loads(sink.communicate(timeout=args.seconds + 10)[0])
+    finally:
+        sink.kill()
+        sink.wait()
+    pps = got["packets"] / got["seconds"] if got["seconds"] else 0.0
+    return pps, 1 - got["packets"] / sent if sent else 0.0
+
+
+def _latency(args) -> dict:
+    out = _run(NS_LAN, "ping", "--probes", str(args.probes), "--streams", str(args.streams))
+    rtts = sorted(out["rtts"])
+    if len(rtts) < 2:
+        return {"p50_us": None, "p90_us": None, "p99_us": None, "lost": out["probes"] - len(rtts)}
+    q = statistics.quantiles(rtts, n=100)
+    return {"p50_us": round(q[49] * 1e6), "p90_us": round(q[89] * 1e6), "p99_us": round(q[98] * 1e6),
+            "lost": out["probes"] - len(rtts)}
+
+
+def _variant(flowtable: bool = False, balancing: bool = False) -> AppConfig:
+    cfg = AppConfig()
+    cfg.wan.device = "eth0"
+    cfg.firewall.flowtable = flowtable
+    cfg.wan.balance.enabled = balancing
+    return cfg
+
+
+VARIANTS = {
+    "baseline": lambda: _variant(),
+    "flowtable": lambda: _variant(flowtable=True),
+    # flows spread 1:1 over eth0 and wlan0 by ct mark
+    "balance": lambda: _variant(balancing=True),
+    "balance+ft": lambda: _variant(flowtable=True, balancing=True),
+}
+
+
+def measure(rig: Rig, name: str, args) -> dict:
+    rig.load(VARIANTS[name]())
+    tcp = [_tcp(args) for _ in range(args.repeat)]
+    udp = [_udp(args) for _ in range(args.repeat)]
+    return {
+        "mbit_s": round(statistics.median(tcp), 1),
+        "kpps": round(statistics.median(p for p, _ in udp) / 1e3, 1),
+        "loss": round(statistics.median(lost for _, lost in udp), 3),
+        **_latency(args),
+        "runs_mbit_s": [round(r, 1) for r in tcp],
+    }
+
+
+def _regressions(results: dict, base: dict, tolerance: float) -> list:
+    failed = []
+    for name, r in results.items():
+        b = base.get(name)
+        if not b:
+            continue
+        for key in ("mbit_s", "kpps"):
+            if r[key] < b[key] * (1 - tolerance):
+                failed.append(f"{name}: {key} {b[key]} -> {r[key]}")
+        # p50 only: the tail is mostly the scheduler on a busy box
+        if r["p50_us"] and b.get("p50_us") and r["p50_us"] > b["p50_us"] * (1 + tolerance) + 10:
+            failed.append(f"{name}: p50 {b['p50_us']}us -> {r['p50_us']}us")
+    return failed
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--role", choices=["sink", "udp-sink", "tcp-source", "udp-source", "ping"], help=argparse.SUPPRESS)
+    ap.add_argument("--seconds", type=float, default=3.0)
+    ap.add_argument("--streams", type=int, default=2, help="TCP connections / UDP flows")
+    ap.add_argument("--size", type=int, default=64, help="UDP payload bytes")
+    ap.add_argument("--probes", type=int, default=2000, help="latency probes per variant")
+    ap.add_argument("-n", "--repeat", type=int, default=3)
+    ap.add_argument("--only", choices=list(VARIANTS), action="append")
+    ap.add_argument("--json", action="store_true")
+    ap.add_argument("--baseline", help="JSON from an earlier --json run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed throughput drop / p50 growth (fraction)")
+    args = ap.parse_args()
+
+    if args.role == "sink":
+        _sink()
+    elif args.role == "udp-sink":
+        _udp_sink(args.seconds)
+    elif args.role == "tcp-source":
+        _tcp_source(args.seconds, args.streams)
+    elif args.role == "udp-source":
+        _udp_source(args.seconds, args.streams, args.size)
+    elif args.role == "ping":
+        _ping(args.probes, args.streams)
+    if args.role:
+        return 0
+
+    if os.geteuid() != 0 or not all(shutil.which(t) for t in ("ip", "nft", "sysctl")):
+        print("needs root, iproute2, nftables and sysctl", file=sys.stderr)
+        return 2
+
+    results = {}
+    with Rig() as rig:
+        sink = _spawn(NS_WAN, "sink")
+        try:
+            for name in args.only or list(VARIANTS):
+                results[name] = measure(rig, name, args)
+        finally:
+            sink.kill()
+            sink.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        first = next(iter(results.values()))
+        print(f"{'variant':<12} {'Mbit/s':>8} {'x':>5} {'kpps':>7} {'loss':>6} {'p50 us':>7} {'p90 us':>7} {'p99 us':>7}")
+        for name, r in results.items():
+            print(
+                f"{name:<12} {r['mbit_s']:>8.1f} {r['mbit_s'] / first['mbit_s']:>5.2f} {r['kpps']:>7.1f} "
+                f"{r['loss']:>6.1%} {r['p50_us'] or '-':>7} {r['p90_us'] or '-':>7} {r['p99_us'] or '-':>7}"
+            )
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    failed = _regressions(results, base, args.tolerance)
+    for msg in failed:
+        print(f"REGRESSION {msg}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
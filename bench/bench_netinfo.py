@@ -0,0 +1,65 @@
+"""
+Cost of one network snapshot: /sys + /proc readers vs. the old `ip` subprocesses.
+
+    python3 bench/bench_netinfo.py [-n 200]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from hamsterfi.core.netinfo import brief_addrs, brief_links, brief_routes, read_snapshot  # noqa: E402
+from hamsterfi.system.net import ipv4_addrs  # noqa: E402
+
+
+def via_ip() -> None:
+    for cmd in (["ip", "-br", "link"], ["ip", "-br", "addr"], ["ip", "route"]):
+        subprocess.check_output(cmd, text=True, stderr=subprocess.STDOUT, timeout=10)
+
+
+def via_netinfo() -> None:
+    snap = read_snapshot(ipv4_addrs)
+    brief_links(snap)
+    brief_addrs(snap)
+    brief_routes(snap)
+
+
+def timeit(fn, n: int) -> list:
+    fn()  # warm up caches / imports
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def report(name: str, samples: list) -> None:
+    samples = sorted(samples)
+    p50 = statistics.median(samples) * 1e3
+    p95 = samples[int(len(samples) * 0.95) - 1] * 1e3
+    print(f"{name:<10} p50={p50:8.3f} ms  p95={p95:8.3f} ms  n={len(samples)}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=200)
+    args = ap.parse_args()
+
+    nf = timeit(via_netinfo, args.n)
+    report("netinfo", nf)
+    try:
+        ip = timeit(via_ip, args.n)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"ip         skipped: {e}")
+        return
+    report("ip", ip)
+    print(f"speedup    {statistics.median(ip) / statistics.median(nf):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
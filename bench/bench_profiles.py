@@ -0,0 +1,95 @@
+"""
+Profile switch latency on the scripted fake Pi: activating a pre-rendered
+profile vs saving the same config and applying it from scratch (resolve
+wlan.channel: auto, scanning if needed; render; plan).
+
+Profiles: "home" (AP on 5 GHz, channel auto), "cafe" (AP on 2.4 GHz, channel
+auto, other SSID) and "dorm" (station). Each switch starts from the previous
+profile running with its leases in. "switch s" runs until apply and the
+first post-apply health check are done.
+
+    python3 bench/bench_profiles.py
+    python3 bench/bench_profiles.py -n 3 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("HAMSTERFI_CONFIG", os.path.join(tempfile.mkdtemp(), "config.yaml"))
+
+from bench_apply import _cfg  # noqa: E402
+from hamsterfi.core.config import save_config  # noqa: E402
+from hamsterfi.system import profiles  # noqa: E402
+from hamsterfi.system.apply import activate_profile, apply  # noqa: E402
+from hamsterfi.system.fake import FakeSystem  # noqa: E402
+from hamsterfi.system.host import use_host  # noqa: E402
+
+
+def _profiles() -> dict:
+    home = _cfg("ap", "eth0", channel="auto")
+    home.wlan.band = "5"
+    home.wlan.ssid = "Home"
+    cafe = _cfg("ap", "eth0", channel="auto")
+    cafe.wlan.ssid = "Cafe"
+    return {"home": home, "cafe": cafe, "dorm": _cfg("station", "wlan0")}
+
+
+SWITCHES = [("home", "cafe"), ("cafe", "home"), ("home", "dorm"), ("dorm", "home")]
+
+
+def run(scale: float) -> dict:
+    cfgs = _profiles()
+    out = {}
+    with FakeSystem(scale=scale) as pi, use_host(pi):
+        for name, cfg in cfgs.items():
+            profiles.save(name, cfg)
+        for src, dst in SWITCHES:
+            row = {}
+            for variant in ("prebuilt", "render"):
+                activate_profile(src)
+                pi.sleep(pi.delays["dhcp"] * 2)
+                pi.reset_counters()
+                t0 = time.monotonic()
+                if variant == "prebuilt":
+                    plan = activate_profile(dst)["summary"]
+                else:
+                    save_config(cfgs[dst])
+                    p = apply(cfgs[dst])
+                    plan = "full" if p.full else f"{len(p.actions)} steps"
+                row[variant] = {"switch_s": (time.monotonic() - t0) / scale, "subprocesses": len(pi.calls), "plan": plan}
+            out[f"{src} -> {dst}"] = row
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--repeat", type=int, default=1)
+    ap.add_argument("--scale", type=float, default=0.02, help="real seconds per simulated second")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    runs = [run(args.scale) for _ in range(args.repeat)]
+    results = {
+        switch: {
+            variant: dict(r, switch_s=round(statistics.median(x[switch][variant]["switch_s"] for x in runs), 2))
+            for variant, r in row.items()
+        }
+        for switch, row in runs[0].items()
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'switch':<14} {'variant':<9} {'switch s':>8} {'procs':>5}  plan")
+    for switch, row in results.items():
+        for variant, r in row.items():
+            print(f"{switch:<14} {variant:<9} {r['switch_s']:>8.2f} {r['subprocesses']:>5}  {r['plan']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Cold start of the socket-activated web UI: time from "systemd starts the
+service" to the first complete response, and the resident size afterwards.
+
+Does what systemd does: the bench binds and listens on a socket itself,
+connects and sends the request straight away (the kernel queues it in the
+backlog), then starts `uvicorn --fd` on the inherited socket. Each run is a
+fresh interpreter, with the template bytecode cache either empty or
+precompiled (`python -m hamsterfi.core.templating`, as the installer does).
+
+    python3 bench/bench_startup.py
+    python3 bench/bench_startup.py --path /wizard -n 5 --json
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _env(tmp: str, cache: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT,
+        "HAMSTERFI_CONFIG": os.path.join(tmp, "config.yaml"),
+        "HAMSTERFI_TEMPLATE_CACHE": cache,
+        # no background survey scans, no idle exit while measuring
+        "HAMSTERFI_CHANNEL_SURVEY_S": "0",
+        "HAMSTERFI_IDLE_EXIT_MIN": "0",
+    })
+    return env
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def cold_request(path: str, env: dict, timeout: float = 30.0) -> dict:
+    lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    lsock.bind(("127.0.0.1", 0))
+    lsock.listen(16)
+    port = lsock.getsockname()[1]
+
+    t0 = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "hamsterfi.main:app", "--fd", str(lsock.fileno()),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env, pass_fds=(lsock.fileno(),),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    lsock.close()
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=timeout) as c:
+            c.sendall(f"GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n".encode())
+            data = b""
+            first = None
+            while True:
+                chunk = c.recv(65536)
+                if not chunk:
+                    break
+                if first is None:
+                    first = time.monotonic() - t0
+                data += chunk
+        done = time.monotonic() - t0
+        rss = _rss_kb(proc.pid)
+    finally:
+        proc.terminate()
+        try:
+            _, err = proc.communicate(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            _, err = proc.communicate()
+    status = data.split(b" ", 2)[1].decode() if data.startswith(b"HTTP/") else "?"
+    if status == "?" and err:
+        sys.stderr.write(err.decode(errors="replace")[-2000:])
+    return {"first_byte_s": first or done, "response_s": done, "rss_mb": rss / 1024, "status": status}
+
+
+def import_time(module: str, env: dict) -> dict:
+    code = (
+        "import sys, time; t = time.perf_counter(); import {m}; d = time.perf_counter() - t; "
+        "print(d, int('hamsterfi.system.apply' in sys.modules))"
+    ).format(m=module)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    secs, planner = out.stdout.split()
+    return {"import_s": float(secs), "planner_loaded": planner == "1"}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--repeat", type=int, default=5)
+    ap.add_argument("--path", default="/")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="hamsterfi-startup-")
+    try:
+        cache = os.path.join(tmp, "jinja")
+        env = _env(tmp, cache)
+        results = {"import hamsterfi.main": import_time("hamsterfi.main", env)}
+        for variant in ("cold cache", "precompiled"):
+            runs = []
+            for _ in range(args.repeat):
+                shutil.rmtree(cache, ignore_errors=True)
+                if variant == "precompiled":
+                    subprocess.run([sys.executable, "-m", "hamsterfi.core.templating"],
+                                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+                runs.append(cold_request(args.path, env))
+            results[variant] = {
+                "first_byte_s": round(statistics.median(r["first_byte_s"] for r in runs), 3),
+                "response_s": round(statistics.median(r["response_s"] for r in runs), 3),
+                "rss_mb": round(statistics.median(r["rss_mb"] for r in runs), 1),
+                "status": runs[-1]["status"],
+            }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    imp = results.pop("import hamsterfi.main")
+    print(f"import hamsterfi.main: {imp['import_s']:.3f}s, planner loaded: {'yes' if imp['planner_loaded'] else 'no'}")
+    print(f"GET {args.path}, cold process:")
+    print(f"{'variant':<12} {'first byte s':>12} {'response s':>10} {'RSS MB':>7}  status")
+    for variant, r in results.items():
+        print(f"{variant:<12} {r['first_byte_s']:>12.3f} {r['response_s']:>10.3f} {r['rss_mb']:>7.1f}  {r['status']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Requests per second for GET /wizard, with the cached config snapshot and with
+the old parse-and-validate-every-time loader.
+
+Drives the ASGI app in-process (no server, no HTTP client), so the numbers
+are the handler + template cost only.
+
+    python3 bench/bench_wizard.py [-n 2000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("HAMSTERFI_CONFIG", os.path.join(tempfile.mkdtemp(), "config.yaml"))
+
+import yaml  # noqa: E402
+
+import hamsterfi.main as main  # noqa: E402
+from hamsterfi.core import config  # noqa: E402
+from hamsterfi.core.models import AppConfig  # noqa: E402
+
+
+def uncached_snapshot() -> AppConfig:
+    with open(config.CONFIG_PATH, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    return AppConfig.model_validate(data)
+
+
+async def get(path: str) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(msg):
+        nonlocal status
+        if msg["type"] == "http.response.start":
+            status = msg["status"]
+
+    await main.app(scope, receive, send)
+    return status
+
+
+async def rps(n: int) -> float:
+    assert await get("/wizard") == 200
+    t0 = time.perf_counter()
+    for _ in range(n):
+        await get("/wizard")
+    return n / (time.perf_counter() - t0)
+
+
+def main_() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=2000)
+    args = ap.parse_args()
+
+    config.save_config(AppConfig())
+
+    cached = main.config_snapshot
+    main.config_snapshot = uncached_snapshot
+    before = asyncio.run(rps(args.n))
+    main.config_snapshot = cached
+    after = asyncio.run(rps(args.n))
+
+    print(f"uncached  {before:8.0f} req/s")
+    print(f"cached    {after:8.0f} req/s  ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main_()
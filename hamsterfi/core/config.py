@@ -1,23 +1,117 @@
+import fcntl
 import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
 import yaml
 from .models import AppConfig
 
 CONFIG_PATH = os.environ.get("HAMSTERFI_CONFIG", "/etc/hamster-fi/config.yaml")
 
+# (st_ino, st_mtime_ns, st_size) of the file the cached snapshot was parsed from
+_StatKey = Tuple[int, int, int]
+_cache: Optional[Tuple[_StatKey, AppConfig]] = None
+_cache_lock = threading.Lock()
+
+
 def ensure_dirs() -> None:
     os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
 
-def load_config() -> AppConfig:
+
+@contextmanager
+def _locked() -> Iterator[None]:
+    # the config file itself is replaced by rename, so lock a sidecar that stays put
     ensure_dirs()
-    if not os.path.exists(CONFIG_PATH):
-        cfg = AppConfig()
-        save_config(cfg)
-        return cfg
-    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f) or {}
-    return AppConfig.model_validate(data)
+    with open(CONFIG_PATH + ".lock", "a") as lf:
+        fcntl.flock(lf, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lf, fcntl.LOCK_UN)
+
+
+def _stat_key() -> Optional[_StatKey]:
+    try:
+        st = os.stat(CONFIG_PATH)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _write(cfg: AppConfig) -> None:
+    d = os.path.dirname(CONFIG_PATH)
+    fd, tmp = tempfile.mkstemp(prefix=".config.", suffix=".yaml", dir=d)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            yaml.safe_dump(cfg.model_dump(), f, sort_keys=False)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(CONFIG_PATH):
+            os.chmod(tmp, os.stat(CONFIG_PATH).st_mode & 0o777)
+        else:
+            os.chmod(tmp, 0o644)
+        os.replace(tmp, CONFIG_PATH)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    # make the rename itself durable
+    dfd = os.open(d, os.O_RDONLY)
+    try:
+        os.fsync(dfd)
+    finally:
+        os.close(dfd)
+
+
+def config_snapshot() -> AppConfig:
+    """
+    Validated config shared by every caller until the file changes on disk.
+    Treat it as read-only; use load_config() to get a copy you can modify.
+    """
+    global _cache
+    key = _stat_key()
+    with _cache_lock:
+        if key is not None and _cache is not None and _cache[0] == key:
+            return _cache[1]
+
+    with _locked():
+        key = _stat_key()
+        if key is None:
+            cfg = AppConfig()
+            _write(cfg)
+            key = _stat_key()
+        else:
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                data = yaml.safe_load(f) or {}
+            cfg = AppConfig.model_validate(data)
+    with _cache_lock:
+        _cache = (key, cfg)
+    return cfg
+
+
+def load_config() -> AppConfig:
+    return config_snapshot().model_copy(deep=True)
+
 
 def save_config(cfg: AppConfig) -> None:
-    ensure_dirs()
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        yaml.safe_dump(cfg.model_dump(), f, sort_keys=False)
+    global _cache
+    with _locked():
+        _write(cfg)
+        key = _stat_key()
+    with _cache_lock:
+        _cache = (key, cfg.model_copy(deep=True))
+
+
+def remove_config() -> None:
+    global _cache
+    with _locked():
+        try:
+            os.remove(CONFIG_PATH)
+        except FileNotFoundError:
+            pass
+    with _cache_lock:
+        _cache = None
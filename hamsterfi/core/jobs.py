@@ -0,0 +1,152 @@
+"""
+Background jobs (apply, the periodic channel survey) with an in-memory
+progress log.
+
+Jobs of one kind run one at a time, in submission order. A job that is still
+queued absorbs later submissions of the same work (same kind and key; the key
+defaults to the kind), since it has not read the config yet and will pick up
+the latest version anyway. Other work of that kind, like a rollback or a
+profile switch queued behind an apply, gets a key of its own and still runs.
+"""
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+# finished jobs kept around for /api/jobs/{id}
+JOBS_KEEP = int(os.environ.get("HAMSTERFI_JOBS_KEEP", "20"))
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    key: str = ""
+    state: str = "queued"  # queued -> running -> succeeded | failed
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    result: Any = None
+    events: List[dict] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _seq: "itertools.count[int]" = field(default_factory=itertools.count, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("succeeded", "failed")
+
+    def emit(self, event: str, **data: Any) -> None:
+        with self._lock:
+            self.events.append({"seq": next(self._seq), "ts": time.time(), "event": event, **data})
+
+    def events_since(self, seq: int) -> List[dict]:
+        with self._lock:
+            return self.events[seq:]
+
+    def describe(self) -> dict:
+        with self._lock:
+            events = list(self.events)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "key": self.key,
+            "state": self.state,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "result": self.result,
+            "events": events,
+        }
+
+
+class JobManager:
+    def __init__(self, keep: int = JOBS_KEEP) -> None:
+        self.keep = keep
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+
+    def submit(self, kind: str, fn: Callable[[Job], Any], key: Optional[str] = None) -> Job:
+        """Queue fn behind the other `kind` jobs; a queued job with the same key is returned instead."""
+        key = key or kind
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == kind and job.key == key and job.state == "queued":
+                    return job
+            job = Job(id=uuid.uuid4().hex[:12], kind=kind, key=key)
+            self._jobs[job.id] = job
+            self._trim()
+            pool = self._pools.get(kind)
+            if pool is None:
+                pool = self._pools[kind] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"job-{kind}")
+        job.emit("queued")
+        pool.submit(self._run, job, fn)
+        return job
+
+    def every(self, kind: str, interval_s: float, fn: Callable[[Job], Any]) -> None:
+        """Submit `fn` as a `kind` job every interval_s (first run after one interval)."""
+        def loop() -> None:
+            while True:
+                time.sleep(interval_s)
+                self.submit(kind, fn)
+
+        threading.Thread(target=loop, name=f"every-{kind}", daemon=True).start()
+
+    def latest(self, kind: str) -> Optional[Job]:
+        """Most recent finished job of `kind`."""
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.kind == kind and job.done:
+                    return job
+        return None
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]) -> None:
+        job.started = time.time()
+        job.state = "running"
+        job.emit("running")
+        try:
+            job.result = fn(job)
+            job.state = "succeeded"
+        except Exception as e:
+            job.error = str(e) or e.__class__.__name__
+            job.state = "failed"
+        job.finished = time.time()
+        job.emit(job.state, error=job.error)
+
+    def _trim(self) -> None:
+        done = [j.id for j in self._jobs.values() if j.done]
+        for jid in done[: max(0, len(self._jobs) - self.keep)]:
+            del self._jobs[jid]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self, kind: str) -> Optional[Job]:
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.kind == kind and not job.done:
+                    return job
+        return None
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_jobs() -> JobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -0,0 +1,182 @@
+"""
+Timing spans and Prometheus-text metrics, stdlib only.
+
+Spans (apply steps, external commands, status sources) go into a bounded ring
+that `/api/trace` returns; histograms and counters are rendered by
+`render()` for `/metrics`.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+TRACE_SPANS = int(os.environ.get("HAMSTERFI_TRACE_SPANS", "512"))
+
+# seconds; apply steps range from a few ms (netlink) to tens of seconds (association, DHCP)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+APPLY_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90, 120)
+
+
+@dataclass
+class Span:
+    kind: str  # "apply", "step", "cmd", "wait", "status"
+    name: str
+    start: float
+    duration: float = 0.0
+    exit_code: Optional[int] = None
+    bytes_out: Optional[int] = None
+    bytes_err: Optional[int] = None
+    error: Optional[str] = None
+    attrs: Dict[str, str] = field(default_factory=dict)
+
+
+_spans: "deque[Span]" = deque(maxlen=TRACE_SPANS)
+_spans_lock = threading.Lock()
+
+
+def record(s: Span) -> None:
+    with _spans_lock:
+        _spans.append(s)
+    SPANS_RECORDED.inc(s.kind)
+
+
+def recent_spans(kind: Optional[str] = None) -> List[dict]:
+    with _spans_lock:
+        spans = list(_spans)
+    return [asdict(s) for s in spans if kind is None or s.kind == kind]
+
+
+@contextmanager
+def span(kind: str, name: str, **attrs: str) -> Iterator[Span]:
+    s = Span(kind=kind, name=name, start=time.time(), attrs=attrs)
+    t0 = time.monotonic()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = str(e) or e.__class__.__name__
+        raise
+    finally:
+        s.duration = time.monotonic() - t0
+        record(s)
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[values] = self._values.get(values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                out.append(f"{self.name}{_labels(self.labels, key)} {_num(v)}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS) -> None:
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *values: str) -> None:
+        with self._lock:
+            counts, total, n = self._series.get(values) or ([0] * len(self.buckets), 0.0, 0)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    counts[i] += 1
+            self._series[values] = (counts, total + value, n + 1)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._series.items()):
+                for b, c in zip(self.buckets, counts):
+                    le = 'le="%s"' % _num(b)
+                    out.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {c}")
+                inf = 'le="+Inf"'
+                out.append(f"{self.name}_bucket{_labels(self.labels, key, inf)} {n}")
+                out.append(f"{self.name}_sum{_labels(self.labels, key)} {_num(total)}")
+                out.append(f"{self.name}_count{_labels(self.labels, key)} {n}")
+        return out
+
+
+APPLY_SECONDS = Histogram(
+    "hamsterfi_apply_duration_seconds", "Wall time of apply runs.", ["mode", "plan", "result"], APPLY_BUCKETS
+)
+STEP_SECONDS = Histogram("hamsterfi_apply_step_duration_seconds", "Duration of apply steps.", ["step", "result"])
+COMMAND_SECONDS = Histogram(
+    "hamsterfi_command_duration_seconds", "Duration of external commands.", ["command", "result"]
+)
+STATUS_SECONDS = Histogram("hamsterfi_status_collect_duration_seconds", "Latency of a full status collection.")
+STATUS_SOURCE_SECONDS = Histogram(
+    "hamsterfi_status_source_duration_seconds", "Latency of each status source.", ["source"]
+)
+SPANS_RECORDED = Counter("hamsterfi_trace_spans_total", "Spans recorded, by kind.", ["kind"])
+
+METRICS = [APPLY_SECONDS, STEP_SECONDS, COMMAND_SECONDS, STATUS_SECONDS, STATUS_SOURCE_SECONDS, SPANS_RECORDED]
+
+
+def command_name(cmd: Sequence[str]) -> str:
+    """Low-cardinality label: the program plus its verb, e.g. "systemctl restart", "nft -f"."""
+    if not cmd:
+        return ""
+    prog = os.path.basename(cmd[0])
+    if len(cmd) > 1 and prog in ("systemctl", "nft", "ip", "iw", "dhcpcd", "dhclient", "nmcli", "sysctl"):
+        verb = cmd[1]
+        # "iw dev wlan0 link" -> "iw link"
+        if prog == "iw" and verb == "dev" and len(cmd) > 3:
+            verb = cmd[3]
+        return f"{prog} {verb}"
+    return prog
+
+
+def record_command(cmd: Sequence[str], start: float, duration: float, exit_code: Optional[int],
+                   stdout: Optional[str] = None, stderr: Optional[str] = None,
+                   error: Optional[str] = None) -> None:
+    s = Span(
+        kind="cmd",
+        name=" ".join(cmd)[:200],
+        start=start,
+        duration=duration,
+        exit_code=exit_code,
+        bytes_out=len(stdout.encode()) if stdout is not None else None,
+        bytes_err=len(stderr.encode()) if stderr is not None else None,
+        error=error,
+    )
+    record(s)
+    ok = exit_code == 0 and error is None
+    COMMAND_SECONDS.observe(duration, command_name(cmd), "ok" if ok else "error")
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in METRICS:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional, Union
 from pydantic import BaseModel, Field
 
 Mode = Literal["ap", "station", "bridge"]
@@ -10,13 +10,30 @@ class WanStatic(BaseModel):
     gateway: str = "192.168.1.1"
     dns: List[str] = Field(default_factory=lambda: ["1.1.1.1", "8.8.8.8"])
 
+class FailoverConfig(BaseModel):
+    # AP mode only: the other interface is kept addressed as a backup uplink (DHCP) and
+    # hamsterfi-failover moves the default route to it when `device` stops passing traffic
+    enabled: bool = False
+    target: str = "1.1.1.1"  # pinged through each uplink, next to an ARP probe of its gateway
+    interval_ms: int = 200
+    detect_ms: int = 600  # probes failing this long = down; losing carrier is down at once
+    failback_s: int = 10  # how long `device` has to be healthy again before moving back
+
+class BalanceConfig(BaseModel):
+    # AP mode only: both interfaces stay addressed (like the failover backup) and new LAN flows
+    # are spread over the healthy ones by weight; a flow keeps the uplink it started on
+    enabled: bool = False
+    weights: Dict[WanDevice, int] = Field(default_factory=lambda: {"eth0": 1, "wlan0": 1})
+
 class WanConfig(BaseModel):
     device: WanDevice = "eth0"
     ipv4: IPv4Mode = "dhcp"
     static: WanStatic = Field(default_factory=WanStatic)
-    # used when device=wlan0 and joining upstream Wi‑Fi
+    # used when device=wlan0 and joining upstream Wi‑Fi (or wlan0 is the failover backup)
     upstream_ssid: Optional[str] = None
     upstream_psk: Optional[str] = None
+    failover: FailoverConfig = Field(default_factory=FailoverConfig)
+    balance: BalanceConfig = Field(default_factory=BalanceConfig)
 
 class DhcpConfig(BaseModel):
     enabled: bool = True
@@ -33,12 +50,51 @@ class WlanConfig(BaseModel):
     ssid: str = "HamsterNet"
     psk: str = "hamster12345"
     country: str = "UA"
-    channel: int = 6
+    # "auto": picked from a scan of the band below when apply has no channel yet
+    channel: Union[int, Literal["auto"]] = 6
+    band: Literal["2.4", "5"] = "2.4"
+    # MHz; "auto" = 20 on 2.4 GHz, the widest the country allows on 5 GHz
+    channel_width: Literal["auto", 20, 40, 80] = "auto"
+
+class DnsConfig(BaseModel):
+    cache_size: int = 10000
+    min_cache_ttl: int = 300  # dnsmasq caps this at 3600
+    all_servers: bool = True  # ask every upstream at once, use the first answer
+    negative_cache: bool = True
+    negative_ttl: int = 60  # for NXDOMAIN/NODATA answers that carry no SOA
+    # "wan": servers from the WAN's DHCP lease (resolv.conf) or wan.static.dns; "custom": `servers`
+    upstream: Literal["wan", "custom"] = "wan"
+    servers: List[str] = Field(default_factory=list)
 
 class FirewallConfig(BaseModel):
     enabled: bool = True
     allow_admin_from_lan: bool = True
     allow_ssh_from_lan: bool = True
+    # offload established WAN<->LAN flows to an nftables flowtable (software fast path)
+    flowtable: bool = False
+
+class TuningConfig(BaseModel):
+    # spread packet processing for the interfaces the mode uses across cores
+    enabled: bool = True
+    rps: bool = True  # RPS + RFS on receive queues
+    xps: bool = True  # transmit queue -> core mapping (multi-queue NICs only)
+    irq_affinity: bool = True
+    threaded_napi: bool = True
+    gro: bool = True
+    gso: bool = True
+    # use the first N online cores; None = all of them
+    cpus: Optional[int] = None
+
+class PerformanceConfig(BaseModel):
+    # conntrack and buffer sysctls are sized from these (see system/sizing.py)
+    expected_clients: int = 25
+    memory_budget_mb: int = 64
+
+class QosConfig(BaseModel):
+    # set the rates a little (5-10%) below what the line really delivers; 0 leaves that direction alone
+    enabled: bool = False
+    up_kbit: int = 0
+    down_kbit: int = 0
 
 class AppConfig(BaseModel):
     mode: Mode = "ap"
@@ -46,3 +102,7 @@ class AppConfig(BaseModel):
     lan: LanConfig = Field(default_factory=LanConfig)
     wlan: WlanConfig = Field(default_factory=WlanConfig)
     firewall: FirewallConfig = Field(default_factory=FirewallConfig)
+    dns: DnsConfig = Field(default_factory=DnsConfig)
+    tuning: TuningConfig = Field(default_factory=TuningConfig)
+    performance: PerformanceConfig = Field(default_factory=PerformanceConfig)
+    qos: QosConfig = Field(default_factory=QosConfig)
@@ -0,0 +1,255 @@
+"""
+Link, address, route and sysctl state read straight from /sys and /proc.
+
+Everything here is plain file reads, so it is cheap enough to call on every
+request and has no dependencies outside the stdlib. IPv4 addresses are
+exposed nowhere under /proc or /sys: the caller passes `ipv4`, a dump of
+them (status uses hamsterfi.system.net.ipv4_addrs, one RTM_GETADDR over the
+netlink backend). Without one, or when it returns None, the SIOCGIFADDR ioctl
+is the fallback; it only sees each interface's primary address.
+"""
+import fcntl
+import os
+import socket
+import struct
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+
+SYS_NET = "/sys/class/net"
+PROC_NET = "/proc/net"
+PROC_SYS = "/proc/sys"
+
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891B
+
+# () -> {ifname: ["192.168.50.1/24", ...]}, or None when it can't tell
+AddrDump = Callable[[], Optional[Dict[str, List[str]]]]
+
+RTF_UP = 0x1
+RTF_GATEWAY = 0x2
+
+SYSCTLS = [
+    "net/ipv4/ip_forward",
+    "net/ipv4/conf/all/rp_filter",
+    "net/netfilter/nf_conntrack_count",
+    "net/netfilter/nf_conntrack_max",
+]
+
+
+@dataclass
+class LinkInfo:
+    name: str
+    operstate: str = "unknown"
+    carrier: Optional[bool] = None
+    mac: str = ""
+    mtu: int = 0
+    up: bool = False
+    master: Optional[str] = None
+    ipv4: List[str] = field(default_factory=list)
+    ipv6: List[str] = field(default_factory=list)
+    rx_bytes: int = 0
+    rx_packets: int = 0
+    tx_bytes: int = 0
+    tx_packets: int = 0
+
+
+@dataclass
+class RouteInfo:
+    iface: str
+    destination: str
+    gateway: Optional[str] = None
+    metric: int = 0
+
+    @property
+    def is_default(self) -> bool:
+        return self.destination == "0.0.0.0/0"
+
+
+@dataclass
+class NetSnapshot:
+    links: List[LinkInfo] = field(default_factory=list)
+    routes: List[RouteInfo] = field(default_factory=list)
+    sysctl: Dict[str, Optional[str]] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def link(self, name: str) -> Optional[LinkInfo]:
+        for l in self.links:
+            if l.name == name:
+                return l
+        return None
+
+    def conntrack(self) -> Optional[Dict[str, int]]:
+        """Current vs maximum conntrack entries; None until nf_conntrack is loaded."""
+        count = self.sysctl.get("net.netfilter.nf_conntrack_count")
+        limit = self.sysctl.get("net.netfilter.nf_conntrack_max")
+        if count is None or not limit:
+            return None
+        used, total = _int(count), _int(limit)
+        return {"count": used, "max": total, "percent": round(100 * used / total, 1) if total else 0}
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _int(text: Optional[str], default: int = 0) -> int:
+    try:
+        return int(text or "")
+    except ValueError:
+        return default
+
+
+def _counters() -> Dict[str, List[int]]:
+    # /proc/net/dev: "  eth0: rx_bytes rx_packets ... (8 rx cols) tx_bytes tx_packets ..."
+    out = {}
+    txt = _read(f"{PROC_NET}/dev") or ""
+    for ln in txt.splitlines()[2:]:
+        name, _, rest = ln.partition(":")
+        cols = [int(x) for x in rest.split()]
+        if len(cols) >= 10:
+            out[name.strip()] = cols
+    return out
+
+
+def _ipv4(sock: socket.socket, name: str) -> List[str]:
+    req = struct.pack("256s", name.encode()[:15])
+    try:
+        addr = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, req)[20:24]
+        mask = fcntl.ioctl(sock.fileno(), SIOCGIFNETMASK, req)[20:24]
+    except OSError:
+        return []
+    plen = bin(struct.unpack("!I", mask)[0]).count("1")
+    return [f"{socket.inet_ntoa(addr)}/{plen}"]
+
+
+def _ipv6() -> Dict[str, List[str]]:
+    # /proc/net/if_inet6: "fe80000000000000022ccffffef0a882 04 40 20 80 ap0"
+    out: Dict[str, List[str]] = {}
+    txt = _read(f"{PROC_NET}/if_inet6") or ""
+    for ln in txt.splitlines():
+        parts = ln.split()
+        if len(parts) < 6:
+            continue
+        addr = socket.inet_ntop(socket.AF_INET6, bytes.fromhex(parts[0]))
+        out.setdefault(parts[5], []).append(f"{addr}/{int(parts[2], 16)}")
+    return out
+
+
+def read_links(ipv4: Optional[AddrDump] = None) -> List[LinkInfo]:
+    try:
+        names = sorted(os.listdir(SYS_NET))
+    except OSError:
+        return []
+
+    counters = _counters()
+    v4 = ipv4() if ipv4 is not None else None
+    v6 = _ipv6()
+    links = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for name in names:
+            base = f"{SYS_NET}/{name}"
+            link = LinkInfo(name=name)
+            link.operstate = _read(f"{base}/operstate") or "unknown"
+            carrier = _read(f"{base}/carrier")
+            link.carrier = None if carrier is None else carrier == "1"
+            link.mac = _read(f"{base}/address") or ""
+            link.mtu = _int(_read(f"{base}/mtu"))
+            flags = _read(f"{base}/flags")
+            link.up = bool(int(flags, 16) & 0x1) if flags else False
+            try:
+                link.master = os.path.basename(os.readlink(f"{base}/master"))
+            except OSError:
+                link.master = None
+            link.ipv4 = v4.get(name, []) if v4 is not None else _ipv4(sock, name)
+            link.ipv6 = v6.get(name, [])
+            c = counters.get(name)
+            if c:
+                link.rx_bytes, link.rx_packets = c[0], c[1]
+                link.tx_bytes, link.tx_packets = c[8], c[9]
+            links.append(link)
+    return links
+
+
+def _hex_ip(h: str) -> str:
+    return socket.inet_ntoa(struct.pack("<I", int(h, 16)))
+
+
+def read_routes() -> List[RouteInfo]:
+    # /proc/net/route: Iface Destination Gateway Flags RefCnt Use Metric Mask ...  (little-endian hex)
+    routes = []
+    txt = _read(f"{PROC_NET}/route") or ""
+    for ln in txt.splitlines()[1:]:
+        parts = ln.split()
+        if len(parts) < 8:
+            continue
+        flags = int(parts[3], 16)
+        if not flags & RTF_UP:
+            continue
+        plen = bin(int(parts[7], 16)).count("1")
+        r = RouteInfo(iface=parts[0], destination=f"{_hex_ip(parts[1])}/{plen}", metric=int(parts[6]))
+        if flags & RTF_GATEWAY:
+            r.gateway = _hex_ip(parts[2])
+        routes.append(r)
+    return sorted(routes, key=lambda r: (not r.is_default, r.metric))
+
+
+def read_sysctls(keys: List[str] = SYSCTLS) -> Dict[str, Optional[str]]:
+    return {k.replace("/", "."): _read(f"{PROC_SYS}/{k}") for k in keys}
+
+
+def read_snapshot(ipv4: Optional[AddrDump] = None) -> NetSnapshot:
+    return NetSnapshot(links=read_links(ipv4), routes=read_routes(), sysctl=read_sysctls())
+
+
+def brief_links(snap: NetSnapshot) -> str:
+    """Text in the spirit of `ip -br link`, for the status page."""
+    rows = []
+    for l in snap.links:
+        state = l.operstate.upper()
+        master = f" master {l.master}" if l.master else ""
+        rows.append(f"{l.name:<16} {state:<14} {l.mac:<17} mtu {l.mtu}{master}")
+    return "\n".join(rows)
+
+
+def brief_addrs(snap: NetSnapshot) -> str:
+    """Text in the spirit of `ip -br addr`."""
+    rows = []
+    for l in snap.links:
+        state = l.operstate.upper()
+        addrs = " ".join(l.ipv4 + l.ipv6)
+        rows.append(f"{l.name:<16} {state:<14} {addrs}".rstrip())
+    return "\n".join(rows)
+
+
+def brief_routes(snap: NetSnapshot) -> str:
+    rows = []
+    for r in snap.routes:
+        dest = "default" if r.is_default else r.destination
+        via = f" via {r.gateway}" if r.gateway else ""
+        metric = f" metric {r.metric}" if r.metric else ""
+        rows.append(f"{dest}{via} dev {r.iface}{metric}")
+    return "\n".join(rows)
+
+
+if __name__ == "__main__":
+    # the CLI (hamsterfi-diag) wires in the netlink dump the way status does
+    from hamsterfi.system.net import ipv4_addrs
+
+    snap = read_snapshot(ipv4_addrs)
+    if "--json" in sys.argv[1:]:
+        import json
+
+        print(json.dumps(snap.to_dict(), indent=2))
+    else:
+        print(brief_links(snap))
+        print()
+        print(brief_addrs(snap))
+        print()
+        print(brief_routes(snap))
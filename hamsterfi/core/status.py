@@ -1,22 +1,141 @@
-import subprocess
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
 
-def _run(cmd: list[str]) -> str:
-    return subprocess.check_output(cmd, text=True, stderr=subprocess.STDOUT)
+from hamsterfi.core import metrics
+from hamsterfi.core.netinfo import brief_addrs, brief_links, brief_routes, read_snapshot
+from hamsterfi.system.host import get_host
+from hamsterfi.system.net import ipv4_addrs
 
-def status_snapshot() -> dict:
-    out = {}
-    for k, cmd in {
-        "ip_link": ["ip", "-br", "link"],
-        "ip_addr": ["ip", "-br", "addr"],
-        "ip_route": ["ip", "route"],
-        "iw_wlan0": ["bash", "-lc", "iw dev wlan0 link 2>/dev/null || true"],
-        "iw_ap0": ["bash", "-lc", "iw dev ap0 info 2>/dev/null || true"],
-        "nft": ["bash", "-lc", "nft list ruleset 2>/dev/null | head -n 120 || true"],
-        "dnsmasq": ["bash", "-lc", "systemctl is-active dnsmasq || true"],
-        "hostapd": ["bash", "-lc", "systemctl is-active hostapd || true"],
-    }.items():
+STATUS_TTL_S = float(os.environ.get("HAMSTERFI_STATUS_TTL", "5"))
+# stop the background refresher when nobody has looked at the status for this long
+STATUS_IDLE_S = float(os.environ.get("HAMSTERFI_STATUS_IDLE", "60"))
+NFT_MAX_LINES = 120
+
+
+def _run_quiet(cmd: list[str]) -> str:
+    # stdout only, exit code ignored (what "2>/dev/null || true" used to do); the host records the command
+    try:
+        return get_host().run(cmd, capture=True, timeout=10).stdout or ""
+    except Exception:
+        return ""
+
+
+def _nft() -> str:
+    lines = _run_quiet(["nft", "list", "ruleset"]).splitlines()
+    return "\n".join(lines[:NFT_MAX_LINES])
+
+
+def _services() -> Dict[str, str]:
+    names = ["dnsmasq", "hostapd"]
+    states = _run_quiet(["systemctl", "is-active"] + names).splitlines()
+    return {n: (states[i].strip() if i < len(states) else "unknown") for i, n in enumerate(names)}
+
+
+def _net() -> Dict[str, Any]:
+    snap = read_snapshot(ipv4_addrs)
+    return {"net": snap, "ip_link": brief_links(snap), "ip_addr": brief_addrs(snap), "ip_route": brief_routes(snap)}
+
+
+# each source returns {field: value}; they run concurrently
+SOURCES: Dict[str, Callable[[], Dict[str, Any]]] = {
+    "net": _net,
+    "iw_wlan0": lambda: {"iw_wlan0": _run_quiet(["iw", "dev", "wlan0", "link"])},
+    "iw_ap0": lambda: {"iw_ap0": _run_quiet(["iw", "dev", "ap0", "info"])},
+    "nft": lambda: {"nft": _nft()},
+    "services": _services,
+}
+
+
+class StatusCollector:
+    """
+    Collects all sources in parallel and keeps the result in memory. Readers
+    never wait on subprocesses once the first collection is done; a refresher
+    thread re-collects every ttl_s while somebody keeps reading.
+    """
+
+    def __init__(self, sources: Dict[str, Callable[[], Dict[str, Any]]], ttl_s: float = STATUS_TTL_S,
+                 idle_s: float = STATUS_IDLE_S) -> None:
+        self.sources = sources
+        self.ttl_s = ttl_s
+        self.idle_s = idle_s
+        self._fields: Dict[str, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="status")
+        self._refresher: Optional[threading.Thread] = None
+        self._collected_at = 0.0
+        self._last_read = 0.0
+
+    @staticmethod
+    def _timed(name: str, fn: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        t0 = time.monotonic()
         try:
-            out[k] = _run(cmd).strip()
-        except Exception as e:
-            out[k] = f"ERROR: {e}"
-    return out
+            return fn()
+        finally:
+            metrics.STATUS_SOURCE_SECONDS.observe(time.monotonic() - t0, name)
+
+    def refresh(self) -> None:
+        with self._refresh_lock, metrics.span("status", "collect"):
+            t0 = time.monotonic()
+            futures = {name: self._pool.submit(self._timed, name, fn) for name, fn in self.sources.items()}
+            for name, fut in futures.items():
+                try:
+                    values = {k: v.strip() if isinstance(v, str) else v for k, v in fut.result().items()}
+                except Exception as e:
+                    values = {name: f"ERROR: {e}"}
+                now = time.time()
+                with self._lock:
+                    for k, v in values.items():
+                        self._fields[k] = (v, now)
+            self._collected_at = time.monotonic()
+            metrics.STATUS_SECONDS.observe(self._collected_at - t0)
+
+    def _refresh_loop(self) -> None:
+        while True:
+            with self._lock:
+                if time.monotonic() - self._last_read >= self.idle_s:
+                    self._refresher = None
+                    return
+            if time.monotonic() - self._collected_at >= self.ttl_s:
+                self.refresh()
+            time.sleep(max(0.05, self.ttl_s - (time.monotonic() - self._collected_at)))
+
+    def _ensure_refresher(self) -> None:
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="status-refresh", daemon=True)
+                self._refresher.start()
+
+    def fields(self) -> Dict[str, dict]:
+        """{field: {"value": text or record, "ts": unix time it was collected}}"""
+        with self._lock:
+            self._last_read = time.monotonic()
+        # first read, or the refresher went idle a while ago: don't serve old data
+        if not self._fields or time.monotonic() - self._collected_at > 2 * self.ttl_s:
+            self.refresh()
+        self._ensure_refresher()
+        with self._lock:
+            return {k: {"value": v, "ts": ts} for k, (v, ts) in self._fields.items()}
+
+
+_collector: Optional[StatusCollector] = None
+_collector_lock = threading.Lock()
+
+
+def get_collector() -> StatusCollector:
+    global _collector
+    with _collector_lock:
+        if _collector is None:
+            _collector = StatusCollector(SOURCES)
+        return _collector
+
+
+def status_fields() -> Dict[str, dict]:
+    return get_collector().fields()
+
+
+def status_snapshot() -> dict:
+    return {k: f["value"] for k, f in status_fields().items()}
@@ -0,0 +1,46 @@
+"""
+Jinja environment for the UI, with compiled templates cached on disk.
+
+Compiling a template (lex, parse, generate Python, compile it) costs more
+than rendering it, and a socket-activated UI pays that again on every cold
+start. FileSystemBytecodeCache keeps the compiled code per template, keyed by
+a checksum of the source, so an edited template is simply recompiled.
+`python -m hamsterfi.core.templating` fills the cache ahead of time (the
+installer runs it); otherwise the first render of each template does.
+"""
+import os
+from typing import List
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+TEMPLATE_CACHE = os.environ.get("HAMSTERFI_TEMPLATE_CACHE", "/var/cache/hamster-fi/jinja")
+
+
+def environment(cache_dir: str = TEMPLATE_CACHE) -> Environment:
+    cache = None
+    if cache_dir:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            cache = FileSystemBytecodeCache(cache_dir)
+        except OSError:
+            cache = None  # read-only or missing: compile in memory as before
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(),
+        bytecode_cache=cache,
+        # templates only change on upgrades, which restart the service anyway
+        auto_reload=False,
+    )
+
+
+def precompile(cache_dir: str = TEMPLATE_CACHE) -> List[str]:
+    env = environment(cache_dir)
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+if __name__ == "__main__":
+    print(f"compiled {len(precompile())} templates into {TEMPLATE_CACHE}")
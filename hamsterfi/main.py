@@ -1,28 +1,135 @@
+import asyncio
+import json
+import os
+import signal
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Optional
+from urllib.parse import quote
+
 import yaml
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import RedirectResponse, HTMLResponse, PlainTextResponse
+from fastapi import FastAPI, HTTPException, Request, Form
+from fastapi.responses import JSONResponse, RedirectResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
-from hamsterfi.core.config import load_config, save_config
+from hamsterfi.core import metrics
+from hamsterfi.core.config import config_snapshot, load_config, save_config
+from hamsterfi.core.jobs import Job, get_jobs
 from hamsterfi.core.models import AppConfig
-from hamsterfi.core.status import status_snapshot
-from hamsterfi.system.apply import apply as apply_system
-from hamsterfi.system.reset import reset_config, factory_defaults
+from hamsterfi.core.templating import environment
+
+# The web UI is socket-activated: systemd starts it on the first connection, so
+# everything below is on the cold path. hamsterfi.system.* (apply, survey,
+# render, reset) and the status collector are imported inside the handlers
+# that need them; a status page view doesn't pay for the planner.
+
+# re-score the air for wlan.channel: auto; 0 (the default) turns the periodic survey off
+CHANNEL_SURVEY_S = float(os.environ.get("HAMSTERFI_CHANNEL_SURVEY_S", "0"))
+# the periodic survey only reads survey dump; 1 lets it scan, which stalls AP clients for seconds
+CHANNEL_SURVEY_SCAN = os.environ.get("HAMSTERFI_CHANNEL_SURVEY_SCAN", "0") == "1"
+# under socket activation, exit after this many idle minutes (the socket stays
+# open and the next connection starts us again); 0 keeps running
+IDLE_EXIT_MIN = float(os.environ.get("HAMSTERFI_IDLE_EXIT_MIN", "10"))
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # background threads only; nothing to tear down, they die with the process
+    _start_channel_survey()
+    _start_idle_exit()
+    yield
+
+
+app = FastAPI(lifespan=_lifespan)
+templates = Jinja2Templates(env=environment())
+
+_inflight = 0
+_last_activity = time.monotonic()
+
+
+class _ActivityMiddleware:
+    """Plain ASGI, so a streamed response (job SSE) counts until its body is done."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        global _inflight, _last_activity
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        _inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _inflight -= 1
+            _last_activity = time.monotonic()
+
+
+app.add_middleware(_ActivityMiddleware)
+
 
-app = FastAPI()
-templates = Jinja2Templates(directory="hamsterfi/templates")
+def _fmt_time(ts: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts))
 
 
 @app.get("/", response_class=HTMLResponse)
-def status(request: Request):
-    cfg = load_config()
-    snap = status_snapshot()
-    return templates.TemplateResponse("status.html", {"request": request, "cfg": cfg, "snap": snap})
+def status(request: Request, job: Optional[str] = None):
+    from hamsterfi.core.status import status_fields
+
+    cfg = config_snapshot()
+    fields = status_fields()
+    snap = {k: f["value"] for k, f in fields.items()}
+    snap_age = int(time.time() - min((f["ts"] for f in fields.values()), default=time.time()))
+    apply_job = get_jobs().get(job) if job else get_jobs().active("apply")
+    failover = None
+    if cfg.mode == "ap" and (cfg.wan.failover.enabled or cfg.wan.balance.enabled):
+        from hamsterfi.system import failover as failover_mod
+
+        failover = failover_mod.status(cfg)
+    return templates.TemplateResponse(
+        "status.html",
+        {"request": request, "cfg": cfg, "snap": snap, "snap_age": snap_age, "job": apply_job,
+         "channel": _channel_recommendation(), "failover": failover, "fmt_time": _fmt_time},
+    )
+
+@app.get("/api/status")
+def api_status():
+    from hamsterfi.core.status import status_fields
+
+    fields = status_fields()
+    out = {k: f["value"] for k, f in fields.items() if k not in ("net", "ip_link", "ip_addr", "ip_route")}
+    net = fields.get("net", {}).get("value")
+    out["net"] = net.to_dict() if hasattr(net, "to_dict") else None
+    out["conntrack"] = net.conntrack() if hasattr(net, "conntrack") else None
+    out["collected_at"] = min((f["ts"] for f in fields.values()), default=None)
+    return out
+
+
+@app.get("/api/failover")
+def api_failover():
+    from hamsterfi.system import failover
+
+    return failover.status(config_snapshot())
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/trace")
+def api_trace(kind: Optional[str] = None):
+    return metrics.recent_spans(kind)
+
 
 @app.get("/wizard", response_class=HTMLResponse)
 def wizard_mode(request: Request):
-    cfg = load_config()
-    return templates.TemplateResponse("wizard_mode.html", {"request": request, "cfg": cfg})
+    from hamsterfi.system import profiles
+
+    cfg = config_snapshot()
+    return templates.TemplateResponse("wizard_mode.html", {"request": request, "cfg": cfg, "profiles": profiles.names()})
 
 
 @app.get("/wizard/mode")
@@ -63,7 +170,7 @@ def wizard_mode_post(mode: str = Form(...)):
 
 @app.get("/wizard/wan", response_class=HTMLResponse)
 def wizard_wan(request: Request):
-    cfg = load_config()
+    cfg = config_snapshot()
     return templates.TemplateResponse("wizard_wan.html", {"request": request, "cfg": cfg})
 
 
@@ -95,9 +202,10 @@ def wizard_wan_post(
         if dns_list:
             cfg.wan.static.dns = dns_list
 
-    need_upstream = (cfg.mode == "station") or (cfg.mode == "ap" and cfg.wan.device == "wlan0")
+    from hamsterfi.system.apply import _follows_uplink
 
-    if need_upstream:
+    # a wlan0 failover backup / balance member needs the upstream network too
+    if cfg.mode == "station" or _follows_uplink(cfg):
         cfg.wan.upstream_ssid = upstream_ssid.strip() or None
         cfg.wan.upstream_psk = upstream_psk.strip() or None
 
@@ -120,7 +228,7 @@ def wizard_wan_post(
 
 @app.get("/wizard/wlan", response_class=HTMLResponse)
 def wizard_wlan(request: Request):
-    cfg = load_config()
+    cfg = config_snapshot()
     return templates.TemplateResponse("wizard_wlan.html", {"request": request, "cfg": cfg})
 
 
@@ -135,13 +243,13 @@ def wizard_wlan_post(ssid: str = Form(...), psk: str = Form(...)):
 
 @app.get("/wizard/review", response_class=HTMLResponse)
 def wizard_review(request: Request):
-    cfg = load_config()
+    cfg = config_snapshot()
     return templates.TemplateResponse("wizard_review.html", {"request": request, "cfg": cfg})
 
 
 @app.get("/advanced", response_class=HTMLResponse)
 def advanced(request: Request):
-    cfg = load_config()
+    cfg = config_snapshot()
     yaml_text = yaml.safe_dump(cfg.model_dump(), sort_keys=False)
     return templates.TemplateResponse("advanced.html", {"request": request, "cfg": cfg, "yaml_text": yaml_text})
 
@@ -156,30 +264,353 @@ def advanced_post(config_yaml: str = Form(...)):
 
 @app.get("/api/config.yaml", response_class=PlainTextResponse)
 def get_config_yaml():
-    cfg = load_config()
+    cfg = config_snapshot()
     return yaml.safe_dump(cfg.model_dump(), sort_keys=False)
 
 
 
 @app.get("/actions/apply")
-def apply_get():
+def apply_get(request: Request, dry_run: int = 0):
+    if dry_run:
+        return apply_now(request, dry_run=dry_run)
     return RedirectResponse("/", status_code=303)
 
 
+def _step_events(job: Job):
+    def on_step(kind: str, action) -> None:
+        job.emit("step", step=action.name, status=kind, detail=action.detail,
+                 duration_s=action.duration, error=action.error)
+    return on_step
+
+
+def _apply_job(job: Job, channel: Optional[int] = None) -> dict:
+    from hamsterfi.core.status import get_collector
+    from hamsterfi.system.apply import apply as apply_system
+
+    # read when the job starts, so a queued job applies the latest saved config
+    cfg = load_config()
+    if channel is not None and cfg.wlan.channel == "auto":
+        # a recommended switch: once hostapd runs on it, "auto" keeps it
+        cfg.wlan.channel = channel
+
+    plan = apply_system(cfg, on_event=_step_events(job))
+    # the cached snapshot predates the apply
+    get_collector().refresh()
+    return plan.describe()
+
+
+def _rollback_job(job: Job, version_id: Optional[int] = None) -> dict:
+    from hamsterfi.core.status import get_collector
+    from hamsterfi.system.apply import rollback
+
+    version, plan, drift = rollback(version_id, on_event=_step_events(job))
+    get_collector().refresh()
+    return dict(plan.describe(), version=version.id, drift=drift)
+
+
 @app.post("/actions/apply")
-def apply_now():
+def apply_now(request: Request, dry_run: int = 0):
+    if dry_run:
+        from hamsterfi.system.apply import apply as apply_system
+
+        return apply_system(load_config(), dry_run=True).describe()
+    job = get_jobs().submit("apply", _apply_job)
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse({"job": job.id, "state": job.state, "url": f"/api/jobs/{job.id}"}, status_code=202)
+    return RedirectResponse(f"/?job={job.id}", status_code=303)
+
+
+def _channel_survey_job(job: Job, scan: bool = CHANNEL_SURVEY_SCAN) -> dict:
+    from hamsterfi.system.apply import _follows_uplink
+    from hamsterfi.system.host import get_host
+    from hamsterfi.system.render import HOSTAPD_PATH
+    from hamsterfi.system.survey import current_channel, recommend
+
     cfg = load_config()
-    apply_system(cfg)
-    return RedirectResponse("/", status_code=303)
+    if cfg.wlan.channel != "auto":
+        return {"skipped": "channel is fixed"}
+    if cfg.mode == "station" or _follows_uplink(cfg):
+        return {"skipped": "no AP channel of its own"}
+    if get_jobs().active("apply"):
+        return {"skipped": "apply in progress"}
+    host = get_host()
+    current = current_channel(host.read_text(HOSTAPD_PATH))
+    rec = recommend(host, cfg.wlan.country, cfg.wlan.band, cfg.wlan.channel_width, current, scan=scan)
+    if rec["switch"]:
+        job.emit("recommend", current=rec["current"], best=rec["best"])
+    return rec
+
+
+def _channel_recommendation() -> Optional[dict]:
+    job = get_jobs().latest("channel-survey")
+    if job is None or not isinstance(job.result, dict) or not job.result.get("switch"):
+        return None
+    from hamsterfi.system.host import get_host
+    from hamsterfi.system.render import HOSTAPD_PATH
+    from hamsterfi.system.survey import current_channel
+
+    if current_channel(get_host().read_text(HOSTAPD_PATH)) == job.result["best"]:
+        return None  # already switched since the survey
+    return dict(job.result, at=job.finished)
+
+
+def _start_channel_survey() -> None:
+    if CHANNEL_SURVEY_S > 0:
+        get_jobs().every("channel-survey", CHANNEL_SURVEY_S, _channel_survey_job)
+
+
+def _idle() -> bool:
+    if _inflight or time.monotonic() - _last_activity < IDLE_EXIT_MIN * 60:
+        return False
+    return not any(j.state in ("queued", "running") for j in get_jobs().list())
+
+
+def _start_idle_exit() -> None:
+    # only when systemd handed us the socket: a uvicorn started by hand stays up
+    if IDLE_EXIT_MIN <= 0 or not os.environ.get("LISTEN_FDS"):
+        return
+
+    def watch() -> None:
+        while True:
+            time.sleep(min(30.0, IDLE_EXIT_MIN * 15))
+            if _idle():
+                # uvicorn shuts down cleanly on SIGTERM; the socket unit keeps listening
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+
+    threading.Thread(target=watch, name="idle-exit", daemon=True).start()
+
+
+@app.get("/api/channel")
+def api_channel():
+    job = get_jobs().latest("channel-survey")
+    return {"survey": job.describe() if job else None, "recommendation": _channel_recommendation()}
+
+
+@app.post("/actions/channel/survey")
+def channel_survey_now(request: Request, scan: bool = False):
+    # ?scan=1: a one-off active scan, asked for by hand
+    job = get_jobs().submit("channel-survey", partial(_channel_survey_job, scan=scan), key="scan" if scan else None)
+    return JSONResponse({"job": job.id, "state": job.state, "url": f"/api/jobs/{job.id}"}, status_code=202)
+
+
+@app.post("/actions/channel/switch")
+def channel_switch(request: Request):
+    rec = _channel_recommendation()
+    if rec is None:
+        raise HTTPException(status_code=409, detail="no channel switch recommended")
+    job = get_jobs().submit("apply", partial(_apply_job, channel=rec["best"]), key=f"channel {rec['best']}")
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse({"job": job.id, "state": job.state, "url": f"/api/jobs/{job.id}"}, status_code=202)
+    return RedirectResponse(f"/?job={job.id}", status_code=303)
+
+
+def _profile_job(job: Job, name: str) -> dict:
+    from hamsterfi.core.status import get_collector
+    from hamsterfi.system.apply import activate_profile
+
+    res = activate_profile(name, on_event=_step_events(job))
+    get_collector().refresh()
+    return res
+
+
+@app.get("/profiles", response_class=HTMLResponse)
+def profiles_page(request: Request, error: Optional[str] = None):
+    from hamsterfi.system import profiles
+
+    cfg = config_snapshot()
+    return templates.TemplateResponse(
+        "profiles.html",
+        {"request": request, "profiles": [profiles.describe(n, cfg) for n in profiles.names()], "error": error},
+    )
+
+
+@app.get("/api/profiles")
+def api_profiles():
+    from hamsterfi.system import profiles
+
+    cfg = config_snapshot()
+    return {"active": profiles.active(), "profiles": [profiles.describe(n, cfg) for n in profiles.names()]}
+
+
+@app.post("/actions/profiles")
+def profile_save(request: Request, name: str = Form(...)):
+    """Save the current config as profile `name`, validated and pre-rendered."""
+    from hamsterfi.system import profiles
+
+    try:
+        m = profiles.save(name.strip(), load_config())
+    except (ValueError, RuntimeError) as e:
+        if "application/json" in request.headers.get("accept", ""):
+            raise HTTPException(status_code=400, detail=str(e))
+        return RedirectResponse(f"/profiles?error={quote(str(e))}", status_code=303)
+    if "application/json" in request.headers.get("accept", ""):
+        return {"name": name.strip(), "mode": m.mode, "channel": m.channel, "files": m.files, "render_s": m.render_s}
+    return RedirectResponse("/profiles", status_code=303)
+
+
+@app.post("/actions/profiles/{name}/activate")
+def profile_activate(request: Request, name: str):
+    """Runs as an apply job; its result carries switch_s, the switch latency."""
+    from hamsterfi.system import profiles
+
+    if name not in profiles.names():
+        raise HTTPException(status_code=404, detail="no such profile")
+    job = get_jobs().submit("apply", partial(_profile_job, name=name), key=f"activate {name}")
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse({"job": job.id, "state": job.state, "url": f"/api/jobs/{job.id}"}, status_code=202)
+    return RedirectResponse(f"/?job={job.id}", status_code=303)
+
+
+@app.post("/actions/profiles/{name}/delete")
+def profile_delete(name: str):
+    from hamsterfi.system import profiles
+
+    if name not in profiles.names():
+        raise HTTPException(status_code=404, detail="no such profile")
+    profiles.delete(name)
+    return RedirectResponse("/profiles", status_code=303)
+
+
+def _version_or_404(vid: int):
+    from hamsterfi.system import history
+
+    version = history.get(vid)
+    if version is None:
+        raise HTTPException(status_code=404, detail="no such version")
+    return version
+
+
+@app.get("/history", response_class=HTMLResponse)
+def history_page(request: Request, diff: Optional[int] = None):
+    from hamsterfi.system import history
+
+    index = history.load_index()
+    versions = sorted(index.versions, key=lambda v: v.id, reverse=True)
+    changes = None
+    current = index.get(index.current)
+    if diff is not None and current is not None:
+        changes = history.diff(current, _version_or_404(diff))
+    return templates.TemplateResponse(
+        "history.html",
+        {"request": request, "versions": versions, "current": index.current, "good": index.good,
+         "changes": changes, "fmt_time": _fmt_time},
+    )
+
+
+@app.get("/api/history")
+def api_history():
+    from hamsterfi.system import history
+
+    index = history.load_index()
+    return {"current": index.current, "good": index.good,
+            "versions": [v.describe() for v in sorted(index.versions, key=lambda v: v.id, reverse=True)]}
+
+
+@app.get("/api/history/{vid}")
+def api_history_version(vid: int):
+    from hamsterfi.system import history
+
+    version = _version_or_404(vid)
+    return dict(version.describe(), config=history.config_of(version).model_dump())
+
+
+@app.get("/api/history/{vid}/diff")
+def api_history_diff(vid: int, base: Optional[int] = None):
+    """What reverting to vid would change, compared with base (default: the current version)."""
+    from hamsterfi.system import history
+
+    target = _version_or_404(vid)
+    if base is None:
+        against = history.current()
+        if against is None:
+            raise HTTPException(status_code=404, detail="nothing applied yet")
+    else:
+        against = _version_or_404(base)
+    return history.diff(against, target)
+
+
+def _submit_rollback(request: Request, version_id: Optional[int]):
+    # not absorbed by a queued apply: that one would apply config.yaml, not the version
+    key = f"rollback {version_id if version_id is not None else 'good'}"
+    job = get_jobs().submit("apply", partial(_rollback_job, version_id=version_id), key=key)
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse({"job": job.id, "state": job.state, "url": f"/api/jobs/{job.id}"}, status_code=202)
+    return RedirectResponse(f"/?job={job.id}", status_code=303)
+
+
+@app.post("/actions/history/{vid}/revert")
+def history_revert(request: Request, vid: int):
+    _version_or_404(vid)
+    return _submit_rollback(request, vid)
+
+
+@app.post("/actions/rollback")
+def rollback_last_good(request: Request):
+    from hamsterfi.system import history
+
+    if history.last_good() is None:
+        raise HTTPException(status_code=409, detail="no known-good version yet")
+    return _submit_rollback(request, None)
+
+
+@app.get("/api/jobs")
+def api_jobs():
+    return [{"id": j.id, "kind": j.kind, "state": j.state, "created": j.created} for j in get_jobs().list()]
+
+
+def _job_or_404(job_id: str) -> Job:
+    job = get_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="no such job")
+    return job
+
+
+@app.get("/api/jobs/{job_id}")
+def api_job(job_id: str):
+    return _job_or_404(job_id).describe()
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def api_job_events(job_id: str, request: Request):
+    """Server-Sent Events: one message per job event, ends after the final state."""
+    job = _job_or_404(job_id)
+    start = int(request.headers.get("last-event-id", "-1")) + 1
+
+    async def stream():
+        seq = start
+        idle = 0.0
+        while True:
+            events = job.events_since(seq)
+            for ev in events:
+                yield f"id: {ev['seq']}\nevent: {ev['event']}\ndata: {json.dumps(ev)}\n\n"
+                seq = ev["seq"] + 1
+                if ev["event"] in ("succeeded", "failed"):
+                    return
+            if events:
+                idle = 0.0
+            elif idle >= 15:
+                yield ": keepalive\n\n"
+                idle = 0.0
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(0.2)
+            idle += 0.2
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @app.post("/actions/reset")
 def do_reset():
+    from hamsterfi.system.reset import reset_config
+
     reset_config()
     return RedirectResponse("/", status_code=303)
 
 
 @app.post("/actions/factory")
 def do_factory():
+    from hamsterfi.system.reset import factory_defaults
+
     factory_defaults()
     return RedirectResponse("/", status_code=303)
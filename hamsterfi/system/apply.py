@@ -1,109 +1,166 @@
 import os
-import shutil
-import subprocess
+import threading
 import time
-from typing import Iterable, List, Optional, Tuple
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
 
+from hamsterfi.core import metrics
+from hamsterfi.core.config import save_config
 from hamsterfi.core.models import AppConfig
+from hamsterfi.system import balance, history, profiles
 from hamsterfi.system.render import (
     HOSTAPD_PATH,
     DNSMASQ_PATH,
+    FASTPATH_PATH,
     NFT_PATH,
     WPA_SUPPLICANT_WLAN0,
     render_hostapd,
     render_dnsmasq,
+    render_fastpath,
     render_nft,
     render_wpa_supplicant,
 )
+from hamsterfi.system.dag import StepListener, run_graph
+from hamsterfi.system.failover import FAILOVER_SERVICE, FAILOVER_UNIT, render_failover_unit, uplinks
+from hamsterfi.system.events import RTMGRP_IPV4_IFADDR, RTMGRP_IPV4_ROUTE
+from hamsterfi.system.host import Host, get_host
+from hamsterfi.system.net import NetBackend, Rule
+from hamsterfi.system.nft import OWNED_TABLES, delete_tables_cmd, legacy_tables
+from hamsterfi.system.sizing import perf_sysctls
+from hamsterfi.system.snapshot import (
+    BOOT_SERVICE,
+    BOOT_SNAPSHOT,
+    BOOT_UNIT,
+    BootSnapshot,
+    config_digest,
+    file_digest,
+    render_boot_unit,
+)
+from hamsterfi.system.qos import QOS_SCRIPT, QOS_SERVICE, QOS_UNIT, render_qos, render_qos_unit
+from hamsterfi.system.tuning import TUNE_SCRIPT, TUNE_SERVICE, TUNE_UNIT, render_tuning, render_tuning_unit
+from hamsterfi.system.survey import candidates, current_channel, pick_channel
+from hamsterfi.system.wifi import channel_plan
+from hamsterfi.system.plan import (
+    Action,
+    DesiredState,
+    LiveState,
+    Plan,
+    changed_files,
+    effective_wan,
+    read_live_state,
+    service_changes,
+    topology_mismatches,
+)
 
 UI_PORT = int(os.environ.get("HAMSTERFI_UI_PORT", "8080"))
+APPLY_WORKERS = int(os.environ.get("HAMSTERFI_APPLY_WORKERS", "4"))
 DHCPCD_DROPIN = "/etc/dhcpcd.conf.d/hamster-fi.conf"
+DHCPCD_BRIDGE_DROPIN = "/etc/dhcpcd.conf.d/99-hamsterfi-bridge.conf"
+SYSCTL_CONF = "/etc/sysctl.d/99-hamster-fi.conf"
+NFTABLES_CONF = "/etc/nftables.conf"
+# the net.netfilter sysctls only exist once nf_conntrack is loaded, also at boot
+MODULES_CONF = "/etc/modules-load.d/hamster-fi.conf"
+# how long the post-apply health check waits for the plan to come back empty
+HEALTH_WAIT_S = float(os.environ.get("HAMSTERFI_HEALTH_WAIT_S", "10"))
 
+# bumped by every apply: a health check still waiting on an older one gives up
+_generation = 0
 
-def _have(cmd: str) -> bool:
-    return shutil.which(cmd) is not None
 
+def _host() -> Host:
+    return get_host()
 
-def _run(cmd: List[str], check: bool = True) -> subprocess.CompletedProcess:
-    return subprocess.run(cmd, check=check, text=True, capture_output=True)
 
+def _net() -> NetBackend:
+    return _host().net()
 
-def _out(cmd: List[str]) -> str:
-    return subprocess.check_output(cmd, text=True)
 
+def _have(cmd: str) -> bool:
+    return _host().which(cmd)
 
-def _write(path: str, content: str) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
 
+def _run(cmd: List[str], check: bool = True):
+    return _host().run(cmd, check=check, capture=True)
 
-def _sysctl_set(key: str, value: str) -> None:
-    subprocess.run(["sysctl", "-w", f"{key}={value}"], check=False)
 
+def _out(cmd: List[str]) -> str:
+    return _host().out(cmd)
 
-def _enable_router_sysctls() -> None:
-    _sysctl_set("net.ipv4.ip_forward", "1")
-    _sysctl_set("net.ipv4.conf.all.rp_filter", "0")
-    _sysctl_set("net.ipv4.conf.default.rp_filter", "0")
 
-    os.makedirs("/etc/sysctl.d", exist_ok=True)
-    _write(
-        "/etc/sysctl.d/99-hamster-fi.conf",
+def _write(path: str, content: str) -> None:
+    _host().write_text(path, content)
+
+
+def _router_sysctl_conf(cfg: AppConfig) -> str:
+    perf = cfg.performance
+    sized = "".join(f"{k}={v}\n" for k, v in perf_sysctls(perf).items())
+    return (
         "net.ipv4.ip_forward=1\n"
         "net.ipv4.conf.all.rp_filter=0\n"
-        "net.ipv4.conf.default.rp_filter=0\n",
+        "net.ipv4.conf.default.rp_filter=0\n"
+        f"# sized for {perf.expected_clients} clients, {perf.memory_budget_mb} MiB\n"
+        + sized
     )
 
 
+def _enable_router_sysctls(cfg: AppConfig) -> None:
+    _write(SYSCTL_CONF, _router_sysctl_conf(cfg))
+    _write(MODULES_CONF, _modules_conf())
+    _load_router_sysctls()
+
+
 def _write_resolv(dns_list: Iterable[str]) -> None:
     _write("/etc/resolv.conf", "".join([f"nameserver {d}\n" for d in dns_list]))
 
 
 def _dhcp_release(iface: str) -> None:
     if _have("dhcpcd"):
-        subprocess.run(["dhcpcd", "-k", iface], check=False)
+        _host().run(["dhcpcd", "-k", iface], check=False)
     if _have("dhclient"):
-        subprocess.run(["dhclient", "-r", iface], check=False)
+        _host().run(["dhclient", "-r", iface], check=False)
     if _have("nmcli"):
-        subprocess.run(["nmcli", "device", "disconnect", iface], check=False)
+        _host().run(["nmcli", "device", "disconnect", iface], check=False)
 
-    subprocess.run(["ip", "route", "del", "default", "dev", iface], check=False)
-    subprocess.run(["ip", "addr", "flush", "dev", iface], check=False)
+    net = _net()
+    with net.batch():
+        net.route_del_default(dev=iface)
+        net.addr_flush(iface)
 
 
 def _dhcp_up(iface: str) -> None:
-    subprocess.run(["ip", "link", "set", iface, "up"], check=False)
+    _net().link_up(iface)
 
     if _have("dhcpcd"):
-        subprocess.run(["dhcpcd", "-k", iface], check=False)
-        subprocess.run(["dhcpcd", "-n", iface], check=False)
-        subprocess.run(["systemctl", "restart", "dhcpcd"], check=False)
+        _host().run(["dhcpcd", "-k", iface], check=False)
+        _host().run(["dhcpcd", "-n", iface], check=False)
+        _host().run(["systemctl", "restart", "dhcpcd"], check=False)
         return
 
     if _have("dhclient"):
-        subprocess.run(["dhclient", "-v", "-r", iface], check=False)
-        subprocess.run(["dhclient", "-v", iface], check=True)
+        _host().run(["dhclient", "-v", "-r", iface], check=False)
+        _host().run(["dhclient", "-v", iface], check=True)
         return
 
     if _have("udhcpc"):
-        subprocess.run(["udhcpc", "-i", iface, "-q", "-f"], check=True)
+        _host().run(["udhcpc", "-i", iface, "-q", "-f"], check=True)
         return
 
     if _have("nmcli"):
-        subprocess.run(["nmcli", "device", "set", iface, "managed", "yes"], check=False)
-        subprocess.run(["nmcli", "device", "disconnect", iface], check=False)
-        subprocess.run(["nmcli", "device", "connect", iface], check=False)
+        _host().run(["nmcli", "device", "set", iface, "managed", "yes"], check=False)
+        _host().run(["nmcli", "device", "disconnect", iface], check=False)
+        _host().run(["nmcli", "device", "connect", iface], check=False)
         return
 
     raise RuntimeError(f"No DHCP client found to configure {iface}.")
 
 
 def _static_up(iface: str, address: str, gateway: str, dns: Iterable[str]) -> None:
-    subprocess.run(["ip", "link", "set", iface, "up"], check=False)
-    subprocess.run(["ip", "addr", "flush", "dev", iface], check=False)
-    subprocess.run(["ip", "addr", "add", address, "dev", iface], check=True)
-    subprocess.run(["ip", "route", "replace", "default", "via", gateway], check=True)
+    net = _net()
+    with net.batch():
+        net.link_up(iface)
+        net.addr_flush(iface)
+        net.addr_add(iface, address)
+        net.route_replace_default(gateway, check=True)
     _write_resolv(dns)
 
 
@@ -116,14 +173,14 @@ def _dhcp_or_static(iface: str, cfg: AppConfig) -> None:
 
 def _ensure_ap_iface() -> str:
     try:
-        out = _out(["ip", "link", "show"])
+        links = _net().links()
     except Exception:
-        out = ""
-    if "ap0" in out:
+        links = {}
+    if "ap0" in links:
         return "ap0"
 
     try:
-        subprocess.run(["iw", "dev", "wlan0", "interface", "add", "ap0", "type", "__ap"], check=True)
+        _host().run(["iw", "dev", "wlan0", "interface", "add", "ap0", "type", "__ap"], check=True)
         return "ap0"
     except Exception:
         return "wlan0"
@@ -131,87 +188,97 @@ def _ensure_ap_iface() -> str:
 
 def _detect_default_uplink() -> Optional[str]:
     try:
-        out = _out(["ip", "-4", "route", "show", "default"])
+        routes = _net().default_routes()
     except Exception:
         return None
-    for line in out.splitlines():
-        parts = line.split()
-        if "dev" in parts:
-            return parts[parts.index("dev") + 1]
-    return None
+    return routes[0].dev if routes else None
+
+
+def _nft_rules(cfg: AppConfig, wan_if: str, lan_if: str) -> str:
+    return render_nft(cfg, wan_if=wan_if, lan_if=lan_if, ui_port=UI_PORT)
+
+
+def _fastpath_rules(cfg: AppConfig, wan_if: str, lan_if: str) -> str:
+    return render_fastpath(cfg, wan_if=wan_if, lan_if=lan_if)
+
+
+def _nftables_conf() -> str:
+    # boot-time entry point; our file replaces its own tables, so no global flush here
+    return "include \"/etc/nftables.d/*.nft\"\n"
+
+
+def _drop_legacy_tables(old_rules: Optional[str]) -> None:
+    """Upgrade step: the inet filter / ip nat tables the previous hamster-fi.nft loaded."""
+    legacy = legacy_tables(old_rules)
+    if legacy:
+        _host().run(delete_tables_cmd(legacy), check=False)
 
 
 def _persist_nft_rules(cfg: AppConfig, wan_if: str, lan_if: str) -> None:
-    rules = render_nft(cfg, wan_if=wan_if, lan_if=lan_if, ui_port=UI_PORT)
+    old_rules = _host().read_text(NFT_PATH)
+    _write(NFT_PATH, _nft_rules(cfg, wan_if=wan_if, lan_if=lan_if))
+    _write(FASTPATH_PATH, _fastpath_rules(cfg, wan_if=wan_if, lan_if=lan_if))
+    _write(NFTABLES_CONF, _nftables_conf())
 
-    mdns_rule = f'iifname "{lan_if}" udp dport 5353 accept'
+    # one transaction that swaps our tables; the service is only enabled so boot loads the same file
+    _load_nft()
+    _load_fastpath()
+    _drop_legacy_tables(old_rules)
+    _host().run(["systemctl", "enable", "nftables"], check=False)
 
-    if mdns_rule not in rules:
-        lines = rules.splitlines()
-        out = []
-        injected = False
 
-        for ln in lines:
-            out.append(ln)
+def _mode_ifaces(cfg: AppConfig, ap_if: str = "ap0") -> List[str]:
+    """Interfaces that carry forwarded/bridged traffic in cfg.mode (what tuning applies to)."""
+    if cfg.mode == "station":
+        return ["wlan0", "eth0"]
+    if cfg.mode == "bridge":
+        return ["eth0", ap_if]
+    return uplinks(cfg) + [ap_if]
 
-            if (not injected) and (f'iifname "{lan_if}"' in ln) and ("tcp dport" in ln) and ("accept" in ln):
-                out.append(f"\t\t{mdns_rule}")
-                injected = True
 
-        if not injected:
-            out2 = []
-            for ln in out:
-                if (not injected) and ln.strip() == "}":
-                    out2.append(f"\t\t{mdns_rule}")
-                    injected = True
-                out2.append(ln)
-            out = out2
+def _run_script(path: str) -> None:
+    _host().run(["sh", path], check=False)
 
-        rules = "\n".join(out) + "\n"
 
-    _write(NFT_PATH, rules)
+def _enable_unit(service: str) -> None:
+    _host().run(["systemctl", "daemon-reload"], check=False)
+    _host().run(["systemctl", "enable", service], check=False)
 
-    _write(
-        "/etc/nftables.conf",
-        "flush ruleset\n"
-        "include \"/etc/nftables.d/*.nft\"\n",
-    )
 
-    _run(["nft", "-f", "/etc/nftables.conf"], check=True)
+def _install_unit(path: str, content: str, service: str) -> None:
+    # units only change on upgrades, so skip daemon-reload when it is already in place
+    if _host().read_text(path) != content:
+        _write(path, content)
+        _enable_unit(service)
 
-    subprocess.run(["systemctl", "enable", "nftables"], check=False)
-    subprocess.run(["systemctl", "restart", "nftables"], check=False)
 
-    subprocess.run(["systemctl", "enable", "avahi-daemon"], check=False)
-    subprocess.run(["systemctl", "restart", "avahi-daemon"], check=False)
+def _apply_tuning(cfg: AppConfig, ifaces: List[str]) -> None:
+    _install_unit(TUNE_UNIT, render_tuning_unit(), TUNE_SERVICE)
+    _write(TUNE_SCRIPT, render_tuning(cfg, ifaces, _host()))
+    _run_script(TUNE_SCRIPT)
+
+
+def _apply_qos(cfg: AppConfig, wan_if: Optional[str]) -> None:
+    _install_unit(QOS_UNIT, render_qos_unit(), QOS_SERVICE)
+    _write(QOS_SCRIPT, render_qos(cfg, wan_if))
+    _run_script(QOS_SCRIPT)
 
 
 def _cleanup_duplicate_defaults(preferred_if: str) -> None:
+    net = _net()
     try:
-        out = _out(["ip", "-4", "route", "show", "default"])
+        routes = net.default_routes()
     except Exception:
         return
 
-    lines = [ln.strip() for ln in out.splitlines() if ln.strip()]
-    for ln in lines:
-        parts = ln.split()
-        if "dev" not in parts:
-            continue
-        dev = parts[parts.index("dev") + 1]
-        if dev != preferred_if:
-            subprocess.run(["ip", "route", "del"] + parts, check=False)
-
     seen = 0
-    try:
-        out2 = _out(["ip", "-4", "route", "show", "default", "dev", preferred_if])
-        for ln in out2.splitlines():
-            if not ln.strip():
-                continue
-            seen += 1
-            if seen >= 2:
-                subprocess.run(["ip", "route", "del"] + ln.split(), check=False)
-    except Exception:
-        pass
+    with net.batch():
+        for r in routes:
+            if r.dev == preferred_if:
+                seen += 1
+                if seen < 2:
+                    continue
+            net.route_del_default(dev=r.dev, via=r.via, metric=r.metric)
 
 
 def _freq_to_channel(freq_mhz: float) -> int:
@@ -247,26 +314,49 @@ def _read_wlan0_link_freq_channel() -> Optional[Tuple[float, int]]:
 
 
 def _rm_bridge() -> None:
-    subprocess.run(["ip", "link", "set", "ap0", "nomaster"], check=False)
-    subprocess.run(["ip", "link", "set", "eth0", "nomaster"], check=False)
-    subprocess.run(["ip", "link", "set", "wlan0", "nomaster"], check=False)
-    subprocess.run(["ip", "link", "set", "br0", "down"], check=False)
-    subprocess.run(["ip", "link", "del", "br0"], check=False)
-
+    net = _net()
+    if "br0" not in net.links():
+        return
+    with net.batch():
+        net.set_master("ap0", None)
+        net.set_master("eth0", None)
+        net.set_master("wlan0", None)
+        net.link_down("br0")
+        net.link_del("br0")
 
-def _set_dhcpcd_mode(mode: str, wan_if: str) -> None:
-    os.makedirs("/etc/dhcpcd.conf.d", exist_ok=True)
 
+def _dhcpcd_mode_conf(mode: str, *dhcp_ifs: str) -> str:
+    """dhcpcd keeps only the DHCP uplinks: on a static WAN it would lease over _static_up's address."""
     if mode == "bridge":
         deny = ["eth0", "wlan0", "ap0"]
     else:
-        deny = ["eth0", "wlan0", "ap0", "br0"]
-        if wan_if in deny:
-            deny.remove(wan_if)
+        deny = [d for d in ("eth0", "wlan0", "ap0", "br0") if d not in dhcp_ifs]
+
+    return "# hamster-fi: prevent route/DHCP fights\n" + "".join([f"denyinterfaces {d}\n" for d in deny])
+
+
+def _bridge_dhcpcd_conf(ap_if: str, br: str = "br0") -> str:
+    return (
+        "# Managed by hamsterfi (bridge mode)\n"
+        "denyinterfaces eth0\n"
+        f"denyinterfaces {ap_if}\n"
+        "\n"
+        f"interface {br}\n"
+        "  ipv4only\n"
+        "  metric 50\n"
+    )
+
+
+def _bridge_hostapd_conf(cfg: AppConfig, ap_if: str, br: str = "br0") -> str:
+    conf = render_hostapd(cfg, ap_if=ap_if)
+    if f"\nbridge={br}\n" not in conf and not conf.rstrip().endswith(f"bridge={br}"):
+        conf = conf.rstrip() + f"\nbridge={br}\n"
+    return conf
+
 
-    content = "# hamster-fi: prevent route/DHCP fights\n" + "".join([f"denyinterfaces {d}\n" for d in deny])
-    _write(DHCPCD_DROPIN, content)
-    subprocess.run(["systemctl", "restart", "dhcpcd"], check=False)
+def _set_dhcpcd_mode(mode: str, *dhcp_ifs: str) -> None:
+    _write(DHCPCD_DROPIN, _dhcpcd_mode_conf(mode, *dhcp_ifs))
+    _host().run(["systemctl", "restart", "dhcpcd"], check=False)
 
 
 def _restart_wpa_supplicant_wlan0() -> None:
@@ -275,74 +365,599 @@ def _restart_wpa_supplicant_wlan0() -> None:
     We try that first, then fall back to generic wpa_supplicant.
     """
     if _have("systemctl"):
-        subprocess.run(["systemctl", "enable", "wpa_supplicant@wlan0.service"], check=False)
-        subprocess.run(["systemctl", "restart", "wpa_supplicant@wlan0.service"], check=False)
+        _host().run(["systemctl", "enable", "wpa_supplicant@wlan0.service"], check=False)
+        _host().run(["systemctl", "restart", "wpa_supplicant@wlan0.service"], check=False)
         # fallback
-        subprocess.run(["systemctl", "enable", "wpa_supplicant"], check=False)
-        subprocess.run(["systemctl", "restart", "wpa_supplicant"], check=False)
+        _host().run(["systemctl", "enable", "wpa_supplicant"], check=False)
+        _host().run(["systemctl", "restart", "wpa_supplicant"], check=False)
+
+
+def _wlan0_link_connected() -> bool:
+    try:
+        out = _out(["iw", "dev", "wlan0", "link"])
+    except Exception:
+        return False
+    return "Connected to" in out and "Not connected" not in out
 
 
 def _wait_wlan0_connected(timeout_s: int = 15) -> bool:
-    deadline = time.time() + timeout_s
-    while time.time() < deadline:
-        try:
-            out = _out(["iw", "dev", "wlan0", "link"])
-            if "Connected to" in out and "Not connected" not in out:
-                return True
-        except Exception:
-            pass
-        time.sleep(1)
+    deadline = time.monotonic() + timeout_s
+    got = _host().wait_wpa_connected("wlan0", timeout_s)
+    if got is not None:
+        return got
+
+    # no control socket (custom wpa_supplicant setup): poll iw like before
+    while time.monotonic() < deadline:
+        if _wlan0_link_connected():
+            return True
+        _host().sleep(1)
     return False
 
 
-def apply(cfg: AppConfig) -> None:
+_PLAN_PATHS = [
+    HOSTAPD_PATH,
+    DNSMASQ_PATH,
+    NFT_PATH,
+    FASTPATH_PATH,
+    NFTABLES_CONF,
+    SYSCTL_CONF,
+    MODULES_CONF,
+    TUNE_SCRIPT,
+    TUNE_UNIT,
+    QOS_SCRIPT,
+    QOS_UNIT,
+    BOOT_UNIT,
+    FAILOVER_UNIT,
+    WPA_SUPPLICANT_WLAN0,
+    DHCPCD_DROPIN,
+    DHCPCD_BRIDGE_DROPIN,
+]
+# nftables is not tracked as a service: the tables are loaded with `nft -f` and the unit is only enabled for boot
+_PLAN_SERVICES = ["hostapd", "dnsmasq", "avahi-daemon", FAILOVER_SERVICE]
+
+# what has to be reloaded after a rendered file changes
+_RELOADS = {
+    HOSTAPD_PATH: "hostapd",
+    DNSMASQ_PATH: "dnsmasq",
+    NFT_PATH: "nftables",
+    FASTPATH_PATH: "fastpath",
+    SYSCTL_CONF: "sysctl",
+    TUNE_SCRIPT: "tuning",
+    QOS_SCRIPT: "qos",
+    TUNE_UNIT: f"unit {TUNE_SERVICE}",
+    QOS_UNIT: f"unit {QOS_SERVICE}",
+    BOOT_UNIT: f"unit {BOOT_SERVICE}",
+    FAILOVER_UNIT: f"unit {FAILOVER_SERVICE}",
+}
+
+
+def _restart_service(svc: str) -> None:
+    _host().run(["systemctl", "enable", svc], check=False)
+    _host().run(["systemctl", "restart", svc], check=False)
+
+
+def _stop_service(svc: str) -> None:
+    _host().run(["systemctl", "stop", svc], check=False)
+    _host().run(["systemctl", "disable", svc], check=False)
+
+
+def _load_nft() -> None:
+    _run(["nft", "-f", NFT_PATH], check=True)
+
+
+def _load_fastpath() -> None:
+    # its own transaction: the flowtable names the LAN interface, which has to exist by now
+    _run(["nft", "-f", FASTPATH_PATH], check=True)
+
+
+def _modules_conf() -> str:
+    return "nf_conntrack\n"
+
+
+def _load_router_sysctls() -> None:
+    _host().run(["modprobe", "nf_conntrack"], check=False)
+    _host().run(["sysctl", "-p", SYSCTL_CONF], check=False)
+
+
+def _add_boot_scripts(d: DesiredState, cfg: AppConfig, wan_if: Optional[str]) -> None:
+    """Tuning + QoS scripts and the units that replay them at boot; wan_if=None leaves no WAN shaped."""
+    d.files[TUNE_SCRIPT] = render_tuning(cfg, _mode_ifaces(cfg, d.lan_if), _host())
+    d.files[TUNE_UNIT] = render_tuning_unit()
+    d.files[QOS_SCRIPT] = render_qos(cfg, wan_if)
+    d.files[QOS_UNIT] = render_qos_unit()
+    d.files[BOOT_UNIT] = render_boot_unit()
+
+
+def _desired_state(cfg: AppConfig, live) -> DesiredState:
+    if cfg.mode == "ap":
+        links = uplinks(cfg)
+        wan_if = links[0]
+        d = DesiredState(mode="ap", lan_if="ap0", wan_if=wan_if, backup_if=links[1] if len(links) > 1 else None)
+        d.topology_files[DHCPCD_DROPIN] = _dhcpcd_mode_conf("ap", *_dhcp_devs(cfg))
+
+        hostapd_cfg = cfg
+        if "wlan0" in links:
+            d.topology_files[WPA_SUPPLICANT_WLAN0] = render_wpa_supplicant(
+                cfg.wlan.country, cfg.wan.upstream_ssid, cfg.wan.upstream_psk
+            )
+            # single radio: the AP follows whatever channel the uplink is on
+            link = _read_wlan0_link_freq_channel()
+            if link is not None:
+                hostapd_cfg = cfg.model_copy(deep=True)
+                hostapd_cfg.wlan.channel = link[1]
+
+        d.files = {
+            HOSTAPD_PATH: render_hostapd(hostapd_cfg, ap_if="ap0", follow="wlan0" in links),
+            DNSMASQ_PATH: render_dnsmasq(cfg, lan_if="ap0"),
+            NFT_PATH: _nft_rules(cfg, wan_if=effective_wan(live, wan_if), lan_if="ap0"),
+            FASTPATH_PATH: _fastpath_rules(cfg, wan_if=effective_wan(live, wan_if), lan_if="ap0"),
+            NFTABLES_CONF: _nftables_conf(),
+            SYSCTL_CONF: _router_sysctl_conf(cfg),
+            MODULES_CONF: _modules_conf(),
+        }
+        d.services = {"hostapd": True, "dnsmasq": True, "avahi-daemon": True, FAILOVER_SERVICE: bool(d.backup_if)}
+        if d.backup_if:
+            d.files[FAILOVER_UNIT] = render_failover_unit()
+        d.rules = balance.rules(cfg)
+        _add_boot_scripts(d, cfg, effective_wan(live, wan_if))
+        return d
+
+    if cfg.mode == "station":
+        d = DesiredState(mode="station", lan_if="eth0", wan_if="wlan0")
+        d.topology_files = {
+            DHCPCD_DROPIN: _dhcpcd_mode_conf("station", *_dhcp_devs(cfg)),
+            WPA_SUPPLICANT_WLAN0: render_wpa_supplicant(
+                cfg.wlan.country, cfg.wan.upstream_ssid, cfg.wan.upstream_psk
+            ),
+        }
+        d.files = {
+            DNSMASQ_PATH: render_dnsmasq(cfg, lan_if="eth0"),
+            NFT_PATH: _nft_rules(cfg, wan_if=effective_wan(live, "wlan0"), lan_if="eth0"),
+            FASTPATH_PATH: _fastpath_rules(cfg, wan_if=effective_wan(live, "wlan0"), lan_if="eth0"),
+            NFTABLES_CONF: _nftables_conf(),
+            SYSCTL_CONF: _router_sysctl_conf(cfg),
+            MODULES_CONF: _modules_conf(),
+        }
+        d.services = {"hostapd": False, "dnsmasq": True, "avahi-daemon": True, FAILOVER_SERVICE: False}
+        _add_boot_scripts(d, cfg, effective_wan(live, "wlan0"))
+        return d
+
+    if cfg.mode == "bridge":
+        d = DesiredState(mode="bridge", lan_if="ap0", wan_if="br0")
+        if _have("dhcpcd"):
+            d.topology_files[DHCPCD_BRIDGE_DROPIN] = _bridge_dhcpcd_conf("ap0")
+        d.files = {HOSTAPD_PATH: _bridge_hostapd_conf(cfg, ap_if="ap0")}
+        d.services = {"hostapd": True, "dnsmasq": False, FAILOVER_SERVICE: False}
+        _add_boot_scripts(d, cfg, None)
+        return d
+
+    raise RuntimeError(f"Unknown mode: {cfg.mode}")
+
+
+def _resolve_channel(cfg: AppConfig, scan: bool = True) -> AppConfig:
+    """
+    wlan.channel "auto" -> a number. The channel hostapd already runs on is
+    kept while it is still a candidate, so only a first apply (or a country or
+    band change) pays for a scan; moving later is survey.recommend()'s call.
+    scan=False (dry runs, health checks) takes the band's default instead.
+    """
+    if cfg.wlan.channel != "auto":
+        return cfg
+    w = cfg.wlan
+    out = cfg.model_copy(deep=True)
+    current = current_channel(_host().read_text(HOSTAPD_PATH))
+    if cfg.mode == "station" or _follows_uplink(cfg):
+        # no AP, or an AP that follows the uplink's channel anyway
+        out.wlan.channel = current or 6
+    elif current in candidates(w.country, w.band, w.channel_width):
+        out.wlan.channel = current
+    else:
+        picked = pick_channel(_host(), w.country, w.band, w.channel_width) if scan else None
+        out.wlan.channel = picked or (6 if w.band == "2.4" else 36)
+    return out
+
+
+def _follows_uplink(cfg: AppConfig) -> bool:
+    """AP on the same radio as an upstream Wi-Fi link (WAN or failover backup): it takes that link's channel."""
+    return cfg.mode == "ap" and "wlan0" in uplinks(cfg)
+
+
+def _need_upstream(cfg: AppConfig) -> bool:
+    return cfg.mode == "station" or _follows_uplink(cfg)
+
+
+def _preflight(cfg: AppConfig) -> None:
+    """Refuse a config (with wlan.channel resolved) before touching anything."""
+    if _need_upstream(cfg) and (not cfg.wan.upstream_ssid or not cfg.wan.upstream_psk):
+        if cfg.wan.device != "wlan0":
+            raise RuntimeError("wan.failover / wan.balance with WAN=eth0 needs upstream SSID+PSK for wlan0.")
+        raise RuntimeError(f"{cfg.mode} mode with WAN=wlan0 requires upstream SSID+PSK.")
+    if balance.balancing(cfg) and not balance.members(cfg):
+        raise RuntimeError("wan.balance needs a weight above 0 for eth0 or wlan0.")
+    if cfg.mode == "bridge" or (cfg.mode == "ap" and not _follows_uplink(cfg)):
+        # the AP picks its own channel here
+        try:
+            channel_plan(cfg.wlan.country, cfg.wlan.channel, cfg.wlan.channel_width)
+        except ValueError as e:
+            raise RuntimeError(str(e)) from e
+
+
+def render_desired(cfg: AppConfig) -> DesiredState:
+    """
+    Validate cfg and render everything it manages ahead of time, as if its WAN
+    already carried the default route (the state right after applying it).
+    wlan.channel "auto" is resolved now, scanning if it has to. build_plan()
+    takes the result as `prebuilt`.
+    """
+    cfg = _resolve_channel(cfg)
+    _preflight(cfg)
+    desired = _desired_state(cfg, LiveState())
+    desired.channel = cfg.wlan.channel
+    return desired
+
+
+def _prebuilt_fits(cfg: AppConfig, prebuilt: DesiredState, live: LiveState) -> bool:
+    if prebuilt.mode != cfg.mode:
+        return False
+    if _follows_uplink(cfg):
+        return False  # hostapd.conf follows the uplink's current channel
+    # nft and the tuning/qos scripts were rendered for the configured WAN
+    return cfg.mode == "bridge" or effective_wan(live, prebuilt.wan_if) == prebuilt.wan_if
+
+
+def build_plan(cfg: AppConfig, prebuilt: Optional[DesiredState] = None, scan: bool = True) -> Plan:
+    """
+    Compare cfg against the live links/addresses/routes, rendered files and
+    service states and return the smallest set of actions that gets there.
+    If the topology itself differs (other mode, missing LAN address, upstream
+    not associated, ...) the plan is the full step graph for the mode.
+
+    `prebuilt` is render_desired(cfg) from earlier (a profile): it stands in
+    for resolving the channel and rendering, as long as the live WAN is the
+    one it was rendered for. scan=False never scans for a channel (see
+    _resolve_channel).
+    """
+    if prebuilt is not None and prebuilt.channel is not None and cfg.wlan.channel == "auto":
+        cfg = cfg.model_copy(deep=True)
+        cfg.wlan.channel = prebuilt.channel
+    else:
+        cfg = _resolve_channel(cfg, scan)
+    _preflight(cfg)
+
+    live = read_live_state(_PLAN_PATHS, _PLAN_SERVICES, need_wlan0=_need_upstream(cfg), need_rules=True)
+    if prebuilt is not None and _prebuilt_fits(cfg, prebuilt, live):
+        desired = prebuilt
+    else:
+        desired = _desired_state(cfg, live)
+
+    managed = sorted({**desired.topology_files, **desired.files})
+    reasons = topology_mismatches(cfg, desired, live)
+    rules: List[Action] = []
+    if live.rules != desired.rules:
+        detail = f"{len(desired.rules)} balance rules" if desired.rules else "remove balance rules"
+        rules = [Action("routing rules", detail, run=partial(_set_rules, desired.rules))]
+    if reasons:
+        steps = _full_apply_steps(cfg, "; ".join(reasons))
+        for a in rules:
+            a.after = ("prepare",)
+        return Plan(mode=cfg.mode, actions=steps + rules, full=True, files=managed)
+
+    actions: List[Action] = list(rules)
+    reloads: Dict[str, List[str]] = {}
+    changed = changed_files(desired, live)
+    for path, content in changed.items():
+        name = f"write {path}"
+        actions.append(Action(name, run=partial(_write, path, content)))
+        step = _RELOADS.get(path)
+        if step:
+            reloads.setdefault(step, []).append(name)
+
+    services = service_changes(desired, live)
+    for svc, want in services.items():
+        after = tuple(reloads.get(svc, []))
+        if f"unit {svc}" in reloads:
+            after += (f"enable {svc}",)
+        if want:
+            actions.append(Action(f"restart {svc}", "not active", run=partial(_restart_service, svc), after=after))
+        else:
+            actions.append(Action(f"stop {svc}", "should not run in this mode", run=partial(_stop_service, svc)))
+
+    if NFT_PATH in changed and legacy_tables(live.files.get(NFT_PATH)):
+        actions.append(Action("drop legacy tables", "inet filter, ip nat",
+                              run=partial(_drop_legacy_tables, live.files.get(NFT_PATH)), after=("load nftables",)))
+
+    for step, writes in reloads.items():
+        if step in services:
+            continue
+        after = tuple(writes)
+        if step == "nftables":
+            actions.append(Action("load nftables", NFT_PATH, run=_load_nft, after=after))
+        elif step == "fastpath":
+            actions.append(Action("load fastpath", FASTPATH_PATH, run=_load_fastpath, after=after))
+        elif step == "sysctl":
+            actions.append(Action("apply sysctls", SYSCTL_CONF, run=_load_router_sysctls, after=after))
+        elif step == "tuning":
+            actions.append(Action("apply tuning", TUNE_SCRIPT, run=partial(_run_script, TUNE_SCRIPT), after=after))
+        elif step == "qos":
+            actions.append(Action("apply qos", QOS_SCRIPT, run=partial(_run_script, QOS_SCRIPT), after=after))
+        elif step.startswith("unit "):
+            svc = step[len("unit "):]
+            actions.append(Action(f"enable {svc}", "unit changed", run=partial(_enable_unit, svc), after=after))
+        else:
+            actions.append(Action(f"restart {step}", "config changed", run=partial(_restart_service, step), after=after))
+    return Plan(mode=cfg.mode, actions=actions, files=managed)
+
+
+def _prepare_full_apply() -> None:
+    _host().run(["systemctl", "stop", "hostapd"], check=False)
+    _host().run(["systemctl", "stop", "dnsmasq"], check=False)
+    if _host().exists(FAILOVER_UNIT):
+        # no route swaps while the topology is rebuilt; the AP steps start it again if enabled
+        _stop_service(FAILOVER_SERVICE)
+
+    net = _net()
+    with net.batch():
+        net.link_up("eth0")
+        net.link_up("wlan0")
+
+
+def _full_apply_steps(cfg: AppConfig, reason: str = "") -> List[Action]:
+    if cfg.mode == "ap":
+        steps = _ap_router_steps(cfg)
+    elif cfg.mode == "station":
+        steps = _station_router_steps(cfg)
+    elif cfg.mode == "bridge":
+        steps = _bridge_ap_steps(cfg)
+    else:
+        raise RuntimeError(f"Unknown mode: {cfg.mode}")
+
+    steps.append(Action("boot unit", BOOT_SERVICE, run=partial(_install_unit, BOOT_UNIT, render_boot_unit(), BOOT_SERVICE)))
+
+    # every root of the mode graph waits for the teardown
+    for s in steps:
+        if not s.after:
+            s.after = ("prepare",)
+    return [Action("prepare", reason, run=_prepare_full_apply)] + steps
+
+
+def _dhcp_devs(cfg: AppConfig) -> List[str]:
+    if cfg.mode == "bridge":
+        return ["br0"]
+    if cfg.mode == "station":
+        return ["wlan0"] if cfg.wan.ipv4 == "dhcp" else []
+    links = uplinks(cfg)
+    # a failover backup is always DHCP
+    return (links[:1] if cfg.wan.ipv4 == "dhcp" else []) + links[1:]
+
+
+def _record_boot_snapshot(cfg: AppConfig) -> None:
+    """What the boot unit replays: the topology as it is right after a successful apply."""
+    live = read_live_state(_PLAN_PATHS, _PLAN_SERVICES + ["wpa_supplicant@wlan0"])
+    dhcp = _dhcp_devs(cfg)
+    bridges: Dict[str, List[str]] = {}
+    for link in live.links.values():
+        if link.master:
+            bridges.setdefault(link.master, []).append(link.name)
+    snap = BootSnapshot(
+        mode=cfg.mode,
+        config=config_digest(cfg),
+        ap_parent="wlan0" if "ap0" in live.links else None,
+        bridges={br: sorted(ports) for br, ports in bridges.items()},
+        up=sorted(n for n, link in live.links.items() if link.up and n != "lo"),
+        addrs={dev: [a for a in addrs if "." in a] for dev, addrs in live.addrs.items()
+               if dev != "lo" and dev not in dhcp and any("." in a for a in addrs)},
+        # on a DHCP interface only the metric is ours (preferred uplink); the gateway comes with the lease
+        routes=[{"dev": r.dev, "via": None if r.dev in dhcp else r.via, "metric": r.metric}
+                for r in live.default_routes],
+        dhcp=dhcp,
+        services=[svc for svc, state in live.services.items() if state == "active"],
+        files={p: file_digest(text) for p, text in live.files.items() if text is not None},
+    )
+    _write(BOOT_SNAPSHOT, snap.to_json())
+
+
+def load_boot_snapshot() -> Optional[BootSnapshot]:
+    return BootSnapshot.from_json(_host().read_text(BOOT_SNAPSHOT))
+
+
+def boot_snapshot_problem(snap: Optional[BootSnapshot], cfg: AppConfig) -> Optional[str]:
+    """Why the snapshot can't be replayed for cfg, or None."""
+    if snap is None:
+        return "no boot snapshot"
+    if snap.config != config_digest(cfg):
+        return "config changed since the last apply"
+    for path, digest in snap.files.items():
+        if file_digest(_host().read_text(path)) != digest:
+            return f"{path} changed since the last apply"
+    return None
+
+
+def restore_lease_routes(snap: BootSnapshot) -> None:
+    """Once the leases are in: move their default routes back to the metrics apply had chosen."""
+    net = _net()
+    leased = {r.dev: r for r in net.default_routes()}
+    with net.batch():
+        for r in snap.routes:
+            have = leased.get(r["dev"])
+            if r["via"] is None and have is not None and have.metric != r["metric"]:
+                net.route_replace_default(have.via, dev=r["dev"], metric=r["metric"])
+    net.flush_route_cache()
+
+
+def replay_boot_snapshot(snap: BootSnapshot, on_event: Optional[StepListener] = None) -> None:
+    """
+    Rebuild the runtime topology from the snapshot: links, then addresses and
+    routes, then the services that need them. No teardown, no waiting for
+    leases; dhcpcd and wpa_supplicant come up as enabled units on their own.
+    nftables.service has loaded the firewall already; the flowtable waits
+    for the links since it names ap0, and so does tune.sh, which
+    hamsterfi-tune.service ran before ap0 was there to be tuned.
+    """
+    def links() -> None:
+        if snap.ap_parent:
+            _ensure_ap_iface()
+        net = _net()
+        for br in snap.bridges:
+            if br not in net.links():
+                net.add_bridge(br, stp=False)
+        with net.batch():
+            for dev in snap.up:
+                net.link_up(dev)
+            for br, ports in snap.bridges.items():
+                for dev in ports:
+                    net.set_master(dev, br)
+
+    def addresses() -> None:
+        net = _net()
+        have = net.addrs()
+        with net.batch():
+            for dev, cidrs in snap.addrs.items():
+                for cidr in cidrs:
+                    if cidr not in have.get(dev, []):
+                        net.addr_add(dev, cidr, check=False)
+        for r in snap.routes:
+            if r["via"]:
+                net.route_replace_default(r["via"], dev=r["dev"], metric=r["metric"])
+
+    def dhcp() -> None:
+        # dhcpcd only picks up a bridge it didn't see at start when told to
+        for dev in snap.dhcp:
+            if dev in snap.bridges:
+                _host().run(["dhcpcd", "-n", dev], check=False)
+
+    steps = [
+        Action("links", ", ".join(snap.up), run=links),
+        Action("addresses", run=addresses, after=("links",)),
+        Action("dhcp", ", ".join(snap.dhcp), run=dhcp, after=("links",)),
+    ]
+    if _host().exists(FASTPATH_PATH):
+        steps.append(Action("load fastpath", FASTPATH_PATH, run=_load_fastpath, after=("links",)))
+    if _host().exists(TUNE_SCRIPT):
+        steps.append(Action("tuning", TUNE_SCRIPT, run=partial(_run_script, TUNE_SCRIPT), after=("links",)))
+    for svc in snap.services:
+        # dhcpcd and wpa_supplicant are enabled units and already running
+        if svc in ("hostapd", "dnsmasq"):
+            steps.append(Action(f"restart {svc}", run=partial(_host().run, ["systemctl", "restart", svc]),
+                                after=("addresses",)))
+    run_graph(steps, max_workers=APPLY_WORKERS, on_event=on_event)
+
+
+def health_problems(cfg: AppConfig) -> List[str]:
+    """What a fresh plan for cfg would still do; empty once the router is running it as applied."""
+    plan = build_plan(cfg, scan=False)
+    if plan.full:
+        return [plan.actions[0].detail or "topology differs"]
+    return [f"{a.name} {a.detail}".strip() for a in plan.actions]
+
+
+def _record_history(cfg: AppConfig, plan: Plan) -> None:
+    """
+    Record the applied version and mark it good once a fresh plan is empty.
+    Only the first check runs inline; if leases are still settling, the rest
+    of the HEALTH_WAIT_S wait happens off the apply path.
+    """
+    host = _host()
+    version = history.record(cfg, {p: host.read_text(p) for p in plan.files})
+    if version.state == "good" and not plan.actions:
+        return
+    problems = health_problems(cfg)
+    if not problems:
+        history.mark(version.id, True)
+        return
+    threading.Thread(target=_watch_health, args=(host, _generation, cfg, version.id),
+                     name="health-check", daemon=True).start()
+
+
+def _watch_health(host: Host, generation: int, cfg: AppConfig, vid: int) -> None:
+    problems: List[str] = []
+
+    def superseded() -> bool:
+        return get_host() is not host or _generation != generation
+
+    def done() -> bool:
+        if superseded():
+            return True
+        problems[:] = health_problems(cfg)
+        return not problems
+
+    host.wait_for(done, HEALTH_WAIT_S, recheck_s=1.0)
+    if not superseded():
+        history.mark(vid, not problems, "; ".join(problems))
+
+
+def rollback(version_id: Optional[int] = None,
+             on_event: Optional[StepListener] = None) -> Tuple[history.Version, Plan, List[str]]:
+    """
+    Go back to a recorded version, by default the last known-good one: its
+    config becomes config.yaml again and the incremental planner changes only
+    what differs from the running state. Returns the version, the plan, and
+    the files that render differently than when the version was recorded
+    (renderers changed since, or `wlan.channel: auto` kept another channel).
+    """
+    version = history.get(version_id) if version_id is not None else history.last_good()
+    if version is None:
+        raise RuntimeError(f"no version {version_id}" if version_id is not None else "no known-good version yet")
+    cfg = history.config_of(version)
+    save_config(cfg)
+    plan = apply(cfg, on_event=on_event)
+    host = _host()
+    drift = [p for p, digest in version.files.items() if file_digest(host.read_text(p)) != digest]
+    return version, plan, drift
+
+
+def activate_profile(name: str, on_event: Optional[StepListener] = None) -> dict:
+    """
+    Switch to a saved profile: its config becomes config.yaml and the planner
+    works from its pre-rendered state. switch_s runs from the call to the
+    router running the profile (apply done, first health check included).
+    """
+    t0 = time.monotonic()
+    cfg, desired, rendered = profiles.prebuilt(name)
+    save_config(cfg)
+    plan = apply(cfg, on_event=on_event, prebuilt=desired)
+    profiles.set_active(name)
+    return dict(
+        plan.describe(), profile=name, rendered_now=rendered,
+        summary="full" if plan.full else f"{len(plan.actions)} steps",
+        switch_s=round(time.monotonic() - t0, 3),
+    )
+
+
+def apply(cfg: AppConfig, dry_run: bool = False, on_event: Optional[StepListener] = None,
+          prebuilt: Optional[DesiredState] = None) -> Plan:
+    global _generation
+    # a dry run only reports: it never takes the radio off the air to scan
+    plan = build_plan(cfg, prebuilt, scan=not dry_run)
+    if dry_run:
+        return plan
+    _generation += 1
 
     files_to_backup = [
         HOSTAPD_PATH,
         DNSMASQ_PATH,
         NFT_PATH,
+        FASTPATH_PATH,
         WPA_SUPPLICANT_WLAN0,
         "/etc/dhcpcd.conf",
     ]
 
-    backups = {}
-    for p in files_to_backup:
-        try:
-            with open(p, "r", encoding="utf-8") as f:
-                backups[p] = f.read()
-        except FileNotFoundError:
-            backups[p] = None
-        except Exception:
-            backups[p] = None
+    host = _host()
+    backups = {p: host.read_text(p) for p in files_to_backup}
 
     def _restore_files() -> None:
         for p, content in backups.items():
             try:
                 if content is None:
-                    if os.path.exists(p):
-                        os.remove(p)
+                    host.remove(p)
                 else:
-                    os.makedirs(os.path.dirname(p), exist_ok=True)
-                    with open(p, "w", encoding="utf-8") as f:
-                        f.write(content)
+                    host.write_text(p, content)
             except Exception:
                 pass
 
+    t0 = time.monotonic()
+    result = "error"
     try:
-        subprocess.run(["systemctl", "stop", "hostapd"], check=False)
-        subprocess.run(["systemctl", "stop", "dnsmasq"], check=False)
-
-        subprocess.run(["ip", "link", "set", "eth0", "up"], check=False)
-        subprocess.run(["ip", "link", "set", "wlan0", "up"], check=False)
-
-        if cfg.mode == "ap":
-            _apply_ap_router(cfg)
-        elif cfg.mode == "station":
-            _apply_station_router(cfg)
-        elif cfg.mode == "bridge":
-            _apply_bridge_ap(cfg)
-        else:
-            raise RuntimeError(f"Unknown mode: {cfg.mode}")
+        plan.critical_path, plan.critical_s = run_graph(plan.actions, max_workers=APPLY_WORKERS, on_event=on_event)
 
     except Exception:
         _restore_files()
@@ -354,291 +969,478 @@ def apply(cfg: AppConfig) -> None:
 
         try:
             ap_if = _ensure_ap_iface()
-            subprocess.run(["ip", "link", "set", ap_if, "up"], check=False)
+            _net().link_up(ap_if)
         except Exception:
             pass
 
-        for svc in ["dhcpcd", "nftables", "hostapd", "dnsmasq", "wpa_supplicant@wlan0"]:
-            subprocess.run(["systemctl", "restart", svc], check=False)
+        for svc in ["dhcpcd", "hostapd", "dnsmasq", "wpa_supplicant@wlan0"]:
+            _host().run(["systemctl", "restart", svc], check=False)
+        for path in (NFT_PATH, FASTPATH_PATH):
+            if _host().exists(path):
+                _host().run(["nft", "-f", path], check=False)
 
         raise
+    else:
+        result = "ok"
+        if plan.actions or not host.exists(BOOT_SNAPSHOT):
+            try:
+                _record_boot_snapshot(cfg)
+            except Exception:
+                # a stale snapshot must not be replayed; boot falls back to a full apply
+                host.remove(BOOT_SNAPSHOT)
+        try:
+            _record_history(cfg, plan)
+        except Exception:
+            pass  # bookkeeping only: the router is configured either way
+    finally:
+        plan.wall_s = time.monotonic() - t0
+        metrics.record(metrics.Span(
+            kind="apply", name=cfg.mode, start=time.time() - plan.wall_s, duration=plan.wall_s,
+            error=None if result == "ok" else next((a.error for a in plan.actions if a.error), "failed"),
+            attrs={"plan": "full" if plan.full else "incremental", "steps": str(len(plan.actions))},
+        ))
+        metrics.APPLY_SECONDS.observe(plan.wall_s, cfg.mode, "full" if plan.full else "incremental", result)
 
-def _apply_ap_router(cfg: AppConfig) -> None:
-    import time
-
-    wan_if = cfg.wan.device
-    ap_if = _ensure_ap_iface()
-
-    _set_dhcpcd_mode("ap", wan_if)
-    _rm_bridge()
+    return plan
 
-    other = "wlan0" if wan_if == "eth0" else "eth0"
-    _dhcp_release(other)
-    subprocess.run(["ip", "addr", "flush", "dev", other], check=False)
-    subprocess.run(["ip", "link", "set", other, "up"], check=False)
 
-    def _safe_out(cmd: list[str]) -> str:
-        try:
-            return _out(cmd) or ""
-        except Exception:
-            return ""
-
-    def _default_gw_for_dev(dev: str) -> str | None:
-        txt = _safe_out(["ip", "-4", "route", "show", "default", "dev", dev]).strip()
-        for ln in txt.splitlines():
-            parts = ln.split()
-            if len(parts) >= 3 and parts[0] == "default" and parts[1] == "via":
-                return parts[2]
+def _default_gw_for_dev(dev: str) -> str | None:
+    try:
+        return _net().default_gw(dev)
+    except Exception:
         return None
 
-    def _default_gw_any() -> str | None:
-        txt = _safe_out(["ip", "-4", "route", "show", "default"]).strip()
-        for ln in txt.splitlines():
-            parts = ln.split()
-            if len(parts) >= 3 and parts[0] == "default" and parts[1] == "via":
-                return parts[2]
-        return None
 
-    def _dhcpcd_lease_router(dev: str) -> str | None:
-        candidates = [
-            f"/var/lib/dhcpcd5/dhcpcd-{dev}.lease",
-            f"/var/lib/dhcpcd/dhcpcd-{dev}.lease",
-        ]
-        for path in candidates:
-            try:
-                with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                    for ln in f:
-                        ln = ln.strip()
-                        if ln.startswith("routers=") or ln.startswith("router="):
-                            v = ln.split("=", 1)[1].strip()
-                            if v:
-                                return v.split()[0]
-            except FileNotFoundError:
-                continue
-            except Exception:
-                continue
+def _default_gw_any() -> str | None:
+    try:
+        return _net().default_gw()
+    except Exception:
         return None
 
-    def _wait_for_gw(preferred_dev: str, timeout_s: int = 15) -> str | None:
-        """
-        dhcpcd is async; sometimes it adds the default route a bit later.
-        Poll until we can infer a gateway.
-        """
-        deadline = time.time() + timeout_s
-        while time.time() < deadline:
-            gw = _default_gw_for_dev(preferred_dev)
-            if not gw:
-                gw = _default_gw_any()
-            if not gw:
-                gw = _dhcpcd_lease_router(preferred_dev)
-            if gw:
-                return gw
-            time.sleep(0.5)
-        return None
 
-    def _prefer_default(preferred_dev: str, backup_dev: str) -> None:
-        """
-        Force preferred default route by metric.
-        This is required in your situation because both interfaces receive defaults,
-        and eth0 has a lower metric so it wins (exactly what you’re seeing).  [oai_citation:2‡log.txt](sediment://file_000000005cac7243aa3d6d90c7eb260c)
-        """
-        gw_pref = _wait_for_gw(preferred_dev, timeout_s=15)
-        if not gw_pref:
-            raise RuntimeError(
-                f"{preferred_dev} is up but no gateway could be inferred (even after waiting). "
-                f"Check: ip -4 route show default ; iw dev {preferred_dev} link"
-            )
+def _dhcpcd_lease_router(dev: str) -> str | None:
+    candidates = [
+        f"/var/lib/dhcpcd5/dhcpcd-{dev}.lease",
+        f"/var/lib/dhcpcd/dhcpcd-{dev}.lease",
+    ]
+    for path in candidates:
+        for ln in (_host().read_text(path) or "").splitlines():
+            ln = ln.strip()
+            if ln.startswith("routers=") or ln.startswith("router="):
+                v = ln.split("=", 1)[1].strip()
+                if v:
+                    return v.split()[0]
+    return None
 
-        subprocess.run(
-            ["ip", "route", "replace", "default", "via", gw_pref, "dev", preferred_dev, "metric", "50"],
-            check=False,
-        )
 
-        gw_bak = _default_gw_for_dev(backup_dev) or _dhcpcd_lease_router(backup_dev) or gw_pref
-        subprocess.run(
-            ["ip", "route", "replace", "default", "via", gw_bak, "dev", backup_dev, "metric", "5000"],
-            check=False,
+def _wait_for_gw(preferred_dev: str, timeout_s: int = 15, strict: bool = False) -> str | None:
+    """
+    dhcpcd is async; sometimes it adds the default route a bit later.
+    Wait for route/address events until we can infer a gateway. The lease
+    file has no event, so it is also re-read once a second. `strict` only
+    takes a gateway that belongs to preferred_dev (both uplinks have one).
+    """
+    found = {}
+
+    def _probe() -> bool:
+        found["gw"] = (
+            _default_gw_for_dev(preferred_dev)
+            or (None if strict else _default_gw_any())
+            or _dhcpcd_lease_router(preferred_dev)
         )
+        return bool(found["gw"])
 
-        subprocess.run(["ip", "route", "flush", "cache"], check=False)
+    with metrics.span("wait", f"gateway {preferred_dev}") as sp:
+        _host().wait_for(_probe, timeout_s, groups=RTMGRP_IPV4_ROUTE | RTMGRP_IPV4_IFADDR, recheck_s=1.0)
+        sp.attrs["gateway"] = found.get("gw") or ""
+    return found.get("gw")
 
-    if wan_if == "wlan0":
-        if not cfg.wan.upstream_ssid or not cfg.wan.upstream_psk:
-            raise RuntimeError("AP mode with WAN=wlan0 requires upstream SSID+PSK.")
 
-        _write(
-            WPA_SUPPLICANT_WLAN0,
-            render_wpa_supplicant(cfg.wlan.country, cfg.wan.upstream_ssid, cfg.wan.upstream_psk),
+def _prefer_default(preferred_dev: str, backup_dev: str, strict: bool = False) -> None:
+    """
+    Force preferred default route by metric.
+    This is required because both interfaces receive defaults,
+    and eth0 has a lower metric so it wins.
+    """
+    gw_pref = _wait_for_gw(preferred_dev, timeout_s=15, strict=strict)
+    if not gw_pref:
+        raise RuntimeError(
+            f"{preferred_dev} is up but no gateway could be inferred (even after waiting). "
+            f"Check: ip -4 route show default ; iw dev {preferred_dev} link"
         )
-        _restart_wpa_supplicant_wlan0()
 
-        if not _wait_wlan0_connected(timeout_s=20):
-            raise RuntimeError("wlan0 did not associate to upstream Wi-Fi (check SSID/PSK).")
+    gw_bak = _default_gw_for_dev(backup_dev) or _dhcpcd_lease_router(backup_dev) or gw_pref
 
-        _dhcp_or_static("wlan0", cfg)
+    net = _net()
+    with net.batch():
+        net.route_replace_default(gw_pref, dev=preferred_dev, metric=50)
+        net.route_replace_default(gw_bak, dev=backup_dev, metric=5000)
+    net.flush_route_cache()
 
-        _prefer_default(preferred_dev="wlan0", backup_dev="eth0")
 
-        link = _read_wlan0_link_freq_channel()
-        if link is not None:
-            _, upstream_ch = link
-            cfg.wlan.channel = upstream_ch
-
-    subprocess.run(["ip", "link", "set", ap_if, "up"], check=False)
-    subprocess.run(["ip", "addr", "flush", "dev", ap_if], check=False)
-    subprocess.run(["ip", "addr", "add", cfg.lan.address, "dev", ap_if], check=True)
+def _prefer_uplink(primary: str, backup: str) -> None:
+    """_prefer_default for a failover pair: start on the backup if the primary never gets a gateway."""
+    try:
+        _prefer_default(primary, backup, strict=True)
+    except RuntimeError:
+        _prefer_default(backup, primary, strict=True)
 
-    _write(HOSTAPD_PATH, render_hostapd(cfg, ap_if=ap_if))
-    subprocess.run(["systemctl", "enable", "hostapd"], check=False)
-    subprocess.run(["systemctl", "restart", "hostapd"], check=False)
 
-    if wan_if == "eth0":
-        _dhcp_or_static("eth0", cfg)
-        _prefer_default(preferred_dev="eth0", backup_dev="wlan0")
+def switch_uplink(cfg: AppConfig, active: str, standby: str) -> None:
+    """
+    Move the preferred default route (metric 50) to `active` and demote
+    `standby` to metric 5000, for the failover monitor: no plan, no waits.
+    Masquerade follows first (nft file reloaded in one transaction), then the
+    routes in one netlink batch. Flows NATed to standby's address can't
+    continue over the other uplink, so their conntrack entries are dropped
+    and clients reconnect through the new one; QoS moves last.
+    """
+    gw_active = _default_gw_for_dev(active) or _dhcpcd_lease_router(active)
+    if not gw_active:
+        raise RuntimeError(f"{active} has no gateway")
+    gw_standby = _default_gw_for_dev(standby)
+    net = _net()
+    old_addrs = [a.split("/")[0] for a in net.addrs(standby).get(standby, []) if "." in a]
+
+    # the same files the planner renders once the default route has moved
+    old_rules = _host().read_text(NFT_PATH)
+    _write(NFT_PATH, _nft_rules(cfg, wan_if=active, lan_if="ap0"))
+    _write(FASTPATH_PATH, _fastpath_rules(cfg, wan_if=active, lan_if="ap0"))
+    _load_nft()
+    _load_fastpath()
+    _drop_legacy_tables(old_rules)
+    with net.batch():
+        net.route_replace_default(gw_active, dev=active, metric=50)
+        if gw_standby:
+            net.route_replace_default(gw_standby, dev=standby, metric=5000)
+    net.flush_route_cache()
+    _drop_nat_flows(old_addrs)
+    _write(QOS_SCRIPT, render_qos(cfg, active))
+    _run_script(QOS_SCRIPT)
+
+
+def _drop_nat_flows(addrs: Iterable[str]) -> None:
+    # NATed to an address that no longer carries them: clients reconnect via another uplink
+    if _have("conntrack"):
+        for addr in addrs:
+            _host().run(["conntrack", "-D", "--reply-dst", addr], check=False)
+
+
+def _set_rules(rules: List[Rule]) -> None:
+    net = _net()
+    balance.sync_rules(net, rules)
+    if not rules:
+        balance.sync_tables(net, {})
+
+
+def rotate_uplinks(gateways: Dict[str, Optional[str]], before: Dict[str, Optional[str]]) -> None:
+    """
+    wan.balance, for the failover monitor: route each uplink's table via
+    `gateways[dev]`, emptying the tables of uplinks that are missing or None
+    (flows marked for them fall through to main). Flows NATed to an uplink
+    that left the rotation are dropped, as in switch_uplink().
+    """
+    net = _net()
+    left = [d for d, gw in before.items() if gw and not gateways.get(d)]
+    addrs = [a.split("/")[0] for d in left for a in net.addrs(d).get(d, []) if "." in a]
+    balance.sync_tables(net, gateways)
+    _drop_nat_flows(addrs)
 
-    _write(DNSMASQ_PATH, render_dnsmasq(cfg, lan_if=ap_if))
-    subprocess.run(["systemctl", "enable", "dnsmasq"], check=False)
-    subprocess.run(["systemctl", "restart", "dnsmasq"], check=False)
 
-    _enable_router_sysctls()
+def _start_failover() -> None:
+    _install_unit(FAILOVER_UNIT, render_failover_unit(), FAILOVER_SERVICE)
+    _restart_service(FAILOVER_SERVICE)
 
-    effective_wan = _detect_default_uplink() or wan_if
-    _persist_nft_rules(cfg, wan_if=effective_wan, lan_if=ap_if)
 
+def _backup_up(iface: str) -> None:
+    """Address the failover backup next to the WAN, without restarting dhcpcd under the WAN's lease."""
+    _net().link_up(iface)
+    if _have("dhcpcd"):
+        _host().run(["dhcpcd", "-n", iface], check=False)
+        return
+    try:
+        _dhcp_up(iface)
+    except Exception:
+        pass  # the monitor sees an uplink without gateway and keeps it out of rotation
 
-def _apply_station_router(cfg: AppConfig) -> None:
-    _set_dhcpcd_mode("station", "wlan0")
-    _rm_bridge()
 
-    if not cfg.wan.upstream_ssid or not cfg.wan.upstream_psk:
-        raise RuntimeError("Station mode requires upstream SSID + PSK.")
+def _release_spare(iface: str) -> None:
+    _dhcp_release(iface)
+    _net().link_up(iface)
 
-    _write(
-        WPA_SUPPLICANT_WLAN0,
-        render_wpa_supplicant(cfg.wlan.country, cfg.wan.upstream_ssid, cfg.wan.upstream_psk),
-    )
-    _restart_wpa_supplicant_wlan0()
 
-    if not _wait_wlan0_connected(timeout_s=20):
-        raise RuntimeError("wlan0 did not associate to upstream Wi-Fi (check SSID/PSK).")
+def _lan_addr(iface: str, address: str) -> None:
+    net = _net()
+    with net.batch():
+        net.link_up(iface)
+        net.addr_flush(iface)
+        net.addr_add(iface, address)
 
-    _dhcp_release("eth0")
-    subprocess.run(["ip", "link", "set", "eth0", "up"], check=False)
 
-    _dhcp_or_static("wlan0", cfg)
+def _join_upstream(required: bool = True) -> None:
+    _restart_wpa_supplicant_wlan0()
+    with metrics.span("wait", "wlan0 association"):
+        connected = _wait_wlan0_connected(timeout_s=20)
+    if not connected and required:
+        raise RuntimeError("wlan0 did not associate to upstream Wi-Fi (check SSID/PSK).")
 
-    _cleanup_duplicate_defaults(preferred_if="wlan0")
-    subprocess.run(["ip", "route", "flush", "cache"], check=False)
 
-    subprocess.run(["ip", "addr", "flush", "dev", "eth0"], check=False)
-    subprocess.run(["ip", "addr", "add", cfg.lan.address, "dev", "eth0"], check=True)
-    subprocess.run(["ip", "link", "set", "eth0", "up"], check=False)
+def _enable_avahi() -> None:
+    _host().run(["systemctl", "enable", "avahi-daemon"], check=False)
+    _host().run(["systemctl", "restart", "avahi-daemon"], check=False)
 
-    _write(DNSMASQ_PATH, render_dnsmasq(cfg, lan_if="eth0"))
-    subprocess.run(["systemctl", "enable", "dnsmasq"], check=False)
-    subprocess.run(["systemctl", "restart", "dnsmasq"], check=False)
 
-    subprocess.run(["systemctl", "stop", "hostapd"], check=False)
-    subprocess.run(["systemctl", "disable", "hostapd"], check=False)
+def _ap_router_steps(cfg: AppConfig) -> List[Action]:
+    links = uplinks(cfg)
+    wan_if = links[0]
+    backup = links[1] if len(links) > 1 else None
+    other = "wlan0" if wan_if == "eth0" else "eth0"
+    # without failover the other interface is released so it can't grab the default route
+    spare: tuple = () if backup else (f"release {other}",)
+    # filled in by "ensure ap0": falls back to wlan0 if the vif can't be created
+    ctx = {"ap_if": "ap0"}
+    # the uplink's channel, once "follow upstream channel" has read it
+    followed: Dict[str, int] = {}
 
-    _enable_router_sysctls()
+    def ensure_ap() -> None:
+        ctx["ap_if"] = _ensure_ap_iface()
 
-    effective_wan = _detect_default_uplink() or "wlan0"
-    _persist_nft_rules(cfg, wan_if=effective_wan, lan_if="eth0")
+    def follow_upstream_channel() -> None:
+        link = _read_wlan0_link_freq_channel()
+        if link is not None:
+            followed["channel"] = link[1]
+
+    def hostapd_conf() -> str:
+        # cfg stays as loaded: history and the boot snapshot record it, and boot compares its digest
+        hostapd_cfg = cfg
+        if "channel" in followed:
+            hostapd_cfg = cfg.model_copy(deep=True)
+            hostapd_cfg.wlan.channel = followed["channel"]
+        return render_hostapd(hostapd_cfg, ap_if=ctx["ap_if"], follow="wlan0" in links)
+
+    steps = [
+        Action("ensure ap0", run=ensure_ap),
+        Action("dhcpcd mode", "ap", run=partial(_set_dhcpcd_mode, "ap", *_dhcp_devs(cfg))),
+        Action("remove bridge", run=_rm_bridge),
+    ]
+    if not backup:
+        steps.append(Action(f"release {other}", run=partial(_release_spare, other), after=("dhcpcd mode",)))
+    steps += [
+        Action(
+            "lan address",
+            cfg.lan.address,
+            run=lambda: _lan_addr(ctx["ap_if"], cfg.lan.address),
+            after=("ensure ap0", "remove bridge"),
+        ),
+        Action(
+            "write dnsmasq",
+            run=lambda: _write(DNSMASQ_PATH, render_dnsmasq(cfg, lan_if=ctx["ap_if"])),
+            after=("ensure ap0",),
+        ),
+        Action("restart dnsmasq", run=partial(_restart_service, "dnsmasq"), after=("write dnsmasq", "lan address")),
+        Action("router sysctls", run=partial(_enable_router_sysctls, cfg)),
+        Action("cpu tuning", run=lambda: _apply_tuning(cfg, _mode_ifaces(cfg, ctx["ap_if"])), after=("ensure ap0",)),
+    ]
 
+    upstream = []
+    if "wlan0" in links:
+        if not cfg.wan.upstream_ssid or not cfg.wan.upstream_psk:
+            raise RuntimeError("AP mode with WAN=wlan0 requires upstream SSID+PSK.")
+        upstream = [
+            Action(
+                "write wpa_supplicant",
+                run=partial(
+                    _write,
+                    WPA_SUPPLICANT_WLAN0,
+                    render_wpa_supplicant(cfg.wlan.country, cfg.wan.upstream_ssid, cfg.wan.upstream_psk),
+                ),
+            ),
+            # a backup that doesn't associate just stays out of rotation
+            Action(
+                "join upstream",
+                cfg.wan.upstream_ssid,
+                run=partial(_join_upstream, wan_if == "wlan0"),
+                after=("write wpa_supplicant", "ensure ap0", "dhcpcd mode"),
+            ),
+        ]
 
-def _apply_bridge_ap(cfg: AppConfig) -> None:
-    import time
-    br = "br0"
-    ap_if = _ensure_ap_iface()
+    if backup:
+        prefer = Action("prefer default", f"{wan_if} over {backup}, {'balance' if balance.balancing(cfg) else 'failover'}",
+                        run=partial(_prefer_uplink, wan_if, backup), after=("wan addressing", "backup addressing"))
+        backup_step = Action("backup addressing", f"{backup} dhcp", run=partial(_backup_up, backup),
+                             after=("join upstream",) if backup == "wlan0" else ("dhcpcd mode",))
+    else:
+        prefer = Action("prefer default", f"{wan_if} over {other}", run=partial(_prefer_default, wan_if, other),
+                        after=("wan addressing",))
 
-    subprocess.run(["systemctl", "stop", "dnsmasq"], check=False)
-    subprocess.run(["systemctl", "disable", "dnsmasq"], check=False)
-    subprocess.run(["nft", "flush", "ruleset"], check=False)
-    subprocess.run(["systemctl", "stop", "nftables"], check=False)
-    subprocess.run(["systemctl", "disable", "nftables"], check=False)
+    if wan_if == "wlan0":
+        steps += upstream + [
+            Action("wan addressing", f"wlan0 {cfg.wan.ipv4}", run=partial(_dhcp_or_static, "wlan0", cfg),
+                   after=("join upstream",) + spare),
+            prefer,
+            Action("follow upstream channel", run=follow_upstream_channel, after=("join upstream",)),
+        ]
+    else:
+        steps += [
+            Action("wan addressing", f"eth0 {cfg.wan.ipv4}", run=partial(_dhcp_or_static, "eth0", cfg),
+                   after=("dhcpcd mode",) + spare),
+            prefer,
+        ]
+        if upstream:
+            steps += upstream + [Action("follow upstream channel", run=follow_upstream_channel, after=("join upstream",))]
+    if backup:
+        steps.append(backup_step)
+    hostapd_after: tuple = ("ensure ap0", "follow upstream channel") if "wlan0" in links else ("ensure ap0",)
+
+    steps += [
+        Action("write hostapd", run=lambda: _write(HOSTAPD_PATH, hostapd_conf()), after=hostapd_after),
+        Action("restart hostapd", run=partial(_restart_service, "hostapd"), after=("write hostapd", "lan address")),
+        Action(
+            "firewall",
+            run=lambda: _persist_nft_rules(cfg, wan_if=_detect_default_uplink() or wan_if, lan_if=ctx["ap_if"]),
+            after=("prefer default", "ensure ap0"),
+        ),
+        Action("qos", run=lambda: _apply_qos(cfg, _detect_default_uplink() or wan_if), after=("prefer default",)),
+        Action("avahi", run=_enable_avahi, after=("firewall",)),
+    ]
+    if backup:
+        steps.append(Action("failover monitor", f"{wan_if} -> {backup}", run=_start_failover, after=("firewall", "qos")))
+    return steps
 
-    _rm_bridge()
 
-    subprocess.run(["ip", "link", "add", br, "type", "bridge"], check=False)
-    subprocess.run(["ip", "link", "set", br, "type", "bridge", "stp_state", "0"], check=False)
-    subprocess.run(["ip", "link", "set", br, "up"], check=False)
+def _station_router_steps(cfg: AppConfig) -> List[Action]:
+    if not cfg.wan.upstream_ssid or not cfg.wan.upstream_psk:
+        raise RuntimeError("Station mode requires upstream SSID + PSK.")
 
-    subprocess.run(["ip", "link", "set", "eth0", "up"], check=False)
-    subprocess.run(["ip", "link", "set", ap_if, "up"], check=False)
-    subprocess.run(["ip", "link", "set", "eth0", "master", br], check=False)
-    subprocess.run(["ip", "link", "set", ap_if, "master", br], check=False)
+    def cleanup_defaults() -> None:
+        _cleanup_duplicate_defaults(preferred_if="wlan0")
+        _net().flush_route_cache()
+
+    return [
+        Action("dhcpcd mode", "station", run=partial(_set_dhcpcd_mode, "station", *_dhcp_devs(cfg))),
+        Action("remove bridge", run=_rm_bridge),
+        Action(
+            "write wpa_supplicant",
+            run=partial(
+                _write,
+                WPA_SUPPLICANT_WLAN0,
+                render_wpa_supplicant(cfg.wlan.country, cfg.wan.upstream_ssid, cfg.wan.upstream_psk),
+            ),
+        ),
+        Action("join upstream", cfg.wan.upstream_ssid, run=_join_upstream,
+               after=("write wpa_supplicant", "dhcpcd mode")),
+        Action("release eth0", run=partial(_dhcp_release, "eth0"), after=("dhcpcd mode", "remove bridge")),
+        Action("wan addressing", f"wlan0 {cfg.wan.ipv4}", run=partial(_dhcp_or_static, "wlan0", cfg),
+               after=("join upstream", "release eth0")),
+        Action("cleanup defaults", run=cleanup_defaults, after=("wan addressing",)),
+        Action("lan address", cfg.lan.address, run=partial(_lan_addr, "eth0", cfg.lan.address),
+               after=("release eth0",)),
+        Action("write dnsmasq", run=partial(_write, DNSMASQ_PATH, render_dnsmasq(cfg, lan_if="eth0"))),
+        Action("restart dnsmasq", run=partial(_restart_service, "dnsmasq"), after=("write dnsmasq", "lan address")),
+        Action("stop hostapd", run=partial(_stop_service, "hostapd")),
+        Action("router sysctls", run=partial(_enable_router_sysctls, cfg)),
+        Action("cpu tuning", run=partial(_apply_tuning, cfg, _mode_ifaces(cfg))),
+        Action(
+            "firewall",
+            run=lambda: _persist_nft_rules(cfg, wan_if=_detect_default_uplink() or "wlan0", lan_if="eth0"),
+            after=("cleanup defaults",),
+        ),
+        Action("qos", run=lambda: _apply_qos(cfg, _detect_default_uplink() or "wlan0"), after=("cleanup defaults",)),
+        Action("avahi", run=_enable_avahi, after=("firewall",)),
+    ]
 
-    conf = render_hostapd(cfg, ap_if=ap_if)
-    if f"\nbridge={br}\n" not in conf and not conf.rstrip().endswith(f"bridge={br}"):
-        conf = conf.rstrip() + f"\nbridge={br}\n"
-    _write(HOSTAPD_PATH, conf)
-    subprocess.run(["systemctl", "enable", "hostapd"], check=False)
-    subprocess.run(["systemctl", "restart", "hostapd"], check=False)
 
-    if _have("dhcpcd"):
-        subprocess.run(["mkdir", "-p", "/etc/dhcpcd.conf.d"], check=False)
-
-        bridge_conf = (
-            "# Managed by hamsterfi (bridge mode)\n"
-            "denyinterfaces eth0\n"
-            f"denyinterfaces {ap_if}\n"
-            "\n"
-            f"interface {br}\n"
-            "  ipv4only\n"
-            "  metric 50\n"
-        )
-        _write("/etc/dhcpcd.conf.d/99-hamsterfi-bridge.conf", bridge_conf)
+def _bridge_ap_steps(cfg: AppConfig) -> List[Action]:
+    br = "br0"
+    ctx = {"ap_if": "ap0"}
+
+    def ensure_ap() -> None:
+        ctx["ap_if"] = _ensure_ap_iface()
+
+    def disable_router() -> None:
+        _stop_service("dnsmasq")
+        # drop only our tables; stopping the unit would flush every table on the box
+        tables = list(OWNED_TABLES) + legacy_tables(_host().read_text(NFT_PATH))
+        _host().run(delete_tables_cmd(tables), check=False)
+        # so the boot replay doesn't load the flowtable again
+        _host().remove(FASTPATH_PATH)
+        _host().run(["systemctl", "disable", "nftables"], check=False)
+
+    def build_bridge() -> None:
+        ap_if = ctx["ap_if"]
+        net = _net()
+        net.add_bridge(br, stp=False)
+        with net.batch():
+            net.link_up(br)
+            net.link_up("eth0")
+            net.link_up(ap_if)
+            net.set_master("eth0", br)
+            net.set_master(ap_if, br)
+
+    def bridge_dhcp() -> None:
+        if _have("dhcpcd"):
+            _write(DHCPCD_BRIDGE_DROPIN, _bridge_dhcpcd_conf(ctx["ap_if"], br=br))
 
-        subprocess.run(["systemctl", "restart", "dhcpcd"], check=False)
+            _host().run(["systemctl", "restart", "dhcpcd"], check=False)
 
-        subprocess.run(["dhcpcd", "-k", "eth0"], check=False)
-        subprocess.run(["dhcpcd", "-4", "-t", "25", "-w", br], check=False)
+            _host().run(["dhcpcd", "-k", "eth0"], check=False)
+            _host().run(["dhcpcd", "-4", "-t", "25", "-w", br], check=False)
 
-    elif _have("dhclient"):
-        subprocess.run(["dhclient", "-v", "-r", br], check=False)
-        subprocess.run(["dhclient", "-v", br], check=False)
+        elif _have("dhclient"):
+            _host().run(["dhclient", "-v", "-r", br], check=False)
+            _host().run(["dhclient", "-v", br], check=False)
 
-    got_ip = False
-    deadline = time.time() + 25
-    while time.time() < deadline:
-        out = subprocess.check_output(["ip", "-4", "-br", "addr", "show", br], text=True).strip()
-        if ("/" in out and br in out) and ("169.254." not in out):
-            got_ip = True
-            break
-        time.sleep(1)
+    def wait_bridge_ip() -> None:
+        ap_if = ctx["ap_if"]
 
-    if not got_ip:
-        subprocess.run(["ip", "link", "set", "eth0", "nomaster"], check=False)
-        subprocess.run(["ip", "link", "set", ap_if, "nomaster"], check=False)
-        subprocess.run(["ip", "link", "del", br], check=False)
+        def _has_lease() -> bool:
+            addrs = _net().addrs(br).get(br, [])
+            return any("." in a and not a.startswith("169.254.") for a in addrs)
 
-        if _have("dhcpcd"):
-            subprocess.run(["systemctl", "restart", "dhcpcd"], check=False)
-            subprocess.run(["dhcpcd", "-n", "eth0"], check=False)
-        elif _have("dhclient"):
-            subprocess.run(["dhclient", "-v", "eth0"], check=False)
+        with metrics.span("wait", f"{br} address"):
+            got_ip = _host().wait_for(_has_lease, 25, groups=RTMGRP_IPV4_IFADDR)
 
-        raise RuntimeError(
-            "Bridge AP: br0 did not obtain a DHCP address; rolled back to avoid leaving UI unreachable."
-        )
+        if not got_ip:
+            net = _net()
+            with net.batch():
+                net.set_master("eth0", None)
+                net.set_master(ap_if, None)
+                net.link_del(br)
 
-    subprocess.run(["ip", "addr", "flush", "dev", "eth0"], check=False)
-    subprocess.run(["ip", "addr", "flush", "dev", ap_if], check=False)
+            if _have("dhcpcd"):
+                _host().run(["systemctl", "restart", "dhcpcd"], check=False)
+                _host().run(["dhcpcd", "-n", "eth0"], check=False)
+            elif _have("dhclient"):
+                _host().run(["dhclient", "-v", "eth0"], check=False)
 
-    subprocess.run(["ip", "route", "del", "default", "dev", "eth0"], check=False)
+            raise RuntimeError(
+                "Bridge AP: br0 did not obtain a DHCP address; rolled back to avoid leaving UI unreachable."
+            )
 
-    gw = None
-    try:
-        d = _out(["ip", "-4", "route", "show", "default", "dev", br]).strip()
-    except Exception:
-        d = ""
-    for ln in d.splitlines():
-        parts = ln.split()
-        if len(parts) >= 3 and parts[0] == "default" and parts[1] == "via":
-            gw = parts[2]
-            break
-    if gw:
-        subprocess.run(["ip", "route", "replace", "default", "via", gw, "dev", br, "metric", "50"], check=False)
-
-    subprocess.run(["ip", "route", "flush", "cache"], check=False)
+    def bridge_routes() -> None:
+        net = _net()
+        with net.batch():
+            net.addr_flush("eth0")
+            net.addr_flush(ctx["ap_if"])
+            net.route_del_default(dev="eth0")
+
+        gw = _default_gw_for_dev(br)
+        if gw:
+            net.route_replace_default(gw, dev=br, metric=50)
+
+        net.flush_route_cache()
+
+    return [
+        Action("ensure ap0", run=ensure_ap),
+        Action("disable router services", "dnsmasq, nftables", run=disable_router),
+        Action("remove bridge", run=_rm_bridge),
+        Action("build bridge", f"eth0 + ap0 -> {br}", run=build_bridge, after=("ensure ap0", "remove bridge")),
+        Action("write hostapd", run=lambda: _write(HOSTAPD_PATH, _bridge_hostapd_conf(cfg, ap_if=ctx["ap_if"], br=br)),
+               after=("ensure ap0",)),
+        Action("restart hostapd", run=partial(_restart_service, "hostapd"), after=("write hostapd", "build bridge")),
+        Action("bridge dhcp", br, run=bridge_dhcp, after=("build bridge",)),
+        Action("wait bridge address", br, run=wait_bridge_ip, after=("bridge dhcp",)),
+        Action("bridge routes", run=bridge_routes, after=("wait bridge address",)),
+        Action("cpu tuning", run=lambda: _apply_tuning(cfg, _mode_ifaces(cfg, ctx["ap_if"])), after=("ensure ap0",)),
+        Action("qos", "off in bridge mode", run=partial(_apply_qos, cfg, None)),
+    ]
@@ -0,0 +1,99 @@
+"""
+Multi-WAN load balancing for the AP profile (wan.balance).
+
+Every uplink has a connection mark, a routing table and an ip rule:
+
+    1000: lookup main suppress_prefixlength 0
+    1001: fwmark 0x1 lookup 101      eth0
+    1002: fwmark 0x2 lookup 102      wlan0
+
+nftables (nft.py) gives each new flow from the LAN a mark picked by `numgen
+random` over the weights, keeps it in the conntrack entry and copies it onto
+every packet of the flow before routing, so a flow stays on one uplink; there
+is a masquerade rule per uplink. Rule 1000 lets main answer for everything
+more specific than a default (connected networks such as the modem's LAN).
+
+A table holds its uplink's default route only while the failover monitor sees
+the uplink as healthy (sync_tables()). A mark whose table is empty falls
+through to main, i.e. to the metric-50 uplink.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from hamsterfi.core.models import AppConfig
+from hamsterfi.system.net import TABLE_NAMES, NetBackend, Rule
+
+MARKS = {"eth0": 1, "wlan0": 2}
+TABLE_BASE = 100
+RULE_BASE = 1000
+# priorities RULE_BASE .. RULE_BASE + RULE_SPAN - 1 are ours
+RULE_SPAN = 10
+
+
+@dataclass
+class Member:
+    dev: str
+    weight: int
+
+    @property
+    def mark(self) -> int:
+        return MARKS[self.dev]
+
+    @property
+    def table(self) -> int:
+        return table(self.dev)
+
+
+def balancing(cfg: AppConfig) -> bool:
+    return cfg.mode == "ap" and cfg.wan.balance.enabled
+
+
+def members(cfg: AppConfig) -> List[Member]:
+    """Uplinks new flows are spread over (weight > 0); empty when not balancing."""
+    if not balancing(cfg):
+        return []
+    return [Member(dev, cfg.wan.balance.weights.get(dev, 0)) for dev in MARKS
+            if cfg.wan.balance.weights.get(dev, 0) > 0]
+
+
+def table(dev: str) -> int:
+    return TABLE_BASE + MARKS[dev]
+
+
+def rules(cfg: AppConfig) -> List[Rule]:
+    ms = members(cfg)
+    if not ms:
+        return []
+    out = [Rule(RULE_BASE, TABLE_NAMES["main"], suppress_prefixlength=0)]
+    return out + [Rule(RULE_BASE + m.mark, m.table, fwmark=m.mark) for m in ms]
+
+
+def ours(rule: Rule) -> bool:
+    return RULE_BASE <= rule.priority < RULE_BASE + RULE_SPAN
+
+
+def sync_rules(net: NetBackend, want: List[Rule]) -> None:
+    have = [r for r in net.rules() if ours(r)]
+    if have == want:
+        return
+    with net.batch():
+        for r in have:
+            if r not in want:
+                net.rule_del(r.priority)
+        for r in want:
+            if r not in have:
+                net.rule_add(r)
+
+
+def sync_tables(net: NetBackend, gateways: Dict[str, Optional[str]]) -> None:
+    """Route each uplink's table via its gateway, or leave it empty (gateway None / not listed)."""
+    current = {dev: net.default_routes(table=table(dev)) for dev in MARKS}
+    with net.batch():
+        for dev, routes in current.items():
+            gw = gateways.get(dev)
+            if gw and not any(r.via == gw and r.dev == dev for r in routes):
+                net.route_replace_default(gw, dev=dev, table=table(dev))
+            for r in routes:
+                if r.via != gw or r.dev != dev:
+                    net.route_del_default(dev=r.dev, via=r.via, metric=r.metric, table=table(dev))
+    net.flush_route_cache()
@@ -0,0 +1,99 @@
+"""
+Boot fast path, run by hamsterfi-boot.service:
+
+    python -m hamsterfi.system.boot
+
+If the snapshot the last apply recorded still matches the config and the
+managed files, replay it (ap0/br0, static addresses and routes,
+hostapd/dnsmasq) and wait for the DHCP leases, which the enabled dhcpcd and
+wpa_supplicant units bring in on their own. apply() then only has to verify;
+its plan is empty unless something is really off. Without a usable snapshot
+it is a plain full apply, and so is a verification that finds the topology
+still wrong.
+"""
+import os
+import sys
+import time
+
+from hamsterfi.core.config import load_config
+from hamsterfi.core.models import AppConfig
+from hamsterfi.system.apply import (
+    apply,
+    boot_snapshot_problem,
+    load_boot_snapshot,
+    replay_boot_snapshot,
+    restore_lease_routes,
+)
+from hamsterfi.system.host import get_host
+from hamsterfi.system.snapshot import BootSnapshot
+
+# association (20 s) plus a DHCP lease, the same budget full apply gives them
+BOOT_VERIFY_S = float(os.environ.get("HAMSTERFI_BOOT_VERIFY_S", "30"))
+
+
+def _log(msg: str) -> None:
+    print(f"[hamsterfi-boot] {msg}", flush=True)
+
+
+def _leases_in(snap: BootSnapshot) -> bool:
+    net = get_host().net()
+    addrs, routes = net.addrs(), net.default_routes()
+    # a failover backup may stay dark (no cable, hotspot off); the preferred uplink may not
+    preferred = snap.routes[0]["dev"] if snap.routes else None
+    return all(
+        any("." in a and not a.startswith("169.254.") for a in addrs.get(dev, []))
+        and any(r.dev == dev for r in routes)
+        for dev in snap.dhcp
+        if dev == preferred or preferred is None
+    )
+
+
+def run(cfg: AppConfig, verify_s: float = BOOT_VERIFY_S) -> dict:
+    """Replay or fall back; returns what happened, for the log and the bench."""
+    t0 = time.monotonic()
+    snap = load_boot_snapshot()
+    problem = boot_snapshot_problem(snap, cfg)
+    replayed = False
+    if problem is None:
+        try:
+            replay_boot_snapshot(snap)
+            replayed = True
+        except Exception as e:
+            problem = f"replay failed: {e}"
+
+    restored_s = None
+    if replayed:
+        # everything static is back; the rest is dhcpcd (and wpa_supplicant) catching up
+        if get_host().wait_for(lambda: _leases_in(snap), verify_s):
+            restore_lease_routes(snap)
+            restored_s = time.monotonic() - t0
+        else:
+            problem = f"no DHCP lease on {', '.join(snap.dhcp)} after {verify_s:.0f}s"
+
+    # verification: normally an empty plan, a full apply if the topology is still off
+    plan = apply(cfg)
+    return {
+        "replayed": replayed,
+        "fallback": problem,
+        "restored_s": restored_s,
+        "plan": "full" if plan.full else f"{len(plan.actions)} steps",
+        "total_s": time.monotonic() - t0,
+    }
+
+
+def main() -> int:
+    cfg = load_config()
+    try:
+        res = run(cfg)
+    except Exception as e:
+        _log(f"failed: {e}")
+        return 1
+    if res["fallback"]:
+        _log(f"full apply ({res['fallback']}), {res['total_s']:.1f}s")
+    else:
+        _log(f"restored in {res['restored_s']:.1f}s, verify plan: {res['plan']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
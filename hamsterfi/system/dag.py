@@ -0,0 +1,128 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from hamsterfi.core import metrics
+from hamsterfi.system.plan import Action
+
+log = logging.getLogger(__name__)
+
+# on_event(kind, action) with kind in "start", "done", "failed"; called from worker threads
+StepListener = Callable[[str, Action], None]
+
+
+def _check_graph(actions: Sequence[Action]) -> Dict[str, Action]:
+    by_name: Dict[str, Action] = {}
+    for a in actions:
+        if a.name in by_name:
+            raise ValueError(f"duplicate step: {a.name}")
+        by_name[a.name] = a
+    for a in actions:
+        for dep in a.after:
+            if dep not in by_name:
+                raise ValueError(f"step {a.name!r} depends on unknown step {dep!r}")
+
+    # Kahn's algorithm, only to reject cycles before anything runs
+    indeg = {a.name: len(a.after) for a in actions}
+    ready = [n for n, d in indeg.items() if d == 0]
+    seen = 0
+    while ready:
+        n = ready.pop()
+        seen += 1
+        for a in actions:
+            if n in a.after:
+                indeg[a.name] -= 1
+                if indeg[a.name] == 0:
+                    ready.append(a.name)
+    if seen != len(actions):
+        raise ValueError("apply steps contain a dependency cycle")
+    return by_name
+
+
+def critical_path(actions: Sequence[Action]) -> Tuple[List[str], float]:
+    """Longest chain of measured durations through the graph."""
+    by_name = {a.name: a for a in actions}
+    best: Dict[str, Tuple[float, List[str]]] = {}
+
+    def walk(name: str) -> Tuple[float, List[str]]:
+        if name not in best:
+            a = by_name[name]
+            own = a.duration or 0.0
+            prev = max((walk(d) for d in a.after), key=lambda x: x[0], default=(0.0, []))
+            best[name] = (prev[0] + own, prev[1] + [name])
+        return best[name]
+
+    total, path = max((walk(a.name) for a in actions), key=lambda x: x[0], default=(0.0, []))
+    return path, total
+
+
+def run_graph(
+    actions: Sequence[Action], max_workers: int = 4, on_event: Optional[StepListener] = None
+) -> Tuple[List[str], float]:
+    """
+    Run every action once all of its `after` steps have finished, as many at a
+    time as max_workers allows. The first failure stops scheduling; steps that
+    are already running are allowed to finish, then the error is re-raised.
+    Returns the critical path and its length in seconds.
+
+    on_event, if given, is told when each step starts and finishes.
+    """
+    by_name = _check_graph(actions)
+    pending = {a.name: set(a.after) for a in actions}
+    error = None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="apply") as pool:
+        running = {}
+
+        def _notify(kind: str, a: Action) -> None:
+            if on_event is None:
+                return
+            try:
+                on_event(kind, a)
+            except Exception:
+                log.exception("apply step listener failed")
+
+        def _timed(a: Action) -> None:
+            _notify("start", a)
+            t0 = time.monotonic()
+            try:
+                with metrics.span("step", a.name, detail=a.detail):
+                    if a.run is not None:
+                        a.run()
+            except Exception as e:
+                a.duration = time.monotonic() - t0
+                a.error = str(e)
+                metrics.STEP_SECONDS.observe(a.duration, a.name, "error")
+                _notify("failed", a)
+                raise
+            a.duration = time.monotonic() - t0
+            metrics.STEP_SECONDS.observe(a.duration, a.name, "ok")
+            _notify("done", a)
+
+        def _submit_ready() -> None:
+            for name in [n for n, deps in pending.items() if not deps]:
+                del pending[name]
+                running[pool.submit(_timed, by_name[name])] = name
+
+        _submit_ready()
+        while running:
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                exc = fut.exception()
+                if exc is not None:
+                    if error is None:
+                        error = exc
+                    continue
+                for deps in pending.values():
+                    deps.discard(name)
+            if error is None:
+                _submit_ready()
+
+    if error is not None:
+        raise error
+
+    path, total = critical_path(actions)
+    log.info("apply critical path %.2fs: %s", total, " -> ".join(path))
+    return path, total
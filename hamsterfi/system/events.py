@@ -0,0 +1,151 @@
+"""
+Readiness waits driven by kernel / wpa_supplicant events instead of sleep loops.
+
+Every wait keeps its timeout as an upper bound and re-checks its condition as
+soon as something relevant happens. When the event source is unavailable we
+fall back to polling so apply still works on odd setups.
+"""
+import os
+import select
+import socket
+import tempfile
+import time
+from typing import Callable, Optional
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+
+WPA_CTRL_DIR = os.environ.get("HAMSTERFI_WPA_CTRL_DIR", "/var/run/wpa_supplicant")
+
+
+def _netlink_subscribe(groups: int) -> Optional[socket.socket]:
+    if not hasattr(socket, "AF_NETLINK"):
+        return None
+    try:
+        s = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, 0)
+        s.bind((0, groups))
+        s.setblocking(False)
+        return s
+    except OSError:
+        return None
+
+
+def wait_for(
+    predicate: Callable[[], bool],
+    timeout_s: float,
+    groups: int = RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE,
+    recheck_s: Optional[float] = None,
+    poll_s: float = 0.5,
+) -> bool:
+    """
+    Return True as soon as predicate() holds, False after timeout_s.
+
+    We subscribe to the rtnetlink multicast groups before the first check so
+    an address or route that shows up in between is not missed; after that the
+    predicate only runs when a netlink message arrives (or every recheck_s,
+    for conditions that have sources outside the kernel, like lease files).
+    """
+    deadline = time.monotonic() + timeout_s
+    sock = _netlink_subscribe(groups)
+    try:
+        while True:
+            if predicate():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if sock is None:
+                time.sleep(min(poll_s, remaining))
+                continue
+            wait_s = remaining if recheck_s is None else min(recheck_s, remaining)
+            ready, _, _ = select.select([sock], [], [], wait_s)
+            if ready:
+                # drain everything queued, one predicate check per burst
+                try:
+                    while sock.recv(1 << 16):
+                        pass
+                except (BlockingIOError, InterruptedError):
+                    pass
+    finally:
+        if sock is not None:
+            sock.close()
+
+
+class WpaCtrl:
+    """Minimal client for the wpa_supplicant control socket."""
+
+    def __init__(self, iface: str, ctrl_dir: str = WPA_CTRL_DIR) -> None:
+        self.path = os.path.join(ctrl_dir, iface)
+        self.local = os.path.join(tempfile.gettempdir(), f"hamsterfi-wpa-{os.getpid()}-{id(self)}")
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self.sock.bind(self.local)
+            self.sock.connect(self.path)
+        except OSError:
+            self.close()
+            raise
+
+    def request(self, cmd: str, timeout_s: float = 2.0) -> str:
+        self.sock.send(cmd.encode())
+        deadline = time.monotonic() + timeout_s
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"wpa_supplicant did not answer {cmd}")
+            ready, _, _ = select.select([self.sock], [], [], remaining)
+            if not ready:
+                continue
+            reply = self.sock.recv(4096).decode(errors="replace")
+            # unsolicited events start with "<level>", skip them while waiting for a reply
+            if not reply.startswith("<"):
+                return reply
+
+    def close(self) -> None:
+        try:
+            self.sock.close()
+        finally:
+            try:
+                os.unlink(self.local)
+            except OSError:
+                pass
+
+
+def wait_wpa_connected(
+    iface: str, timeout_s: float, ctrl_dir: str = WPA_CTRL_DIR, connect_grace_s: float = 3.0
+) -> Optional[bool]:
+    """
+    Wait for CTRL-EVENT-CONNECTED on iface's control socket.
+
+    Returns None when the control socket did not become reachable within
+    connect_grace_s, so the caller can fall back to another method; otherwise
+    True/False.
+    """
+    deadline = time.monotonic() + timeout_s
+    give_up = time.monotonic() + min(connect_grace_s, timeout_s)
+    ctrl = None
+    # the socket appears a moment after (re)starting wpa_supplicant
+    while ctrl is None:
+        try:
+            ctrl = WpaCtrl(iface, ctrl_dir)
+        except OSError:
+            if time.monotonic() >= give_up:
+                return None
+            time.sleep(0.1)
+
+    try:
+        if ctrl.request("ATTACH").strip() != "OK":
+            return None
+        if "wpa_state=COMPLETED" in ctrl.request("STATUS"):
+            return True
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            ready, _, _ = select.select([ctrl.sock], [], [], remaining)
+            if ready and "CTRL-EVENT-CONNECTED" in ctrl.sock.recv(4096).decode(errors="replace"):
+                return True
+    except (OSError, TimeoutError):
+        return None
+    finally:
+        ctrl.close()
@@ -0,0 +1,335 @@
+"""
+WAN failover monitor, run by hamsterfi-failover.service in AP mode with
+wan.failover or wan.balance enabled:
+
+    python -m hamsterfi.system.failover [run]
+    python -m hamsterfi.system.failover status
+
+wan.device is the primary uplink and the other interface the backup; apply
+keeps both addressed and gives the primary the metric-50 default route and the
+backup metric 5000 (_prefer_default). Every failover.interval_ms each uplink
+gets an ARP request to its gateway and an ICMP echo to failover.target sent
+out of that interface, and between rounds the monitor sleeps on rtnetlink link
+events, so a pulled cable or a lost association is seen at once. An uplink is
+down when it has no carrier or no gateway, or when its probes have been
+failing for failover.detect_ms.
+
+When the uplink holding metric 50 goes down and another one is up,
+apply.switch_uplink() reloads nftables with masquerade on the new uplink,
+swaps the two route metrics in one netlink batch, drops conntrack entries
+NATed to the old address and re-runs QoS. Moving back to the primary waits
+until it has been up for failover.failback_s. Switches are logged to stdout
+(the journal) as "[hamsterfi-failover] ..."; the UI reads FAILOVER_STATE.
+
+With wan.balance the monitor also owns the rotation: each healthy member's
+routing table points at its gateway, a failing member's table is emptied
+(apply.rotate_uplinks()) and it rejoins after the same failback_s hold-down.
+"""
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from hamsterfi.core.config import config_snapshot
+from hamsterfi.core.models import AppConfig
+from hamsterfi.system import balance
+from hamsterfi.system.events import RTMGRP_LINK
+from hamsterfi.system.host import Host, get_host
+from hamsterfi.system.snapshot import APP_DIR
+
+FAILOVER_UNIT = "/etc/systemd/system/hamsterfi-failover.service"
+FAILOVER_SERVICE = "hamsterfi-failover"
+FAILOVER_STATE = os.environ.get("HAMSTERFI_FAILOVER_STATE", "/run/hamster-fi/failover.json")
+EVENTS_KEEP = 20
+
+
+def _log(msg: str) -> None:
+    print(f"[hamsterfi-failover] {msg}", flush=True)
+
+
+def uplinks(cfg: AppConfig) -> List[str]:
+    """Interfaces an AP config uses as WAN, preferred first: wan.device, then the failover backup / balance member."""
+    primary = cfg.wan.device
+    if cfg.mode != "ap" or not (cfg.wan.failover.enabled or cfg.wan.balance.enabled):
+        return [primary]
+    return [primary, "wlan0" if primary == "eth0" else "eth0"]
+
+
+def render_failover_unit(python: str = sys.executable, app_dir: str = APP_DIR) -> str:
+    return f"""[Unit]
+Description=Hamster-Fi WAN failover monitor
+After=network.target hamsterfi-boot.service
+
+[Service]
+Type=simple
+WorkingDirectory={app_dir}
+ExecStart={python} -m hamsterfi.system.failover
+Restart=always
+RestartSec=1
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+@dataclass
+class Health:
+    dev: str
+    up: bool = True  # innocent until its probes fail for detect_ms
+    carrier: bool = False
+    gateway: Optional[str] = None
+    arp: Optional[bool] = None  # None: couldn't ask
+    rtt_ms: Optional[float] = None
+    problem: Optional[str] = None
+    last_ok: float = 0.0  # host.clock()
+    up_since: Optional[float] = None
+
+
+class Monitor:
+    def __init__(self, host: Optional[Host] = None, config: Callable[[], AppConfig] = config_snapshot) -> None:
+        self.host = host or get_host()
+        self.config = config
+        self.health: Dict[str, Health] = {}
+        self.events: List[dict] = []
+        self.active: Optional[str] = None
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="failover-probe")
+        self._saved: Optional[tuple] = None
+        self._saved_at = 0.0
+        self._stranded = False
+        # wan.balance: dev -> gateway its table routes via (None: out of rotation), and the config the rules are for
+        self.rotation: Optional[Dict[str, Optional[str]]] = None
+        self._rules_for: Optional[AppConfig] = None
+
+    # -- probing ----------------------------------------------------------
+
+    def _carriers(self, devs: List[str]) -> Dict[str, bool]:
+        links = self.host.net().links()
+        return {d: bool(links.get(d) and links[d].carrier) for d in devs}
+
+    def _probe(self, dev: str, target: str, timeout_s: float) -> Tuple[Optional[str], Optional[bool], Optional[float]]:
+        gw = self.host.net().default_gw(dev)
+        if not gw:
+            return None, None, None
+        arp = self._pool.submit(self.host.arp_probe, dev, gw, timeout_s)
+        rtt = self.host.ping(dev, target or gw, timeout_s)
+        return gw, arp.result(), rtt
+
+    def check(self, cfg: AppConfig) -> Dict[str, bool]:
+        """One probe round over every uplink; returns the carriers it saw."""
+        fo = cfg.wan.failover
+        devs = uplinks(cfg)
+        carriers = self._carriers(devs)
+        timeout_s = fo.interval_ms / 1000
+        probes = {d: self._pool.submit(self._probe, d, fo.target, timeout_s) for d in devs if carriers[d]}
+        for dev in devs:
+            gw, arp, rtt = probes[dev].result() if dev in probes else (None, None, None)
+            now = self.host.clock()
+            h = self.health.setdefault(dev, Health(dev, last_ok=now, up_since=now))
+            h.carrier, h.gateway, h.arp = carriers[dev], gw, arp
+            h.rtt_ms = None if rtt is None else round(rtt * 1000, 1)
+            if not h.carrier:
+                h.problem = "no carrier"
+            elif not gw:
+                h.problem = "no gateway"
+            elif arp is False:
+                h.problem = f"gateway {gw} not answering ARP"
+            elif rtt is None:
+                h.problem = f"{fo.target or gw} unreachable via {dev}"
+            else:
+                h.problem = None
+
+            if h.problem is None:
+                h.last_ok = now
+                if not h.up:
+                    h.up, h.up_since = True, now
+            elif h.up and (not h.carrier or not gw or now - h.last_ok >= fo.detect_ms / 1000):
+                h.up, h.up_since = False, None
+        for dev in list(self.health):
+            if dev not in devs:
+                del self.health[dev]
+        return carriers
+
+    # -- switching --------------------------------------------------------
+
+    def _preferred(self, devs: List[str]) -> Optional[str]:
+        """The uplink holding the metric-50 default; its routes vanish with its lease, so keep the last one."""
+        for r in self.host.net().default_routes():
+            if r.dev in devs and r.metric == 50:
+                return r.dev
+        return self.active if self.active in devs else None
+
+    def decide(self, cfg: AppConfig) -> Optional[dict]:
+        """Switch the preferred uplink if the health says so; returns the event."""
+        devs = uplinks(cfg)
+        primary = devs[0]
+        self.active = self._preferred(devs) or primary
+        active = self.health.get(self.active)
+        now = self.host.clock()
+        if active is not None and not active.up:
+            to = next((d for d in devs if d != self.active and self.health.get(d) and self.health[d].up), None)
+            if to is None:
+                if not self._stranded:
+                    _log(f"no healthy uplink: {', '.join(f'{d} {self.health[d].problem}' for d in devs if d in self.health)}")
+                    self._stranded = True
+                return None
+            return self._switch(cfg, to, "failback" if to == primary else "failover", active.problem or "down",
+                                now - active.last_ok)
+        self._stranded = False
+        back = self.health.get(primary)
+        if (self.active != primary and back is not None and back.up and back.up_since is not None
+                and now - back.up_since >= cfg.wan.failover.failback_s):
+            return self._switch(cfg, primary, "failback", f"{primary} healthy for {cfg.wan.failover.failback_s}s")
+        return None
+
+    def _switch(self, cfg: AppConfig, to: str, kind: str, reason: str,
+                waited_s: Optional[float] = None) -> Optional[dict]:
+        from hamsterfi.system.apply import switch_uplink
+
+        old = self.active
+        t0 = self.host.clock()
+        try:
+            switch_uplink(cfg, to, old)
+        except Exception as e:
+            _log(f"{kind} {old} -> {to} failed: {e}")
+            return None
+        event = {
+            "time": time.time(), "kind": kind, "from": old, "to": to, "reason": reason,
+            # how long the old uplink had been failing its probes when it was given up
+            "detect_ms": None if waited_s is None else round(waited_s * 1000),
+            "switch_ms": round((self.host.clock() - t0) * 1000),
+        }
+        self.active = to
+        self.events = (self.events + [event])[-EVENTS_KEEP:]
+        down = f"down for {event['detect_ms']} ms, " if waited_s is not None else ""
+        _log(f"{kind} {old} -> {to}: {reason} ({down}switched in {event['switch_ms']} ms)")
+        self.save(force=True)
+        return event
+
+    # -- balancing --------------------------------------------------------
+
+    def rotate(self, cfg: AppConfig) -> None:
+        """wan.balance: keep healthy members' tables routed; a member that went down rejoins after failback_s."""
+        net = self.host.net()
+        if cfg is not self._rules_for:
+            # first round (boot) or a new config: the ip rules go with it
+            balance.sync_rules(net, balance.rules(cfg))
+            self._rules_for = cfg
+        now = self.host.clock()
+        old = self.rotation or {}
+        want: Dict[str, Optional[str]] = {}
+        for m in balance.members(cfg):
+            h = self.health.get(m.dev)
+            if h is None or not h.up or not h.gateway:
+                continue
+            if self.rotation is None or old.get(m.dev) or now - (h.up_since or now) >= cfg.wan.failover.failback_s:
+                want[m.dev] = h.gateway
+        if want == old and self.rotation is not None:
+            return
+        from hamsterfi.system.apply import rotate_uplinks
+
+        try:
+            rotate_uplinks(want, old)
+        except Exception as e:
+            _log(f"balance: updating the uplink tables failed: {e}")
+            return
+        for dev in sorted(set(old) - set(want)):
+            h = self.health.get(dev)
+            _log(f"balance: {dev} out of rotation ({h.problem if h and h.problem else 'not a member'})")
+        if self.rotation is not None:
+            for dev in sorted(set(want) - set(old)):
+                _log(f"balance: {dev} back in rotation")
+        self.rotation = want
+
+    # -- state ------------------------------------------------------------
+
+    def describe(self) -> dict:
+        return {
+            "active": self.active,
+            "balancing": sorted(self.rotation or {}),
+            "uplinks": {d: {k: v for k, v in asdict(h).items() if k not in ("last_ok", "up_since")}
+                        for d, h in self.health.items()},
+            "events": list(self.events),
+            "updated": time.time(),
+        }
+
+    def save(self, force: bool = False) -> None:
+        """FAILOVER_STATE for the UI: on every change, and every few seconds for the round trips."""
+        key = (self.active, tuple(sorted(self.rotation or {})),
+               tuple((d, h.up, h.carrier, h.problem) for d, h in self.health.items()))
+        now = self.host.clock()
+        if not force and key == self._saved and now - self._saved_at < 5:
+            return
+        self._saved, self._saved_at = key, now
+        self.host.write_text(FAILOVER_STATE, json.dumps(self.describe(), indent=1) + "\n")
+
+    def run(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            cfg = self.config()
+            if len(uplinks(cfg)) < 2:
+                # switched off in the config; apply stops the unit, until then just idle
+                self.host.wait_for(stop.is_set, 5.0)
+                continue
+            started = self.host.clock()
+            carriers = self.check(cfg)
+            self.decide(cfg)
+            if self.rotation is not None or balance.balancing(cfg):
+                self.rotate(cfg)
+                if not balance.balancing(cfg):
+                    self.rotation = None
+            self.save()
+            # rest of the interval, cut short by any link (carrier) change
+            remaining = cfg.wan.failover.interval_ms / 1000 - (self.host.clock() - started)
+            if remaining > 0:
+                devs = list(carriers)
+                self.host.wait_for(lambda: stop.is_set() or self._carriers(devs) != carriers, remaining,
+                                   groups=RTMGRP_LINK)
+        self.host.remove(FAILOVER_STATE)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+def status(cfg: AppConfig) -> dict:
+    """Config plus what the running monitor last wrote (None when it isn't running)."""
+    try:
+        state = json.loads(get_host().read_text(FAILOVER_STATE) or "")
+    except ValueError:
+        state = None
+    return {
+        "enabled": len(uplinks(cfg)) > 1,
+        "uplinks": uplinks(cfg),
+        "settings": cfg.wan.failover.model_dump(),
+        "balance": cfg.wan.balance.model_dump() if balance.balancing(cfg) else None,
+        "monitor": state,
+    }
+
+
+def main(argv: List[str]) -> int:
+    cmd = argv[0] if argv else "run"
+    if cmd == "status":
+        print(json.dumps(status(config_snapshot()), indent=2))
+        return 0
+    if cmd != "run":
+        print("usage: python -m hamsterfi.system.failover [run | status]", file=sys.stderr)
+        return 2
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    monitor = Monitor()
+    cfg = config_snapshot()
+    _log(f"watching {', '.join(uplinks(cfg))} (target {cfg.wan.failover.target}, "
+         f"detect {cfg.wan.failover.detect_ms} ms, failback {cfg.wan.failover.failback_s}s)")
+    try:
+        monitor.run(stop)
+    finally:
+        monitor.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
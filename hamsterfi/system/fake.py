@@ -0,0 +1,764 @@
+"""
+A scripted Raspberry Pi for running apply() on any Linux box.
+
+FakeSystem is a Host whose commands, files, links, addresses, routes and
+waits are all simulated: systemctl/dhcpcd/iw/nft/sysctl invocations update
+an in-memory model of the machine, wpa_supplicant associates and dhcpcd hands
+out leases after configurable delays, and every rendered file lands under a
+temporary root instead of /etc.
+
+Delays are in simulated seconds and are slept for real, multiplied by
+`scale`, so apply's thread pool and event waits behave as they would on the
+device, only faster. Divide measured times by `scale` to get simulated ones.
+
+    with FakeSystem() as pi, use_host(pi):
+        plan = apply(cfg)
+    print(len(pi.calls), pi.netlink_round_trips, plan.wall_s / pi.scale)
+"""
+import errno
+import glob
+import ipaddress
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from hamsterfi.system import events
+from hamsterfi.system.host import Host
+from hamsterfi.system.net import TABLE_NAMES, DefaultRoute, Link, NetBackend, Rule
+from hamsterfi.system.render import WPA_SUPPLICANT_WLAN0
+
+# simulated seconds
+DEFAULT_DELAYS: Dict[str, float] = {
+    "exec": 0.005,  # fork + exec of any command
+    "systemctl": 0.05,  # enable / disable / stop / is-active
+    "restart": 0.3,  # any other service
+    "restart hostapd": 1.0,
+    "restart dnsmasq": 0.4,
+    "restart dhcpcd": 0.6,
+    "restart nftables": 0.15,
+    "restart wpa_supplicant": 0.3,
+    "nft": 0.08,
+    "sh": 0.02,  # the tuning script: a few dozen sysfs writes
+    "iw": 0.02,
+    "iw scan": 3.0,  # active scan across both bands
+    "netlink": 0.001,  # one request/ack round trip
+    "associate": 2.5,  # wpa_supplicant (re)start -> associated
+    "dhcp": 1.5,  # dhcpcd starts on an interface -> lease
+    "arp": 0.002,  # ARP request -> reply from the gateway
+    "ping": 0.015,  # ICMP echo to an internet target and back
+}
+
+DEFAULT_TOOLS = ("systemctl", "dhcpcd", "iw", "nft", "sysctl", "sh", "modprobe")
+
+# neighbouring BSSes a scan finds: (freq MHz, signal dBm)
+NEIGHBOURS = [(2412, -48.0), (2412, -67.0), (2437, -55.0), (2462, -82.0), (5180, -70.0)]
+
+# what the upstream side of each interface looks like: dhcp prefix
+UPSTREAM_NETS = {"eth0": "192.168.1", "wlan0": "10.0.0"}
+
+
+class FakeSystem(Host):
+    def __init__(
+        self,
+        delays: Optional[Dict[str, float]] = None,
+        scale: float = 0.02,
+        tools: Iterable[str] = DEFAULT_TOOLS,
+        networks: Optional[Dict[str, str]] = None,
+        upstream_freq: int = 2437,
+        neighbours: Optional[List[Tuple[int, float]]] = None,
+        eth0_lease: bool = True,
+        root: Optional[str] = None,
+    ) -> None:
+        self._own_root = root is None
+        super().__init__(root=root or tempfile.mkdtemp(prefix="hamsterfi-fake-"), record=True)
+        self.delays = dict(DEFAULT_DELAYS, **(delays or {}))
+        self.scale = scale
+        self.tools: Set[str] = set(tools)
+        # upstream Wi-Fi networks in range: ssid -> psk
+        self.networks = dict(networks if networks is not None else {"upstream": "upstream-psk"})
+        self.upstream_freq = upstream_freq
+        self.neighbours = list(NEIGHBOURS if neighbours is None else neighbours)
+        # interfaces whose far side runs a DHCP server
+        self.upstream_nets = dict(UPSTREAM_NETS)
+        # uplinks whose gateway stopped answering (link stays up) / whose gateway answers
+        # but has no internet behind it; see gateway_down()
+        self.dead_gateways: Set[str] = set()
+        self.dead_upstreams: Set[str] = set()
+
+        self._cond = threading.Condition(threading.RLock())
+        # bumped on every state change, so waiters can't miss one between check and wait
+        self._gen = 0
+        self._timers: List[threading.Timer] = []
+        self._next_index = 10
+
+        self.links: Dict[str, Link] = {
+            "lo": Link("lo", 1, up=True, carrier=True, operstate="UNKNOWN"),
+            "eth0": Link("eth0", 2, up=True, carrier=True, operstate="UP"),
+            "wlan0": Link("wlan0", 3, up=False, carrier=False, operstate="DOWN"),
+        }
+        self.addrs: Dict[str, List[str]] = {"lo": ["127.0.0.1/8"]}
+        self.routes: List[DefaultRoute] = []
+        # policy routing: defaults in other tables, and the rules that pick them
+        self.table_routes: Dict[int, List[DefaultRoute]] = {}
+        self.rules: List[Rule] = []
+        self.services: Dict[str, str] = {"dhcpcd": "active"}
+        self.enabled: Set[str] = {"dhcpcd"}
+        self.associated = False
+        self.dhcp_managed: Set[str] = {"eth0", "wlan0"}
+        # dev -> token of the lease request in flight; "dhcpcd -k" invalidates it
+        self._leases_pending: Dict[str, int] = {}
+        self._lease_tokens = 0
+        # "inet hamsterfi" -> that table's definition as last committed
+        self.nft_tables: Dict[str, str] = {}
+
+        self.netlink_ops = 0
+        self.netlink_round_trips = 0
+        self._net = FakeNet(self)
+
+        if eth0_lease:
+            self._lease("eth0")
+
+    # -- lifecycle --------------------------------------------------------
+
+    def close(self) -> None:
+        with self._cond:
+            for t in self._timers:
+                t.cancel()
+            self._timers.clear()
+        if self._own_root:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self) -> "FakeSystem":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def reboot(self) -> None:
+        """
+        Power cycle: files survive; created links, addresses, routes, leases,
+        the association and running services don't. Enabled units start again.
+        """
+        with self._cond:
+            for t in self._timers:
+                t.cancel()
+            self._timers.clear()
+            self.links = {n: Link(n, self.links[n].index) for n in ("lo", "eth0", "wlan0")}
+            self.links["lo"].up = self.links["lo"].carrier = True
+            self.links["eth0"].up = self.links["eth0"].carrier = True
+            self.links["eth0"].operstate = "UP"
+            self.addrs = {"lo": ["127.0.0.1/8"]}
+            self.routes = []
+            self.table_routes = {}
+            self.rules = []
+            self.services = {}
+            self.associated = False
+            self._leases_pending.clear()
+            self.nft_tables = {}
+            for unit in sorted(self.enabled):
+                self._start(unit)
+            self._changed()
+
+    def reset_counters(self) -> None:
+        with self._calls_lock:
+            self.calls.clear()
+        self.netlink_ops = 0
+        self.netlink_round_trips = 0
+
+    # -- time -------------------------------------------------------------
+
+    def _sim(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds * self.scale)
+
+    def sleep(self, seconds: float) -> None:
+        self._sim(seconds)
+
+    def clock(self) -> float:
+        return time.monotonic() / self.scale
+
+    def _later(self, delay: str, fn: Callable[[], None]) -> None:
+        def fire() -> None:
+            with self._cond:
+                fn()
+                self._changed()
+
+        t = threading.Timer(self.delays[delay] * self.scale, fire)
+        t.daemon = True
+        with self._cond:
+            self._timers.append(t)
+        t.start()
+
+    def _changed(self) -> None:
+        # what a netlink multicast event would do: wake every waiter
+        with self._cond:
+            self._gen += 1
+            self._cond.notify_all()
+
+    def wait_for(self, predicate: Callable[[], bool], timeout_s: float,
+                 groups: int = events.RTMGRP_LINK, recheck_s: Optional[float] = None) -> bool:
+        deadline = time.monotonic() + timeout_s * self.scale
+        while True:
+            with self._cond:
+                gen = self._gen
+            # not under the lock: the predicate may use net(), which sleeps per round trip
+            if predicate():
+                return True
+            with self._cond:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if recheck_s is not None:
+                    remaining = min(remaining, recheck_s * self.scale)
+                if self._gen == gen:
+                    self._cond.wait(remaining)
+
+    def wait_wpa_connected(self, iface: str, timeout_s: float) -> Optional[bool]:
+        if self.services.get("wpa_supplicant@wlan0") != "active" and self.services.get("wpa_supplicant") != "active":
+            return None
+        return self.wait_for(lambda: self.associated, timeout_s)
+
+    # -- failures ---------------------------------------------------------
+
+    def gateway_down(self, dev: str, down: bool = True, internet_only: bool = False) -> None:
+        """The far side of dev stops forwarding; carrier, address and routes stay (what the monitor has to probe for)."""
+        with self._cond:
+            target = self.dead_upstreams if internet_only else self.dead_gateways
+            (target.add if down else target.discard)(dev)
+            self._changed()
+
+    def set_carrier(self, dev: str, up: bool) -> None:
+        """Cable pulled / plugged (eth0) or upstream association lost / back (wlan0)."""
+        with self._cond:
+            link = self.links[dev]
+            if not up:
+                link.carrier = False
+                link.operstate = "DOWN"
+                if dev == "wlan0":
+                    self.associated = False
+                # dhcpcd drops the lease on carrier loss, and the routes with it
+                if dev in self.dhcp_managed:
+                    self._drop_ipv4(dev)
+            elif dev == "wlan0":
+                if self.services.get("wpa_supplicant@wlan0") == "active" or self.services.get("wpa_supplicant") == "active":
+                    self._later("associate", self._associate)
+            else:
+                link.carrier = link.up
+                link.operstate = "UP" if link.up else "DOWN"
+                self._kick_dhcp(dev)
+            self._changed()
+
+    # -- probes -----------------------------------------------------------
+
+    def _reachable(self, dev: str, target: str, beyond_gateway: bool) -> bool:
+        with self._cond:
+            link = self.links.get(dev)
+            addrs = [a for a in self.addrs.get(dev, []) if "." in a]
+            if link is None or not link.carrier or not addrs or dev in self.dead_gateways:
+                return False
+            if not beyond_gateway:
+                return dev in self.upstream_nets and target == f"{self.upstream_nets[dev]}.1"
+            if dev in self.dead_upstreams:
+                return False
+            # bound to dev, the echo leaves through dev's own default route
+            return _on_link(addrs, target) or any(r.dev == dev for r in self.routes)
+
+    def arp_probe(self, dev: str, target: str, timeout_s: float) -> Optional[bool]:
+        self._sim(self.delays["exec"])
+        with self._cond:
+            if not any("." in a for a in self.addrs.get(dev, [])):
+                return None
+        if self._reachable(dev, target, beyond_gateway=False):
+            self._sim(self.delays["arp"])
+            return True
+        self._sim(timeout_s)
+        return False
+
+    def ping(self, dev: str, target: str, timeout_s: float) -> Optional[float]:
+        self._sim(self.delays["exec"])
+        if self._reachable(dev, target, beyond_gateway=True):
+            self._sim(self.delays["ping"])
+            return self.delays["ping"]
+        self._sim(timeout_s)
+        return None
+
+    # -- model ------------------------------------------------------------
+
+    def _add_link(self, name: str) -> Link:
+        self._next_index += 1
+        link = Link(name, self._next_index, operstate="DOWN")
+        self.links[name] = link
+        return link
+
+    def _drop_routes(self, dev: str) -> None:
+        self.routes = [r for r in self.routes if r.dev != dev]
+        for routes in self.table_routes.values():
+            routes[:] = [r for r in routes if r.dev != dev]
+
+    def _drop_ipv4(self, dev: str) -> None:
+        self.addrs[dev] = [a for a in self.addrs.get(dev, []) if ":" in a]
+        self._drop_routes(dev)
+
+    def _dhcpcd_conf(self) -> Tuple[Set[str], Dict[str, int]]:
+        deny: Set[str] = set()
+        metrics: Dict[str, int] = {}
+        for path in sorted(glob.glob(self.path("/etc/dhcpcd.conf.d/*.conf"))):
+            current = None
+            with open(path, "r", encoding="utf-8") as f:
+                for ln in f:
+                    parts = ln.split()
+                    if len(parts) == 2 and parts[0] == "denyinterfaces":
+                        deny.add(parts[1])
+                    elif len(parts) == 2 and parts[0] == "interface":
+                        current = parts[1]
+                    elif len(parts) == 2 and parts[0] == "metric" and current:
+                        metrics[current] = int(parts[1])
+        return deny, metrics
+
+    def _lease_possible(self, dev: str) -> bool:
+        link = self.links.get(dev)
+        if link is None or not link.up or link.master:
+            return False
+        if dev == "br0":
+            eth0 = self.links.get("eth0")
+            return bool(eth0 and eth0.master == "br0" and eth0.carrier) and "eth0" in self.upstream_nets
+        if dev == "wlan0":
+            return self.associated and dev in self.upstream_nets
+        return link.carrier and dev in self.upstream_nets
+
+    def _lease(self, dev: str, token: Optional[int] = None) -> None:
+        if token is not None and self._leases_pending.get(dev) != token:
+            return
+        self._leases_pending.pop(dev, None)
+        if dev not in self.dhcp_managed or not self._lease_possible(dev):
+            return
+        prefix = self.upstream_nets["eth0" if dev == "br0" else dev]
+        link = self.links[dev]
+        _, metrics = self._dhcpcd_conf()
+        metric = metrics.get(dev, (300 if dev == "wlan0" else 200) + link.index)
+        # (re)binding only replaces dhcpcd's own address and route, not ones added by hand
+        self.addrs[dev] = [f"{prefix}.{100 + link.index}/24"] + [
+            a for a in self.addrs.get(dev, []) if not a.startswith(prefix + ".")
+        ]
+        self.routes = [r for r in self.routes if not (r.dev == dev and r.metric == metric)]
+        self.routes.append(DefaultRoute(dev=dev, via=f"{prefix}.1", metric=metric))
+        self._changed()
+
+    def _kick_dhcp(self, dev: str) -> None:
+        if dev in self.dhcp_managed and dev not in self._leases_pending and self._lease_possible(dev):
+            self._lease_tokens += 1
+            token = self._leases_pending[dev] = self._lease_tokens
+            self._later("dhcp", lambda: self._lease(dev, token))
+
+    def _associate(self) -> None:
+        text = self.read_text(WPA_SUPPLICANT_WLAN0) or ""
+        ssid = psk = None
+        for ln in text.splitlines():
+            ln = ln.strip()
+            if ln.startswith("ssid="):
+                ssid = ln.split("=", 1)[1].strip('"')
+            elif ln.startswith("psk="):
+                psk = ln.split("=", 1)[1].strip('"')
+        if ssid is None or self.networks.get(ssid) != psk:
+            return
+        wlan0 = self.links["wlan0"]
+        wlan0.up = True
+        wlan0.carrier = True
+        wlan0.operstate = "UP"
+        self.associated = True
+        self._kick_dhcp("wlan0")
+        self._changed()
+
+    def _start(self, unit: str) -> int:
+        if unit == "hostapd":
+            conf = self.read_text("/etc/hostapd/hostapd.conf")
+            iface = next((ln.split("=", 1)[1] for ln in (conf or "").splitlines() if ln.startswith("interface=")), None)
+            if iface not in self.links:
+                # no config, or its interface (ap0) doesn't exist yet
+                self.services[unit] = "failed"
+                return 1
+        if unit == "nftables":
+            if not self.exists("/etc/nftables.conf"):
+                self.services[unit] = "failed"
+                return 1
+            if not self._nft_batch(self._nft_conf("/etc/nftables.conf") or ""):
+                self.services[unit] = "failed"
+                return 1
+        self.services[unit] = "active"
+        if unit.startswith("wpa_supplicant"):
+            self.associated = False
+            self.links["wlan0"].carrier = False
+            self._later("associate", self._associate)
+        if unit == "dhcpcd":
+            deny, _ = self._dhcpcd_conf()
+            self.dhcp_managed = {d for d in ("eth0", "wlan0", "br0") if d in self.links and d not in deny}
+            for dev in sorted(self.dhcp_managed):
+                self._kick_dhcp(dev)
+        return 0
+
+    def _stop(self, unit: str) -> None:
+        self.services[unit] = "inactive"
+        if unit.startswith("wpa_supplicant"):
+            self.associated = False
+            self.links["wlan0"].carrier = False
+
+    # -- commands ---------------------------------------------------------
+
+    def which(self, cmd: str) -> bool:
+        return cmd in self.tools
+
+    def _exec(self, cmd: List[str], capture: bool, timeout: Optional[float]) -> subprocess.CompletedProcess:
+        self._sim(self.delays["exec"])
+        if not cmd or cmd[0] not in self.tools:
+            return subprocess.CompletedProcess(cmd, 127, "", f"{cmd[0] if cmd else ''}: not found\n")
+        handler = getattr(self, f"_cmd_{cmd[0]}", None)
+        rc, out = handler(cmd[1:]) if handler else (0, "")
+        self._changed()
+        return subprocess.CompletedProcess(cmd, rc, out, "")
+
+    def _cmd_systemctl(self, args: List[str]) -> Tuple[int, str]:
+        action, units = args[0], [u[:-len(".service")] if u.endswith(".service") else u for u in args[1:]]
+        if action == "is-active":
+            self._sim(self.delays["systemctl"])
+            with self._cond:
+                states = [self.services.get(u, "inactive") for u in units]
+            return (0 if all(s == "active" for s in states) else 3), "".join(f"{s}\n" for s in states)
+        if action == "restart":
+            rc = 0
+            for u in units:
+                base = u.split("@")[0]
+                self._sim(self.delays.get(f"restart {base}", self.delays["restart"]))
+                with self._cond:
+                    rc = rc or self._start(u)
+            return rc, ""
+        self._sim(self.delays["systemctl"])
+        with self._cond:
+            for u in units:
+                if action == "stop":
+                    self._stop(u)
+                elif action == "enable":
+                    self.enabled.add(u)
+                elif action == "disable":
+                    self.enabled.discard(u)
+        return 0, ""
+
+    def _cmd_dhcpcd(self, args: List[str]) -> Tuple[int, str]:
+        dev = args[-1]
+        if "-k" in args:
+            with self._cond:
+                self.dhcp_managed.discard(dev)
+                self._leases_pending.pop(dev, None)
+                if dev in self.links:
+                    self._drop_ipv4(dev)
+            return 0, ""
+        with self._cond:
+            if dev in self.links:
+                self.dhcp_managed.add(dev)
+                self._kick_dhcp(dev)
+        if "-w" in args:
+            # wait for the lease like dhcpcd -w does, up to -t
+            t = float(args[args.index("-t") + 1]) if "-t" in args else 30.0
+            got = self.wait_for(lambda: any("." in a for a in self.addrs.get(dev, [])), t)
+            return (0 if got else 1), ""
+        return 0, ""
+
+    def _cmd_iw(self, args: List[str]) -> Tuple[int, str]:
+        self._sim(self.delays["iw"])
+        scan = None
+        with self._cond:
+            if args[:3] == ["dev", "wlan0", "link"]:
+                if not self.associated:
+                    return 0, "Not connected.\n"
+                return 0, (
+                    "Connected to 02:00:00:00:00:01 (on wlan0)\n"
+                    f"\tSSID: {next(iter(self.networks), '')}\n"
+                    f"\tfreq: {self.upstream_freq}.0\n"
+                )
+            if args[:3] == ["dev", "wlan0", "interface"] and args[3] == "add":
+                name = args[4]
+                if name in self.links:
+                    return 233, "command failed: Too many open files in system (-23)\n"
+                self._add_link(name)
+                return 0, ""
+            if len(args) >= 3 and args[0] == "dev" and args[2] == "info":
+                if args[1] not in self.links:
+                    return 237, "command failed: No such device (-19)\n"
+                return 0, f"Interface {args[1]}\n\tifindex {self.links[args[1]].index}\n"
+            if len(args) >= 3 and args[0] == "dev" and args[2] == "scan":
+                bss = [f"BSS 02:00:00:00:01:{i:02x}(on {args[1]})\n\tfreq: {f}.0\n\tsignal: {sig:.2f} dBm\n"
+                       f"\tSSID: neighbour{i}\n" for i, (f, sig) in enumerate(self.neighbours)]
+                scan = "".join(bss)
+        if scan is None:
+            # survey dump included: brcmfmac reports no survey data
+            return 0, ""
+        # dwelling on every channel happens outside the lock
+        self._sim(self.delays["iw scan"])
+        return 0, scan
+
+    def _cmd_sh(self, args: List[str]) -> Tuple[int, str]:
+        self._sim(self.delays["sh"])
+        return (0 if args and self.exists(args[0]) else 127), ""
+
+    def _nft_conf(self, path: str) -> Optional[str]:
+        """Contents of an nft file with its `include "glob"` lines expanded."""
+        out = []
+        for line in (self.read_text(path) or "").splitlines():
+            if line.startswith("include "):
+                for inc in sorted(glob.glob(self.path(line.split(None, 1)[1].strip('"')))):
+                    with open(inc, "r", encoding="utf-8") as f:
+                        out.append(f.read())
+            else:
+                out.append(line + "\n")
+        return "".join(out) or None
+
+    @property
+    def nft_loaded(self) -> Optional[str]:
+        """The committed ruleset, `nft list ruleset` style; None when empty."""
+        return "".join(self.nft_tables.values()) or None
+
+    def _nft_batch(self, text: str) -> bool:
+        """
+        Commit one nft transaction to the table model, all or nothing: deleting
+        a missing table or a flowtable on a missing device rejects the batch.
+        """
+        tables = dict(self.nft_tables)
+        lines = iter(text.splitlines())
+        for line in lines:
+            stmt = line.strip()
+            words = stmt.rstrip("{").split()
+            if words[:2] == ["flush", "ruleset"]:
+                tables.clear()
+            elif words[:2] == ["delete", "table"]:
+                if tables.pop(" ".join(words[2:4]), None) is None:
+                    return False
+            elif words[:1] == ["table"]:
+                ref = " ".join(words[1:3])
+                if not stmt.endswith("{"):
+                    tables.setdefault(ref, f"table {ref} {{\n}}\n")
+                    continue
+                body = [line]
+                for inner in lines:
+                    body.append(inner)
+                    if inner == "}":
+                        break
+                for devices in re.findall(r"devices = \{ ([^}]*) \}", "\n".join(body)):
+                    if any(d.strip() not in self.links for d in devices.split(",")):
+                        return False
+                tables[ref] = "\n".join(body) + "\n"
+        self.nft_tables = tables
+        return True
+
+    def _cmd_nft(self, args: List[str]) -> Tuple[int, str]:
+        self._sim(self.delays["nft"])
+        with self._cond:
+            if args[:1] == ["-f"]:
+                if not self.exists(args[1]) or not self._nft_batch(self._nft_conf(args[1]) or ""):
+                    return 1, ""
+            elif args[:2] == ["list", "ruleset"]:
+                return 0, self.nft_loaded or ""
+            elif not self._nft_batch("\n".join(a.strip() for a in " ".join(args).split(";"))):
+                return 1, ""
+        return 0, ""
+
+    # -- network ----------------------------------------------------------
+
+    def net(self) -> NetBackend:
+        return self._net
+
+
+def _on_link(addrs: List[str], gw: str) -> bool:
+    ip = ipaddress.ip_address(gw)
+    return any(ip in ipaddress.ip_interface(a).network for a in addrs if ":" not in a)
+
+
+class FakeNet(NetBackend):
+    """NetBackend over FakeSystem's model; counts requests and round trips."""
+
+    def __init__(self, system: FakeSystem) -> None:
+        self.sys = system
+        self._local = threading.local()
+
+    def _trip(self) -> None:
+        if getattr(self._local, "depth", 0):
+            self._local.ops += 1
+            return
+        self._round_trip()
+
+    def _round_trip(self) -> None:
+        with self.sys._cond:
+            self.sys.netlink_round_trips += 1
+        self.sys._sim(self.sys.delays["netlink"])
+
+    @contextmanager
+    def batch(self) -> Iterator[NetBackend]:
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            self._local.ops = 0
+        self._local.depth = depth + 1
+        try:
+            yield self
+        finally:
+            self._local.depth = depth
+        if depth == 0 and self._local.ops:
+            self._round_trip()
+
+    @contextmanager
+    def _change(self) -> Iterator[FakeSystem]:
+        self._trip()
+        with self.sys._cond:
+            self.sys.netlink_ops += 1
+            yield self.sys
+            self.sys._changed()
+
+    def _dev(self, s: FakeSystem, dev: str, check: bool) -> Optional[Link]:
+        link = s.links.get(dev)
+        if link is None and check:
+            raise OSError(errno.ENODEV, f"{dev}: no such device")
+        return link
+
+    def links(self) -> Dict[str, Link]:
+        self._trip()
+        with self.sys._cond:
+            return {n: replace(l) for n, l in self.sys.links.items()}
+
+    def addrs(self, dev: Optional[str] = None) -> Dict[str, List[str]]:
+        self._trip()
+        with self.sys._cond:
+            return {d: list(a) for d, a in self.sys.addrs.items() if a and (not dev or d == dev)}
+
+    @staticmethod
+    def _table(s: FakeSystem, table: Optional[int]) -> List[DefaultRoute]:
+        if not table or table == TABLE_NAMES["main"]:
+            return s.routes
+        return s.table_routes.setdefault(table, [])
+
+    def default_routes(self, dev: Optional[str] = None, table: Optional[int] = None) -> List[DefaultRoute]:
+        self._trip()
+        with self.sys._cond:
+            routes = [replace(r) for r in self._table(self.sys, table) if not dev or r.dev == dev]
+        return sorted(routes, key=lambda r: r.metric)
+
+    def link_set(self, dev: str, up: bool, check: bool = False) -> None:
+        with self._change() as s:
+            link = self._dev(s, dev, check)
+            if link is None:
+                return
+            link.up = up
+            if dev == "eth0" or link.name == "br0":
+                link.carrier = up
+            link.operstate = "UP" if up and link.carrier else "DOWN"
+            if not up:
+                s._drop_routes(dev)
+
+    def set_master(self, dev: str, master: Optional[str], check: bool = False) -> None:
+        with self._change() as s:
+            link = self._dev(s, dev, check)
+            if link is None or (master and self._dev(s, master, check) is None):
+                return
+            link.master = master
+            if master:
+                # an enslaved port loses its own layer-3 config
+                s._drop_ipv4(dev)
+
+    def add_bridge(self, name: str, stp: bool = False, check: bool = False) -> None:
+        with self._change() as s:
+            if name in s.links:
+                if check:
+                    raise OSError(errno.EEXIST, f"{name} exists")
+                return
+            s._add_link(name)
+
+    def link_del(self, dev: str, check: bool = False) -> None:
+        with self._change() as s:
+            if self._dev(s, dev, check) is None:
+                return
+            del s.links[dev]
+            s.addrs.pop(dev, None)
+            s._drop_routes(dev)
+            s.dhcp_managed.discard(dev)
+            for link in s.links.values():
+                if link.master == dev:
+                    link.master = None
+
+    def addr_flush(self, dev: str) -> None:
+        with self._change() as s:
+            if dev in s.links:
+                s.addrs[dev] = []
+                s._drop_routes(dev)
+
+    def addr_add(self, dev: str, cidr: str, check: bool = True) -> None:
+        with self._change() as s:
+            if self._dev(s, dev, check) is None:
+                return
+            addrs = s.addrs.setdefault(dev, [])
+            if cidr in addrs:
+                if check:
+                    raise OSError(errno.EEXIST, "File exists")
+                return
+            addrs.append(cidr)
+
+    def route_replace_default(self, via: str, dev: Optional[str] = None, metric: Optional[int] = None,
+                              check: bool = False, table: Optional[int] = None) -> None:
+        with self._change() as s:
+            if dev is None:
+                prefix = via.rsplit(".", 1)[0] + "."
+                dev = next((d for d, a in s.addrs.items() if any(x.startswith(prefix) for x in a)), None)
+                if dev is None:
+                    if check:
+                        raise OSError(errno.ENETUNREACH, "Network is unreachable")
+                    return
+            elif self._dev(s, dev, check) is None:
+                return
+            elif not _on_link(s.addrs.get(dev, []), via):
+                if check:
+                    raise OSError(errno.ENETUNREACH, "Nexthop has invalid gateway")
+                return
+            m = metric or 0
+            routes = self._table(s, table)
+            routes[:] = [r for r in routes if r.metric != m]
+            routes.append(DefaultRoute(dev=dev, via=via, metric=m))
+
+    def route_del_default(self, dev: Optional[str] = None, via: Optional[str] = None,
+                          metric: Optional[int] = None, check: bool = False, table: Optional[int] = None) -> None:
+        with self._change() as s:
+            routes = self._table(s, table)
+            # like the kernel: one request removes the first match only
+            for r in sorted(routes, key=lambda r: r.metric):
+                if (dev and r.dev != dev) or (via and r.via != via) or (metric is not None and r.metric != metric):
+                    continue
+                routes.remove(r)
+                return
+            if check:
+                raise OSError(errno.ESRCH, "No such process")
+
+    def flush_route_cache(self) -> None:
+        self._trip()
+
+    def rules(self) -> List[Rule]:
+        self._trip()
+        with self.sys._cond:
+            return sorted((replace(r) for r in self.sys.rules), key=lambda r: r.priority)
+
+    def rule_add(self, rule: Rule, check: bool = False) -> None:
+        with self._change() as s:
+            # the kernel takes a duplicate at the same priority; EEXIST only for an identical rule
+            if rule in s.rules:
+                if check:
+                    raise OSError(errno.EEXIST, "File exists")
+                return
+            s.rules.append(replace(rule))
+
+    def rule_del(self, priority: int, check: bool = False) -> None:
+        with self._change() as s:
+            for r in s.rules:
+                if r.priority == priority:
+                    s.rules.remove(r)
+                    return
+            if check:
+                raise OSError(errno.ENOENT, "No such file or directory")
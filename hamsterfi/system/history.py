@@ -0,0 +1,236 @@
+"""
+History of applied configs.
+
+Every apply that changes something records a version: the AppConfig it was
+given plus the files it left behind, stored by content hash so identical
+files across versions are kept once. A version starts as "applied" and
+becomes "good" once the post-apply health check passes (a fresh plan for
+that config comes back empty), or "unhealthy" with the reason if it doesn't.
+
+    HISTORY_DIR/index.json        current and last known-good pointers, version list
+    HISTORY_DIR/versions/<id>.json the config of one version
+    HISTORY_DIR/objects/<digest>   rendered file contents
+
+Re-applying a config whose config and files match a recorded version moves
+the `current` pointer back to it instead of adding a version, so a rollback
+(apply.rollback()) is a pointer switch plus whatever the incremental planner
+finds to change. Old versions beyond HISTORY_KEEP are dropped, except the
+current and known-good ones.
+
+    python -m hamsterfi.system.history [list]
+    python -m hamsterfi.system.history rollback [<id>]
+"""
+import difflib
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from hamsterfi.core.models import AppConfig
+from hamsterfi.system.host import get_host
+from hamsterfi.system.snapshot import config_digest, file_digest
+
+HISTORY_DIR = os.environ.get("HAMSTERFI_HISTORY_DIR", "/var/lib/hamster-fi/history")
+HISTORY_KEEP = int(os.environ.get("HAMSTERFI_HISTORY_KEEP", "30"))
+
+# readers too: the health check marks versions from its own thread, and the
+# index is rewritten in place
+_lock = threading.RLock()
+
+
+@dataclass
+class Version:
+    id: int
+    created: float
+    mode: str
+    config: str  # config_digest()
+    files: Dict[str, str] = field(default_factory=dict)  # path -> file_digest(); missing files are left out
+    state: str = "applied"  # applied -> good | unhealthy
+    problem: Optional[str] = None
+    checked: Optional[float] = None
+
+    def describe(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class Index:
+    current: Optional[int] = None
+    good: Optional[int] = None
+    next_id: int = 1
+    versions: List[Version] = field(default_factory=list)
+
+    def get(self, vid: Optional[int]) -> Optional[Version]:
+        return next((v for v in self.versions if v.id == vid), None)
+
+
+def _path(*parts: str) -> str:
+    return os.path.join(HISTORY_DIR, *parts)
+
+
+def load_index() -> Index:
+    try:
+        with _lock:
+            text = get_host().read_text(_path("index.json"))
+        data = json.loads(text or "")
+        return Index(
+            current=data.get("current"), good=data.get("good"), next_id=data.get("next_id", 1),
+            versions=[Version(**v) for v in data.get("versions", [])],
+        )
+    except (ValueError, TypeError, AttributeError):
+        return Index()
+
+
+def _save_index(index: Index) -> None:
+    get_host().write_text(_path("index.json"), json.dumps(asdict(index), indent=1) + "\n")
+
+
+def versions() -> List[Version]:
+    """Newest first."""
+    return sorted(load_index().versions, key=lambda v: v.id, reverse=True)
+
+
+def get(vid: int) -> Optional[Version]:
+    return load_index().get(vid)
+
+
+def current() -> Optional[Version]:
+    index = load_index()
+    return index.get(index.current)
+
+
+def last_good() -> Optional[Version]:
+    index = load_index()
+    return index.get(index.good)
+
+
+def config_of(version: Version) -> AppConfig:
+    text = get_host().read_text(_path("versions", f"{version.id}.json"))
+    if text is None:
+        raise RuntimeError(f"version {version.id}: config missing from {HISTORY_DIR}")
+    return AppConfig.model_validate_json(text)
+
+
+def file_text(version: Version, path: str) -> Optional[str]:
+    digest = version.files.get(path)
+    return get_host().read_text(_path("objects", digest)) if digest else None
+
+
+def record(cfg: AppConfig, files: Dict[str, Optional[str]]) -> Version:
+    """
+    The version for (cfg, files): the current one if nothing changed, an older
+    one with the same config and files (becomes current), or a new one.
+    """
+    host = get_host()
+    digest = config_digest(cfg)
+    digests = {p: file_digest(text) for p, text in files.items() if text is not None}
+    with _lock:
+        index = load_index()
+        same = [v for v in index.versions if v.config == digest and v.files == digests]
+        if same:
+            v = max(same, key=lambda v: v.id)
+            if index.current != v.id:
+                index.current = v.id
+                _save_index(index)
+            return v
+
+        for path, text in files.items():
+            if text is not None and not host.exists(_path("objects", digests[path])):
+                host.write_text(_path("objects", digests[path]), text)
+        v = Version(id=index.next_id, created=time.time(), mode=cfg.mode, config=digest, files=digests)
+        host.write_text(_path("versions", f"{v.id}.json"), cfg.model_dump_json(indent=1) + "\n")
+        index.versions.append(v)
+        index.next_id += 1
+        index.current = v.id
+        _trim(index)
+        _save_index(index)
+        return v
+
+
+def mark(vid: int, healthy: bool, problem: Optional[str] = None) -> None:
+    with _lock:
+        index = load_index()
+        v = index.get(vid)
+        if v is None:
+            return
+        v.state = "good" if healthy else "unhealthy"
+        v.problem = None if healthy else problem
+        v.checked = time.time()
+        if healthy:
+            index.good = vid
+        _save_index(index)
+
+
+def _trim(index: Index) -> None:
+    host = get_host()
+    ordered = sorted(index.versions, key=lambda v: v.id)
+    if HISTORY_KEEP <= 0 or len(ordered) <= HISTORY_KEEP:
+        return
+    keep = {index.current, index.good}
+    drop = [v for v in ordered[:len(ordered) - HISTORY_KEEP] if v.id not in keep]
+    for v in drop:
+        index.versions.remove(v)
+        host.remove(_path("versions", f"{v.id}.json"))
+    used = {d for v in index.versions for d in v.files.values()}
+    for name in host.listdir(_path("objects")):
+        if name not in used:
+            host.remove(_path("objects", name))
+
+
+def _flatten(data, prefix: str = "") -> Dict[str, object]:
+    if not isinstance(data, dict):
+        return {prefix: data}
+    out: Dict[str, object] = {}
+    for k, v in data.items():
+        out.update(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    return out
+
+
+def diff(a: Version, b: Version) -> dict:
+    """What changes going from version a to version b: config keys and unified diffs of the files."""
+    ca, cb = _flatten(config_of(a).model_dump()), _flatten(config_of(b).model_dump())
+    config = [{"key": k, "from": ca.get(k), "to": cb.get(k)}
+              for k in sorted(set(ca) | set(cb)) if ca.get(k) != cb.get(k)]
+    files = {}
+    for path in sorted(set(a.files) | set(b.files)):
+        if a.files.get(path) == b.files.get(path):
+            continue
+        old, new = file_text(a, path) or "", file_text(b, path) or ""
+        files[path] = "".join(difflib.unified_diff(
+            old.splitlines(keepends=True), new.splitlines(keepends=True),
+            fromfile=f"{path}@{a.id}", tofile=f"{path}@{b.id}",
+        ))
+    return {"from": a.id, "to": b.id, "config": config, "files": files}
+
+
+def main(argv: List[str]) -> int:
+    cmd = argv[0] if argv else "list"
+    if cmd == "list":
+        index = load_index()
+        for v in versions():
+            flags = ("*" if v.id == index.current else " ") + ("g" if v.id == index.good else " ")
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(v.created))
+            print(f"{flags} {v.id:>4}  {when}  {v.mode:<8} {v.state:<9} {v.problem or ''}")
+        return 0
+    if cmd == "rollback":
+        from hamsterfi.system.apply import rollback
+
+        try:
+            v, plan, drift = rollback(int(argv[1]) if len(argv) > 1 else None)
+        except Exception as e:
+            print(f"rollback failed: {e}", file=sys.stderr)
+            return 1
+        steps = "full apply" if plan.full else f"{len(plan.actions)} steps"
+        print(f"rolled back to version {v.id} ({v.mode}), {steps}")
+        for path in drift:
+            print(f"  note: {path} renders differently than when version {v.id} was applied")
+        return 0
+    print("usage: python -m hamsterfi.system.history [list | rollback [<id>]]", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,167 @@
+"""
+Everything apply touches on the machine, behind one object: commands, files,
+the link/address/route backend and the readiness waits.
+
+The default Host runs real commands against "/" (or HAMSTERFI_ROOT). Tests and
+benchmarks swap in another Host (see fake.py) with `use_host()`, so the apply
+code itself never calls subprocess or open() on /etc directly.
+"""
+import os
+import shutil
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional
+
+from hamsterfi.core import metrics
+from hamsterfi.system import events, probe
+from hamsterfi.system.net import NetBackend, get_backend
+
+FS_ROOT = os.environ.get("HAMSTERFI_ROOT", "/")
+
+
+@dataclass
+class Call:
+    cmd: List[str]
+    returncode: int
+    duration: float
+
+
+class Host:
+    def __init__(self, root: str = FS_ROOT, record: bool = False) -> None:
+        self.root = root
+        self.record = record
+        self.calls: List[Call] = []
+        self._calls_lock = threading.Lock()
+
+    # -- commands ---------------------------------------------------------
+
+    def _exec(self, cmd: List[str], capture: bool, timeout: Optional[float]) -> subprocess.CompletedProcess:
+        return subprocess.run(cmd, check=False, text=True, capture_output=capture, timeout=timeout)
+
+    def run(self, cmd: List[str], check: bool = False, capture: bool = False,
+            timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        start, t0 = time.time(), time.monotonic()
+        try:
+            res = self._exec(cmd, capture, timeout)
+        except Exception as e:
+            metrics.record_command(cmd, start, time.monotonic() - t0, None, error=str(e) or e.__class__.__name__)
+            raise
+        metrics.record_command(cmd, start, time.monotonic() - t0, res.returncode, res.stdout, res.stderr)
+        if self.record:
+            with self._calls_lock:
+                self.calls.append(Call(list(cmd), res.returncode, time.monotonic() - t0))
+        if check and res.returncode != 0:
+            raise subprocess.CalledProcessError(res.returncode, cmd, res.stdout, res.stderr)
+        return res
+
+    def out(self, cmd: List[str]) -> str:
+        """stdout of cmd; raises like subprocess.check_output on failure."""
+        return self.run(cmd, check=True, capture=True).stdout or ""
+
+    def which(self, cmd: str) -> bool:
+        return shutil.which(cmd) is not None
+
+    # -- files ------------------------------------------------------------
+
+    def path(self, path: str) -> str:
+        if self.root in ("", "/"):
+            return path
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def read_text(self, path: str) -> Optional[str]:
+        try:
+            with open(self.path(path), "r", encoding="utf-8", errors="ignore") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def write_text(self, path: str, content: str) -> None:
+        real = self.path(path)
+        os.makedirs(os.path.dirname(real), exist_ok=True)
+        with open(real, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def remove(self, path: str) -> None:
+        try:
+            os.remove(self.path(path))
+        except FileNotFoundError:
+            pass
+
+    def listdir(self, path: str) -> List[str]:
+        try:
+            return sorted(os.listdir(self.path(path)))
+        except OSError:
+            return []
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(self.path(path))
+
+    # -- network and waits ------------------------------------------------
+
+    def net(self) -> NetBackend:
+        return get_backend()
+
+    def wait_for(self, predicate: Callable[[], bool], timeout_s: float,
+                 groups: int = events.RTMGRP_LINK | events.RTMGRP_IPV4_IFADDR | events.RTMGRP_IPV4_ROUTE,
+                 recheck_s: Optional[float] = None) -> bool:
+        return events.wait_for(predicate, timeout_s, groups=groups, recheck_s=recheck_s)
+
+    def wait_wpa_connected(self, iface: str, timeout_s: float) -> Optional[bool]:
+        return events.wait_wpa_connected(iface, timeout_s)
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def clock(self) -> float:
+        """Monotonic seconds, on the same timescale as sleep() and the wait timeouts."""
+        return time.monotonic()
+
+    # -- probes -----------------------------------------------------------
+
+    def arp_probe(self, dev: str, target: str, timeout_s: float) -> Optional[bool]:
+        """Does target answer ARP on dev? None when it can't be asked (no IPv4 on dev, no raw socket)."""
+        src = next((a.split("/")[0] for a in self.net().addrs(dev).get(dev, []) if "." in a), None)
+        return probe.arp(dev, src, target, timeout_s)
+
+    def ping(self, dev: str, target: str, timeout_s: float) -> Optional[float]:
+        """Round trip of one ICMP echo to target sent out of dev, None without a reply."""
+        try:
+            return probe.ping(dev, target, timeout_s)
+        except OSError:
+            if not self.which("ping"):
+                return None
+        # no ICMP socket for us: iputils ping (whole seconds only)
+        res = self.run(["ping", "-n", "-c", "1", "-W", str(max(1, round(timeout_s))), "-I", dev, target],
+                       capture=True)
+        for word in (res.stdout or "").split():
+            if res.returncode == 0 and word.startswith("time="):
+                return float(word[5:]) / 1000
+        return None
+
+
+_host: Optional[Host] = None
+_host_lock = threading.Lock()
+
+
+def get_host() -> Host:
+    global _host
+    with _host_lock:
+        if _host is None:
+            _host = Host()
+        return _host
+
+
+@contextmanager
+def use_host(host: Host) -> Iterator[Host]:
+    """Route apply/plan through `host` for the duration of the block."""
+    global _host
+    with _host_lock:
+        prev, _host = _host, host
+    try:
+        yield host
+    finally:
+        with _host_lock:
+            _host = prev
@@ -0,0 +1,697 @@
+"""
+Link/address/route operations behind one interface.
+
+NetlinkBackend talks rtnetlink over a stdlib AF_NETLINK socket and can send a
+whole group of changes in one sendmsg (see `batch()`); IpRouteBackend is the
+old fork-per-command `ip` path and stays as the fallback (non-Linux dev boxes,
+HAMSTERFI_NET_BACKEND=ip, or a kernel that refuses the socket).
+"""
+import ipaddress
+import os
+import socket
+import struct
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from hamsterfi.core import metrics
+
+
+@dataclass
+class Link:
+    name: str
+    index: int
+    up: bool = False
+    carrier: bool = False
+    master: Optional[str] = None
+    operstate: str = "UNKNOWN"
+
+
+@dataclass
+class DefaultRoute:
+    dev: str
+    via: Optional[str] = None
+    metric: int = 0
+
+
+@dataclass
+class Rule:
+    """An IPv4 policy routing rule: packets matching it look up `table`."""
+    priority: int
+    table: int
+    fwmark: Optional[int] = None
+    # "lookup main suppress_prefixlength 0": use main for everything but its default routes
+    suppress_prefixlength: Optional[int] = None
+
+
+TABLE_NAMES = {"local": 255, "main": 254, "default": 253}
+
+
+class NetBackend:
+    def links(self) -> Dict[str, Link]:
+        raise NotImplementedError
+
+    def addrs(self, dev: Optional[str] = None) -> Dict[str, List[str]]:
+        """dev -> ["192.168.50.1/24", "fe80::1/64", ...]"""
+        raise NotImplementedError
+
+    def default_routes(self, dev: Optional[str] = None, table: Optional[int] = None) -> List[DefaultRoute]:
+        """IPv4 defaults in the main table (or `table`), lowest metric first."""
+        raise NotImplementedError
+
+    def link_set(self, dev: str, up: bool, check: bool = False) -> None:
+        raise NotImplementedError
+
+    def set_master(self, dev: str, master: Optional[str], check: bool = False) -> None:
+        """master=None detaches (nomaster)."""
+        raise NotImplementedError
+
+    def add_bridge(self, name: str, stp: bool = False, check: bool = False) -> None:
+        raise NotImplementedError
+
+    def link_del(self, dev: str, check: bool = False) -> None:
+        raise NotImplementedError
+
+    def addr_flush(self, dev: str) -> None:
+        raise NotImplementedError
+
+    def addr_add(self, dev: str, cidr: str, check: bool = True) -> None:
+        raise NotImplementedError
+
+    def route_replace_default(self, via: str, dev: Optional[str] = None, metric: Optional[int] = None,
+                              check: bool = False, table: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def route_del_default(self, dev: Optional[str] = None, via: Optional[str] = None,
+                          metric: Optional[int] = None, check: bool = False, table: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def flush_route_cache(self) -> None:
+        raise NotImplementedError
+
+    def rules(self) -> List[Rule]:
+        """IPv4 policy routing rules, lowest priority first."""
+        raise NotImplementedError
+
+    def rule_add(self, rule: Rule, check: bool = False) -> None:
+        raise NotImplementedError
+
+    def rule_del(self, priority: int, check: bool = False) -> None:
+        raise NotImplementedError
+
+    @contextmanager
+    def batch(self) -> Iterator["NetBackend"]:
+        """Group changes; backends that can send them together do so on exit."""
+        yield self
+
+    def link_up(self, dev: str, check: bool = False) -> None:
+        self.link_set(dev, True, check=check)
+
+    def link_down(self, dev: str, check: bool = False) -> None:
+        self.link_set(dev, False, check=check)
+
+    def default_gw(self, dev: Optional[str] = None) -> Optional[str]:
+        for r in self.default_routes(dev):
+            if r.via:
+                return r.via
+        return None
+
+
+# ---------------------------------------------------------------------------
+# subprocess fallback
+
+
+def _parse_links(txt: str) -> Dict[str, Link]:
+    # "3: eth0: <BROADCAST,...,UP,LOWER_UP> mtu 1500 ... master br0 state UP ..."
+    links = {}
+    for ln in txt.splitlines():
+        parts = ln.split()
+        if len(parts) < 3:
+            continue
+        name = parts[1].rstrip(":").split("@")[0]
+        flags = parts[2].strip("<>").split(",")
+        link = Link(name=name, index=int(parts[0].rstrip(":") or 0), up="UP" in flags, carrier="LOWER_UP" in flags)
+        if "master" in parts:
+            link.master = parts[parts.index("master") + 1]
+        if "state" in parts:
+            link.operstate = parts[parts.index("state") + 1]
+        links[name] = link
+    return links
+
+
+def _parse_addrs(txt: str) -> Dict[str, List[str]]:
+    # "ap0              UP             192.168.50.1/24 fe80::2ccf:67ff:fef0:a882/64"
+    addrs = {}
+    for ln in txt.splitlines():
+        parts = ln.split()
+        if len(parts) < 2:
+            continue
+        addrs[parts[0].split("@")[0]] = parts[2:]
+    return addrs
+
+
+def _parse_default_routes(txt: str) -> List[DefaultRoute]:
+    routes = []
+    for ln in txt.splitlines():
+        parts = ln.split()
+        if not parts or parts[0] != "default" or "dev" not in parts:
+            continue
+        r = DefaultRoute(dev=parts[parts.index("dev") + 1])
+        if "via" in parts:
+            r.via = parts[parts.index("via") + 1]
+        if "metric" in parts:
+            r.metric = int(parts[parts.index("metric") + 1])
+        routes.append(r)
+    return sorted(routes, key=lambda r: r.metric)
+
+
+def _parse_rules(txt: str) -> List[Rule]:
+    # "1001:\tfrom all fwmark 0x1 lookup 101" / "1000:\tfrom all lookup main suppress_prefixlength 0"
+    rules = []
+    for ln in txt.splitlines():
+        parts = ln.split()
+        if not parts or not parts[0].endswith(":") or "lookup" not in parts:
+            continue
+        table = parts[parts.index("lookup") + 1]
+        r = Rule(priority=int(parts[0][:-1]), table=TABLE_NAMES.get(table) or int(table))
+        if "fwmark" in parts:
+            r.fwmark = int(parts[parts.index("fwmark") + 1].split("/")[0], 0)
+        if "suppress_prefixlength" in parts:
+            r.suppress_prefixlength = int(parts[parts.index("suppress_prefixlength") + 1])
+        rules.append(r)
+    return sorted(rules, key=lambda r: r.priority)
+
+
+def _traced(cmd: List[str], check: bool = False, capture: bool = False) -> subprocess.CompletedProcess:
+    start, t0 = time.time(), time.monotonic()
+    try:
+        res = subprocess.run(cmd, check=False, text=True, capture_output=capture)
+    except Exception as e:
+        metrics.record_command(cmd, start, time.monotonic() - t0, None, error=str(e))
+        raise
+    metrics.record_command(cmd, start, time.monotonic() - t0, res.returncode, res.stdout, res.stderr)
+    if check and res.returncode != 0:
+        raise subprocess.CalledProcessError(res.returncode, cmd, res.stdout, res.stderr)
+    return res
+
+
+class IpRouteBackend(NetBackend):
+    def _ip(self, args: List[str], check: bool = False) -> None:
+        _traced(["ip"] + args, check=check)
+
+    def _out(self, args: List[str]) -> str:
+        try:
+            return _traced(["ip"] + args, capture=True).stdout or ""
+        except Exception:
+            return ""
+
+    def links(self) -> Dict[str, Link]:
+        return _parse_links(self._out(["-o", "link", "show"]))
+
+    def addrs(self, dev: Optional[str] = None) -> Dict[str, List[str]]:
+        return _parse_addrs(self._out(["-br", "addr", "show"] + (["dev", dev] if dev else [])))
+
+    def default_routes(self, dev: Optional[str] = None, table: Optional[int] = None) -> List[DefaultRoute]:
+        # "ip route show default dev X" drops "dev X" from its output, so filter here
+        args = ["-4", "route", "show", "default"] + (["table", str(table)] if table else [])
+        routes = _parse_default_routes(self._out(args))
+        return [r for r in routes if not dev or r.dev == dev]
+
+    def link_set(self, dev: str, up: bool, check: bool = False) -> None:
+        self._ip(["link", "set", dev, "up" if up else "down"], check=check)
+
+    def set_master(self, dev: str, master: Optional[str], check: bool = False) -> None:
+        self._ip(["link", "set", dev] + (["master", master] if master else ["nomaster"]), check=check)
+
+    def add_bridge(self, name: str, stp: bool = False, check: bool = False) -> None:
+        self._ip(["link", "add", name, "type", "bridge"], check=check)
+        self._ip(["link", "set", name, "type", "bridge", "stp_state", "1" if stp else "0"], check=check)
+
+    def link_del(self, dev: str, check: bool = False) -> None:
+        self._ip(["link", "del", dev], check=check)
+
+    def addr_flush(self, dev: str) -> None:
+        self._ip(["addr", "flush", "dev", dev])
+
+    def addr_add(self, dev: str, cidr: str, check: bool = True) -> None:
+        self._ip(["addr", "add", cidr, "dev", dev], check=check)
+
+    def route_replace_default(self, via: str, dev: Optional[str] = None, metric: Optional[int] = None,
+                              check: bool = False, table: Optional[int] = None) -> None:
+        args = ["route", "replace", "default", "via", via]
+        if dev:
+            args += ["dev", dev]
+        if metric is not None:
+            args += ["metric", str(metric)]
+        if table:
+            args += ["table", str(table)]
+        self._ip(args, check=check)
+
+    def route_del_default(self, dev: Optional[str] = None, via: Optional[str] = None,
+                          metric: Optional[int] = None, check: bool = False, table: Optional[int] = None) -> None:
+        args = ["route", "del", "default"]
+        if via:
+            args += ["via", via]
+        if dev:
+            args += ["dev", dev]
+        if metric is not None:
+            args += ["metric", str(metric)]
+        if table:
+            args += ["table", str(table)]
+        self._ip(args, check=check)
+
+    def flush_route_cache(self) -> None:
+        self._ip(["route", "flush", "cache"])
+
+    def rules(self) -> List[Rule]:
+        return _parse_rules(self._out(["-4", "rule", "show"]))
+
+    def rule_add(self, rule: Rule, check: bool = False) -> None:
+        args = ["-4", "rule", "add", "priority", str(rule.priority)]
+        if rule.fwmark is not None:
+            args += ["fwmark", hex(rule.fwmark)]
+        args += ["lookup", str(rule.table)]
+        if rule.suppress_prefixlength is not None:
+            args += ["suppress_prefixlength", str(rule.suppress_prefixlength)]
+        self._ip(args, check=check)
+
+    def rule_del(self, priority: int, check: bool = False) -> None:
+        self._ip(["-4", "rule", "del", "priority", str(priority)], check=check)
+
+
+# ---------------------------------------------------------------------------
+# rtnetlink
+
+NETLINK_ROUTE = 0
+
+RTM_NEWLINK, RTM_DELLINK, RTM_GETLINK = 16, 17, 18
+RTM_NEWADDR, RTM_DELADDR, RTM_GETADDR = 20, 21, 22
+RTM_NEWROUTE, RTM_DELROUTE, RTM_GETROUTE = 24, 25, 26
+RTM_NEWRULE, RTM_DELRULE, RTM_GETRULE = 32, 33, 34
+
+NLMSG_ERROR, NLMSG_DONE = 2, 3
+
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLM_F_REPLACE = 0x100
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+
+IFLA_IFNAME = 3
+IFLA_MASTER = 10
+IFLA_OPERSTATE = 16
+IFLA_LINKINFO = 18
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+IFLA_BR_STP_STATE = 5
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_TABLE = 15
+
+RT_TABLE_UNSPEC = 0
+RT_TABLE_MAIN = 254
+RTPROT_BOOT = 3
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_NOWHERE = 255
+RTN_UNICAST = 1
+
+FRA_PRIORITY = 6
+FRA_FWMARK = 10
+FRA_SUPPRESS_PREFIXLEN = 14
+FRA_TABLE = 15
+FRA_FWMASK = 16
+FR_ACT_TO_TBL = 1
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_IFINFOMSG = struct.Struct("=BxHiII")
+_IFADDRMSG = struct.Struct("=BBBBI")
+_RTMSG = struct.Struct("=BBBBBBBBI")
+# struct fib_rule_hdr has the same layout: family, dst/src len, tos, table, 2 reserved, action, flags
+_FIBRULE = _RTMSG
+_RTATTR = struct.Struct("=HH")
+
+_OPERSTATES = ["UNKNOWN", "NOTPRESENT", "DOWN", "LOWERLAYERDOWN", "TESTING", "DORMANT", "UP"]
+
+
+def _align(n: int) -> int:
+    return (n + 3) & ~3
+
+
+def _attr(kind: int, payload: bytes) -> bytes:
+    raw = _RTATTR.pack(_RTATTR.size + len(payload), kind) + payload
+    return raw + b"\0" * (_align(len(raw)) - len(raw))
+
+
+def _u32(kind: int, value: int) -> bytes:
+    return _attr(kind, struct.pack("=I", value))
+
+
+def _ip4(kind: int, addr: str) -> bytes:
+    return _attr(kind, socket.inet_aton(addr))
+
+
+def _parse_attrs(data: bytes, offset: int = 0) -> Dict[int, bytes]:
+    attrs = {}
+    while offset + _RTATTR.size <= len(data):
+        length, kind = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[kind & 0x7FFF] = data[offset + _RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+class NetlinkBackend(NetBackend):
+    def __init__(self) -> None:
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self._sock.bind((0, 0))
+        self._seq = 0
+        self._lock = threading.RLock()
+        self._pending: Optional[List[Tuple[int, bytes, bool]]] = None
+
+    # -- transport --------------------------------------------------------
+
+    def _msg(self, kind: int, flags: int, body: bytes) -> Tuple[int, bytes]:
+        self._seq += 1
+        return self._seq, _NLMSGHDR.pack(_NLMSGHDR.size + len(body), kind, flags, self._seq, 0) + body
+
+    def _send(self, msgs: List[Tuple[int, bytes, bool]]) -> None:
+        """Send requests in one datagram and wait for every ACK."""
+        if not msgs:
+            return
+        self._sock.sendto(b"".join(m for _, m, _ in msgs), (0, 0))
+        waiting = {seq: check for seq, _, check in msgs}
+        first_error: Optional[OSError] = None
+        while waiting:
+            data = self._sock.recv(1 << 16)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, kind, _, seq, _ = _NLMSGHDR.unpack_from(data, offset)
+                if kind == NLMSG_ERROR and seq in waiting:
+                    (err,) = struct.unpack_from("=i", data, offset + _NLMSGHDR.size)
+                    if err and waiting[seq] and first_error is None:
+                        first_error = OSError(-err, os.strerror(-err))
+                    del waiting[seq]
+                offset += _align(length) if length else len(data)
+        if first_error is not None:
+            raise first_error
+
+    def _request(self, kind: int, flags: int, body: bytes, check: bool) -> None:
+        with self._lock:
+            seq, msg = self._msg(kind, flags | NLM_F_REQUEST | NLM_F_ACK, body)
+            if self._pending is not None:
+                self._pending.append((seq, msg, check))
+                return
+            self._send([(seq, msg, check)])
+
+    def _dump(self, kind: int, body: bytes) -> List[Tuple[int, bytes]]:
+        with self._lock:
+            seq, msg = self._msg(kind, NLM_F_REQUEST | NLM_F_DUMP, body)
+            self._sock.sendto(msg, (0, 0))
+            out = []
+            while True:
+                data = self._sock.recv(1 << 16)
+                offset = 0
+                while offset + _NLMSGHDR.size <= len(data):
+                    length, mtype, _, mseq, _ = _NLMSGHDR.unpack_from(data, offset)
+                    if mseq == seq:
+                        if mtype == NLMSG_DONE:
+                            return out
+                        if mtype == NLMSG_ERROR:
+                            (err,) = struct.unpack_from("=i", data, offset + _NLMSGHDR.size)
+                            raise OSError(-err, os.strerror(-err))
+                        out.append((mtype, data[offset + _NLMSGHDR.size:offset + length]))
+                    offset += _align(length) if length else len(data)
+
+    @contextmanager
+    def batch(self) -> Iterator["NetBackend"]:
+        with self._lock:
+            if self._pending is not None:
+                # nested: the outer batch sends
+                yield self
+                return
+            self._pending = []
+            try:
+                yield self
+                msgs = self._pending
+            finally:
+                self._pending = None
+            self._send(msgs)
+
+    @staticmethod
+    def _index(dev: str, check: bool) -> Optional[int]:
+        try:
+            return socket.if_nametoindex(dev)
+        except OSError:
+            if check:
+                raise
+            return None
+
+    # -- queries ----------------------------------------------------------
+
+    def links(self) -> Dict[str, Link]:
+        by_index: Dict[int, Link] = {}
+        masters: Dict[int, int] = {}
+        for _, body in self._dump(RTM_GETLINK, _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)):
+            _, _, index, flags, _ = _IFINFOMSG.unpack_from(body)
+            attrs = _parse_attrs(body, _IFINFOMSG.size)
+            name = attrs.get(IFLA_IFNAME, b"").split(b"\0")[0].decode()
+            link = Link(name=name, index=index, up=bool(flags & IFF_UP), carrier=bool(flags & IFF_LOWER_UP))
+            if IFLA_OPERSTATE in attrs:
+                state = attrs[IFLA_OPERSTATE][0]
+                link.operstate = _OPERSTATES[state] if state < len(_OPERSTATES) else "UNKNOWN"
+            if IFLA_MASTER in attrs:
+                masters[index] = struct.unpack("=I", attrs[IFLA_MASTER][:4])[0]
+            by_index[index] = link
+        for index, master in masters.items():
+            if master in by_index:
+                by_index[index].master = by_index[master].name
+        return {l.name: l for l in by_index.values()}
+
+    def _names(self) -> Dict[int, str]:
+        return {i: n for i, n in socket.if_nameindex()}
+
+    def _addr_msgs(self, family: int = socket.AF_UNSPEC) -> List[Tuple[int, int, int, str]]:
+        """(family, prefixlen, ifindex, address) for every address."""
+        out = []
+        for _, body in self._dump(RTM_GETADDR, _IFADDRMSG.pack(family, 0, 0, 0, 0)):
+            fam, plen, _, _, index = _IFADDRMSG.unpack_from(body)
+            attrs = _parse_attrs(body, _IFADDRMSG.size)
+            raw = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+            if raw is None:
+                continue
+            out.append((fam, plen, index, socket.inet_ntop(fam, raw)))
+        return out
+
+    def addrs(self, dev: Optional[str] = None) -> Dict[str, List[str]]:
+        names = self._names()
+        out: Dict[str, List[str]] = {}
+        for _, plen, index, addr in self._addr_msgs():
+            name = names.get(index)
+            if name is None or (dev and name != dev):
+                continue
+            out.setdefault(name, []).append(f"{addr}/{plen}")
+        return out
+
+    def default_routes(self, dev: Optional[str] = None, table: Optional[int] = None) -> List[DefaultRoute]:
+        want = table or RT_TABLE_MAIN
+        names = self._names()
+        routes = []
+        for _, body in self._dump(RTM_GETROUTE, _RTMSG.pack(socket.AF_INET, 0, 0, 0, 0, 0, 0, 0, 0)):
+            _, dst_len, _, _, table, _, _, rtype, _ = _RTMSG.unpack_from(body)
+            attrs = _parse_attrs(body, _RTMSG.size)
+            if RTA_TABLE in attrs:
+                table = struct.unpack("=I", attrs[RTA_TABLE][:4])[0]
+            if dst_len != 0 or table != want or rtype != RTN_UNICAST or RTA_OIF not in attrs:
+                continue
+            oif = names.get(struct.unpack("=I", attrs[RTA_OIF][:4])[0])
+            if oif is None or (dev and oif != dev):
+                continue
+            r = DefaultRoute(dev=oif)
+            if RTA_GATEWAY in attrs:
+                r.via = socket.inet_ntoa(attrs[RTA_GATEWAY])
+            if RTA_PRIORITY in attrs:
+                r.metric = struct.unpack("=I", attrs[RTA_PRIORITY][:4])[0]
+            routes.append(r)
+        return sorted(routes, key=lambda r: r.metric)
+
+    # -- changes ----------------------------------------------------------
+
+    def link_set(self, dev: str, up: bool, check: bool = False) -> None:
+        index = self._index(dev, check)
+        if index is None:
+            return
+        body = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, IFF_UP if up else 0, IFF_UP)
+        self._request(RTM_NEWLINK, 0, body, check)
+
+    def set_master(self, dev: str, master: Optional[str], check: bool = False) -> None:
+        index = self._index(dev, check)
+        if index is None:
+            return
+        master_index = 0
+        if master:
+            master_index = self._index(master, check)
+            if master_index is None:
+                return
+        body = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, 0, 0) + _u32(IFLA_MASTER, master_index)
+        self._request(RTM_NEWLINK, 0, body, check)
+
+    def add_bridge(self, name: str, stp: bool = False, check: bool = False) -> None:
+        info = _attr(IFLA_INFO_KIND, b"bridge") + _attr(IFLA_INFO_DATA, _u32(IFLA_BR_STP_STATE, 1 if stp else 0))
+        body = (
+            _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+            + _attr(IFLA_IFNAME, name.encode() + b"\0")
+            + _attr(IFLA_LINKINFO, info)
+        )
+        self._request(RTM_NEWLINK, NLM_F_CREATE | NLM_F_EXCL, body, check)
+
+    def link_del(self, dev: str, check: bool = False) -> None:
+        index = self._index(dev, check)
+        if index is None:
+            return
+        self._request(RTM_DELLINK, 0, _IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, 0, 0), check)
+
+    def addr_flush(self, dev: str) -> None:
+        index = self._index(dev, False)
+        if index is None:
+            return
+        with self.batch():
+            for fam, plen, idx, addr in self._addr_msgs():
+                if idx != index:
+                    continue
+                raw = socket.inet_pton(fam, addr)
+                body = _IFADDRMSG.pack(fam, plen, 0, 0, index) + _attr(IFA_LOCAL, raw)
+                self._request(RTM_DELADDR, 0, body, False)
+
+    def addr_add(self, dev: str, cidr: str, check: bool = True) -> None:
+        index = self._index(dev, check)
+        if index is None:
+            return
+        iface = ipaddress.ip_interface(cidr)
+        fam = socket.AF_INET if iface.version == 4 else socket.AF_INET6
+        raw = iface.ip.packed
+        body = (
+            _IFADDRMSG.pack(fam, iface.network.prefixlen, 0, RT_SCOPE_UNIVERSE, index)
+            + _attr(IFA_LOCAL, raw)
+            + _attr(IFA_ADDRESS, raw)
+        )
+        self._request(RTM_NEWADDR, NLM_F_CREATE | NLM_F_EXCL, body, check)
+
+    def _default_route_body(self, delete: bool, via: Optional[str], dev: Optional[str],
+                            metric: Optional[int], check: bool, table: Optional[int] = None) -> Optional[bytes]:
+        table = table or RT_TABLE_MAIN
+        # the header only has 8 bits for the table; RTA_TABLE carries the real id
+        short = table if table < 256 else RT_TABLE_UNSPEC
+        # like iproute2: deletes leave protocol/type open and use scope nowhere so they match any default
+        if delete:
+            body = _RTMSG.pack(socket.AF_INET, 0, 0, 0, short, 0, RT_SCOPE_NOWHERE, 0, 0)
+        else:
+            body = _RTMSG.pack(socket.AF_INET, 0, 0, 0, short, RTPROT_BOOT, RT_SCOPE_UNIVERSE, RTN_UNICAST, 0)
+        body += _u32(RTA_TABLE, table)
+        if via:
+            body += _ip4(RTA_GATEWAY, via)
+        if dev:
+            index = self._index(dev, check)
+            if index is None:
+                return None
+            body += _u32(RTA_OIF, index)
+        if metric is not None:
+            body += _u32(RTA_PRIORITY, metric)
+        return body
+
+    def route_replace_default(self, via: str, dev: Optional[str] = None, metric: Optional[int] = None,
+                              check: bool = False, table: Optional[int] = None) -> None:
+        body = self._default_route_body(False, via, dev, metric, check, table)
+        if body is not None:
+            self._request(RTM_NEWROUTE, NLM_F_CREATE | NLM_F_REPLACE, body, check)
+
+    def route_del_default(self, dev: Optional[str] = None, via: Optional[str] = None,
+                          metric: Optional[int] = None, check: bool = False, table: Optional[int] = None) -> None:
+        body = self._default_route_body(True, via, dev, metric, check, table)
+        if body is not None:
+            self._request(RTM_DELROUTE, 0, body, check)
+
+    def rules(self) -> List[Rule]:
+        rules = []
+        for _, body in self._dump(RTM_GETRULE, _FIBRULE.pack(socket.AF_INET, 0, 0, 0, 0, 0, 0, 0, 0)):
+            _, _, _, _, table, _, _, action, _ = _FIBRULE.unpack_from(body)
+            attrs = _parse_attrs(body, _FIBRULE.size)
+            if action != FR_ACT_TO_TBL:
+                continue
+            if FRA_TABLE in attrs:
+                table = struct.unpack("=I", attrs[FRA_TABLE][:4])[0]
+            r = Rule(priority=struct.unpack("=I", attrs[FRA_PRIORITY][:4])[0] if FRA_PRIORITY in attrs else 0,
+                     table=table)
+            if FRA_FWMARK in attrs:
+                r.fwmark = struct.unpack("=I", attrs[FRA_FWMARK][:4])[0]
+            if FRA_SUPPRESS_PREFIXLEN in attrs:
+                plen = struct.unpack("=i", attrs[FRA_SUPPRESS_PREFIXLEN][:4])[0]
+                r.suppress_prefixlength = plen if plen >= 0 else None
+            rules.append(r)
+        return sorted(rules, key=lambda r: r.priority)
+
+    def rule_add(self, rule: Rule, check: bool = False) -> None:
+        short = rule.table if rule.table < 256 else RT_TABLE_UNSPEC
+        body = _FIBRULE.pack(socket.AF_INET, 0, 0, 0, short, 0, 0, FR_ACT_TO_TBL, 0)
+        body += _u32(FRA_PRIORITY, rule.priority) + _u32(FRA_TABLE, rule.table)
+        if rule.fwmark is not None:
+            body += _u32(FRA_FWMARK, rule.fwmark) + _u32(FRA_FWMASK, 0xFFFFFFFF)
+        if rule.suppress_prefixlength is not None:
+            body += _u32(FRA_SUPPRESS_PREFIXLEN, rule.suppress_prefixlength)
+        self._request(RTM_NEWRULE, NLM_F_CREATE | NLM_F_EXCL, body, check)
+
+    def rule_del(self, priority: int, check: bool = False) -> None:
+        body = _FIBRULE.pack(socket.AF_INET, 0, 0, 0, RT_TABLE_UNSPEC, 0, 0, 0, 0) + _u32(FRA_PRIORITY, priority)
+        self._request(RTM_DELRULE, 0, body, check)
+
+    def flush_route_cache(self) -> None:
+        # what "ip route flush cache" does for IPv4
+        try:
+            with open("/proc/sys/net/ipv4/route/flush", "w") as f:
+                f.write("1\n")
+        except OSError:
+            pass
+
+
+_backend: Optional[NetBackend] = None
+_backend_lock = threading.Lock()
+
+
+def ipv4_addrs() -> Optional[Dict[str, List[str]]]:
+    """Every IPv4 address (secondaries included) per interface from one RTM_GETADDR dump; None without rtnetlink."""
+    backend = get_backend()
+    if not isinstance(backend, NetlinkBackend):
+        return None
+    try:
+        addrs = backend.addrs()
+    except OSError:
+        return None
+    return {name: [a for a in found if ":" not in a] for name, found in addrs.items()}
+
+
+def get_backend() -> NetBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = IpRouteBackend()
+            if os.environ.get("HAMSTERFI_NET_BACKEND", "netlink") == "netlink" and hasattr(socket, "AF_NETLINK"):
+                try:
+                    _backend = NetlinkBackend()
+                except OSError:
+                    pass
+        return _backend
@@ -0,0 +1,203 @@
+"""
+nftables ruleset as data.
+
+The firewall is built as tables/chains/rules and rendered as a batch that
+replaces only hamster-fi's own tables:
+
+    table inet hamsterfi            # create if missing, so the delete can't fail
+    delete table inet hamsterfi
+    table inet hamsterfi { ... }    # the new definition
+
+`nft -f` commits a file as one kernel transaction, so traffic never sees a
+moment without rules, and tables that belong to anything else are left alone
+(no `flush ruleset`). That only holds for names nobody else uses: `inet
+filter` and `ip nat` are also iptables-nft's, Docker's and the distro
+nftables.conf's, so ours are hamsterfi-prefixed. Older versions did use those
+two; legacy_tables() finds them in the previous file so apply drops them once.
+
+The flowtable lives in a table of its own (build_fastpath), loaded from a
+separate file once the LAN interface exists: a flowtable naming a missing
+device (ap0 while nftables.service runs at boot) fails the whole transaction,
+and the firewall and NAT must not go down with it.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from hamsterfi.core.models import AppConfig
+from hamsterfi.system.balance import Member, members
+
+FILTER_TABLE = ("inet", "hamsterfi")
+NAT_TABLE = ("ip", "hamsterfi_nat")
+FASTPATH_TABLE = ("inet", "hamsterfi_fastpath")
+OWNED_TABLES = (FILTER_TABLE, NAT_TABLE, FASTPATH_TABLE)
+# what hamster-fi.nft defined before the tables had names of their own
+LEGACY_TABLES = (("inet", "filter"), ("ip", "nat"))
+FLOWTABLE = "fastpath"
+# after the filter table's forward chain, so only flows it accepted are offloaded
+FASTPATH_PRIORITY = 10
+# before the routing decision, so the mark picks the table (NF_IP_PRI_MANGLE)
+MANGLE_PRIORITY = -150
+
+
+@dataclass
+class Chain:
+    name: str
+    type: Optional[str] = None
+    hook: Optional[str] = None
+    priority: int = 0
+    policy: Optional[str] = None
+    rules: List[str] = field(default_factory=list)
+
+    def add(self, *rules: str) -> "Chain":
+        self.rules.extend(r for r in rules if r)
+        return self
+
+    def render(self) -> str:
+        out = [f"  chain {self.name} {{"]
+        if self.type:
+            policy = f" policy {self.policy};" if self.policy else ""
+            out.append(f"    type {self.type} hook {self.hook} priority {self.priority};{policy}")
+            out.append("")
+        out += [f"    {r}" for r in self.rules]
+        out.append("  }")
+        return "\n".join(out)
+
+
+@dataclass
+class Flowtable:
+    name: str
+    devices: List[str]
+    hook: str = "ingress"
+    priority: int = 0
+
+    def render(self) -> str:
+        devices = ", ".join(self.devices)
+        return (
+            f"  flowtable {self.name} {{\n"
+            f"    hook {self.hook} priority {self.priority}; devices = {{ {devices} }};\n"
+            f"  }}"
+        )
+
+
+@dataclass
+class Table:
+    family: str
+    name: str
+    chains: List[Chain] = field(default_factory=list)
+    flowtables: List[Flowtable] = field(default_factory=list)
+
+    @property
+    def ref(self) -> str:
+        return f"{self.family} {self.name}"
+
+    def chain(self, name: str) -> Chain:
+        for c in self.chains:
+            if c.name == name:
+                return c
+        raise KeyError(name)
+
+    def render(self) -> str:
+        body = "\n\n".join([f.render() for f in self.flowtables] + [c.render() for c in self.chains])
+        return f"table {self.ref} {{\n{body}\n}}\n"
+
+
+@dataclass
+class Ruleset:
+    tables: List[Table] = field(default_factory=list)
+    # tables this batch removes (if present) without defining them again
+    removed: List[Tuple[str, str]] = field(default_factory=list)
+
+    def table(self, family: str, name: str) -> Table:
+        for t in self.tables:
+            if (t.family, t.name) == (family, name):
+                return t
+        raise KeyError(f"{family} {name}")
+
+    def render(self) -> str:
+        """One nft -f batch that atomically replaces these tables and nothing else."""
+        out = ["# Managed by hamster-fi. Replaces only the tables below, in one transaction."]
+        for ref in [t.ref for t in self.tables] + [f"{family} {name}" for family, name in self.removed]:
+            out += [f"table {ref}", f"delete table {ref}"]
+        out.append("")
+        return "\n".join(out) + "\n".join(t.render() for t in self.tables)
+
+
+def legacy_tables(old_rules: Optional[str]) -> List[Tuple[str, str]]:
+    """LEGACY_TABLES an older hamster-fi.nft defined: ours to drop once, anyone's after that."""
+    return [t for t in LEGACY_TABLES if re.search(rf"^table {t[0]} {t[1]} {{", old_rules or "", re.M)]
+
+
+def delete_tables_cmd(tables: List[tuple] = OWNED_TABLES) -> List[str]:
+    """`nft` argv that removes our tables (if present) in one transaction."""
+    parts = []
+    for family, name in tables:
+        parts += [f"table {family} {name}", f"delete table {family} {name}"]
+    return ["nft", "; ".join(parts)]
+
+
+def mark_map(ms: List[Member]) -> str:
+    """`numgen random` over the weights: {0-1 : 1, 2 : 2} for eth0 x2, wlan0 x1."""
+    out, start = [], 0
+    for m in ms:
+        end = start + m.weight - 1
+        out.append(f"{start}-{end} : {m.mark}" if end > start else f"{start} : {m.mark}")
+        start = end + 1
+    return f"numgen random mod {start} map {{ {', '.join(out)} }}"
+
+
+def _wans(cfg: AppConfig, wan_if: str) -> List[str]:
+    # balancing: every member is a WAN, whichever holds the main default route
+    return [m.dev for m in members(cfg)] or [wan_if]
+
+
+def build_ruleset(cfg: AppConfig, wan_if: str, lan_if: str, ui_port: int = 8080) -> Ruleset:
+    allow_ssh = bool(getattr(cfg.firewall, "allow_ssh_from_lan", True))
+    lan = f'iifname "{lan_if}"'
+    balance = members(cfg)
+    wans = _wans(cfg, wan_if)
+    oif = f'oifname "{wans[0]}"' if len(wans) == 1 else "oifname { " + ", ".join(f'"{w}"' for w in wans) + " }"
+
+    input_chain = Chain("input", "filter", "input", 0, "drop").add(
+        "iif lo accept",
+        "ct state established,related accept",
+        "ip protocol icmp accept",
+        "ip6 nexthdr icmpv6 accept",
+        f"{lan} udp dport {{ 67, 68 }} accept",
+        f"{lan} udp dport 53 accept",
+        f"{lan} tcp dport 53 accept",
+        f"{lan} tcp dport {ui_port} accept",
+        f"{lan} udp dport 5353 accept",
+        f"{lan} tcp dport 22 accept" if allow_ssh else "",
+    )
+    forward_chain = Chain("forward", "filter", "forward", 0, "drop").add(
+        "ct state established,related accept",
+        f"{lan} {oif} accept",
+    )
+    # one rule per uplink: each flow is NATed to the address of the uplink it leaves by
+    postrouting = Chain("postrouting", "nat", "postrouting", 100, "accept").add(
+        *(f'oifname "{w}" masquerade' for w in wans),
+    )
+    chains = [input_chain, forward_chain]
+    if balance:
+        # new flows get an uplink by weight; later packets (and replies' flows) keep it via ct mark
+        chains.insert(0, Chain("prerouting", "filter", "prerouting", MANGLE_PRIORITY).add(
+            f"{lan} ct state new ct mark set {mark_map(balance)}",
+            f"{lan} meta mark set ct mark",
+        ))
+    return Ruleset([
+        Table(*FILTER_TABLE, chains=chains),
+        Table(*NAT_TABLE, chains=[postrouting]),
+    ])
+
+
+def build_fastpath(cfg: AppConfig, wan_if: str, lan_if: str) -> Ruleset:
+    """The flowtable on the WANs and the LAN, or just the removal of its table when it is off."""
+    if not bool(getattr(cfg.firewall, "flowtable", False)) or wan_if == lan_if:
+        return Ruleset(removed=[FASTPATH_TABLE])
+    forward = Chain("forward", "filter", "forward", FASTPATH_PRIORITY, "accept").add(
+        # once a flow is established in both directions, later packets skip the hooks entirely
+        f"meta l4proto {{ tcp, udp }} flow add @{FLOWTABLE}",
+    )
+    flowtable = Flowtable(FLOWTABLE, _wans(cfg, wan_if) + [lan_if])
+    return Ruleset([Table(*FASTPATH_TABLE, chains=[forward], flowtables=[flowtable])])
@@ -0,0 +1,210 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from hamsterfi.core.models import AppConfig
+from hamsterfi.system.host import get_host
+from hamsterfi.system.balance import ours
+from hamsterfi.system.net import DefaultRoute, Link, Rule
+
+
+@dataclass
+class Action:
+    name: str
+    detail: str = ""
+    run: Optional[Callable[[], None]] = field(default=None, repr=False)
+    # names of the actions that must finish before this one starts
+    after: Tuple[str, ...] = ()
+    duration: Optional[float] = None
+    error: Optional[str] = None
+
+    def describe(self) -> dict:
+        d = {"step": self.name, "detail": self.detail, "after": list(self.after)}
+        if self.duration is not None:
+            d["duration_s"] = round(self.duration, 3)
+        if self.error is not None:
+            d["error"] = self.error
+        return d
+
+
+@dataclass
+class Plan:
+    mode: str
+    actions: List[Action] = field(default_factory=list)
+    full: bool = False
+    wall_s: Optional[float] = None
+    critical_path: List[str] = field(default_factory=list)
+    critical_s: Optional[float] = None
+    # every file the desired state for this config manages, written or not
+    files: List[str] = field(default_factory=list)
+
+    def describe(self) -> dict:
+        d = {"mode": self.mode, "full": self.full, "plan": [a.describe() for a in self.actions]}
+        if self.wall_s is not None:
+            d["wall_s"] = round(self.wall_s, 3)
+            d["critical_path"] = self.critical_path
+            d["critical_s"] = round(self.critical_s or 0.0, 3)
+        return d
+
+
+@dataclass
+class LiveState:
+    links: Dict[str, Link] = field(default_factory=dict)
+    addrs: Dict[str, List[str]] = field(default_factory=dict)
+    default_routes: List[DefaultRoute] = field(default_factory=list)
+    files: Dict[str, Optional[str]] = field(default_factory=dict)
+    services: Dict[str, str] = field(default_factory=dict)
+    wlan0_connected: bool = False
+    # hamster-fi's policy routing rules (balance.ours)
+    rules: List[Rule] = field(default_factory=list)
+
+    def has_ipv4(self, dev: str) -> bool:
+        return any(
+            "." in a and not a.startswith("169.254.") for a in self.addrs.get(dev, [])
+        )
+
+    def defaults_on(self, dev: str) -> List[DefaultRoute]:
+        return [r for r in self.default_routes if r.dev == dev]
+
+
+@dataclass
+class DesiredState:
+    mode: str
+    lan_if: str
+    wan_if: str
+    # rewritten in place when they drift; each maps to a reload step
+    files: Dict[str, str] = field(default_factory=dict)
+    # if any of these drift the topology is different and we fall back to a full apply
+    topology_files: Dict[str, str] = field(default_factory=dict)
+    services: Dict[str, bool] = field(default_factory=dict)
+    # the AP channel the files were rendered for (wlan.channel: auto resolved)
+    channel: Optional[int] = None
+    # standby uplink the failover monitor may give the preferred (metric 50) default to
+    backup_if: Optional[str] = None
+    # wan.balance ip rules; anything else in our priority range is removed
+    rules: List[Rule] = field(default_factory=list)
+
+    def preferred_uplink(self, live: "LiveState") -> str:
+        if self.backup_if and any(r.metric == 50 for r in live.defaults_on(self.backup_if)):
+            return self.backup_if
+        return self.wan_if
+
+
+def _safe_out(cmd: List[str]) -> str:
+    try:
+        return get_host().run(cmd, check=False, capture=True).stdout or ""
+    except Exception:
+        return ""
+
+
+def read_live_state(paths: Iterable[str], services: Iterable[str], need_wlan0: bool = False,
+                    need_rules: bool = False) -> LiveState:
+    host = get_host()
+    net = host.net()
+    live = LiveState()
+    live.links = net.links()
+    live.addrs = net.addrs()
+    live.default_routes = net.default_routes()
+    if need_rules:
+        live.rules = [r for r in net.rules() if ours(r)]
+    live.files = {p: host.read_text(p) for p in paths}
+
+    svcs = list(services)
+    if svcs:
+        states = _safe_out(["systemctl", "is-active"] + svcs).splitlines()
+        for i, svc in enumerate(svcs):
+            live.services[svc] = states[i].strip() if i < len(states) else "unknown"
+
+    if need_wlan0:
+        out = _safe_out(["iw", "dev", "wlan0", "link"])
+        live.wlan0_connected = "Connected to" in out and "Not connected" not in out
+    return live
+
+
+def effective_wan(live: LiveState, fallback: str) -> str:
+    if not live.default_routes:
+        return fallback
+    return live.default_routes[0].dev
+
+
+def _wan_mismatches(cfg: AppConfig, live: LiveState, wan_if: str) -> List[str]:
+    out = []
+    if cfg.wan.ipv4 == "static":
+        if cfg.wan.static.address not in live.addrs.get(wan_if, []):
+            out.append(f"{wan_if} is missing static address {cfg.wan.static.address}")
+        if not any(r.via == cfg.wan.static.gateway for r in live.default_routes):
+            out.append(f"no default route via {cfg.wan.static.gateway}")
+    else:
+        out += _dhcp_mismatches(live, wan_if)
+    return out
+
+
+def _dhcp_mismatches(live: LiveState, dev: str) -> List[str]:
+    out = []
+    if not live.has_ipv4(dev):
+        out.append(f"{dev} has no DHCP address")
+    if not live.defaults_on(dev):
+        out.append(f"no default route on {dev}")
+    return out
+
+
+def topology_mismatches(cfg: AppConfig, desired: DesiredState, live: LiveState) -> List[str]:
+    """
+    Everything that the incremental path cannot fix by rewriting a file and
+    reloading a service. An empty list means the links, addresses, routes and
+    upstream association already match the requested mode.
+    """
+    out = []
+    for path, content in desired.topology_files.items():
+        if live.files.get(path) != content:
+            out.append(f"{path} differs")
+
+    if desired.mode in ("ap", "station"):
+        if "br0" in live.links:
+            out.append("br0 still present")
+        if desired.lan_if not in live.links:
+            out.append(f"{desired.lan_if} missing")
+        elif cfg.lan.address not in live.addrs.get(desired.lan_if, []):
+            out.append(f"{desired.lan_if} is missing {cfg.lan.address}")
+        # after a failover the backup carries the traffic; the primary is the monitor's to bring back
+        uplink = desired.preferred_uplink(live)
+        if uplink == "wlan0" and not live.wlan0_connected:
+            out.append("wlan0 not associated upstream")
+        if uplink == desired.wan_if:
+            out += _wan_mismatches(cfg, live, uplink)
+        else:
+            out += _dhcp_mismatches(live, uplink)
+
+    if desired.mode == "ap":
+        if not any(r.metric == 50 for r in live.defaults_on(uplink)):
+            out.append(f"{desired.wan_if} is not the preferred (metric 50) default")
+
+    if desired.mode == "station":
+        stray = sorted({r.dev for r in live.default_routes if r.dev != "wlan0"})
+        if stray:
+            out.append(f"extra default routes on {', '.join(stray)}")
+
+    if desired.mode == "bridge":
+        if "br0" not in live.links:
+            out.append("br0 missing")
+        else:
+            for dev in ("eth0", desired.lan_if):
+                link = live.links.get(dev)
+                if link is None or link.master != "br0":
+                    out.append(f"{dev} not enslaved to br0")
+            if not live.has_ipv4("br0"):
+                out.append("br0 has no DHCP address")
+    return out
+
+
+def changed_files(desired: DesiredState, live: LiveState) -> Dict[str, str]:
+    return {p: c for p, c in desired.files.items() if live.files.get(p) != c}
+
+
+def service_changes(desired: DesiredState, live: LiveState) -> Dict[str, bool]:
+    """Services whose active state has to flip: name -> should be active."""
+    out = {}
+    for svc, want in desired.services.items():
+        is_active = live.services.get(svc) == "active"
+        if want != is_active:
+            out[svc] = want
+    return out
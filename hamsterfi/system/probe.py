@@ -0,0 +1,129 @@
+"""
+Reachability probes for one uplink, with stdlib sockets only.
+
+`arp()` asks "who has <gateway>" on the interface itself (AF_PACKET), so it
+answers whether the next hop is alive no matter which uplink the routing
+table currently prefers. `ping()` sends one ICMP echo out of the interface
+(SO_BINDTODEVICE), which makes the kernel route it over that uplink's own
+default route even while it is the metric-5000 backup.
+
+Both need CAP_NET_RAW (the monitor runs as root). ping() falls back to an
+unprivileged ICMP datagram socket; arp() returns None when it can't send,
+and callers then go by ping() alone.
+"""
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from typing import Optional
+
+ETH_P_ARP = 0x0806
+SO_BINDTODEVICE = getattr(socket, "SO_BINDTODEVICE", 25)
+
+_seq_lock = threading.Lock()
+_seq = 0
+
+
+def _next_seq() -> int:
+    global _seq
+    with _seq_lock:
+        _seq = (_seq + 1) & 0xFFFF
+        return _seq
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _recv_until(sock: socket.socket, deadline: float, match) -> bool:
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        ready, _, _ = select.select([sock], [], [], remaining)
+        if not ready:
+            return False
+        try:
+            data, addr = sock.recvfrom(2048)
+        except (BlockingIOError, InterruptedError):
+            continue
+        if match(data, addr):
+            return True
+
+
+def arp(dev: str, src: Optional[str], target: str, timeout_s: float) -> Optional[bool]:
+    """True once `target` answers an ARP request sent from `src` on dev; None if it can't be asked."""
+    if not src or not hasattr(socket, "AF_PACKET"):
+        return None
+    try:
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+    except OSError:
+        return None
+    with sock:
+        try:
+            sock.bind((dev, ETH_P_ARP))
+            mac = sock.getsockname()[4]
+            if len(mac) != 6:
+                return None  # not an Ethernet-like link
+            want = socket.inet_aton(target)
+            request = (
+                b"\xff" * 6 + mac + struct.pack("!H", ETH_P_ARP)
+                + struct.pack("!HHBBH6s4s6s4s", 1, 0x0800, 6, 4, 1, mac, socket.inet_aton(src), b"\0" * 6, want)
+            )
+            sock.send(request.ljust(60, b"\0"))
+        except OSError:
+            return None
+
+        def reply(frame: bytes, _addr) -> bool:
+            # ARP op at 20, sender protocol address at 28
+            return len(frame) >= 42 and frame[20:22] == b"\x00\x02" and frame[28:32] == want
+
+        return _recv_until(sock, time.monotonic() + timeout_s, reply)
+
+
+def _icmp_socket(dev: str) -> socket.socket:
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    except PermissionError:
+        # net.ipv4.ping_group_range ping sockets: the kernel owns the echo id
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, dev.encode() + b"\0")
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def ping(dev: str, target: str, timeout_s: float) -> Optional[float]:
+    """Round trip in seconds of one echo to target out of dev, None without a reply. OSError if it can't be sent."""
+    sock = _icmp_socket(dev)
+    with sock:
+        raw = sock.type == socket.SOCK_RAW
+        ident, seq = os.getpid() & 0xFFFF, _next_seq()
+        payload = b"hamsterfi-probe"
+        header = struct.pack("!BBHHH", 8, 0, 0, ident, seq)
+        packet = struct.pack("!BBHHH", 8, 0, _checksum(header + payload), ident, seq) + payload
+        t0 = time.monotonic()
+        sock.sendto(packet, (target, 0))
+
+        def reply(data: bytes, addr) -> bool:
+            if addr[0] != target:
+                return False
+            if raw:
+                data = data[(data[0] & 0x0F) * 4:]  # skip the IP header
+            if len(data) < 8:
+                return False
+            kind, _, _, rid, rseq = struct.unpack_from("!BBHHH", data)
+            return kind == 0 and rseq == seq and (rid == ident or not raw)
+
+        if _recv_until(sock, t0 + timeout_s, reply):
+            return time.monotonic() - t0
+        return None
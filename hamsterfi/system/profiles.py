@@ -0,0 +1,226 @@
+"""
+Named profiles ("home-ap", "dorm-station", ...), each a full AppConfig kept
+next to what it renders to:
+
+    PROFILES_DIR/<name>.yaml            the config, same format as config.yaml
+    PROFILES_DIR/<name>.d/manifest.json  mode, interfaces, resolved channel, services,
+                                         path -> digest of every managed file
+    PROFILES_DIR/<name>.d/<digest>       the rendered files
+
+Saving a profile validates it and renders it right away (apply.render_desired:
+preflight checks, channel scan for wlan.channel: auto, hostapd/dnsmasq/nft/
+wpa_supplicant/dhcpcd/sysctl/boot scripts). Activating it makes its config
+config.yaml again and hands the rendered state to the planner, so switching
+pays for the file writes and restarts (or, between modes, the topology
+rebuild) but not for a scan or a render. A manifest whose config digest no
+longer matches the YAML is stale and rendered again first.
+
+    python -m hamsterfi.system.profiles [list]
+    python -m hamsterfi.system.profiles render <name> | --all
+    python -m hamsterfi.system.profiles activate <name>
+"""
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from hamsterfi.core.models import AppConfig
+from hamsterfi.system.host import get_host
+from hamsterfi.system.plan import DesiredState
+from hamsterfi.system.snapshot import config_digest, file_digest
+
+PROFILES_DIR = os.environ.get("HAMSTERFI_PROFILES_DIR", "/etc/hamster-fi/profiles")
+ACTIVE_PROFILE = os.environ.get("HAMSTERFI_ACTIVE_PROFILE", "/etc/hamster-fi/runtime/active-profile")
+
+_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+
+@dataclass
+class Manifest:
+    config: str  # config_digest() of the profile it was rendered from
+    mode: str
+    lan_if: str
+    wan_if: str
+    channel: Optional[int] = None
+    services: Dict[str, bool] = field(default_factory=dict)
+    files: Dict[str, str] = field(default_factory=dict)  # path -> file_digest()
+    topology: List[str] = field(default_factory=list)  # paths of files that are topology files
+    rendered: float = field(default_factory=time.time)
+    render_s: float = 0.0
+
+
+def _yaml_path(name: str) -> str:
+    return os.path.join(PROFILES_DIR, f"{name}.yaml")
+
+
+def _dir(name: str) -> str:
+    return os.path.join(PROFILES_DIR, f"{name}.d")
+
+
+def check_name(name: str) -> str:
+    if not _NAME.match(name or ""):
+        raise ValueError("profile names are 1-32 lowercase letters, digits, '-' or '_'")
+    return name
+
+
+def names() -> List[str]:
+    return [n[:-5] for n in get_host().listdir(PROFILES_DIR) if n.endswith(".yaml") and _NAME.match(n[:-5])]
+
+
+def load(name: str) -> Optional[AppConfig]:
+    text = get_host().read_text(_yaml_path(check_name(name)))
+    if text is None:
+        return None
+    return AppConfig.model_validate(yaml.safe_load(text) or {})
+
+
+def manifest(name: str) -> Optional[Manifest]:
+    try:
+        return Manifest(**json.loads(get_host().read_text(os.path.join(_dir(name), "manifest.json")) or ""))
+    except (ValueError, TypeError):
+        return None
+
+
+def render(name: str) -> Manifest:
+    """Validate and pre-render a saved profile; raises (RuntimeError/ValueError) if it can't be applied."""
+    from hamsterfi.system.apply import render_desired
+
+    cfg = load(name)
+    if cfg is None:
+        raise KeyError(name)
+    host = get_host()
+    t0 = time.monotonic()
+    desired = render_desired(cfg)
+    files = {**desired.topology_files, **desired.files}
+    m = Manifest(
+        config=config_digest(cfg), mode=desired.mode, lan_if=desired.lan_if, wan_if=desired.wan_if,
+        channel=desired.channel, services=desired.services,
+        files={p: file_digest(text) for p, text in files.items()},
+        topology=sorted(desired.topology_files), render_s=round(time.monotonic() - t0, 3),
+    )
+    keep = set(m.files.values()) | {"manifest.json"}
+    for path, text in files.items():
+        host.write_text(os.path.join(_dir(name), m.files[path]), text)
+    for old in host.listdir(_dir(name)):
+        if old not in keep:
+            host.remove(os.path.join(_dir(name), old))
+    host.write_text(os.path.join(_dir(name), "manifest.json"), json.dumps(asdict(m), indent=1) + "\n")
+    return m
+
+
+def save(name: str, cfg: AppConfig) -> Manifest:
+    """Store cfg as profile `name` and render it; a profile that can't render is not kept."""
+    check_name(name)
+    host = get_host()
+    previous = host.read_text(_yaml_path(name))
+    host.write_text(_yaml_path(name), yaml.safe_dump(cfg.model_dump(), sort_keys=False))
+    try:
+        return render(name)
+    except Exception:
+        if previous is None:
+            host.remove(_yaml_path(name))
+        else:
+            host.write_text(_yaml_path(name), previous)
+        raise
+
+
+def delete(name: str) -> None:
+    host = get_host()
+    host.remove(_yaml_path(check_name(name)))
+    for f in host.listdir(_dir(name)):
+        host.remove(os.path.join(_dir(name), f))
+    if active() == name:
+        host.remove(ACTIVE_PROFILE)
+
+
+def prebuilt(name: str) -> Tuple[AppConfig, DesiredState, bool]:
+    """(config, rendered desired state, whether it had to be rendered now)."""
+    cfg = load(name)
+    if cfg is None:
+        raise KeyError(name)
+    m = manifest(name)
+    fresh = m is None or m.config != config_digest(cfg)
+    if fresh:
+        m = render(name)
+    host = get_host()
+    texts = {p: host.read_text(os.path.join(_dir(name), d)) for p, d in m.files.items()}
+    if any(t is None for t in texts.values()):
+        # artifacts went missing under the manifest
+        m, fresh = render(name), True
+        texts = {p: host.read_text(os.path.join(_dir(name), d)) for p, d in m.files.items()}
+    desired = DesiredState(
+        mode=m.mode, lan_if=m.lan_if, wan_if=m.wan_if, services=dict(m.services), channel=m.channel,
+        topology_files={p: t for p, t in texts.items() if p in m.topology},
+        files={p: t for p, t in texts.items() if p not in m.topology},
+    )
+    return cfg, desired, fresh
+
+
+def active() -> Optional[str]:
+    name = (get_host().read_text(ACTIVE_PROFILE) or "").strip()
+    return name or None
+
+
+def set_active(name: str) -> None:
+    get_host().write_text(ACTIVE_PROFILE, name + "\n")
+
+
+def describe(name: str, current: Optional[AppConfig] = None) -> dict:
+    cfg = load(name)
+    m = manifest(name)
+    digest = config_digest(cfg) if cfg else None
+    return {
+        "name": name,
+        "mode": cfg.mode if cfg else None,
+        "ssid": cfg.wlan.ssid if cfg else None,
+        "wan": cfg.wan.device if cfg else None,
+        "channel": m.channel if m else None,
+        "rendered": m.rendered if m else None,
+        "render_s": m.render_s if m else None,
+        "stale": m is None or m.config != digest,
+        "files": m.files if m else {},
+        # active and config.yaml still what the profile says
+        "active": active() == name and current is not None and config_digest(current) == digest,
+    }
+
+
+def main(argv: List[str]) -> int:
+    cmd = argv[0] if argv else "list"
+    if cmd == "list":
+        for name in names():
+            d = describe(name)
+            flags = ("*" if active() == name else " ") + ("!" if d["stale"] else " ")
+            print(f"{flags} {name:<20} {d['mode']:<8} {d['ssid'] or '':<20} channel {d['channel']}")
+        return 0
+    if cmd == "render" and len(argv) > 1:
+        targets = names() if argv[1] == "--all" else [argv[1]]
+        rc = 0
+        for name in targets:
+            try:
+                m = render(name)
+                print(f"{name}: {len(m.files)} files, channel {m.channel}, {m.render_s:.2f}s")
+            except Exception as e:
+                print(f"{name}: {e}", file=sys.stderr)
+                rc = 1
+        return rc
+    if cmd == "activate" and len(argv) > 1:
+        from hamsterfi.system.apply import activate_profile
+
+        try:
+            res = activate_profile(argv[1])
+        except Exception as e:
+            print(f"activate failed: {e}", file=sys.stderr)
+            return 1
+        print(f"{argv[1]} active in {res['switch_s']:.2f}s ({res['summary']})")
+        return 0
+    print("usage: python -m hamsterfi.system.profiles [list | render <name>|--all | activate <name>]", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
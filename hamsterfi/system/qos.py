@@ -0,0 +1,80 @@
+"""
+Queue management on the effective WAN: CAKE (or HTB + fq_codel where sch_cake
+is missing) shaped a little below the line rate, so queues build on the Pi
+where they are managed and not in the modem's buffer.
+
+Egress is shaped on the WAN interface itself; ingress is redirected to an IFB
+device (ifb4<wan>) and shaped on its egress. Everything lives in one shell
+script (QOS_SCRIPT) that first removes shaping from the other WAN candidates,
+so re-running it after the uplink moves from eth0 to wlan0 (or back) leaves
+exactly one shaped interface. A oneshot unit replays it at boot.
+"""
+from typing import List, Optional
+
+from hamsterfi.core.models import AppConfig
+from hamsterfi.system.render import render_oneshot_unit
+
+QOS_SCRIPT = "/etc/hamster-fi/qos.sh"
+QOS_UNIT = "/etc/systemd/system/hamsterfi-qos.service"
+QOS_SERVICE = "hamsterfi-qos"
+
+WAN_CANDIDATES = ("eth0", "wlan0")
+
+_HEADER = """#!/bin/sh
+# Managed by hamster-fi: WAN queue management, also run at boot by hamsterfi-qos.service
+unshape() {
+  tc qdisc del dev "$1" root 2>/dev/null
+  tc qdisc del dev "$1" ingress 2>/dev/null
+  ip link del "ifb4$1" 2>/dev/null
+  true
+}
+# dev kbit cake-options; HTB + fq_codel when the kernel has no sch_cake
+shape() {
+  tc qdisc replace dev "$1" root cake bandwidth "$2kbit" $3 2>/dev/null && return
+  tc qdisc replace dev "$1" root handle 1: htb default 10
+  tc class replace dev "$1" parent 1: classid 1:10 htb rate "$2kbit" ceil "$2kbit" quantum 1514
+  tc qdisc replace dev "$1" parent 1:10 fq_codel 2>/dev/null || true
+}
+"""
+
+
+def ifb_name(wan_if: str) -> str:
+    return f"ifb4{wan_if}"[:15]
+
+
+def render_qos(cfg: AppConfig, wan_if: Optional[str]) -> str:
+    q = cfg.qos
+    active = wan_if if q.enabled and (q.up_kbit or q.down_kbit) else None
+    lines: List[str] = [_HEADER.rstrip("\n")]
+    for dev in WAN_CANDIDATES:
+        if dev != active:
+            lines.append(f"unshape {dev}")
+    if active is None:
+        return "\n".join(lines) + "\n"
+
+    ifb = ifb_name(active)
+    lines.append(f"# {active}: up {q.up_kbit or '-'} kbit/s, down {q.down_kbit or '-'} kbit/s")
+    if q.up_kbit:
+        # nat: fairness per LAN host behind the masquerade, not per WAN address
+        lines.append(f"shape {active} {q.up_kbit} nat")
+    else:
+        lines.append(f"tc qdisc del dev {active} root 2>/dev/null")
+
+    lines.append(f"tc qdisc del dev {active} ingress 2>/dev/null")
+    if q.down_kbit:
+        lines += [
+            f"ip link add {ifb} type ifb 2>/dev/null",
+            f"ip link set {ifb} up",
+            f"tc qdisc add dev {active} handle ffff: ingress",
+            # u32 "match everything" works on kernels built without cls_matchall
+            f"tc filter add dev {active} parent ffff: protocol all u32 match u32 0 0 "
+            f"action mirred egress redirect dev {ifb}",
+            f'shape {ifb} {q.down_kbit} "nat ingress"',
+        ]
+    else:
+        lines.append(f"ip link del {ifb} 2>/dev/null")
+    return "\n".join(lines) + "\n"
+
+
+def render_qos_unit() -> str:
+    return render_oneshot_unit("Hamster-Fi WAN queue management", QOS_SCRIPT, after="network.target")
@@ -1,28 +1,43 @@
+from typing import List
+
 from hamsterfi.core.models import AppConfig
+from hamsterfi.system.nft import build_fastpath, build_ruleset
+from hamsterfi.system.wifi import ChannelPlan, channel_plan
 
 HOSTAPD_PATH = "/etc/hostapd/hostapd.conf"
 DNSMASQ_PATH = "/etc/dnsmasq.d/hamster-fi.conf"
 NFT_PATH = "/etc/nftables.d/hamster-fi.nft"
+# not under nftables.d: loaded by apply and the boot replay once the LAN interface exists
+FASTPATH_PATH = "/etc/hamster-fi/fastpath.nft"
 WPA_SUPPLICANT_WLAN0 = "/etc/wpa_supplicant/wpa_supplicant-wlan0.conf"
 
 
-def _hostapd_band_block(channel: int) -> str:
-    # 2.4 GHz channels are 1..14; everything else we treat as 5 GHz here.
-    if 1 <= channel <= 14:
-        # 2.4 GHz
-        return """hw_mode=g
-ieee80211n=1
-"""
-    # 5 GHz
-    return """hw_mode=a
-ieee80211n=1
-ieee80211ac=1
-"""
-
-
-def render_hostapd(cfg: AppConfig, ap_if: str) -> str:
+def _hostapd_band_block(plan: ChannelPlan) -> str:
+    sgi = "[SHORT-GI-20]" + ("[SHORT-GI-40]" if plan.width >= 40 else "")
+    ht40 = {1: "[HT40+]", -1: "[HT40-]"}.get(plan.secondary, "")
+    lines = []
+    if plan.band == "2.4":
+        lines += ["hw_mode=g", "ieee80211n=1"]
+    else:
+        lines += ["hw_mode=a", "ieee80211n=1", "ieee80211ac=1"]
+    lines.append(f"ht_capab={ht40}{sgi}")
+    if plan.band == "5":
+        if plan.width == 80:
+            lines.append("vht_capab=[SHORT-GI-80]")
+        lines.append(f"vht_oper_chwidth={1 if plan.width == 80 else 0}")
+        lines.append(f"vht_oper_centr_freq_seg0_idx={plan.center}")
+    # 802.11d/h: advertise the country, and do radar detection on DFS channels
+    lines.append("ieee80211d=1")
+    if plan.dfs:
+        lines.append("ieee80211h=1")
+    return "\n".join(lines) + "\n"
+
+
+def render_hostapd(cfg: AppConfig, ap_if: str, follow: bool = False) -> str:
+    """`follow`: the channel was copied from the uplink, narrow the width to fit instead of failing."""
     chan = int(cfg.wlan.channel)
-    band_block = _hostapd_band_block(chan)
+    plan = channel_plan(cfg.wlan.country, chan, cfg.wlan.channel_width, follow=follow)
+    band_block = _hostapd_band_block(plan)
 
     return f"""country_code={cfg.wlan.country}
 interface={ap_if}
@@ -57,48 +72,50 @@ dhcp-option=option:dns-server,{lan_ip}
 
 domain-needed
 bogus-priv
-"""
-
-
-def render_nft(cfg: AppConfig, wan_if: str, lan_if: str, ui_port: int = 8080) -> str:
-    allow_ssh = bool(getattr(cfg.firewall, "allow_ssh_from_lan", True))
-    ssh_rule = f'    iifname "{lan_if}" tcp dport 22 accept\n' if allow_ssh else ""
-
-    return f"""flush ruleset
-
-table inet filter {{
-  chain input {{
-    type filter hook input priority 0; policy drop;
 
-    iif lo accept
-    ct state established,related accept
+""" + "".join(f"{line}\n" for line in dns_cache_options(cfg))
+
+
+def dns_upstreams(cfg: AppConfig) -> List[str]:
+    """Explicit upstream servers; empty means "follow the WAN's DHCP lease via resolv.conf"."""
+    if cfg.dns.upstream == "custom":
+        return list(cfg.dns.servers)
+    if cfg.wan.ipv4 == "static":
+        return list(cfg.wan.static.dns)
+    return []
+
+
+def dns_cache_options(cfg: AppConfig) -> List[str]:
+    dns = cfg.dns
+    out = [
+        f"cache-size={dns.cache_size}",
+        f"min-cache-ttl={min(dns.min_cache_ttl, 3600)}",
+        # default 150 in-flight queries is tight once a few dozen clients browse at once
+        "dns-forward-max=500",
+    ]
+    if dns.all_servers:
+        out.append("all-servers")
+    if dns.negative_cache:
+        out.append(f"neg-ttl={dns.negative_ttl}")
+    else:
+        out.append("no-negcache")
+
+    servers = dns_upstreams(cfg)
+    if servers:
+        out.append("no-resolv")
+        out += [f"server={s}" for s in servers]
+    else:
+        # dhcpcd keeps the WAN lease's servers here; dnsmasq re-reads it when it changes
+        out.append("resolv-file=/etc/resolv.conf")
+    return out
 
-    ip protocol icmp accept
-    ip6 nexthdr icmpv6 accept
 
-    iifname "{lan_if}" udp dport {{ 67, 68 }} accept
-    iifname "{lan_if}" udp dport 53 accept
-    iifname "{lan_if}" tcp dport 53 accept
-
-    iifname "{lan_if}" tcp dport {ui_port} accept
-{ssh_rule.rstrip()}
-  }}
-
-  chain forward {{
-    type filter hook forward priority 0; policy drop;
+def render_nft(cfg: AppConfig, wan_if: str, lan_if: str, ui_port: int = 8080) -> str:
+    return build_ruleset(cfg, wan_if=wan_if, lan_if=lan_if, ui_port=ui_port).render()
 
-    ct state established,related accept
-    iifname "{lan_if}" oifname "{wan_if}" accept
-  }}
-}}
 
-table ip nat {{
-  chain postrouting {{
-    type nat hook postrouting priority 100; policy accept;
-    oifname "{wan_if}" masquerade
-  }}
-}}
-"""
+def render_fastpath(cfg: AppConfig, wan_if: str, lan_if: str) -> str:
+    return build_fastpath(cfg, wan_if=wan_if, lan_if=lan_if).render()
 
 
 def render_wpa_supplicant(country: str, ssid: str, psk: str) -> str:
@@ -111,3 +128,19 @@ network={{
   psk="{psk}"
 }}
 """
+
+
+def render_oneshot_unit(description: str, script: str, after: str = "network.target") -> str:
+    """systemd unit that runs one of our rendered scripts once at boot."""
+    return f"""[Unit]
+Description={description}
+After={after}
+
+[Service]
+Type=oneshot
+ExecStart=/bin/sh {script}
+RemainAfterExit=yes
+
+[Install]
+WantedBy=multi-user.target
+"""
@@ -1,5 +1,4 @@
-import os
-from hamsterfi.core.config import CONFIG_PATH, save_config
+from hamsterfi.core.config import remove_config, save_config
 from hamsterfi.core.models import AppConfig
 
 def reset_config() -> None:
@@ -8,7 +7,4 @@ def reset_config() -> None:
 
 def factory_defaults() -> None:
     # Remove config file entirely
-    try:
-        os.remove(CONFIG_PATH)
-    except FileNotFoundError:
-        pass
+    remove_config()
@@ -0,0 +1,86 @@
+"""
+Boot snapshot: what the last successful apply left behind, in a form the boot
+unit can replay without planning.
+
+Most of the applied state survives a reboot on its own (rendered files,
+enabled units, sysctl.d, nftables.conf, dhcpcd drop-ins). What doesn't is the
+runtime topology apply built by hand: the ap0 vif, br0 and its ports, static
+addresses and routes, and hostapd/dnsmasq started in the right order after
+them. The snapshot records exactly that, plus digests of the config and of
+every managed file, so boot can tell whether replaying is still valid.
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from hamsterfi.core.models import AppConfig
+
+BOOT_SNAPSHOT = "/var/lib/hamster-fi/boot.json"
+BOOT_UNIT = "/etc/systemd/system/hamsterfi-boot.service"
+BOOT_SERVICE = "hamsterfi-boot"
+SNAPSHOT_VERSION = 1
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@dataclass
+class BootSnapshot:
+    mode: str
+    config: str  # config_digest() of the applied config
+    # "wlan0" when the AP ran on an ap0 vif created on it
+    ap_parent: Optional[str] = None
+    # bridge -> ports
+    bridges: Dict[str, List[str]] = field(default_factory=dict)
+    up: List[str] = field(default_factory=list)
+    # addresses apply set itself; DHCP ones are dhcpcd's to restore
+    addrs: Dict[str, List[str]] = field(default_factory=dict)
+    # default routes {dev, via, metric}; via is None on DHCP interfaces, where only the metric is replayed
+    routes: List[dict] = field(default_factory=list)
+    # interfaces that get their address and default route from DHCP
+    dhcp: List[str] = field(default_factory=list)
+    services: List[str] = field(default_factory=list)
+    files: Dict[str, str] = field(default_factory=dict)  # path -> file_digest()
+    created: float = field(default_factory=time.time)
+    version: int = SNAPSHOT_VERSION
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), indent=1, sort_keys=True) + "\n"
+
+    @classmethod
+    def from_json(cls, text: Optional[str]) -> Optional["BootSnapshot"]:
+        try:
+            data = json.loads(text or "")
+            if data.get("version") != SNAPSHOT_VERSION:
+                return None
+            return cls(**data)
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+
+def config_digest(cfg: AppConfig) -> str:
+    return hashlib.sha256(cfg.model_dump_json().encode()).hexdigest()[:16]
+
+
+def file_digest(text: Optional[str]) -> str:
+    return "" if text is None else hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def render_boot_unit(python: str = sys.executable, app_dir: str = APP_DIR) -> str:
+    return f"""[Unit]
+Description=Hamster-Fi boot fast path (replay the last applied state)
+Wants=sys-subsystem-net-devices-wlan0.device
+After=sys-subsystem-net-devices-wlan0.device local-fs.target
+
+[Service]
+Type=oneshot
+WorkingDirectory={app_dir}
+ExecStart={python} -m hamsterfi.system.boot
+RemainAfterExit=yes
+
+[Install]
+WantedBy=multi-user.target
+"""
@@ -0,0 +1,248 @@
+"""
+Automatic channel selection (`wlan.channel: auto`).
+
+One `iw dev wlan0 scan` lists the neighbouring BSSes with their signal and
+operating width; `iw dev wlan0 survey dump` adds how busy each frequency was
+during the scan. Every candidate channel gets a congestion score (lower is
+better):
+
+    sum over overlapping BSSes of  overlap * signal weight
+    + BUSY_WEIGHT * busy fraction of the channels the AP would occupy
+
+Candidates are 1/6/11 on 2.4 GHz and the non-DFS channels the country allows
+on 5 GHz, each scored over the block `wifi.channel_plan()` would give it, so
+an 80 MHz AP is charged for everything in its 80 MHz.
+
+apply scans only when it has to pick (no channel in hostapd.conf yet, or the
+one there is no longer a candidate); otherwise it keeps the running channel
+so re-applies don't move clients around. The periodic survey job
+(`recommend()`) re-scores the air and only recommends a switch when another
+channel is clearly better; the switch itself is a user action.
+
+By default the job is passive: it reads `survey dump` from the AP interface
+and compares only the channels the radio has busy times for. An active scan
+takes the radio off-channel for seconds, so AP clients stall; the job scans
+only when asked to (`scan=True`). Neither ever brings wlan0 up; only apply
+does that, in `pick_channel()`.
+"""
+import os
+import re
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from hamsterfi.system.host import Host
+from hamsterfi.system.wifi import DFS_CHANNELS, allowed_channels, channel_plan
+
+CHANNELS_24 = (1, 6, 11)
+CHANNELS_5 = (36, 40, 44, 48, 149, 153, 157, 161, 165)
+BUSY_WEIGHT = 10.0
+# recommend a switch only if the best channel scores this much lower (relative and absolute)
+SWITCH_MARGIN = float(os.environ.get("HAMSTERFI_CHANNEL_SWITCH_MARGIN", "0.3"))
+SWITCH_MIN_GAIN = 1.0
+SCAN_TIMEOUT_S = 15
+
+
+@dataclass
+class Bss:
+    freq: int
+    signal: float = -90.0
+    ssid: str = ""
+    # 20 MHz channels the BSS occupies (primary first)
+    channels: List[int] = field(default_factory=list)
+
+
+def freq_to_channel(freq: int) -> int:
+    if freq == 2484:
+        return 14
+    if 2412 <= freq < 2484:
+        return (freq - 2407) // 5
+    return (freq - 5000) // 5
+
+
+def parse_scan(text: str) -> List[Bss]:
+    out: List[Bss] = []
+    cur: Optional[Bss] = None
+    secondary = 0
+    center80 = 0
+    for raw in text.splitlines():
+        line = raw.strip()
+        if raw.startswith("BSS "):
+            if cur is not None:
+                out.append(_finish(cur, secondary, center80))
+            cur, secondary, center80 = Bss(freq=0), 0, 0
+            continue
+        if cur is None:
+            continue
+        if line.startswith("freq:"):
+            cur.freq = int(float(line.split()[1]))
+        elif line.startswith("signal:"):
+            cur.signal = float(line.split()[1])
+        elif line.startswith("SSID:"):
+            cur.ssid = line[5:].strip()
+        elif "secondary channel offset:" in line:
+            secondary = {"above": 1, "below": -1}.get(line.rsplit(":", 1)[1].strip(), 0)
+        elif "channel width:" in line and "80 MHz" in line:
+            center80 = -1  # segment follows
+        elif "center freq segment 1:" in line and center80 == -1:
+            center80 = int(line.rsplit(":", 1)[1])
+    if cur is not None:
+        out.append(_finish(cur, secondary, center80))
+    return [b for b in out if b.freq]
+
+
+def _finish(bss: Bss, secondary: int, center80: int) -> Bss:
+    primary = freq_to_channel(bss.freq)
+    bss.channels = [primary]
+    if center80 > 0:
+        bss.channels += [c for c in range(center80 - 6, center80 + 7, 4) if c != primary]
+    elif secondary:
+        bss.channels.append(primary + 4 * secondary)
+    return bss
+
+
+def parse_survey(text: str) -> Dict[int, float]:
+    """channel -> busy fraction, for the frequencies that report active time."""
+    out: Dict[int, float] = {}
+    freq = active = busy = None
+
+    def flush() -> None:
+        if freq and active:
+            out[freq_to_channel(freq)] = min(1.0, (busy or 0) / active)
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("Survey data"):
+            flush()
+            freq = active = busy = None
+        elif line.startswith("frequency:"):
+            freq = int(re.findall(r"\d+", line)[0])
+        elif line.startswith("channel active time:"):
+            active = int(re.findall(r"\d+", line)[0])
+        elif line.startswith("channel busy time:"):
+            busy = int(re.findall(r"\d+", line)[0])
+    flush()
+    return out
+
+
+def candidates(country: str, band: str, width="auto") -> List[int]:
+    allowed = allowed_channels(country)
+    pool = CHANNELS_24 if band == "2.4" else CHANNELS_5
+    out = []
+    for c in pool:
+        # DFS channels are left out: radar detection delays start-up and the firmware is unreliable with it
+        if (allowed is not None and c not in allowed) or c in DFS_CHANNELS:
+            continue
+        try:
+            channel_plan(country, c, width)
+        except ValueError:
+            continue
+        out.append(c)
+    return out
+
+
+def _block(country: str, channel: int, width) -> List[int]:
+    plan = channel_plan(country, channel, width)
+    if plan.width == 20:
+        return [channel]
+    if plan.band == "2.4":
+        return [channel, channel + 4 * plan.secondary]
+    half = plan.width // 10 - 2  # 40 -> 2, 80 -> 6
+    return list(range(plan.center - half, plan.center + half + 1, 4))
+
+
+def _overlap(bss: Bss, block: List[int]) -> float:
+    if block[0] <= 14:
+        # 2.4 GHz channels are 5 MHz apart but 20 MHz wide: partial overlap up to 4 apart
+        best = max((5 - abs(b - c)) / 5 for b in bss.channels for c in block)
+        return max(0.0, best)
+    return 1.0 if set(bss.channels) & set(block) else 0.0
+
+
+def _signal_weight(dbm: float) -> float:
+    # -55 dBm (next flat) counts 1.0, a faint -90 dBm BSS next to nothing
+    return min(1.5, max(0.1, (dbm + 95) / 40))
+
+
+def score_channels(country: str, channels: List[int], width, bsses: List[Bss],
+                   busy: Dict[int, float]) -> Dict[int, float]:
+    scores: Dict[int, float] = {}
+    for ch in channels:
+        block = _block(country, ch, width)
+        s = sum(_overlap(b, block) * _signal_weight(b.signal) for b in bsses)
+        known = [busy[c] for c in block if c in busy]
+        if known:
+            s += BUSY_WEIGHT * sum(known) / len(known)
+        scores[ch] = round(s, 2)
+    return scores
+
+
+def survey(host: Host, iface: str = "wlan0", scan: bool = True) -> Tuple[List[Bss], Dict[int, float]]:
+    """(BSSes, busy fractions) from one scan; empty when the radio can't scan right now.
+
+    With scan=False only the survey dump is read: no BSSes, and the busy
+    times are whatever the driver has collected so far.
+    """
+    if not host.which("iw"):
+        return [], {}
+    try:
+        if not scan:
+            dump = host.run(["iw", "dev", iface, "survey", "dump"], capture=True, timeout=SCAN_TIMEOUT_S)
+            return [], parse_survey(dump.stdout or "") if dump.returncode == 0 else {}
+        res = host.run(["iw", "dev", iface, "scan"], capture=True, timeout=SCAN_TIMEOUT_S)
+        if res.returncode != 0:
+            # wlan0 is busy (e.g. only ap0 is up): scan from the AP interface itself
+            res = host.run(["iw", "dev", "ap0", "scan", "ap-force"], capture=True, timeout=SCAN_TIMEOUT_S)
+        bsses = parse_scan(res.stdout or "") if res.returncode == 0 else []
+        dump = host.run(["iw", "dev", iface, "survey", "dump"], capture=True, timeout=SCAN_TIMEOUT_S)
+    except subprocess.TimeoutExpired:
+        # a radio stuck in a scan counts as an empty one; retrying on ap0 would stall as long again
+        return [], {}
+    busy = parse_survey(dump.stdout or "") if dump.returncode == 0 else {}
+    return bsses, busy
+
+
+def pick_channel(host: Host, country: str, band: str, width) -> Optional[int]:
+    chans = candidates(country, band, width)
+    if not chans:
+        return None
+    # apply owns the links: wlan0 may still be down before its first configure
+    host.net().link_up("wlan0")
+    bsses, busy = survey(host)
+    scores = score_channels(country, chans, width, bsses, busy)
+    # ties go to the lowest channel, so an empty band always gives the same answer
+    return min(chans, key=lambda c: (scores[c], c))
+
+
+def recommend(host: Host, country: str, band: str, width, current: Optional[int],
+              scan: bool = False) -> dict:
+    """Re-score the air and say whether moving off `current` is worth it.
+
+    Passive (the default) reads the AP interface's survey dump, and only
+    channels with busy times for their whole block are compared; a channel
+    the radio has no data for is not a better one.
+    """
+    chans = candidates(country, band, width)
+    # an active scan goes through wlan0 and falls back to ap0 when wlan0 is down
+    bsses, busy = survey(host, "wlan0" if scan else "ap0", scan=scan)
+    if not scan:
+        known = [c for c in chans if all(b in busy for b in _block(country, c, width))]
+        if current in chans and current not in known:
+            known = []  # nothing to compare against
+        chans = known
+    scores = score_channels(country, chans, width, bsses, busy)
+    best = min(chans, key=lambda c: (scores[c], c)) if chans else None
+    out = {"current": current, "best": best, "scores": scores, "neighbours": len(bsses), "switch": False}
+    if best is None or current == best:
+        return out
+    if current not in scores:
+        out["switch"] = True
+        return out
+    gain = scores[current] - scores[best]
+    out["switch"] = gain >= SWITCH_MIN_GAIN and scores[best] <= scores[current] * (1 - SWITCH_MARGIN)
+    return out
+
+
+def current_channel(hostapd_conf: Optional[str]) -> Optional[int]:
+    m = re.search(r"^channel=(\d+)$", hostapd_conf or "", re.M)
+    return int(m.group(1)) if m else None
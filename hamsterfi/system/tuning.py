@@ -0,0 +1,118 @@
+"""
+Packet steering and offload tuning for the interfaces the active mode uses.
+
+Everything is rendered into one shell script (TUNE_SCRIPT): RPS/RFS masks on
+receive queues, XPS on transmit queues, NIC IRQ affinity, threaded NAPI and
+GRO/GSO via ethtool. apply runs the script once; a oneshot unit runs the same
+script at boot, so the settings survive reboots. The script only depends on
+the config and on the machine's layout (cores, queues, IRQs), so re-rendering
+it is how the planner notices that something changed.
+"""
+import os
+from typing import List, Optional, Sequence
+
+from hamsterfi.core.models import AppConfig
+from hamsterfi.system.host import Host, get_host
+from hamsterfi.system.render import render_oneshot_unit
+
+TUNE_SCRIPT = "/etc/hamster-fi/tune.sh"
+TUNE_UNIT = "/etc/systemd/system/hamsterfi-tune.service"
+TUNE_SERVICE = "hamsterfi-tune"
+
+# RFS: global socket flow table, split across each device's receive queues
+RFS_FLOW_ENTRIES = 32768
+
+
+def online_cpus(host: Host) -> List[int]:
+    """CPU ids from /sys/devices/system/cpu/online ("0-3", "0,2-3")."""
+    text = (host.read_text("/sys/devices/system/cpu/online") or "").strip()
+    cpus: List[int] = []
+    try:
+        for part in filter(None, text.split(",")):
+            lo, _, hi = part.partition("-")
+            cpus += range(int(lo), int(hi or lo) + 1)
+    except ValueError:
+        cpus = []
+    return cpus or list(range(os.cpu_count() or 1))
+
+
+def cpu_mask(cpus: Sequence[int]) -> str:
+    mask = 0
+    for c in cpus:
+        mask |= 1 << c
+    return f"{mask:x}"
+
+
+def _queues(host: Host, iface: str, kind: str) -> List[str]:
+    names = [q for q in host.listdir(f"/sys/class/net/{iface}/queues") if q.startswith(kind + "-")]
+    return sorted(names, key=lambda q: int(q.split("-")[1]))
+
+
+def nic_irqs(host: Host, iface: str) -> List[int]:
+    """IRQs whose /proc/interrupts name is the interface or one of its queues (eth0-rx-0, ...)."""
+    out = []
+    for line in (host.read_text("/proc/interrupts") or "").splitlines():
+        head, _, rest = line.partition(":")
+        if not head.strip().isdigit():
+            continue
+        names = rest.split()
+        if any(n == iface or n.startswith(iface + "-") for n in names):
+            out.append(int(head))
+    return out
+
+
+def render_tuning(cfg: AppConfig, ifaces: Sequence[str], host: Optional[Host] = None) -> str:
+    host = host or get_host()
+    t = cfg.tuning
+    lines = [
+        "#!/bin/sh",
+        "# Managed by hamster-fi: packet steering and offloads, also run at boot by hamsterfi-tune.service",
+        'w() { [ -e "$2" ] && echo "$1" > "$2" 2>/dev/null || true; }',
+    ]
+    if not t.enabled:
+        return "\n".join(lines + ["# tuning disabled", ""])
+
+    cpus = online_cpus(host)
+    if t.cpus:
+        cpus = cpus[: t.cpus]
+    mask = cpu_mask(cpus)
+    lines.append(f"# {len(cpus)} cores: {mask}")
+
+    if t.rps:
+        lines.append(f"w {RFS_FLOW_ENTRIES} /proc/sys/net/core/rps_sock_flow_entries")
+
+    irq_slot = 0
+    for iface in dict.fromkeys(ifaces):
+        base = f"/sys/class/net/{iface}"
+        if not host.exists(base):
+            continue
+        lines.append(f"# {iface}")
+        if t.threaded_napi:
+            lines.append(f"w 1 {base}/threaded")
+
+        rx = _queues(host, iface, "rx")
+        if t.rps and len(cpus) > 1:
+            for q in rx:
+                lines.append(f"w {mask} {base}/queues/{q}/rps_cpus")
+                lines.append(f"w {RFS_FLOW_ENTRIES // len(rx)} {base}/queues/{q}/rps_flow_cnt")
+
+        tx = _queues(host, iface, "tx")
+        if t.xps and len(tx) > 1:
+            for i, q in enumerate(tx):
+                lines.append(f"w {cpu_mask([cpus[i % len(cpus)]])} {base}/queues/{q}/xps_cpus")
+
+        if t.irq_affinity:
+            # one core per IRQ, round-robin across every interface's IRQs
+            for irq in nic_irqs(host, iface):
+                lines.append(f"w {cpus[irq_slot % len(cpus)]} /proc/irq/{irq}/smp_affinity_list")
+                irq_slot += 1
+
+        gro, gso = ("on" if t.gro else "off"), ("on" if t.gso else "off")
+        lines.append(f"command -v ethtool >/dev/null && ethtool -K {iface} gro {gro} gso {gso} 2>/dev/null || true")
+    return "\n".join(lines) + "\n"
+
+
+def render_tuning_unit() -> str:
+    return render_oneshot_unit(
+        "Hamster-Fi packet steering and offload tuning", TUNE_SCRIPT, after="network.target hostapd.service"
+    )
@@ -0,0 +1,146 @@
+"""
+Channel and width planning for the AP.
+
+hostapd needs more than `channel=`: a 40 MHz AP needs `ht_capab=[HT40+]` or
+`[HT40-]` depending on where the secondary channel sits, and an 80 MHz VHT AP
+needs `vht_oper_chwidth=1` plus the centre channel of its 80 MHz block. Without
+them the radio comes up at 20 MHz whatever it could do.
+
+A width is only valid if every 20 MHz channel it spans is allowed in the
+configured country, so the regulatory table below decides both whether the
+primary channel is usable and how wide the AP can go on it. The table is a
+coarse copy of wireless-regdb for the countries we ship to; for any other
+country code only the channel numbering is checked and hostapd/the kernel get
+the final word.
+"""
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Union
+
+Width = Union[int, str]  # 20 / 40 / 80 or "auto"
+
+_24_NA = frozenset(range(1, 12))
+_24_ETSI = frozenset(range(1, 14))
+_5_LOW = frozenset(range(36, 65, 4))  # UNII-1 + UNII-2, 36..64
+_5_MID_ETSI = frozenset(range(100, 141, 4))  # 100..140
+_5_MID_FCC = frozenset(range(100, 145, 4))  # 100..144
+_5_HIGH = frozenset(range(149, 166, 4))  # 149..165
+
+_FCC = _24_NA | _5_LOW | _5_MID_FCC | _5_HIGH
+_ETSI = _24_ETSI | _5_LOW | _5_MID_ETSI | _5_HIGH
+
+_REGDOMAINS: Dict[str, FrozenSet[int]] = {
+    "US": _FCC, "CA": _FCC, "TW": _FCC,
+    "AU": _24_ETSI | _5_LOW | _5_MID_FCC | _5_HIGH,
+    "NZ": _24_ETSI | _5_LOW | _5_MID_FCC | _5_HIGH,
+    "JP": _24_ETSI | {14} | _5_LOW | _5_MID_FCC,
+    "CN": _24_ETSI | _5_LOW | _5_HIGH,
+}
+for _cc in (
+    "UA AT BE BG CH CY CZ DE DK EE ES FI FR GB GR HR HU IE IS IT LI LT LU LV "
+    "MD MT NL NO PL PT RO SE SI SK"
+).split():
+    _REGDOMAINS[_cc] = _ETSI
+
+# channels that need radar detection (DFS) before the AP may transmit
+DFS_CHANNELS = frozenset(range(52, 65, 4)) | _5_MID_FCC
+
+_VALID_CHANNELS = frozenset(range(1, 15)) | _5_LOW | _5_MID_FCC | _5_HIGH
+
+# 80 MHz blocks by centre channel
+_VHT80 = {42: range(36, 49, 4), 58: range(52, 65, 4), 106: range(100, 113, 4),
+          122: range(116, 129, 4), 138: range(132, 145, 4), 155: range(149, 162, 4)}
+
+
+@dataclass
+class ChannelPlan:
+    channel: int
+    width: int
+    # centre channel of the whole block (the channel itself at 20 MHz)
+    center: int
+    # +1/-1: secondary channel above/below the primary (HT40+/HT40-), 0 for 20 MHz
+    secondary: int = 0
+    dfs: bool = False
+
+    @property
+    def band(self) -> str:
+        return "2.4" if self.channel <= 14 else "5"
+
+
+def allowed_channels(country: str) -> Optional[FrozenSet[int]]:
+    """Channels the AP may use in `country`, None if the code isn't in the table."""
+    return _REGDOMAINS.get((country or "").upper())
+
+
+def _span(channel: int, width: int) -> Optional[List[int]]:
+    """20 MHz channels covered by a `width` block on a 5 GHz primary."""
+    if width == 20:
+        return [channel]
+    if width == 40:
+        lower = channel - ((channel - 36) % 8 if channel < 149 else (channel - 149) % 8)
+        return [lower, lower + 4] if lower + 4 != 169 else None
+    for chans in _VHT80.values():
+        if channel in chans:
+            return list(chans)
+    return None
+
+
+def _fits(allowed: Optional[FrozenSet[int]], chans: Optional[List[int]]) -> bool:
+    if not chans:
+        return False
+    return all(c in (allowed if allowed is not None else _VALID_CHANNELS) for c in chans)
+
+
+def _plan_24(channel: int, width: int, allowed: Optional[FrozenSet[int]]) -> Optional[ChannelPlan]:
+    if width == 20:
+        return ChannelPlan(channel, 20, channel)
+    if width != 40 or channel == 14:
+        return None
+    # prefer the secondary above for the low channels, below for the high ones
+    for sec in ((1, -1) if channel <= 7 else (-1, 1)):
+        if _fits(allowed, [channel + 4 * sec]) and channel + 4 * sec <= 13:
+            return ChannelPlan(channel, 40, channel + 2 * sec, sec)
+    return None
+
+
+def _plan_5(channel: int, width: int, allowed: Optional[FrozenSet[int]]) -> Optional[ChannelPlan]:
+    chans = _span(channel, width)
+    if not _fits(allowed, chans):
+        return None
+    center = chans[0] + 2 * (len(chans) - 1)
+    secondary = 0
+    if width >= 40:
+        secondary = 1 if (channel - chans[0]) % 8 == 0 else -1
+    return ChannelPlan(channel, width, center, secondary, dfs=any(c in DFS_CHANNELS for c in chans))
+
+
+def channel_plan(country: str, channel: int, width: Width = "auto", follow: bool = False) -> ChannelPlan:
+    """
+    Resolve channel + width for hostapd.
+
+    "auto" is 20 MHz on 2.4 GHz (40 MHz there mostly collides with the
+    neighbours) and the widest block the country allows on 5 GHz. An explicit
+    width the channel can't carry raises ValueError, unless `follow` is set:
+    the channel then comes from the uplink (single radio), so it is taken as
+    is and the width narrowed until it fits.
+    """
+    allowed = allowed_channels(country)
+    if channel not in _VALID_CHANNELS:
+        raise ValueError(f"Wi-Fi channel {channel} does not exist")
+    if not follow and allowed is not None and channel not in allowed:
+        raise ValueError(f"Wi-Fi channel {channel} is not allowed in country {country}")
+    if follow and allowed is not None:
+        allowed = allowed | {channel}
+
+    plan_fn = _plan_24 if channel <= 14 else _plan_5
+    if width == "auto":
+        widths = [20] if channel <= 14 else [80, 40, 20]
+    elif follow:
+        widths = [w for w in (80, 40, 20) if w <= int(width)]
+    else:
+        widths = [int(width)]
+
+    for w in widths:
+        plan = plan_fn(channel, w, allowed)
+        if plan is not None:
+            return plan
+    raise ValueError(f"{width} MHz does not fit on channel {channel} in country {country}")
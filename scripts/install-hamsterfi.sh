@@ -3,6 +3,7 @@ set -euo pipefail
 
 APPDIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
 SERVICE_PATH="/etc/systemd/system/hamsterfi-web.service"
+SOCKET_PATH="/etc/systemd/system/hamsterfi-web.socket"
 BIN_DIR="/usr/local/bin"
 
 echo "[install] APPDIR=$APPDIR"
@@ -18,8 +19,16 @@ cat > "$BIN_DIR/hamsterfi-diag" <<'EOF'
 #!/usr/bin/env bash
 set -euo pipefail
 
-echo "=== ip addr ==="; ip -br addr
-echo "=== routes ==="; ip route | sed -n "1,15p"
+APPDIR="@APPDIR@"
+
+netinfo() {
+  if [[ -x "$APPDIR/.venv/bin/python" ]]; then
+    (cd "$APPDIR" && .venv/bin/python -m hamsterfi.core.netinfo) && return
+  fi
+  ip -br addr; echo; ip route
+}
+
+echo "=== links / routes ==="; netinfo | sed -n "1,40p"
 
 echo "=== hostapd ==="
 systemctl is-active hostapd >/dev/null && echo "OK" || systemctl status hostapd --no-pager
@@ -34,13 +43,14 @@ ss -lunp | egrep ':(53|67)\b' || true
 ss -ltnp | grep ':8080' || echo "no 8080 listener"
 
 echo "=== hamsterfi service ==="
-systemctl status hamsterfi-web --no-pager 2>/dev/null || true
+systemctl status hamsterfi-web.socket hamsterfi-web --no-pager 2>/dev/null || true
 
 echo "=== recent logs (dnsmasq/hostapd/web) ==="
 journalctl -u dnsmasq -n 30 --no-pager 2>/dev/null || true
 journalctl -u hostapd -n 30 --no-pager 2>/dev/null || true
 journalctl -u hamsterfi-web -n 30 --no-pager 2>/dev/null || true
 EOF
+sed -i "s|@APPDIR@|$APPDIR|" "$BIN_DIR/hamsterfi-diag"
 chmod +x "$BIN_DIR/hamsterfi-diag"
 
 if [[ -f "$APPDIR/scripts/systemd/hamsterfi-recover" ]]; then
@@ -85,28 +95,52 @@ echo "Tip: if you changed hostname, ensure /etc/hosts has '127.0.1.1 <hostname>'
 EOF
 chmod +x "$BIN_DIR/hamsterfi-ip"
 
+# The UI is socket-activated: systemd listens on 8080 and starts uvicorn on the
+# first connection, handing it the socket as fd 3. uvicorn exits again after
+# HAMSTERFI_IDLE_EXIT_MIN idle minutes, so it isn't kept resident on the Pi.
+cat > "$SOCKET_PATH" <<EOF
+[Unit]
+Description=Hamster-Fi Web UI socket
+
+[Socket]
+ListenStream=8080
+NoDelay=true
+
+[Install]
+WantedBy=sockets.target
+EOF
+
 cat > "$SERVICE_PATH" <<EOF
 [Unit]
 Description=Hamster-Fi Web UI
-After=network-online.target
-Wants=network-online.target
+Requires=hamsterfi-web.socket
+After=hamsterfi-web.socket
 
 [Service]
 Type=simple
 WorkingDirectory=${APPDIR}
 Environment=PYTHONUNBUFFERED=1
-ExecStart=${APPDIR}/.venv/bin/uvicorn hamsterfi.main:app --host 0.0.0.0 --port 8080
+Environment=HAMSTERFI_IDLE_EXIT_MIN=10
+ExecStart=${APPDIR}/.venv/bin/uvicorn hamsterfi.main:app --fd 3
 Restart=on-failure
 RestartSec=1
 User=root
 
 [Install]
-WantedBy=multi-user.target
+Also=hamsterfi-web.socket
 EOF
 
+# compile the UI templates now rather than on the first (cold) request
+(cd "$APPDIR" && .venv/bin/python -m hamsterfi.core.templating) || echo "[install] NOTE: template precompile failed; templates compile on first use."
+
+# re-render saved profiles with this version's renderers
+(cd "$APPDIR" && .venv/bin/python -m hamsterfi.system.profiles render --all) || echo "[install] NOTE: some profiles failed to render; see above."
+
 systemctl daemon-reload
-systemctl enable --now hamsterfi-web
+# older installs ran the service on its own, holding port 8080
+systemctl disable --now hamsterfi-web.service 2>/dev/null || true
+systemctl enable --now hamsterfi-web.socket
 
 echo
 echo "[install] Done."
-echo "[install] Try: hamsterfi-ip"
\ No newline at end of file
+echo "[install] Try: hamsterfi-ip"
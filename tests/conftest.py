@@ -0,0 +1,42 @@
+"""
+Shared fixtures: every test that applies runs against a scripted fake Pi
+(hamsterfi.system.fake), so the suite needs neither root nor the hardware.
+"""
+import os
+import tempfile
+
+# before hamsterfi.core.config is imported: save_config() must not touch /etc
+os.environ.setdefault("HAMSTERFI_CONFIG", os.path.join(tempfile.mkdtemp(prefix="hamsterfi-test-"), "config.yaml"))
+
+import pytest  # noqa: E402
+
+from hamsterfi.core.models import AppConfig  # noqa: E402
+from hamsterfi.system.fake import FakeSystem  # noqa: E402
+from hamsterfi.system.host import use_host  # noqa: E402
+
+# real seconds per simulated second; a full AP apply is ~4 simulated seconds
+SCALE = 0.01
+UPSTREAM = ("upstream", "upstream-psk")
+
+
+def make_cfg(mode: str = "ap", wan: str = "eth0", channel=6) -> AppConfig:
+    cfg = AppConfig()
+    cfg.mode = mode
+    cfg.wan.device = wan
+    cfg.wlan.channel = channel
+    if wan == "wlan0" or mode == "station":
+        cfg.wan.upstream_ssid, cfg.wan.upstream_psk = UPSTREAM
+    if mode == "bridge":
+        cfg.lan.dhcp.enabled = False
+    return cfg
+
+
+@pytest.fixture
+def pi():
+    with FakeSystem(scale=SCALE) as fake, use_host(fake):
+        yield fake
+
+
+def settle(pi: FakeSystem) -> None:
+    """Let the leases apply doesn't wait for come in."""
+    pi.sleep(pi.delays["dhcp"] * 2)
@@ -0,0 +1,80 @@
+import pytest
+
+from conftest import UPSTREAM, make_cfg, settle
+from hamsterfi.system.apply import apply
+from hamsterfi.system.balance import Member, members, rules, sync_tables, table
+from hamsterfi.system.net import TABLE_NAMES, Rule
+from hamsterfi.system.nft import FILTER_TABLE, MANGLE_PRIORITY, build_ruleset, mark_map
+
+GATEWAYS = {"eth0": "192.168.1.1", "wlan0": "10.0.0.1"}
+
+
+def _balanced(eth0: int = 1, wlan0: int = 1):
+    cfg = make_cfg("ap", "eth0")
+    cfg.wan.upstream_ssid, cfg.wan.upstream_psk = UPSTREAM
+    cfg.wan.balance.enabled = True
+    cfg.wan.balance.weights = {"eth0": eth0, "wlan0": wlan0}
+    return cfg
+
+
+@pytest.mark.parametrize("weights,expected", [
+    ((1, 1), "numgen random mod 2 map { 0 : 1, 1 : 2 }"),
+    ((2, 1), "numgen random mod 3 map { 0-1 : 1, 2 : 2 }"),
+    ((1, 3), "numgen random mod 4 map { 0 : 1, 1-3 : 2 }"),
+    # a zero weight is not a member at all
+    ((3, 0), "numgen random mod 3 map { 0-2 : 1 }"),
+])
+def test_mark_map(weights, expected):
+    assert mark_map(members(_balanced(*weights))) == expected
+
+
+def test_members_only_when_balancing_an_ap():
+    assert members(_balanced()) == [Member("eth0", 1), Member("wlan0", 1)]
+    assert members(make_cfg("ap", "eth0")) == []
+    cfg = _balanced()
+    cfg.mode = "station"
+    assert members(cfg) == [] and rules(cfg) == []
+
+
+def test_each_mark_looks_up_its_uplinks_table():
+    assert rules(_balanced()) == [
+        Rule(1000, TABLE_NAMES["main"], suppress_prefixlength=0),
+        Rule(1001, table("eth0"), fwmark=1),
+        Rule(1002, table("wlan0"), fwmark=2),
+    ]
+    assert (table("eth0"), table("wlan0")) == (101, 102)
+    assert all(m.table == 100 + m.mark for m in members(_balanced()))
+
+
+def test_prerouting_marks_new_flows_and_restores_the_mark():
+    ruleset = build_ruleset(_balanced(2, 1), wan_if="eth0", lan_if="ap0")
+    pre = ruleset.table(*FILTER_TABLE).chains[0]
+    assert (pre.name, pre.type, pre.hook, pre.priority) == ("prerouting", "filter", "prerouting", MANGLE_PRIORITY)
+    assert pre.rules == [
+        'iifname "ap0" ct state new ct mark set numgen random mod 3 map { 0-1 : 1, 2 : 2 }',
+        'iifname "ap0" meta mark set ct mark',
+    ]
+    text = ruleset.render()
+    assert 'oifname "eth0" masquerade' in text and 'oifname "wlan0" masquerade' in text
+    assert 'iifname "ap0" oifname { "eth0", "wlan0" } accept' in text
+
+
+def test_no_prerouting_without_balancing():
+    ruleset = build_ruleset(make_cfg("ap", "eth0"), wan_if="eth0", lan_if="ap0")
+    assert [c.name for c in ruleset.table(*FILTER_TABLE).chains] == ["input", "forward"]
+
+
+def test_apply_installs_the_rules_and_tables_follow_health(pi):
+    apply(_balanced())
+    settle(pi)
+    assert pi.rules == rules(_balanced())
+
+    net = pi.net()
+    sync_tables(net, GATEWAYS)
+    for dev, gw in GATEWAYS.items():
+        assert [(r.dev, r.via) for r in net.default_routes(table=table(dev))] == [(dev, gw)]
+
+    # wlan0 unhealthy: its table empties and mark 2 falls through to main
+    sync_tables(net, {"eth0": GATEWAYS["eth0"]})
+    assert [r.dev for r in net.default_routes(table=table("eth0"))] == ["eth0"]
+    assert net.default_routes(table=table("wlan0")) == []
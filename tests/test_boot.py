@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import SCALE, make_cfg, settle
+from hamsterfi.system import boot
+from hamsterfi.system.apply import apply, boot_snapshot_problem, load_boot_snapshot, replay_boot_snapshot
+from hamsterfi.system.fake import FakeSystem
+from hamsterfi.system.host import use_host
+from hamsterfi.system.render import HOSTAPD_PATH
+from hamsterfi.system.tuning import TUNE_SCRIPT
+
+
+@pytest.fixture
+def pi_ch11():
+    # the upstream AP on channel 11, the config on 6
+    with FakeSystem(scale=SCALE, upstream_freq=2462) as pi, use_host(pi):
+        yield pi
+
+
+def test_replay_reruns_tuning_after_links(pi):
+    apply(make_cfg("ap", "eth0"))
+    settle(pi)
+    pi.reboot()
+    pi.reset_counters()
+
+    replay_boot_snapshot(load_boot_snapshot())
+    cmds = [c.cmd for c in pi.calls]
+    assert ["sh", TUNE_SCRIPT] in cmds
+    assert "ap0" in pi.links
+
+
+def test_channel_follow_keeps_config_and_snapshot(pi_ch11):
+    pi = pi_ch11
+    cfg = make_cfg("ap", "wlan0")
+    assert apply(cfg).full
+    settle(pi)
+    assert cfg.wlan.channel == 6
+    assert "channel=11" in pi.read_text(HOSTAPD_PATH)
+
+    pi.reboot()
+    # what the boot unit sees: a freshly loaded config
+    assert boot_snapshot_problem(load_boot_snapshot(), make_cfg("ap", "wlan0")) is None
+    res = boot.run(make_cfg("ap", "wlan0"))
+    assert res["replayed"] and res["plan"] == "0 steps"
@@ -0,0 +1,116 @@
+import fcntl
+import os
+
+import pytest
+import yaml
+
+from hamsterfi.core import config
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+    p = tmp_path / "config.yaml"
+    monkeypatch.setattr(config, "CONFIG_PATH", str(p))
+    monkeypatch.setattr(config, "_cache", None)
+    return p
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """How many times the YAML was parsed."""
+    count = []
+    safe_load = yaml.safe_load
+    monkeypatch.setattr(yaml, "safe_load", lambda f: count.append(1) or safe_load(f))
+    return count
+
+
+def _edit_ssid(path, ssid: str, keep=()):
+    """Rewrite the file by hand; `keep` lists which parts of the stat key to hold still."""
+    st = os.stat(path)
+    text = path.read_text().replace(f"ssid: {config.config_snapshot().wlan.ssid}", f"ssid: {ssid}")
+    if "ino" in keep:
+        with open(path, "w") as f:
+            f.write(text)
+    else:
+        new = path.with_name("new.yaml")
+        new.write_text(text)
+        os.replace(new, path)
+    if "mtime" in keep:
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    else:
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+
+def test_missing_file_is_created_with_defaults(path):
+    cfg = config.config_snapshot()
+    assert cfg == config.AppConfig()
+    assert yaml.safe_load(path.read_text()) == cfg.model_dump()
+    assert os.stat(path).st_mode & 0o777 == 0o644
+
+
+def test_snapshot_is_parsed_once_until_the_file_changes(path, parses):
+    config.save_config(config.AppConfig())
+    first = config.config_snapshot()
+    assert config.config_snapshot() is first
+    assert parses == []  # save_config already knows what it wrote
+
+    copy = config.load_config()
+    copy.wlan.ssid = "Changed"
+    assert config.config_snapshot().wlan.ssid == "HamsterNet"
+
+
+@pytest.mark.parametrize("keep", [
+    ("mtime",),           # same size, new inode (renamed over)
+    ("ino", "mtime"),     # same inode and mtime, different size
+    ("ino",),             # same inode, only the mtime moves
+])
+def test_any_change_of_ino_mtime_or_size_reloads(path, parses, keep):
+    config.save_config(config.AppConfig())
+    config.config_snapshot()
+    ssid = "HamsterNet2" if "ino" in keep and "mtime" in keep else "HamsterNot"
+    _edit_ssid(path, ssid, keep)
+    assert config.config_snapshot().wlan.ssid == ssid
+    assert len(parses) == 1
+
+
+def test_save_writes_under_the_lock_and_renames(path, monkeypatch):
+    config.save_config(config.AppConfig())
+    before = os.stat(path).st_ino
+    os.chmod(path, 0o600)
+    held = []
+    write = config._write
+
+    def checked(cfg):
+        with open(str(path) + ".lock", "a") as lf:
+            try:
+                fcntl.flock(lf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                held.append(True)
+        write(cfg)
+
+    monkeypatch.setattr(config, "_write", checked)
+    cfg = config.AppConfig()
+    cfg.wlan.ssid = "Saved"
+    config.save_config(cfg)
+    assert held == [True]
+    st = os.stat(path)
+    assert st.st_ino != before and st.st_mode & 0o777 == 0o600
+    assert config.config_snapshot().wlan.ssid == "Saved"
+    assert sorted(os.listdir(path.parent)) == ["config.yaml", "config.yaml.lock"]
+
+
+def test_failed_write_leaves_the_old_file(path, monkeypatch):
+    config.save_config(config.AppConfig())
+    text = path.read_text()
+
+    def broken(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(yaml, "safe_dump", broken)
+    cfg = config.AppConfig()
+    cfg.wlan.ssid = "Lost"
+    with pytest.raises(OSError, match="disk full"):
+        config.save_config(cfg)
+    assert path.read_text() == text
+    assert sorted(os.listdir(path.parent)) == ["config.yaml", "config.yaml.lock"]
+    assert config.config_snapshot().wlan.ssid == "HamsterNet"
@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from hamsterfi.system.dag import run_graph
+from hamsterfi.system.plan import Action
+
+
+def _step(name, ran, after=(), fail=False, wait=None, then=None):
+    def run():
+        if wait is not None:
+            assert wait.wait(5)
+        ran.append(name)
+        if then is not None:
+            then.set()
+        if fail:
+            raise RuntimeError(f"{name} broke")
+    return Action(name, run=run, after=tuple(after))
+
+
+def test_dependencies_run_first():
+    ran = []
+    actions = [_step("c", ran, after=["a", "b"]), _step("b", ran, after=["a"]), _step("a", ran)]
+    path, _ = run_graph(actions)
+    assert ran == ["a", "b", "c"]
+    assert path == ["a", "b", "c"]
+    assert all(a.duration is not None and a.error is None for a in actions)
+
+
+def test_failure_stops_the_dependents():
+    ran, events = [], []
+    actions = [_step("a", ran), _step("b", ran, after=["a"], fail=True),
+               _step("c", ran, after=["b"]), _step("d", ran, after=["c"])]
+    with pytest.raises(RuntimeError, match="b broke"):
+        run_graph(actions, on_event=lambda kind, a: events.append((kind, a.name)))
+    assert ran == ["a", "b"]
+    assert actions[1].error == "b broke"
+    assert (actions[2].duration, actions[3].duration) == (None, None)
+    assert ("failed", "b") in events and ("start", "c") not in events
+
+
+def test_running_siblings_finish_and_nothing_new_starts():
+    ran = []
+    go = threading.Event()
+    slow = _step("slow", ran, wait=go)
+    actions = [slow, _step("broken", ran, fail=True, then=go), _step("after slow", ran, after=["slow"])]
+    with pytest.raises(RuntimeError, match="broken broke"):
+        run_graph(actions, max_workers=2)
+    # slow was already running when broken failed: it completes, its dependent never starts
+    assert ran == ["broken", "slow"]
+    assert slow.duration is not None and actions[2].duration is None
+
+
+def test_the_first_error_is_raised():
+    ran = []
+    go = threading.Event()
+    first = _step("first", ran, fail=True, then=go)
+    second = _step("second", ran, fail=True, wait=go)
+    with pytest.raises(RuntimeError, match="first broke"):
+        run_graph([first, second], max_workers=2)
+    assert second.error == "second broke"
+
+
+@pytest.mark.parametrize("actions,error", [
+    ([Action("a", after=("b",)), Action("b", after=("a",))], "dependency cycle"),
+    ([Action("a"), Action("b", after=("c",)), Action("c", after=("b",))], "dependency cycle"),
+    ([Action("a", after=("a",))], "dependency cycle"),
+    ([Action("a", after=("missing",))], "step 'a' depends on unknown step 'missing'"),
+    ([Action("a"), Action("a")], "duplicate step: a"),
+])
+def test_bad_graphs_are_refused_before_anything_runs(actions, error):
+    ran = []
+    for a in actions:
+        a.run = lambda a=a: ran.append(a.name)
+    with pytest.raises(ValueError, match=error):
+        run_graph(actions)
+    assert ran == []
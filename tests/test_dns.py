@@ -0,0 +1,63 @@
+import pytest
+
+from conftest import make_cfg
+from hamsterfi.system.render import dns_cache_options, render_dnsmasq
+
+RESOLV = "resolv-file=/etc/resolv.conf"
+
+
+def test_defaults():
+    assert dns_cache_options(make_cfg()) == [
+        "cache-size=10000",
+        "min-cache-ttl=300",
+        "dns-forward-max=500",
+        "all-servers",
+        "neg-ttl=60",
+        RESOLV,
+    ]
+
+
+@pytest.mark.parametrize("ttl,expected", [(0, 0), (300, 300), (3600, 3600), (3601, 3600), (86400, 3600)])
+def test_min_cache_ttl_is_clamped_to_what_dnsmasq_accepts(ttl, expected):
+    cfg = make_cfg()
+    cfg.dns.min_cache_ttl = ttl
+    assert f"min-cache-ttl={expected}" in dns_cache_options(cfg)
+
+
+def test_switches():
+    cfg = make_cfg()
+    cfg.dns.cache_size, cfg.dns.all_servers, cfg.dns.negative_cache = 150, False, False
+    out = dns_cache_options(cfg)
+    assert "cache-size=150" in out and "no-negcache" in out
+    assert "all-servers" not in out and not any(o.startswith("neg-ttl=") for o in out)
+
+
+def test_dhcp_wan_follows_resolv_conf():
+    out = dns_cache_options(make_cfg())
+    assert RESOLV in out
+    assert "no-resolv" not in out and not any(o.startswith("server=") for o in out)
+
+
+def test_static_wan_uses_its_servers_only():
+    cfg = make_cfg()
+    cfg.wan.ipv4 = "static"
+    cfg.wan.static.dns = ["192.168.1.1", "9.9.9.9"]
+    out = dns_cache_options(cfg)
+    assert out[-3:] == ["no-resolv", "server=192.168.1.1", "server=9.9.9.9"]
+    assert RESOLV not in out
+
+
+def test_custom_servers_win_over_the_wan():
+    cfg = make_cfg()
+    cfg.wan.ipv4 = "static"
+    cfg.wan.static.dns = ["192.168.1.1"]
+    cfg.dns.upstream, cfg.dns.servers = "custom", ["1.1.1.1"]
+    assert dns_cache_options(cfg)[-2:] == ["no-resolv", "server=1.1.1.1"]
+
+
+def test_dnsmasq_conf_carries_the_options():
+    cfg = make_cfg()
+    lines = render_dnsmasq(cfg, lan_if="ap0").splitlines()
+    assert lines[-len(dns_cache_options(cfg)):] == dns_cache_options(cfg)
+    cfg.lan.dhcp.enabled = False
+    assert render_dnsmasq(cfg, lan_if="ap0") == "port=0\n"
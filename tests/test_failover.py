@@ -0,0 +1,116 @@
+import pytest
+
+from conftest import UPSTREAM, make_cfg, settle
+from hamsterfi.system.apply import apply
+from hamsterfi.system.failover import Monitor
+
+
+class Script:
+    """A fake clock plus which uplinks answer their probes; the monitor only sees these."""
+
+    def __init__(self, pi, monkeypatch) -> None:
+        self.now = 0.0
+        self.ok = {"eth0": True, "wlan0": True}
+        monkeypatch.setattr(pi, "clock", lambda: self.now)
+        monkeypatch.setattr(pi, "arp_probe", lambda dev, gw, timeout_s: True)
+        monkeypatch.setattr(pi, "ping", lambda dev, target, timeout_s: 0.01 if self.ok[dev] else None)
+
+
+@pytest.fixture
+def failover(pi, monkeypatch):
+    cfg = make_cfg("ap", "eth0")
+    cfg.wan.upstream_ssid, cfg.wan.upstream_psk = UPSTREAM
+    cfg.wan.failover.enabled = True
+    apply(cfg)
+    settle(pi)
+    script = Script(pi, monkeypatch)
+    monitor = Monitor(pi, config=lambda: cfg)
+    yield cfg, script, monitor
+    monitor.close()
+
+
+def _round(cfg, script, monitor, at: float):
+    script.now = at
+    monitor.check(cfg)
+    return monitor.decide(cfg)
+
+
+def _preferred(pi):
+    """dev -> the failover metric (50 / 5000) it holds, if any."""
+    return {r.dev: r.metric for r in pi.net().default_routes() if r.metric in (50, 5000)}
+
+
+def test_healthy_primary_stays(pi, failover):
+    cfg, script, monitor = failover
+    for i in range(5):
+        assert _round(cfg, script, monitor, i * 0.2) is None
+    assert monitor.active == "eth0"
+    assert _preferred(pi) == {"eth0": 50}
+
+
+def test_failover_waits_for_detect_ms_then_swaps_the_metrics(pi, failover):
+    cfg, script, monitor = failover
+    assert _round(cfg, script, monitor, 0.0) is None
+
+    script.ok["eth0"] = False
+    # detect_ms is 600: probes failing for less than that are not an outage yet
+    for t in (0.2, 0.4, 0.59):
+        assert _round(cfg, script, monitor, t) is None
+        assert monitor.health["eth0"].up
+    assert _preferred(pi) == {"eth0": 50}
+
+    event = _round(cfg, script, monitor, 0.6)
+    assert (event["kind"], event["from"], event["to"], event["detect_ms"]) == ("failover", "eth0", "wlan0", 600)
+    assert event["reason"] == "1.1.1.1 unreachable via eth0"
+    assert monitor.active == "wlan0"
+    assert _preferred(pi) == {"wlan0": 50, "eth0": 5000}
+
+
+def test_failback_holds_down_for_failback_s(pi, failover):
+    cfg, script, monitor = failover
+    _round(cfg, script, monitor, 0.0)
+    script.ok["eth0"] = False
+    assert _round(cfg, script, monitor, 0.6)["kind"] == "failover"
+
+    # eth0 answers again at t=1; failback_s is 10
+    script.ok["eth0"] = True
+    for t in (1.0, 5.0, 10.9):
+        assert _round(cfg, script, monitor, t) is None
+    assert _preferred(pi) == {"wlan0": 50, "eth0": 5000}
+
+    # a relapse during the hold-down restarts it
+    script.ok["eth0"] = False
+    _round(cfg, script, monitor, 11.0)
+    _round(cfg, script, monitor, 11.6)
+    assert not monitor.health["eth0"].up
+    script.ok["eth0"] = True
+    assert _round(cfg, script, monitor, 12.0) is None
+    assert _round(cfg, script, monitor, 21.9) is None
+
+    event = _round(cfg, script, monitor, 22.0)
+    assert (event["kind"], event["from"], event["to"], event["detect_ms"]) == ("failback", "wlan0", "eth0", None)
+    assert monitor.active == "eth0"
+    assert _preferred(pi) == {"eth0": 50, "wlan0": 5000}
+
+
+def test_no_switch_without_a_healthy_backup(pi, failover):
+    cfg, script, monitor = failover
+    _round(cfg, script, monitor, 0.0)
+    script.ok = {"eth0": False, "wlan0": False}
+    for t in (0.6, 1.0, 5.0):
+        assert _round(cfg, script, monitor, t) is None
+    assert monitor.active == "eth0"
+    assert _preferred(pi) == {"eth0": 50}
+
+    # the backup comes back first: move to it straight away
+    script.ok["wlan0"] = True
+    event = _round(cfg, script, monitor, 5.2)
+    assert (event["kind"], event["to"]) == ("failover", "wlan0")
+
+
+def test_lost_carrier_is_down_at_once(pi, failover):
+    cfg, script, monitor = failover
+    _round(cfg, script, monitor, 0.0)
+    pi.set_carrier("eth0", False)
+    event = _round(cfg, script, monitor, 0.2)
+    assert (event["kind"], event["to"], event["reason"]) == ("failover", "wlan0", "no carrier")
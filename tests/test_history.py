@@ -0,0 +1,63 @@
+import time
+
+from conftest import make_cfg, settle
+from hamsterfi.system import apply as apply_mod
+from hamsterfi.system import history
+from hamsterfi.system.apply import apply
+
+
+def test_apply_records_the_config_as_loaded(pi):
+    cfg = make_cfg("ap", "eth0")
+    apply(cfg)
+    settle(pi)
+    version = history.current()
+    assert history.config_of(version) == cfg
+
+
+def _unhealthy_at_first(monkeypatch, failures: int) -> None:
+    real = apply_mod.health_problems
+    left = [failures]
+
+    def health_problems(cfg):
+        if left[0]:
+            left[0] -= 1
+            return ["restart dnsmasq not active"]
+        return real(cfg)
+
+    monkeypatch.setattr(apply_mod, "health_problems", health_problems)
+
+
+def test_health_check_continues_off_the_apply_path(pi, monkeypatch):
+    cfg = make_cfg("ap", "eth0")
+    apply(cfg)
+    settle(pi)
+    cfg.wlan.psk = "another-secret"
+    _unhealthy_at_first(monkeypatch, 2)
+
+    t0 = time.monotonic()
+    apply(cfg)
+    # returned after the first check, well before HEALTH_WAIT_S
+    assert (time.monotonic() - t0) / pi.scale < apply_mod.HEALTH_WAIT_S / 2
+    assert history.current().state == "applied"
+
+    pi.wait_for(lambda: history.current().state != "applied", apply_mod.HEALTH_WAIT_S)
+    assert history.current().state == "good"
+    assert history.last_good().id == history.current().id
+
+
+def test_newer_apply_cancels_the_pending_check(pi, monkeypatch):
+    cfg = make_cfg("ap", "eth0")
+    apply(cfg)
+    settle(pi)
+    cfg.wlan.psk = "another-secret"
+    _unhealthy_at_first(monkeypatch, 100)
+    apply(cfg)
+    pending = history.current()
+    monkeypatch.undo()
+
+    cfg.wlan.psk = "third-secret"
+    apply(cfg)
+    pi.sleep(apply_mod.HEALTH_WAIT_S * 1.5)
+    # the first check gave up without a verdict; the newer version was checked on its own
+    assert history.get(pending.id).state == "applied"
+    assert history.current().state == "good"
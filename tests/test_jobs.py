@@ -0,0 +1,36 @@
+import threading
+
+from hamsterfi.core.jobs import JobManager
+
+
+def _blocked(jobs: JobManager) -> threading.Event:
+    """Occupy the apply worker until the returned event is set."""
+    gate = threading.Event()
+    jobs.submit("apply", lambda job: gate.wait(5), key="blocker")
+    return gate
+
+
+def test_queued_job_absorbs_same_work():
+    jobs = JobManager()
+    gate = _blocked(jobs)
+    first = jobs.submit("apply", lambda job: "a")
+    assert jobs.submit("apply", lambda job: "b") is first
+    gate.set()
+
+
+def test_other_work_of_the_kind_still_runs():
+    jobs = JobManager()
+    gate = _blocked(jobs)
+    ran = []
+    apply = jobs.submit("apply", lambda job: ran.append("apply"))
+    rollback = jobs.submit("apply", lambda job: ran.append("rollback"), key="rollback good")
+    activate = jobs.submit("apply", lambda job: ran.append("activate"), key="activate home")
+    assert len({apply.id, rollback.id, activate.id}) == 3
+    assert jobs.submit("apply", lambda job: None, key="rollback good") is rollback
+
+    gate.set()
+    for job in (apply, rollback, activate):
+        while not job.done:
+            threading.Event().wait(0.01)
+    # one worker per kind: still one at a time, in submission order
+    assert ran == ["apply", "rollback", "activate"]
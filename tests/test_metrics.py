@@ -0,0 +1,97 @@
+import re
+
+import pytest
+
+from hamsterfi.core import metrics
+from hamsterfi.core.metrics import Counter, Histogram, command_name
+
+# one sample line of the text exposition format: name{label="value",...} number
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]\w*="(\\.|[^"\\])*",?)*\})? (-?[0-9.e+-]+|\+Inf|NaN)$')
+
+
+def test_counter():
+    c = Counter("hamsterfi_test_total", "Things counted.", ["kind"])
+    c.inc("b")
+    c.inc("a", amount=2.5)
+    c.inc("b")
+    assert c.render() == [
+        "# HELP hamsterfi_test_total Things counted.",
+        "# TYPE hamsterfi_test_total counter",
+        'hamsterfi_test_total{kind="a"} 2.5',
+        'hamsterfi_test_total{kind="b"} 2',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("hamsterfi_test_seconds", "Test durations.", ["step"], buckets=(1, 0.1, 0.5))
+    for v in (0.05, 0.3, 0.3, 2.0):
+        h.observe(v, "x")
+    assert h.render() == [
+        "# HELP hamsterfi_test_seconds Test durations.",
+        "# TYPE hamsterfi_test_seconds histogram",
+        'hamsterfi_test_seconds_bucket{step="x",le="0.1"} 1',
+        'hamsterfi_test_seconds_bucket{step="x",le="0.5"} 3',
+        'hamsterfi_test_seconds_bucket{step="x",le="1"} 3',
+        'hamsterfi_test_seconds_bucket{step="x",le="+Inf"} 4',
+        'hamsterfi_test_seconds_sum{step="x"} 2.65',
+        'hamsterfi_test_seconds_count{step="x"} 4',
+    ]
+
+
+def test_histogram_without_labels():
+    h = Histogram("hamsterfi_test_seconds", "Test durations.", buckets=(1,))
+    h.observe(1)
+    assert h.render()[2:] == [
+        'hamsterfi_test_seconds_bucket{le="1"} 1',
+        'hamsterfi_test_seconds_bucket{le="+Inf"} 1',
+        "hamsterfi_test_seconds_sum 1",
+        "hamsterfi_test_seconds_count 1",
+    ]
+
+
+def test_label_values_are_escaped():
+    c = Counter("hamsterfi_test_total", "Things counted.", ["cmd"])
+    c.inc('say "hi"\\now\nthen')
+    assert c.render()[-1] == r'hamsterfi_test_total{cmd="say \"hi\"\\now\nthen"} 1'
+    assert SAMPLE.match(c.render()[-1])
+
+
+def test_render_is_valid_exposition_text():
+    metrics.record_command(["iw", "dev", "wlan0", "link"], 0.0, 0.02, 0, stdout="ok")
+    metrics.STEP_SECONDS.observe(0.3, 'step "quoted"', "ok")
+    text = metrics.render()
+    assert text.endswith("\n")
+    seen = set()
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name = line.split()[2]
+            assert name not in seen
+            seen.add(name)
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split()
+            assert name in seen and kind in ("counter", "histogram")
+        else:
+            assert SAMPLE.match(line), line
+            # every sample belongs to the family announced above it
+            assert re.sub(r"_(bucket|sum|count)$", "", re.match(r"\w+", line).group(0)) in seen
+    assert seen == {m.name for m in metrics.METRICS}
+    assert 'hamsterfi_command_duration_seconds_count{command="iw link",result="ok"}' in text
+
+
+@pytest.mark.parametrize("cmd,name", [
+    (["systemctl", "restart", "hostapd"], "systemctl restart"),
+    (["/usr/sbin/nft", "-f", "/etc/nftables.d/hamster-fi.nft"], "nft -f"),
+    (["iw", "dev", "wlan0", "scan"], "iw scan"),
+    (["tc", "qdisc", "replace"], "tc"),
+    ([], ""),
+])
+def test_command_name(cmd, name):
+    assert command_name(cmd) == name
+
+
+def test_span_records_errors():
+    with pytest.raises(KeyError):
+        with metrics.span("step", "boom", detail="x"):
+            raise KeyError("k")
+    last = metrics.recent_spans("step")[-1]
+    assert (last["name"], last["error"], last["attrs"]) == ("boom", "'k'", {"detail": "x"})
@@ -0,0 +1,66 @@
+import os
+import shutil
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from hamsterfi.system import net
+from hamsterfi.system.net import NetlinkBackend
+
+
+def _backend() -> NetlinkBackend:
+    # message encoding only: no netlink socket needed
+    return NetlinkBackend.__new__(NetlinkBackend)
+
+
+def test_scope_constants_match_rtnetlink_h():
+    # enum rt_scope_t: UNIVERSE 0, SITE 200, LINK 253, HOST 254, NOWHERE 255
+    assert net.RT_SCOPE_UNIVERSE == 0
+    assert net.RT_SCOPE_NOWHERE == 255
+
+
+def test_default_route_delete_uses_scope_nowhere():
+    # the kernel only matches a gateway route on delete with scope nowhere (what `ip route del` sends)
+    body = _backend()._default_route_body(True, "192.168.1.1", None, 50, check=False)
+    family, dst_len, _, _, table, protocol, scope, rtype, _ = net._RTMSG.unpack_from(body)
+    assert (family, dst_len, table) == (socket.AF_INET, 0, net.RT_TABLE_MAIN)
+    assert scope == net.RT_SCOPE_NOWHERE
+    # protocol and type left open so any default route matches
+    assert (protocol, rtype) == (0, 0)
+    attrs = net._parse_attrs(body, net._RTMSG.size)
+    assert socket.inet_ntoa(attrs[net.RTA_GATEWAY]) == "192.168.1.1"
+
+
+def test_default_route_add_is_universe_unicast():
+    body = _backend()._default_route_body(False, "192.168.1.1", None, 50, check=False, table=101)
+    _, _, _, _, table, protocol, scope, rtype, _ = net._RTMSG.unpack_from(body)
+    assert (table, protocol, scope, rtype) == (101, net.RTPROT_BOOT, net.RT_SCOPE_UNIVERSE, net.RTN_UNICAST)
+
+
+_LIVE = """
+import subprocess
+from hamsterfi.system.net import NetlinkBackend
+subprocess.run(["ip", "link", "add", "hf0", "type", "veth", "peer", "hf1"], check=True)
+subprocess.run(["ip", "addr", "add", "192.168.77.2/24", "dev", "hf0"], check=True)
+subprocess.run(["ip", "link", "set", "hf0", "up"], check=True)
+subprocess.run(["ip", "link", "set", "hf1", "up"], check=True)
+nl = NetlinkBackend()
+nl.route_replace_default("192.168.77.1", dev="hf0", metric=50, check=True)
+assert [(r.dev, r.via, r.metric) for r in nl.default_routes()] == [("hf0", "192.168.77.1", 50)]
+nl.route_del_default(dev="hf0", via="192.168.77.1", metric=50, check=True)
+assert nl.default_routes() == []
+"""
+
+
+def test_default_route_delete_in_netns():
+    """Add and delete a gateway default route in a throwaway network namespace."""
+    if not (shutil.which("unshare") and shutil.which("ip")):
+        pytest.skip("needs unshare and ip")
+    probe = subprocess.run(["unshare", "-rn", "true"], capture_output=True)
+    if probe.returncode != 0:
+        pytest.skip("no unprivileged network namespaces here")
+    res = subprocess.run(["unshare", "-rn", sys.executable, "-c", _LIVE], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert res.returncode == 0, res.stderr
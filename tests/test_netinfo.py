@@ -0,0 +1,56 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from hamsterfi.core.netinfo import SYS_NET, LinkInfo, NetSnapshot, brief_addrs, brief_links, read_snapshot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LIVE = """
+import subprocess
+from hamsterfi.core.netinfo import read_snapshot
+from hamsterfi.system.net import ipv4_addrs
+subprocess.run(["mount", "-t", "sysfs", "none", "/sys"], check=True)
+subprocess.run(["ip", "link", "add", "hf0", "type", "veth", "peer", "hf1"], check=True)
+subprocess.run(["ip", "addr", "add", "192.168.77.1/24", "dev", "hf0"], check=True)
+subprocess.run(["ip", "addr", "add", "192.168.78.1/24", "dev", "hf0"], check=True)
+assert read_snapshot(ipv4_addrs).link("hf0").ipv4 == ["192.168.77.1/24", "192.168.78.1/24"]
+# no dump passed in: the ioctl fallback sees the primary only
+assert read_snapshot().link("hf0").ipv4 == ["192.168.77.1/24"]
+"""
+
+
+def test_link_and_addr_text_differ():
+    snap = NetSnapshot(links=[LinkInfo(name="ap0", operstate="up", mac="02:00:00:00:00:01", mtu=1500,
+                                       master="br0", ipv4=["192.168.50.1/24"])])
+    assert "192.168.50.1/24" in brief_addrs(snap)
+    assert "192.168.50.1/24" not in brief_links(snap)
+    assert "02:00:00:00:00:01" in brief_links(snap) and "master br0" in brief_links(snap)
+
+
+def test_secondary_ipv4_addresses_in_netns():
+    """SIOCGIFADDR only returns the primary address; the RTM_GETADDR dump returns both."""
+    if not (shutil.which("unshare") and shutil.which("ip")):
+        pytest.skip("needs unshare and ip")
+    if subprocess.run(["unshare", "-rnm", "true"], capture_output=True).returncode != 0:
+        pytest.skip("no unprivileged network namespaces here")
+    res = subprocess.run(["unshare", "-rnm", sys.executable, "-c", _LIVE], capture_output=True, text=True, cwd=ROOT)
+    assert res.returncode == 0, res.stderr
+
+
+def test_netinfo_does_not_import_the_system_layer():
+    code = "import sys, hamsterfi.core.netinfo; print([m for m in sys.modules if m.startswith('hamsterfi.system')])"
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT, check=True)
+    assert res.stdout.strip() == "[]"
+
+
+def test_the_address_dump_is_injected():
+    if not os.path.exists(f"{SYS_NET}/lo"):
+        pytest.skip("no /sys/class/net/lo")
+    snap = read_snapshot(lambda: {"lo": ["127.0.0.1/8", "127.0.0.2/8"]})
+    assert snap.link("lo").ipv4 == ["127.0.0.1/8", "127.0.0.2/8"]
+    # a dump that can't tell (None) falls back to the ioctl
+    assert read_snapshot(lambda: None).link("lo").ipv4 == read_snapshot().link("lo").ipv4
@@ -0,0 +1,123 @@
+from conftest import make_cfg, settle
+from hamsterfi.system import boot
+from hamsterfi.system.apply import apply, build_plan
+from hamsterfi.system.nft import (
+    FASTPATH_TABLE,
+    FILTER_TABLE,
+    LEGACY_TABLES,
+    NAT_TABLE,
+    build_fastpath,
+    build_ruleset,
+    legacy_tables,
+)
+from hamsterfi.system.render import NFT_PATH
+
+FASTPATH = " ".join(FASTPATH_TABLE)
+FILTER, NAT = " ".join(FILTER_TABLE), " ".join(NAT_TABLE)
+# what hamster-fi.nft looked like before the tables were renamed
+LEGACY_RULES = """flush ruleset
+
+table inet filter {
+  chain input {
+    type filter hook input priority 0; policy drop;
+  }
+}
+
+table ip nat {
+  chain postrouting {
+    type nat hook postrouting priority 100; policy accept;
+  }
+}
+"""
+FOREIGN = "table inet filter {\n  chain docker {\n  }\n}\n"
+
+
+def _devices(cfg, wan_if="eth0", lan_if="ap0"):
+    ruleset = build_fastpath(cfg, wan_if=wan_if, lan_if=lan_if)
+    return [f.devices for t in ruleset.tables for f in t.flowtables]
+
+
+def test_flowtable_devices_are_the_wans_and_the_lan():
+    cfg = make_cfg("ap", "eth0")
+    cfg.firewall.flowtable = True
+    assert _devices(cfg) == [["eth0", "ap0"]]
+    assert _devices(cfg, wan_if="wlan0") == [["wlan0", "ap0"]]
+
+
+def test_flowtable_devices_with_balancing():
+    cfg = make_cfg("ap", "eth0")
+    cfg.firewall.flowtable = True
+    cfg.wan.balance.enabled = True
+    assert _devices(cfg) == [["eth0", "wlan0", "ap0"]]
+
+
+def test_flowtable_off_only_removes_its_table():
+    cfg = make_cfg("ap", "eth0")
+    text = build_fastpath(cfg, wan_if="eth0", lan_if="ap0").render()
+    assert f"delete table {FASTPATH}" in text
+    assert "flowtable" not in text
+
+
+def test_boot_ruleset_never_names_the_lan_flowtable():
+    # nftables.service loads this before ap0 exists; a flowtable on ap0 would fail the whole file
+    cfg = make_cfg("ap", "eth0")
+    cfg.firewall.flowtable = True
+    text = build_ruleset(cfg, wan_if="eth0", lan_if="ap0").render()
+    assert "flowtable" not in text and "flow add" not in text
+
+
+def test_firewall_survives_reboot_with_flowtable(pi):
+    cfg = make_cfg("ap", "eth0")
+    cfg.firewall.flowtable = True
+    apply(cfg)
+    settle(pi)
+    assert FASTPATH in pi.nft_tables
+
+    pi.reboot()
+    assert pi.services["nftables"] == "active"
+    assert {FILTER, NAT} <= set(pi.nft_tables)
+
+    res = boot.run(cfg)
+    assert res["replayed"] and res["fallback"] is None
+    assert FASTPATH in pi.nft_tables
+    assert res["plan"] == "0 steps"
+
+
+def test_tables_have_names_of_their_own():
+    cfg = make_cfg("ap", "eth0")
+    cfg.firewall.flowtable = True
+    refs = {(t.family, t.name) for r in (build_ruleset(cfg, "eth0", "ap0"), build_fastpath(cfg, "eth0", "ap0"))
+            for t in r.tables}
+    assert refs == {FILTER_TABLE, NAT_TABLE, FASTPATH_TABLE}
+    assert not refs & set(LEGACY_TABLES)
+
+
+def test_legacy_tables_are_found_in_the_old_file_only():
+    assert legacy_tables(LEGACY_RULES) == list(LEGACY_TABLES)
+    assert legacy_tables(build_ruleset(make_cfg("ap", "eth0"), "eth0", "ap0").render()) == []
+    assert legacy_tables(None) == []
+
+
+def test_apply_leaves_a_foreign_inet_filter_alone(pi):
+    pi.nft_tables["inet filter"] = FOREIGN
+    apply(make_cfg("ap", "eth0"))
+    assert pi.nft_tables["inet filter"] == FOREIGN
+    assert {FILTER, NAT} <= set(pi.nft_tables)
+
+
+def test_upgrade_drops_the_legacy_tables_once(pi):
+    cfg = make_cfg("ap", "eth0")
+    apply(cfg)
+    settle(pi)
+    # the box as an older version left it
+    pi.write_text(NFT_PATH, LEGACY_RULES)
+    pi.run(["nft", "-f", NFT_PATH])
+    assert "inet filter" in pi.nft_tables
+
+    plan = build_plan(cfg)
+    assert not plan.full
+    assert "drop legacy tables" in [a.name for a in plan.actions]
+    apply(cfg)
+    assert not {"inet filter", "ip nat"} & set(pi.nft_tables)
+    assert {FILTER, NAT} <= set(pi.nft_tables)
+    assert build_plan(cfg).actions == []
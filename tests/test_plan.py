@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import make_cfg, settle
+from hamsterfi.system.apply import apply, build_plan
+from hamsterfi.system.render import HOSTAPD_PATH
+
+
+@pytest.mark.parametrize("wan", ["eth0", "wlan0"])
+def test_reapply_is_empty(pi, wan):
+    cfg = make_cfg("ap", wan)
+    assert apply(cfg).full
+    settle(pi)
+    assert build_plan(cfg).actions == []
+
+
+@pytest.mark.parametrize("wan", ["eth0", "wlan0"])
+def test_psk_change_only_touches_hostapd(pi, wan):
+    cfg = make_cfg("ap", wan)
+    apply(cfg)
+    settle(pi)
+
+    cfg.wlan.psk = "another-secret"
+    plan = build_plan(cfg)
+    assert not plan.full
+    assert [a.name for a in plan.actions] == [f"write {HOSTAPD_PATH}", "restart hostapd"]
+
+    apply(cfg)
+    assert "wpa_passphrase=another-secret" in pi.read_text(HOSTAPD_PATH)
+    assert build_plan(cfg).actions == []
+
+
+def test_dry_run_changes_nothing(pi):
+    cfg = make_cfg("ap", "eth0")
+    plan = apply(cfg, dry_run=True)
+    assert plan.full
+    assert pi.read_text(HOSTAPD_PATH) is None
+    assert "ap0" not in pi.links
+
+
+@pytest.mark.parametrize("mode,wan", [("ap", "eth0"), ("ap", "wlan0"), ("station", "wlan0")])
+def test_static_wan_reapply_is_empty(pi, mode, wan):
+    cfg = make_cfg(mode, wan)
+    cfg.wan.ipv4 = "static"
+    cfg.wan.static.address, cfg.wan.static.gateway = "192.168.1.200/24", "192.168.1.1"
+    apply(cfg)
+    settle(pi)
+    # dhcpcd leaves the static WAN alone: no lease on top of the static address
+    assert pi.addrs[wan] == ["192.168.1.200/24"]
+    assert build_plan(cfg).actions == []
@@ -0,0 +1,92 @@
+import os
+import subprocess
+
+import pytest
+
+from conftest import make_cfg
+from hamsterfi.system.qos import ifb_name, render_qos
+
+
+def _cfg(up: int = 0, down: int = 0, enabled: bool = True):
+    cfg = make_cfg("ap", "eth0")
+    cfg.qos.enabled, cfg.qos.up_kbit, cfg.qos.down_kbit = enabled, up, down
+    return cfg
+
+
+def _body(script: str):
+    """The lines after the shell functions."""
+    return script.split("}\n")[-1].splitlines()
+
+
+def test_off_unshapes_every_candidate():
+    assert _body(render_qos(_cfg(enabled=False, up=9000, down=45000), "eth0")) == ["unshape eth0", "unshape wlan0"]
+    assert _body(render_qos(_cfg(), "eth0")) == ["unshape eth0", "unshape wlan0"]
+
+
+def test_both_directions_shape_egress_and_the_ifb():
+    assert _body(render_qos(_cfg(up=9000, down=45000), "wlan0")) == [
+        "unshape eth0",
+        "# wlan0: up 9000 kbit/s, down 45000 kbit/s",
+        "shape wlan0 9000 nat",
+        "tc qdisc del dev wlan0 ingress 2>/dev/null",
+        "ip link add ifb4wlan0 type ifb 2>/dev/null",
+        "ip link set ifb4wlan0 up",
+        "tc qdisc add dev wlan0 handle ffff: ingress",
+        "tc filter add dev wlan0 parent ffff: protocol all u32 match u32 0 0 action mirred egress redirect dev ifb4wlan0",
+        'shape ifb4wlan0 45000 "nat ingress"',
+    ]
+
+
+def test_one_direction_clears_the_other():
+    up = _body(render_qos(_cfg(up=9000), "eth0"))
+    assert "shape eth0 9000 nat" in up and "ip link del ifb4eth0 2>/dev/null" in up
+    assert not any(l.startswith("ip link add") or l.startswith("shape ifb4") for l in up)
+    down = _body(render_qos(_cfg(down=45000), "eth0"))
+    assert "tc qdisc del dev eth0 root 2>/dev/null" in down
+    assert 'shape ifb4eth0 45000 "nat ingress"' in down
+
+
+def test_ifb_name_fits_ifnamsiz():
+    assert ifb_name("eth0") == "ifb4eth0"
+    assert len(ifb_name("enx001122334455")) == 15
+
+
+@pytest.fixture
+def tools(tmp_path):
+    """`tc` and `ip` that log their argv; `tc ... cake` fails when NO_CAKE is set, like a kernel without sch_cake."""
+    log = tmp_path / "log"
+    for name in ("tc", "ip"):
+        tool = tmp_path / name
+        tool.write_text(f'#!/bin/sh\necho "{name} $*" >> "{log}"\n'
+                        'case "$*" in *cake*) [ -n "$NO_CAKE" ] && exit 2;; esac\nexit 0\n')
+        tool.chmod(0o755)
+
+    def run(script: str, cake: bool = True):
+        path = tmp_path / "qos.sh"
+        path.write_text(script)
+        log.write_text("")
+        env = dict(os.environ, PATH=f"{tmp_path}:{os.environ['PATH']}")
+        if not cake:
+            env["NO_CAKE"] = "1"
+        subprocess.run(["sh", str(path)], env=env, check=True)
+        return [l for l in log.read_text().splitlines() if " del " not in l]
+
+    return run
+
+
+def test_cake_when_the_kernel_has_it(tools):
+    calls = tools(render_qos(_cfg(up=9000, down=45000), "eth0"))
+    assert "tc qdisc replace dev eth0 root cake bandwidth 9000kbit nat" in calls
+    assert "tc qdisc replace dev ifb4eth0 root cake bandwidth 45000kbit nat ingress" in calls
+    assert not any("htb" in c or "fq_codel" in c for c in calls)
+
+
+def test_htb_and_fq_codel_without_cake(tools):
+    calls = tools(render_qos(_cfg(up=9000, down=45000), "eth0"), cake=False)
+    for dev, kbit in (("eth0", 9000), ("ifb4eth0", 45000)):
+        assert f"tc qdisc replace dev {dev} root handle 1: htb default 10" in calls
+        assert (f"tc class replace dev {dev} parent 1: classid 1:10 htb rate {kbit}kbit ceil {kbit}kbit quantum 1514"
+                in calls)
+        assert f"tc qdisc replace dev {dev} parent 1:10 fq_codel" in calls
+    # the ingress side still goes through the IFB
+    assert "tc filter add dev eth0 parent ffff: protocol all u32 match u32 0 0 action mirred egress redirect dev ifb4eth0" in calls
@@ -0,0 +1,67 @@
+"""Action routes (the job each one queues, without running it) and app startup."""
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from conftest import make_cfg
+from hamsterfi import main
+from hamsterfi.system import profiles
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.submitted = []
+
+    def submit(self, kind, fn, key=None):
+        self.submitted.append((kind, key or kind))
+        return main.Job(id=str(len(self.submitted)), kind=kind, key=key or kind)
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    rec = Recorder()
+    monkeypatch.setattr(main, "get_jobs", lambda: rec)
+    return rec
+
+
+def _request() -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": []})
+
+
+def test_profile_activate_is_not_absorbed_by_a_queued_apply(jobs, monkeypatch):
+    monkeypatch.setattr(profiles, "names", lambda: ["home"])
+    main.apply_now(_request())
+    main.profile_activate(_request(), "home")
+    assert jobs.submitted == [("apply", "apply"), ("apply", "activate home")]
+
+
+def test_channel_switch_is_not_absorbed_by_a_queued_apply(jobs, monkeypatch):
+    monkeypatch.setattr(main, "_channel_recommendation", lambda: {"best": 11})
+    main.apply_now(_request())
+    main.channel_switch(_request())
+    assert jobs.submitted == [("apply", "apply"), ("apply", "channel 11")]
+
+
+@pytest.mark.parametrize("mode,wan,backup", [("station", "wlan0", None), ("ap", "wlan0", None),
+                                             ("ap", "eth0", "failover"), ("ap", "eth0", "balance")])
+def test_channel_survey_skips_an_ap_that_follows_the_uplink(monkeypatch, mode, wan, backup):
+    cfg = make_cfg(mode, wan, channel="auto")
+    if backup:
+        getattr(cfg.wan, backup).enabled = True
+    monkeypatch.setattr(main, "load_config", lambda: cfg)
+    assert main._channel_survey_job(None) == {"skipped": "no AP channel of its own"}
+
+
+def test_startup_runs_from_the_lifespan(monkeypatch):
+    started = []
+    monkeypatch.setattr(main, "_start_channel_survey", lambda: started.append("survey"))
+    monkeypatch.setattr(main, "_start_idle_exit", lambda: started.append("idle exit"))
+
+    async def run() -> None:
+        async with main.app.router.lifespan_context(main.app):
+            pass
+
+    asyncio.run(run())
+    assert started == ["survey", "idle exit"]
+    assert main.app.router.on_startup == []
@@ -0,0 +1,40 @@
+import pytest
+
+from hamsterfi.core.models import PerformanceConfig
+from hamsterfi.system.sizing import CONNTRACK_TIMEOUTS, conntrack_max, perf_sysctls
+
+MB = 1024 * 1024
+
+
+@pytest.mark.parametrize("clients,budget_mb,expected", [
+    # 256 flows per client, within the budget
+    (25, 64, 6144),
+    (32, 64, 8192),
+    # never below MIN_CONNTRACK
+    (4, 64, 4096),
+    (1, 1, 4096),
+    # half of 16 MB at 352 bytes an entry caps a big LAN, rounded down to 1024
+    (1000, 16, 23552),
+    (1000, 256, 256000),
+])
+def test_conntrack_max(clients, budget_mb, expected):
+    assert conntrack_max(PerformanceConfig(expected_clients=clients, memory_budget_mb=budget_mb)) == expected
+
+
+@pytest.mark.parametrize("clients,budget_mb,ct_max,buckets,backlog,buf,default", [
+    (25, 64, 6144, 2048, 1024, 2 * MB, 262144),
+    (32, 64, 8192, 2048, 1024, 2 * MB, 262144),
+    (1000, 16, 23552, 8192, 16384, MB // 2, 262144),
+    # a tiny budget keeps the kernel's own buffer sizes
+    (4, 1, 4096, 1024, 1024, 212992, 212992),
+    # a huge one stops at 16 MB buffers
+    (100, 1024, 25600, 8192, 4096, 16 * MB, 262144),
+])
+def test_perf_sysctls(clients, budget_mb, ct_max, buckets, backlog, buf, default):
+    out = perf_sysctls(PerformanceConfig(expected_clients=clients, memory_budget_mb=budget_mb))
+    assert out["net.netfilter.nf_conntrack_max"] == str(ct_max)
+    assert out["net.netfilter.nf_conntrack_buckets"] == str(buckets)
+    assert out["net.core.netdev_max_backlog"] == str(backlog)
+    assert out["net.core.rmem_max"] == out["net.core.wmem_max"] == str(buf)
+    assert out["net.core.rmem_default"] == out["net.core.wmem_default"] == str(default)
+    assert {k: out[k] for k in CONNTRACK_TIMEOUTS} == CONNTRACK_TIMEOUTS
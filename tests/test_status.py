@@ -0,0 +1,36 @@
+import subprocess
+
+from conftest import make_cfg, settle
+from hamsterfi.core import status
+from hamsterfi.system.apply import apply
+
+
+def _cmds(pi):
+    return [c.cmd for c in pi.calls]
+
+
+def test_sources_ask_the_current_host(pi):
+    apply(make_cfg("ap", "eth0"))
+    settle(pi)
+    pi.calls.clear()
+
+    assert status._services() == {"dnsmasq": "active", "hostapd": "active"}
+    assert status._nft() == pi.nft_loaded.strip("\n")
+    assert status.SOURCES["iw_ap0"]()["iw_ap0"].startswith("Interface ap0")
+    assert _cmds(pi) == [
+        ["systemctl", "is-active", "dnsmasq", "hostapd"],
+        ["nft", "list", "ruleset"],
+        ["iw", "dev", "ap0", "info"],
+    ]
+
+
+def test_run_quiet_ignores_failures(pi, monkeypatch):
+    # a non-zero exit keeps its stdout: "is-active" says which units are down that way
+    assert status._services() == {"dnsmasq": "inactive", "hostapd": "inactive"}
+
+    def stuck(cmd, *args, **kwargs):
+        raise subprocess.TimeoutExpired(cmd, kwargs.get("timeout"))
+
+    monkeypatch.setattr(pi, "run", stuck)
+    assert status._run_quiet(["nft", "list", "ruleset"]) == ""
+    assert status._services() == {"dnsmasq": "unknown", "hostapd": "unknown"}
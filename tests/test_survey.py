@@ -0,0 +1,82 @@
+import subprocess
+
+from conftest import make_cfg
+from hamsterfi.system.apply import apply
+from hamsterfi.system.render import HOSTAPD_PATH
+from hamsterfi.system.survey import pick_channel, recommend, survey
+
+
+def _scans(pi):
+    return [c.cmd for c in pi.calls if "scan" in c.cmd]
+
+
+def test_scan_timeout_is_an_empty_scan(pi, monkeypatch):
+    run = pi.run
+
+    def stuck(cmd, *args, **kwargs):
+        if "scan" in cmd:
+            raise subprocess.TimeoutExpired(cmd, kwargs.get("timeout"))
+        return run(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(pi, "run", stuck)
+    assert survey(pi) == ([], {})
+    # nothing to score: the lowest candidate
+    assert pick_channel(pi, "US", "2.4", 20) == 1
+
+
+def test_dry_run_never_scans(pi):
+    cfg = make_cfg("ap", "eth0", channel="auto")
+    plan = apply(cfg, dry_run=True)
+    assert plan.full
+    assert _scans(pi) == []
+    assert pi.read_text(HOSTAPD_PATH) is None
+
+    apply(cfg)
+    assert _scans(pi) != []
+
+
+def _dump(busy):
+    # busy: channel -> (active ms, busy ms)
+    return "".join(f"Survey data from ap0\n\tfrequency:\t\t\t{2407 + 5 * ch} MHz\n"
+                   f"\tchannel active time:\t\t{a} ms\n\tchannel busy time:\t\t{b} ms\n"
+                   for ch, (a, b) in busy.items())
+
+
+def _with_dump(pi, monkeypatch, busy):
+    run = pi.run
+
+    def fake(cmd, *args, **kwargs):
+        if cmd[-2:] == ["survey", "dump"]:
+            res = run(cmd, *args, **kwargs)
+            res.stdout = _dump(busy)
+            return res
+        return run(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(pi, "run", fake)
+    ups = []
+    link_set = pi.net().link_set
+    monkeypatch.setattr(pi.net(), "link_set", lambda dev, up, **kw: (ups.append((dev, up)), link_set(dev, up, **kw)))
+    return ups
+
+
+def test_passive_recommend_reads_the_dump_only(pi, monkeypatch):
+    ups = _with_dump(pi, monkeypatch, {1: (100, 10), 6: (100, 80), 11: (100, 5)})
+    rec = recommend(pi, "US", "2.4", 20, 6)
+    assert (rec["best"], rec["switch"]) == (11, True)
+    assert _scans(pi) == []
+    assert [c.cmd for c in pi.calls if "dump" in c.cmd] == [["iw", "dev", "ap0", "survey", "dump"]]
+    assert ups == []
+
+
+def test_passive_recommend_needs_data_for_the_current_channel(pi, monkeypatch):
+    # channel 6 was never measured: nothing says 11 is better
+    _with_dump(pi, monkeypatch, {11: (100, 5)})
+    rec = recommend(pi, "US", "2.4", 20, 6)
+    assert (rec["best"], rec["switch"], rec["scores"]) == (None, False, {})
+
+
+def test_active_recommend_is_opt_in(pi, monkeypatch):
+    ups = _with_dump(pi, monkeypatch, {})
+    recommend(pi, "US", "2.4", 20, 6, scan=True)
+    assert _scans(pi) != []
+    assert ups == []
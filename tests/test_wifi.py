@@ -0,0 +1,93 @@
+import pytest
+
+from hamsterfi.system.render import _hostapd_band_block
+from hamsterfi.system.wifi import ChannelPlan, channel_plan
+
+
+@pytest.mark.parametrize("country,channel,width,plan", [
+    # 2.4 GHz: auto stays at 20 MHz, HT40 picks the side that fits
+    ("US", 6, "auto", ChannelPlan(6, 20, 6)),
+    ("US", 6, 40, ChannelPlan(6, 40, 8, 1)),
+    ("US", 11, 40, ChannelPlan(11, 40, 9, -1)),
+    ("DE", 13, 40, ChannelPlan(13, 40, 11, -1)),
+    ("JP", 14, 20, ChannelPlan(14, 20, 14)),
+    # 5 GHz: auto is the widest block the country allows
+    ("US", 36, "auto", ChannelPlan(36, 80, 42, 1)),
+    ("US", 36, 80, ChannelPlan(36, 80, 42, 1)),
+    ("US", 40, 80, ChannelPlan(40, 80, 42, -1)),
+    ("US", 44, 40, ChannelPlan(44, 40, 46, 1)),
+    ("US", 48, 40, ChannelPlan(48, 40, 46, -1)),
+    ("US", 149, 80, ChannelPlan(149, 80, 155, 1)),
+    ("US", 165, "auto", ChannelPlan(165, 20, 165)),
+    ("US", 144, 80, ChannelPlan(144, 80, 138, -1, dfs=True)),
+    ("DE", 140, "auto", ChannelPlan(140, 20, 140, dfs=True)),
+    ("CN", 36, "auto", ChannelPlan(36, 80, 42, 1)),
+    # DFS: the whole block counts, not just the primary
+    ("US", 52, 20, ChannelPlan(52, 20, 52, dfs=True)),
+    ("US", 52, 80, ChannelPlan(52, 80, 58, 1, dfs=True)),
+    ("US", 100, 40, ChannelPlan(100, 40, 102, 1, dfs=True)),
+    # not in the table: only the numbering is checked
+    ("XX", 13, 20, ChannelPlan(13, 20, 13)),
+])
+def test_channel_plan(country, channel, width, plan):
+    assert channel_plan(country, channel, width) == plan
+
+
+@pytest.mark.parametrize("country,channel,width,error", [
+    ("US", 13, 20, "not allowed in country US"),
+    ("US", 14, 20, "not allowed in country US"),
+    ("CN", 100, "auto", "not allowed in country CN"),
+    ("US", 99, 20, "does not exist"),
+    ("JP", 14, 40, "does not fit"),
+    ("US", 165, 40, "does not fit"),
+    ("US", 165, 80, "does not fit"),
+    # 144 is not in ETSI, so neither is the 132..144 block nor 140+144
+    ("DE", 140, 80, "does not fit"),
+    ("DE", 140, 40, "does not fit"),
+])
+def test_channel_plan_rejects(country, channel, width, error):
+    with pytest.raises(ValueError, match=error):
+        channel_plan(country, channel, width)
+
+
+@pytest.mark.parametrize("country,channel,width,plan", [
+    # the uplink's channel is taken even where the country wouldn't allow it
+    ("US", 13, 20, ChannelPlan(13, 20, 13)),
+    ("US", 13, 40, ChannelPlan(13, 40, 11, -1)),
+    # and the width narrowed until it fits
+    ("US", 165, 80, ChannelPlan(165, 20, 165)),
+    ("DE", 140, 80, ChannelPlan(140, 20, 140, dfs=True)),
+    ("JP", 14, 40, ChannelPlan(14, 20, 14)),
+    ("US", 36, 40, ChannelPlan(36, 40, 38, 1)),
+])
+def test_channel_plan_follow(country, channel, width, plan):
+    assert channel_plan(country, channel, width, follow=True) == plan
+
+
+def test_channel_plan_follow_still_needs_a_real_channel():
+    with pytest.raises(ValueError, match="does not exist"):
+        channel_plan("US", 99, 20, follow=True)
+
+
+@pytest.mark.parametrize("plan,lines", [
+    (ChannelPlan(6, 20, 6), ["hw_mode=g", "ieee80211n=1", "ht_capab=[SHORT-GI-20]", "ieee80211d=1"]),
+    (ChannelPlan(6, 40, 8, 1),
+     ["hw_mode=g", "ieee80211n=1", "ht_capab=[HT40+][SHORT-GI-20][SHORT-GI-40]", "ieee80211d=1"]),
+    (ChannelPlan(11, 40, 9, -1),
+     ["hw_mode=g", "ieee80211n=1", "ht_capab=[HT40-][SHORT-GI-20][SHORT-GI-40]", "ieee80211d=1"]),
+    (ChannelPlan(165, 20, 165),
+     ["hw_mode=a", "ieee80211n=1", "ieee80211ac=1", "ht_capab=[SHORT-GI-20]",
+      "vht_oper_chwidth=0", "vht_oper_centr_freq_seg0_idx=165", "ieee80211d=1"]),
+    (ChannelPlan(48, 40, 46, -1),
+     ["hw_mode=a", "ieee80211n=1", "ieee80211ac=1", "ht_capab=[HT40-][SHORT-GI-20][SHORT-GI-40]",
+      "vht_oper_chwidth=0", "vht_oper_centr_freq_seg0_idx=46", "ieee80211d=1"]),
+    (ChannelPlan(36, 80, 42, 1),
+     ["hw_mode=a", "ieee80211n=1", "ieee80211ac=1", "ht_capab=[HT40+][SHORT-GI-20][SHORT-GI-40]",
+      "vht_capab=[SHORT-GI-80]", "vht_oper_chwidth=1", "vht_oper_centr_freq_seg0_idx=42", "ieee80211d=1"]),
+    (ChannelPlan(52, 80, 58, 1, dfs=True),
+     ["hw_mode=a", "ieee80211n=1", "ieee80211ac=1", "ht_capab=[HT40+][SHORT-GI-20][SHORT-GI-40]",
+      "vht_capab=[SHORT-GI-80]", "vht_oper_chwidth=1", "vht_oper_centr_freq_seg0_idx=58",
+      "ieee80211d=1", "ieee80211h=1"]),
+])
+def test_hostapd_band_block(plan, lines):
+    assert _hostapd_band_block(plan).splitlines() == lines